@@ -2,14 +2,35 @@ package app
 
 import (
 	"bytes"
+	"database/sql"
 	"encoding/json"
+	"errors"
 	"log"
 	"net/http"
+	"strconv"
+	"sync"
 	"time"
 
 	kennyupull "github.com/jdboisvert/kenny-u-pull-go-sdk"
 )
 
+// The alert consumer answers 429 or 503 with a Retry-After header when it is too far behind to take more listings. A
+// listing is sent up to maxSendAttempts times, waiting as long as the consumer asks (defaultRetryDelay if it doesn't
+// say, at most maxRetryDelay) between attempts.
+const maxSendAttempts = 5
+const defaultRetryDelay = 5 * time.Second
+const maxRetryDelay = time.Minute
+
+// Waits between attempts, replaced in tests to not wait.
+var sleep = time.Sleep
+
+// The number of subscriptions in a page of GET /v1/subscriptions when the limit isn't given, and the most a page can have.
+const defaultSubscriptionsPageLimit = 1000
+const maxSubscriptionsPageLimit = 10000
+
+var ErrInvalidAfterID = errors.New("Invalid after_id")
+var ErrInvalidLimit = errors.New("Invalid limit")
+
 func CheckVehiclesListings() {
 	log.Println("Checking for new vehicles to alert on...")
 	db := GetDatabase()
@@ -52,30 +73,58 @@ func CheckForNewVehiclesPosted(vehicle Vehicle) {
 	if latestListing.DateListed <= currentDate && doesNotMatchRecordInDatabase {
 		// New listing found for today for the vehicle that we haven't seen before so send an alert
 		log.Println("New listing found for vehicle: ", vehicle, " and the listing is: ", latestListing)
-		go SendUpdateToSubscribers(latestListing, &vehicle)
 
-		// Update the vehicle with the latest listing info
 		db := GetDatabase()
 		defer db.Close()
 
-		vehicle.LastRowID.String = latestListing.RowID
-		vehicle.Location.String = latestListing.Branch
-		UpdateVehicle(db, &vehicle)
+		DeliverNewListing(db, latestListing, &vehicle)
 	}
 }
 
-func SendUpdateToSubscribers(latestListing *kennyupull.InventoryListing, vehicle *Vehicle) {
-	db := GetDatabase()
-	defer db.Close()
+// Sends a new listing to the subscribers of the vehicle and only then updates the vehicle with the latest listing info.
+// If any subscriber didn't get it the vehicle is left as is so the listing is sent again on the next check, the alert
+// consumer drops the copies the other subscribers already got. Returns whether every subscriber got the listing.
+func DeliverNewListing(db *sql.DB, latestListing *kennyupull.InventoryListing, vehicle *Vehicle) bool {
+	if !SendUpdateToSubscribers(db, latestListing, vehicle) {
+		log.Println("Not every subscriber got the listing, it will be sent again on the next check: ", latestListing)
+		return false
+	}
 
+	vehicle.LastRowID.String = latestListing.RowID
+	vehicle.Location.String = latestListing.Branch
+	UpdateVehicle(db, vehicle)
+
+	return true
+}
+
+// Sends a listing to every subscriber of the vehicle at once. Returns whether every subscriber got it.
+func SendUpdateToSubscribers(db *sql.DB, latestListing *kennyupull.InventoryListing, vehicle *Vehicle) bool {
 	allSubscribers := GetAllSubscriptions(db, vehicle)
 
-	for _, subscriber := range allSubscribers {
-		go SendUpdateToASubscriber(latestListing, &subscriber)
+	var wg sync.WaitGroup
+	results := make([]bool, len(allSubscribers))
+	for index := range allSubscribers {
+		wg.Add(1)
+		go func(index int) {
+			defer wg.Done()
+			results[index] = SendUpdateToASubscriber(latestListing, &allSubscribers[index])
+		}(index)
+	}
+	wg.Wait()
+
+	for _, sent := range results {
+		if !sent {
+			return false
+		}
 	}
+
+	return true
 }
 
-func SendUpdateToASubscriber(latestListing *kennyupull.InventoryListing, subscriber *Subscription) {
+// Sends a listing to the alert consumer for a subscriber, trying again while the consumer is unreachable or asks to
+// retry later (see maxSendAttempts). Returns false if the listing should be sent again later, true if the consumer took
+// it or rejected it for good (ex: it is invalid).
+func SendUpdateToASubscriber(latestListing *kennyupull.InventoryListing, subscriber *Subscription) bool {
 	values := map[string]string{"year": latestListing.Year, "make": latestListing.Make, "model": latestListing.Model, "date_listed": latestListing.DateListed, "row_id": latestListing.RowID, "branch": latestListing.Branch, "listing_url": latestListing.ListingUrl, "client_id": subscriber.ClientID}
 	json_data, err := json.Marshal(values)
 
@@ -86,21 +135,57 @@ func SendUpdateToASubscriber(latestListing *kennyupull.InventoryListing, subscri
 	}
 
 	mainAlertConsumerUrl := GetEnv("MAIN_ALERT_CONSUMER_URL")
-	resp, err := http.Post(mainAlertConsumerUrl, "application/json", bytes.NewBuffer(json_data))
-
-	if err != nil {
-		log.Println("Got an error when trying to send an alert: ", err)
-		return
+	for attempt := 1; attempt <= maxSendAttempts; attempt++ {
+		retryDelay := defaultRetryDelay
+		resp, err := http.Post(mainAlertConsumerUrl, "application/json", bytes.NewBuffer(json_data))
+
+		if err != nil {
+			log.Println("Got an error when trying to send an alert: ", err)
+		} else {
+			resp.Body.Close()
+
+			switch {
+			case resp.StatusCode == http.StatusNoContent:
+				log.Println("Successfully sent alert to subscriber: ", subscriber)
+				return true
+			case resp.StatusCode == http.StatusTooManyRequests || resp.StatusCode >= http.StatusInternalServerError:
+				log.Println("The alert consumer asked to retry later when trying to send an alert: ", resp.StatusCode)
+				retryDelay = GetRetryDelay(resp)
+			default:
+				log.Println("Got a non-204 status code from the alert consumer when trying to send an alert: ", resp.StatusCode)
+				return true
+			}
+		}
+
+		if attempt < maxSendAttempts {
+			sleep(retryDelay)
+		}
 	}
 
-	if resp.StatusCode != http.StatusNoContent {
-		log.Println("Got a non-204 status code from the alert consumer when trying to send an alert: ", resp.StatusCode)
-		return
+	log.Println("Gave up sending alert to subscriber after ", maxSendAttempts, " attempts: ", subscriber)
+	return false
+}
+
+// Gets how long to wait before sending again from the Retry-After header of a response (a number of seconds or a date),
+// defaultRetryDelay if it has none and at most maxRetryDelay.
+func GetRetryDelay(resp *http.Response) time.Duration {
+	retryAfter := resp.Header.Get("Retry-After")
+
+	delay := defaultRetryDelay
+	if seconds, err := strconv.Atoi(retryAfter); err == nil {
+		delay = time.Duration(seconds) * time.Second
+	} else if date, err := http.ParseTime(retryAfter); err == nil {
+		delay = time.Until(date)
 	}
 
-	log.Println("Successfully sent alert to subscriber: ", subscriber)
+	if delay < 0 {
+		return 0
+	}
+	if delay > maxRetryDelay {
+		return maxRetryDelay
+	}
 
-	defer resp.Body.Close()
+	return delay
 }
 
 func SubscribeToVehicle(vehicleSubscription *VehicleSubscription) (*Subscription, error) {
@@ -132,3 +217,33 @@ func UnsubscribeFromVehicle(vehicleSubscription *VehicleSubscription) {
 
 	DeleteSubscription(db, &vehicle, vehicleSubscription.ClientID)
 }
+
+// Parses the after_id and limit query parameters of GET /v1/subscriptions, either can be left empty for its default.
+func ParseSubscriptionsPageParams(afterIDParam string, limitParam string) (int, int, error) {
+	afterID := 0
+	if afterIDParam != "" {
+		var err error
+		afterID, err = strconv.Atoi(afterIDParam)
+		if err != nil {
+			return 0, 0, ErrInvalidAfterID
+		}
+	}
+
+	limit := defaultSubscriptionsPageLimit
+	if limitParam != "" {
+		var err error
+		limit, err = strconv.Atoi(limitParam)
+		if err != nil || limit < 1 || limit > maxSubscriptionsPageLimit {
+			return 0, 0, ErrInvalidLimit
+		}
+	}
+
+	return afterID, limit, nil
+}
+
+func ListSubscriptions(afterClientID string, afterID int, limit int) ([]SubscribedVehicle, error) {
+	db := GetDatabase()
+	defer db.Close()
+
+	return GetSubscriptionsPage(db, afterClientID, afterID, limit)
+}
@@ -1,12 +1,25 @@
 package app
 
 import (
+	"database/sql"
+	"net/http"
 	"testing"
+	"time"
 
+	"github.com/DATA-DOG/go-sqlmock"
 	"github.com/h2non/gock"
 	kennyupull "github.com/jdboisvert/kenny-u-pull-go-sdk"
 )
 
+// Records the delays between attempts instead of waiting for them.
+func recordSleeps(t *testing.T) *[]time.Duration {
+	var delays []time.Duration
+	sleep = func(delay time.Duration) { delays = append(delays, delay) }
+	t.Cleanup(func() { sleep = time.Sleep })
+
+	return &delays
+}
+
 func TestSendUpdateToASubscriber_SendsAlertAsExpected(t *testing.T) {
 	inventoryListing := kennyupull.InventoryListing{Year: "1996", Make: "Toyota", Model: "Corolla", RowID: "row1", Branch: "location1", DateListed: "2020-01-01", ListingUrl: "https://www.kennyupull.com/inventory/row1"}
 	subscription := Subscription{ID: 1, ClientID: "client1", VehicleID: 1}
@@ -22,3 +35,193 @@ func TestSendUpdateToASubscriber_SendsAlertAsExpected(t *testing.T) {
 		t.Error("Expected an alert to be sent to the alert consumer")
 	}
 }
+
+func TestSendUpdateToASubscriber_RetriesAfterTheConsumerAsks(t *testing.T) {
+	defer gock.Off()
+	delays := recordSleeps(t)
+	inventoryListing := kennyupull.InventoryListing{Year: "1996", Make: "Toyota", Model: "Corolla", RowID: "row1", Branch: "location1", DateListed: "2020-01-01", ListingUrl: "https://www.kennyupull.com/inventory/row1"}
+	subscription := Subscription{ID: 1, ClientID: "client1", VehicleID: 1}
+
+	testUrl := "https://alert-consumer-test.com"
+	t.Setenv("MAIN_ALERT_CONSUMER_URL", testUrl)
+
+	gock.New(testUrl).Post("").Reply(503).SetHeader("Retry-After", "2")
+	gock.New(testUrl).Post("").Reply(429).SetHeader("Retry-After", "3")
+	gock.New(testUrl).Post("").Reply(204)
+
+	if !SendUpdateToASubscriber(&inventoryListing, &subscription) {
+		t.Error("Expected the alert to be sent")
+	}
+
+	if !gock.IsDone() {
+		t.Error("Expected the alert to be sent until the alert consumer took it")
+	}
+
+	if len(*delays) != 2 || (*delays)[0] != 2*time.Second || (*delays)[1] != 3*time.Second {
+		t.Errorf("Expected to wait 2s then 3s between attempts, waited %v", *delays)
+	}
+}
+
+func TestSendUpdateToASubscriber_GivesUpAfterMaxSendAttempts(t *testing.T) {
+	defer gock.Off()
+	delays := recordSleeps(t)
+	inventoryListing := kennyupull.InventoryListing{Year: "1996", Make: "Toyota", Model: "Corolla", RowID: "row1", Branch: "location1", DateListed: "2020-01-01", ListingUrl: "https://www.kennyupull.com/inventory/row1"}
+	subscription := Subscription{ID: 1, ClientID: "client1", VehicleID: 1}
+
+	testUrl := "https://alert-consumer-test.com"
+	t.Setenv("MAIN_ALERT_CONSUMER_URL", testUrl)
+
+	gock.New(testUrl).Post("").Times(maxSendAttempts).Reply(503).SetHeader("Retry-After", "1")
+
+	if SendUpdateToASubscriber(&inventoryListing, &subscription) {
+		t.Error("Expected the alert to be left to send again later")
+	}
+
+	if !gock.IsDone() {
+		t.Errorf("Expected the alert to be sent %d times", maxSendAttempts)
+	}
+
+	if len(*delays) != maxSendAttempts-1 {
+		t.Errorf("Expected to wait between each of the %d attempts, waited %v", maxSendAttempts, *delays)
+	}
+}
+
+func TestSendUpdateToASubscriber_DoesNotRetryRejectedAlert(t *testing.T) {
+	defer gock.Off()
+	delays := recordSleeps(t)
+	inventoryListing := kennyupull.InventoryListing{Year: "1996", Make: "Toyota", Model: "Corolla", RowID: "row1", Branch: "location1", DateListed: "2020-01-01", ListingUrl: "https://www.kennyupull.com/inventory/row1"}
+	subscription := Subscription{ID: 1, ClientID: "client1", VehicleID: 1}
+
+	testUrl := "https://alert-consumer-test.com"
+	t.Setenv("MAIN_ALERT_CONSUMER_URL", testUrl)
+
+	gock.New(testUrl).Post("").Reply(400)
+
+	if !SendUpdateToASubscriber(&inventoryListing, &subscription) {
+		t.Error("Expected an alert rejected for good to not be sent again")
+	}
+
+	if len(*delays) != 0 {
+		t.Errorf("Expected no retries, waited %v", *delays)
+	}
+}
+
+func TestDeliverNewListing_UpdatesVehicleOnceDelivered(t *testing.T) {
+	defer gock.Off()
+	recordSleeps(t)
+	db, mock, err := sqlmock.New(sqlmock.QueryMatcherOption(sqlmock.QueryMatcherEqual))
+	if err != nil {
+		t.Fatalf("an error '%s' was not expected when opening a stub database connection", err)
+	}
+	defer db.Close()
+
+	inventoryListing := kennyupull.InventoryListing{Year: "1996", Make: "Toyota", Model: "Corolla", RowID: "E28", Branch: "Ottawa", DateListed: "2020-01-01", ListingUrl: "https://www.kennyupull.com/inventory/E28"}
+	vehicle := Vehicle{ID: 1, Manufacturer: "Toyota", Model: "Corolla", Year: "1996", LastRowID: sql.NullString{String: "E27", Valid: true}, Location: sql.NullString{String: "Ottawa", Valid: true}}
+
+	testUrl := "https://alert-consumer-test.com"
+	t.Setenv("MAIN_ALERT_CONSUMER_URL", testUrl)
+
+	rows := sqlmock.NewRows([]string{"id", "client_id", "vehicle_id"}).AddRow(1, "client_id_1", 1)
+	mock.ExpectQuery("SELECT id, client_id, vehicle_id FROM subscription WHERE vehicle_id = ?").WithArgs(1).WillReturnRows(rows)
+	mock.ExpectExec("UPDATE vehicle SET last_row_id = ?, branch_location = ? WHERE id = ?").WithArgs("E28", "Ottawa", 1).WillReturnResult(sqlmock.NewResult(1, 1))
+	gock.New(testUrl).Post("").Reply(503).SetHeader("Retry-After", "1")
+	gock.New(testUrl).Post("").Reply(204)
+
+	if !DeliverNewListing(db, &inventoryListing, &vehicle) {
+		t.Error("Expected the listing to be delivered")
+	}
+
+	if vehicle.LastRowID.String != "E28" {
+		t.Errorf("Expected the vehicle's last row id to be E28, got %s", vehicle.LastRowID.String)
+	}
+
+	if err := mock.ExpectationsWereMet(); err != nil {
+		t.Errorf("there were unfulfilled expectations: %s", err)
+	}
+}
+
+func TestDeliverNewListing_KeepsVehicleWhenNotDelivered(t *testing.T) {
+	defer gock.Off()
+	recordSleeps(t)
+	db, mock, err := sqlmock.New(sqlmock.QueryMatcherOption(sqlmock.QueryMatcherEqual))
+	if err != nil {
+		t.Fatalf("an error '%s' was not expected when opening a stub database connection", err)
+	}
+	defer db.Close()
+
+	inventoryListing := kennyupull.InventoryListing{Year: "1996", Make: "Toyota", Model: "Corolla", RowID: "E28", Branch: "Ottawa", DateListed: "2020-01-01", ListingUrl: "https://www.kennyupull.com/inventory/E28"}
+	vehicle := Vehicle{ID: 1, Manufacturer: "Toyota", Model: "Corolla", Year: "1996", LastRowID: sql.NullString{String: "E27", Valid: true}, Location: sql.NullString{String: "Ottawa", Valid: true}}
+
+	testUrl := "https://alert-consumer-test.com"
+	t.Setenv("MAIN_ALERT_CONSUMER_URL", testUrl)
+
+	rows := sqlmock.NewRows([]string{"id", "client_id", "vehicle_id"}).AddRow(1, "client_id_1", 1).AddRow(2, "client_id_2", 1)
+	mock.ExpectQuery("SELECT id, client_id, vehicle_id FROM subscription WHERE vehicle_id = ?").WithArgs(1).WillReturnRows(rows)
+	// One subscriber gets the listing, the other never does.
+	gock.New(testUrl).Post("").Reply(204)
+	gock.New(testUrl).Post("").Times(maxSendAttempts).Reply(503)
+
+	if DeliverNewListing(db, &inventoryListing, &vehicle) {
+		t.Error("Expected the listing to not be delivered")
+	}
+
+	if vehicle.LastRowID.String != "E27" {
+		t.Errorf("Expected the vehicle's last row id to stay E27 so the listing is sent again, got %s", vehicle.LastRowID.String)
+	}
+
+	// No UPDATE of the vehicle is expected.
+	if err := mock.ExpectationsWereMet(); err != nil {
+		t.Errorf("there were unfulfilled expectations: %s", err)
+	}
+}
+
+func TestGetRetryDelay(t *testing.T) {
+	tests := map[string]time.Duration{
+		"":                              defaultRetryDelay,
+		"7":                             7 * time.Second,
+		"3600":                          maxRetryDelay,
+		"-1":                            0,
+		"Wed, 21 Oct 2015 07:28:00 GMT": 0,
+		"soon":                          defaultRetryDelay,
+	}
+
+	for retryAfter, expected := range tests {
+		resp := &http.Response{Header: http.Header{}}
+		if retryAfter != "" {
+			resp.Header.Set("Retry-After", retryAfter)
+		}
+
+		if delay := GetRetryDelay(resp); delay != expected {
+			t.Errorf("Expected a delay of %v for Retry-After %q, got %v", expected, retryAfter, delay)
+		}
+	}
+}
+
+func TestParseSubscriptionsPageParams(t *testing.T) {
+	tests := []struct {
+		afterID         string
+		limit           string
+		expectedAfterID int
+		expectedLimit   int
+		expectedErr     error
+	}{
+		{"", "", 0, defaultSubscriptionsPageLimit, nil},
+		{"42", "50", 42, 50, nil},
+		{"", "1", 0, 1, nil},
+		{"", "10000", 0, maxSubscriptionsPageLimit, nil},
+		{"", "10001", 0, 0, ErrInvalidLimit},
+		{"", "0", 0, 0, ErrInvalidLimit},
+		{"", "many", 0, 0, ErrInvalidLimit},
+		{"first", "", 0, 0, ErrInvalidAfterID},
+	}
+
+	for _, test := range tests {
+		afterID, limit, err := ParseSubscriptionsPageParams(test.afterID, test.limit)
+		if err != test.expectedErr || afterID != test.expectedAfterID || limit != test.expectedLimit {
+			t.Errorf(
+				"Expected (%d, %d, %v) for after_id %q and limit %q, got (%d, %d, %v)",
+				test.expectedAfterID, test.expectedLimit, test.expectedErr, test.afterID, test.limit, afterID, limit, err,
+			)
+		}
+	}
+}
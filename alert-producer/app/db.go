@@ -110,6 +110,34 @@ func GetAllSubscriptions(db *sql.DB, vehicle *Vehicle) []Subscription {
 	return subscribers
 }
 
+const subscriptionsPageQuery = "SELECT subscription.id, subscription.client_id, vehicle.manufacturer_name, vehicle.model_name, vehicle.model_year FROM subscription JOIN vehicle ON vehicle.id = subscription.vehicle_id WHERE subscription.client_id > ? OR (subscription.client_id = ? AND subscription.id > ?) ORDER BY subscription.client_id, subscription.id LIMIT ?"
+
+// Gets a page of subscriptions with their vehicle ordered by client id (then id) starting after the given subscription,
+// used to walk every subscription without loading them all at once.
+func GetSubscriptionsPage(db *sql.DB, afterClientID string, afterID int, limit int) ([]SubscribedVehicle, error) {
+	subscriptions := []SubscribedVehicle{}
+
+	rows, err := db.Query(subscriptionsPageQuery, afterClientID, afterClientID, afterID, limit)
+	if err != nil {
+		log.Println("Error getting a page of subscriptions from database", err)
+		return subscriptions, err
+	}
+	defer rows.Close()
+
+	for rows.Next() {
+		var subscription SubscribedVehicle
+		err = rows.Scan(&subscription.ID, &subscription.ClientID, &subscription.Manufacturer, &subscription.Model, &subscription.Year)
+		if err != nil {
+			log.Println("Error processing a page of subscriptions from database", err)
+			return subscriptions, err
+		}
+
+		subscriptions = append(subscriptions, subscription)
+	}
+
+	return subscriptions, rows.Err()
+}
+
 func CreateSubscription(db *sql.DB, vehicle *Vehicle, clientID string) (*Subscription, error) {
 	res, err := db.Exec("INSERT INTO subscription (client_id, vehicle_id) VALUES (?, ?)", clientID, vehicle.ID)
 	if err != nil {
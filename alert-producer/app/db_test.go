@@ -3,6 +3,7 @@ package app
 import (
 	"database/sql"
 	"errors"
+	"strings"
 	"testing"
 
 	"github.com/DATA-DOG/go-sqlmock"
@@ -481,3 +482,119 @@ func TestDeleteDeleteSubscription_ExpectedQueriesCalled(t *testing.T) {
 }
 
 // TODO do rest of functions.
+
+func TestGetSubscriptionsPage_SubscriptionsFound(t *testing.T) {
+	db, mock, err := sqlmock.New(sqlmock.QueryMatcherOption(sqlmock.QueryMatcherEqual))
+	if err != nil {
+		t.Fatalf("an error '%s' was not expected when opening a stub database connection", err)
+	}
+	defer db.Close()
+
+	rows := sqlmock.NewRows([]string{"id", "client_id", "manufacturer_name", "model_name", "model_year"}).AddRow(2, "b", "Ford", "F-150", "2018").AddRow(3, "c", "Honda", "Civic", "2001")
+
+	mock.ExpectQuery(subscriptionsPageQuery).WithArgs("a", "a", 1, 2).WillReturnRows(rows)
+
+	subscriptions, err := GetSubscriptionsPage(db, "a", 1, 2)
+
+	if err != nil {
+		t.Errorf("Expected no error, got %s", err)
+	}
+
+	if len(subscriptions) != 2 {
+		t.Fatalf("Expected 2 subscriptions, got %d", len(subscriptions))
+	}
+
+	if subscriptions[1].ClientID != "c" || subscriptions[1].Manufacturer != "Honda" || subscriptions[1].Year != "2001" {
+		t.Errorf("Expected the second subscription to be c's Honda, got %v", subscriptions[1])
+	}
+
+	if err := mock.ExpectationsWereMet(); err != nil {
+		t.Errorf("there were unfulfilled expectations: %s", err)
+	}
+}
+
+func TestGetSubscriptionsPage_Error(t *testing.T) {
+	db, mock, err := sqlmock.New(sqlmock.QueryMatcherOption(sqlmock.QueryMatcherEqual))
+	if err != nil {
+		t.Fatalf("an error '%s' was not expected when opening a stub database connection", err)
+	}
+	defer db.Close()
+
+	mock.ExpectQuery(subscriptionsPageQuery).WithArgs("", "", 0, 10).WillReturnError(errors.New("error"))
+
+	_, err = GetSubscriptionsPage(db, "", 0, 10)
+
+	if err == nil {
+		t.Errorf("Expected an error, got none")
+	}
+
+	if err := mock.ExpectationsWereMet(); err != nil {
+		t.Errorf("there were unfulfilled expectations: %s", err)
+	}
+}
+
+func TestGetSubscriptionsPage_OrdersByClientIDThenID(t *testing.T) {
+	// The cursor of the next page is the (client_id, id) of the last subscription of a page, so the pages must be ordered
+	// by both and start strictly after the cursor.
+	if !strings.Contains(subscriptionsPageQuery, "WHERE subscription.client_id > ? OR (subscription.client_id = ? AND subscription.id > ?)") {
+		t.Errorf("Expected the page to start after the (client_id, id) cursor, got %s", subscriptionsPageQuery)
+	}
+
+	if !strings.HasSuffix(subscriptionsPageQuery, "ORDER BY subscription.client_id, subscription.id LIMIT ?") {
+		t.Errorf("Expected the page to be ordered by client_id then id, got %s", subscriptionsPageQuery)
+	}
+}
+
+func TestGetSubscriptionsPage_WalksEveryPage(t *testing.T) {
+	db, mock, err := sqlmock.New(sqlmock.QueryMatcherOption(sqlmock.QueryMatcherEqual))
+	if err != nil {
+		t.Fatalf("an error '%s' was not expected when opening a stub database connection", err)
+	}
+	defer db.Close()
+
+	columns := []string{"id", "client_id", "manufacturer_name", "model_name", "model_year"}
+	// A client with subscriptions on both sides of a page boundary.
+	mock.ExpectQuery(subscriptionsPageQuery).WithArgs("", "", 0, 2).WillReturnRows(
+		sqlmock.NewRows(columns).AddRow(4, "a", "Ford", "F-150", "2018").AddRow(7, "b", "Honda", "Civic", "2001"),
+	)
+	mock.ExpectQuery(subscriptionsPageQuery).WithArgs("b", "b", 7, 2).WillReturnRows(
+		sqlmock.NewRows(columns).AddRow(9, "b", "Toyota", "Corolla", "1996").AddRow(2, "c", "Honda", "Accord", "2005"),
+	)
+	mock.ExpectQuery(subscriptionsPageQuery).WithArgs("c", "c", 2, 2).WillReturnRows(sqlmock.NewRows(columns))
+
+	var walked []int
+	afterClientID, afterID := "", 0
+	for {
+		subscriptions, err := GetSubscriptionsPage(db, afterClientID, afterID, 2)
+		if err != nil {
+			t.Fatalf("Expected no error, got %s", err)
+		}
+
+		if len(subscriptions) == 0 {
+			break
+		}
+
+		for _, subscription := range subscriptions {
+			walked = append(walked, subscription.ID)
+		}
+
+		last := subscriptions[len(subscriptions)-1]
+		afterClientID, afterID = last.ClientID, last.ID
+	}
+
+	expected := []int{4, 7, 9, 2}
+	if len(walked) != len(expected) {
+		t.Fatalf("Expected to walk the subscriptions %v, got %v", expected, walked)
+	}
+
+	for i := range expected {
+		if walked[i] != expected[i] {
+			t.Errorf("Expected to walk the subscriptions %v, got %v", expected, walked)
+			break
+		}
+	}
+
+	if err := mock.ExpectationsWereMet(); err != nil {
+		t.Errorf("there were unfulfilled expectations: %s", err)
+	}
+}
@@ -23,3 +23,11 @@ type VehicleSubscription struct {
 	Year         string `json:"year"`
 	ClientID     string `json:"client_id"`
 }
+
+type SubscribedVehicle struct {
+	ID           int    `json:"id"`
+	ClientID     string `json:"client_id"`
+	Manufacturer string `json:"manufacturer"`
+	Model        string `json:"model"`
+	Year         string `json:"year"`
+}
@@ -42,10 +42,27 @@ func unsubscribeToVehicle(c *gin.Context) {
 	c.IndentedJSON(http.StatusOK, vehicleToUnsubscribeFrom)
 }
 
+func listSubscriptions(c *gin.Context) {
+	afterID, limit, err := app.ParseSubscriptionsPageParams(c.Query("after_id"), c.Query("limit"))
+	if err != nil {
+		c.JSON(http.StatusBadRequest, gin.H{"error": err.Error()})
+		return
+	}
+
+	subscriptions, err := app.ListSubscriptions(c.Query("after_client_id"), afterID, limit)
+	if err != nil {
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Error listing subscriptions"})
+		return
+	}
+
+	c.JSON(http.StatusOK, gin.H{"results": subscriptions})
+}
+
 func main() {
 	router := gin.Default()
 	router.POST("/v1/subscribe-vehicle", subscribeToVehicle)
 	router.DELETE("/v1/unsubscribe-from-vehicle", unsubscribeToVehicle)
+	router.GET("/v1/subscriptions", listSubscriptions)
 
 	app.LoadEnv()
 
@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from simple_history.admin import SimpleHistoryAdmin
 
-from alerts.models import Vehicle, Alert
+from alerts.models import Vehicle, Alert, SubscriptionOutboxEntry
 
 
 class AlertAdmin(SimpleHistoryAdmin):
@@ -11,7 +11,10 @@ class AlertAdmin(SimpleHistoryAdmin):
     """
 
     model = Alert
+    # The alerts are listed with their user and vehicle rather than querying them for every row.
+    list_select_related = ("user", "vehicle")
 
 
 admin.site.register(Alert, AlertAdmin)
 admin.site.register(Vehicle)
+admin.site.register(SubscriptionOutboxEntry)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AlertsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "alerts"
+
+    def ready(self):
+        # Keep the cached lists of alerts in sync with the alerts.
+        import alerts.signals  # noqa: F401
@@ -0,0 +1,121 @@
+import logging
+import time
+from typing import Optional
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+from alerts.constants import ALERT_LIST_CACHE_KEY_PREFIX
+from user_watch.metrics import ALERT_LIST_CACHE_LOOKUPS, get_registry
+
+logger = logging.getLogger(__name__)
+
+# The cache being unavailable should never fail reading or writing the alerts, the list is read from the database instead
+# and a failed invalidation is logged.
+
+
+def _version_key(user_id: int) -> str:
+    return f"{ALERT_LIST_CACHE_KEY_PREFIX}:{user_id}:version"
+
+
+def _list_key(user_id: int, version: int) -> str:
+    return f"{ALERT_LIST_CACHE_KEY_PREFIX}:{user_id}:{version}"
+
+
+def get_alert_list_version(user_id: int) -> Optional[int]:
+    """
+    Get the current version of the user's cached list of alerts. Every write to the user's alerts moves to a new version
+    so a list serialized by a reader that raced with a writer is stored under a version that is never read again.
+
+    :param user_id: The id of the user.
+    :return: The current version, None if the cache is unavailable.
+    """
+    version_key = _version_key(user_id)
+    try:
+        version = cache.get(version_key)
+        if version is None:
+            # Start from the current time rather than 1 so a version key that was evicted never comes back to a version
+            # that still has a list cached under it.
+            cache.add(version_key, time.time_ns(), timeout=None)
+            version = cache.get(version_key)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to get the version of the cached alert list of user {user_id} with error {e}")
+        return None
+
+    return version
+
+
+def get_cached_alert_list(user_id: int, version: Optional[int]) -> Optional[list[dict]]:
+    """
+    Get the user's serialized list of alerts from the cache and record whether it was a hit or a miss.
+
+    :param user_id: The id of the user.
+    :param version: The version of the list to get, from get_alert_list_version.
+    :return: The serialized list of alerts, None if it isn't cached or the cache is unavailable.
+    """
+    if version is None:
+        return None
+
+    try:
+        alert_list = cache.get(_list_key(user_id, version))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to get the cached alert list of user {user_id} with error {e}")
+        return None
+
+    # Counted in the process rather than in the cache so a read doesn't cost another round trip to Redis.
+    ALERT_LIST_CACHE_LOOKUPS.labels(result="miss" if alert_list is None else "hit").inc()
+
+    return alert_list
+
+
+def set_cached_alert_list(user_id: int, version: Optional[int], alert_list: list[dict]):
+    """
+    Cache the user's serialized list of alerts.
+
+    :param user_id: The id of the user.
+    :param version: The version the list was built for, from get_alert_list_version. Nothing is cached when None.
+    :param alert_list: The serialized list of alerts.
+    """
+    if version is None:
+        return
+
+    try:
+        cache.set(_list_key(user_id, version), alert_list, timeout=settings.ALERT_LIST_CACHE_TIMEOUT_SECONDS)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to cache the alert list of user {user_id} with error {e}")
+
+
+def invalidate_alert_list(user_id: int):
+    """
+    Invalidate the user's cached list of alerts by moving to a new version.
+
+    :param user_id: The id of the user.
+    """
+    version_key = _version_key(user_id)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # Nothing was cached for the user, the next read starts a new version.
+        pass
+    except redis.RedisError as e:
+        logger.error(f"Failed to invalidate the cached alert list of user {user_id} with error {e}")
+
+
+def get_alert_list_cache_stats() -> dict:
+    """
+    Get how often the cached lists of alerts were found in the cache, from the Prometheus metrics (added up across every
+    process in multiprocess mode).
+
+    :return: The number of hits, misses and the hit ratio (None before the first read).
+    """
+    lookups = {"hit": 0, "miss": 0}
+    for metric in get_registry().collect():
+        for sample in metric.samples:
+            if sample.name == "user_watch_alert_list_cache_lookups_total" and sample.labels.get("result") in lookups:
+                lookups[sample.labels["result"]] += int(sample.value)
+
+    hits, misses = lookups["hit"], lookups["miss"]
+    total = hits + misses
+
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else None}
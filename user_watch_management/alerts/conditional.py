@@ -0,0 +1,67 @@
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Count, Max
+
+from alerts.models import Alert
+
+
+def _get_alerts_validator(request) -> tuple[int, Optional[datetime]]:
+    """
+    Get the number of alerts the user has and when the most recent of them was modified with a single query. The result
+    is kept on the request since both the ETag and the Last-Modified of the response are built from it.
+    """
+    if not hasattr(request, "alerts_validator"):
+        aggregate = Alert.objects.filter(user=request.user.id).aggregate(count=Count("id"), last_modified=Max("modified"))
+        request.alerts_validator = (aggregate["count"], aggregate["last_modified"])
+
+    return request.alerts_validator
+
+
+def alerts_etag(request) -> str:
+    """
+    Build the ETag of the user's list of alerts. The count is part of it so deleting an alert also changes the ETag.
+    """
+    count, last_modified = _get_alerts_validator(request)
+    last_modified_timestamp = last_modified.timestamp() if last_modified else 0
+
+    return f'"alerts-{request.user.id}-{count}-{last_modified_timestamp}"'
+
+
+def alerts_last_modified(request) -> Optional[datetime]:
+    """
+    Get when the user's list of alerts was last modified. Deleting an alert doesn't move it, clients are expected to send
+    the ETag (If-None-Match) which does catch deletions and takes precedence over If-Modified-Since.
+    """
+    _, last_modified = _get_alerts_validator(request)
+
+    return last_modified
+
+
+def _get_alert_modified(request, alert_id: int) -> Optional[datetime]:
+    """
+    Get when the user's alert was last modified, None if the user has no such alert. The result is kept on the request
+    since both the ETag and the Last-Modified of the response are built from it.
+    """
+    if not hasattr(request, "alert_modified"):
+        request.alert_modified = Alert.objects.filter(user=request.user.id, id=alert_id).values_list("modified", flat=True).first()
+
+    return request.alert_modified
+
+
+def alert_etag(request, alert_id: int) -> Optional[str]:
+    """
+    Build the ETag of one of the user's alerts, None if the user has no such alert.
+    """
+    modified = _get_alert_modified(request, alert_id)
+    if modified is None:
+        return None
+
+    return f'"alert-{alert_id}-{modified.timestamp()}"'
+
+
+def alert_last_modified(request, alert_id: int) -> Optional[datetime]:
+    """
+    Get when one of the user's alerts was last modified, None if the user has no such alert.
+    """
+    return _get_alert_modified(request, alert_id)
@@ -5,3 +5,18 @@ MIN_CHAR_FOR_YEAR = 4
 # API Message constants
 ALERT_NOT_UPDATED_MESSAGE = "Alert not updated"
 ALERT_DOES_NOT_EXIST_MESSAGE = "Alert does not exist"
+INVALID_CURSOR_MESSAGE = "Invalid cursor"
+INVALID_PAGE_SIZE_MESSAGE = "Invalid page size"
+INVALID_ALERT_ID_MESSAGE = "Invalid alert id"
+INVALID_DIGEST_MESSAGE = "Invalid digest, expected true or false"
+
+# Pagination constants
+DEFAULT_ALERTS_PAGE_SIZE = 50
+MAX_ALERTS_PAGE_SIZE = 200
+
+# Bulk constants
+MAX_BULK_ALERT_OPERATIONS = 100
+INVALID_BULK_ALERTS_MESSAGE = f"Expected a list of 1 to {MAX_BULK_ALERT_OPERATIONS} alert operations"
+
+# Cache constants
+ALERT_LIST_CACHE_KEY_PREFIX = "alerts:list"
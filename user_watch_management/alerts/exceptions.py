@@ -1,6 +1,19 @@
-
 class SubscriptionFailureException(Exception):
     """Exception raised when a subscription fails to be created or updated."""
 
     def __init__(self, message):
         self.message = message
+
+
+class InvalidCursorException(Exception):
+    """Exception raised when a pagination cursor can not be decoded."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class OutOfOrderException(Exception):
+    """Exception raised when subscriptions to reconcile are not ordered by client_id, so they can't be compared safely."""
+
+    def __init__(self, message):
+        self.message = message
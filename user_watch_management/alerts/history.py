@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils.deprecation import MiddlewareMixin
+from simple_history.models import HistoricalRecords
+
+from user_watch.async_utils import sync_context
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class HistoryBatch:
+    """
+    The history records captured during a history_batch() scope, written with one bulk insert per history model when the
+    scope ends.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.is_closed = False
+
+    def add(self, historical_records: "DeferredHistoricalRecords", history_instance, instance, using: Optional[str]):
+        self.records.append((historical_records, history_instance, instance, using))
+
+        if self.is_closed:
+            # The change was committed after the scope ended (ex: by a transaction wrapping it), write it right away.
+            self.flush_safely()
+
+    def flush(self) -> int:
+        """
+        Write every captured history record.
+
+        :return: The number of history records written.
+        """
+        records, self.records = self.records, []
+
+        records_by_model = defaultdict(list)
+        for record in records:
+            historical_records, history_instance, instance, using = record
+            records_by_model[(type(history_instance), using)].append(record)
+
+        for (history_model, using), model_records in records_by_model.items():
+            history_model._default_manager.db_manager(using).bulk_create([history_instance for _, history_instance, _, _ in model_records])
+
+            for historical_records, history_instance, instance, _ in model_records:
+                historical_records.create_historical_record_m2ms(history_instance, instance)
+
+        return len(records)
+
+    def flush_safely(self):
+        """
+        Write every captured history record, logging rather than raising on failure since the changes themselves are
+        already committed.
+        """
+        try:
+            self.flush()
+        except Exception as e:
+            logger.exception(f"Failed to write deferred history records with error {e}")
+
+
+def get_current_history_batch() -> Optional[HistoryBatch]:
+    return getattr(_local, "batch", None)
+
+
+@contextmanager
+def history_batch() -> Iterator[HistoryBatch]:
+    """
+    Capture the history records of the models using DeferredHistoricalRecords in memory and write them with one bulk
+    insert when the scope ends, if ALERT_HISTORY_DEFERRED is on. Nested scopes share the outermost batch.
+
+    :return: The batch the history records are captured in.
+    """
+    batch = get_current_history_batch()
+    if batch is not None:
+        yield batch
+        return
+
+    _local.batch = batch = HistoryBatch()
+    try:
+        yield batch
+    finally:
+        _local.batch = None
+        batch.is_closed = True
+        batch.flush_safely()
+
+
+class HistoryBatchMiddleware(MiddlewareMixin):
+    """
+    Write the history records captured while handling a request with one bulk insert once it is handled, see history_batch.
+    Under ASGI it runs as async middleware and opens the batch in the thread the views make their changes in.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not settings.ALERT_HISTORY_DEFERRED:
+            return self.get_response(request)
+
+        with history_batch():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not settings.ALERT_HISTORY_DEFERRED:
+            return await self.get_response(request)
+
+        async with sync_context(history_batch()):
+            return await self.get_response(request)
+
+
+class DeferredHistoricalModel(models.Model):
+    """
+    The base of the history models of DeferredHistoricalRecords, whose records are captured instead of saved while
+    DeferredHistoricalRecords.create_historical_record defers them.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        captured = getattr(_local, "captured", None)
+        if captured is None:
+            return super().save(*args, **kwargs)
+
+        captured.append((self, kwargs.get("using")))
+
+
+class DeferredHistoricalRecords(HistoricalRecords):
+    """
+    Historical records that are captured in memory and written in bulk at the end of the current history_batch() scope
+    (ex: the request) instead of with one INSERT per save or delete, when ALERT_HISTORY_DEFERRED is on.
+
+    A history record is only captured once the transaction that made the change commits so a rolled back change never
+    gets one, and it is built when the change is made (by HistoricalRecords.create_historical_record, whose save of the
+    record is captured) so it holds exactly what an immediately written record would. Its pre_create_historical_record
+    and post_create_historical_record signals are sent when the change is made, its many to many history when it is
+    written. Outside of a history_batch() scope records are written right away like HistoricalRecords.
+    """
+
+    def __init__(self, *args, bases=(models.Model,), **kwargs):
+        super().__init__(*args, bases=(DeferredHistoricalModel, *bases), **kwargs)
+
+    def create_historical_record(self, instance, history_type, using=None):
+        batch = get_current_history_batch()
+        if not settings.ALERT_HISTORY_DEFERRED or batch is None:
+            return super().create_historical_record(instance, history_type, using=using)
+
+        _local.captured = captured = []
+        try:
+            super().create_historical_record(instance, history_type, using=using)
+        finally:
+            _local.captured = None
+
+        for history_instance, history_using in captured:
+            transaction.on_commit(partial(batch.add, self, history_instance, instance, history_using), using=instance._state.db)
+
+    def create_historical_record_m2ms(self, history_instance, instance):
+        # The many to many history of a captured record is written once the record is, see HistoryBatch.flush.
+        if getattr(_local, "captured", None) is None:
+            super().create_historical_record_m2ms(history_instance, instance)
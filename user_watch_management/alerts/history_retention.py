@@ -0,0 +1,134 @@
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from alerts.models import Alert
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryArchive:
+    """
+    A gzip compressed NDJSON file the pruned history records are written to, one JSON object per line. Every chunk written
+    is flushed to disk before it is deleted from the database, so a crash can at worst archive a chunk twice.
+
+    :param path: The path of the file to create.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = None
+        self.__gzip_file = None
+
+    def write(self, records: list[dict]):
+        """
+        Write records to the archive and flush them to disk, the file is only created with the first records.
+
+        :param records: The records to write.
+        """
+        if self.__file is None:
+            self.__file = open(self.path, "xb")
+            self.__gzip_file = gzip.GzipFile(fileobj=self.__file, mode="wb")
+
+        self.__gzip_file.write("".join(f"{json.dumps(record, cls=DjangoJSONEncoder)}\n" for record in records).encode())
+        self.__gzip_file.flush()
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    def close(self):
+        if self.__file is not None:
+            self.__gzip_file.close()
+            self.__file.close()
+
+
+def get_archive_path(archive_dir: str, cutoff: datetime) -> str:
+    """
+    Get the path of the archive of a run, named after the cutoff and the time of the run so runs never share a file.
+
+    :param archive_dir: The directory to write the archive to.
+    :param cutoff: The date the pruned records are older than.
+    :return: The path of the archive.
+    """
+    date_format = "%Y%m%dT%H%M%S"
+    return os.path.join(
+        archive_dir, f"alert-history-before-{cutoff.strftime(date_format)}-{timezone.now().strftime(date_format)}.ndjson.gz"
+    )
+
+
+def prune_alert_history(
+    max_age_days: int,
+    chunk_size: int,
+    sleep_seconds: float = 0,
+    archive_dir: Optional[str] = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Delete the alert history records older than max_age_days, archiving them first if archive_dir is set. Records are
+    handled chunk_size at a time walking up the primary key, each chunk deleted in its own short statement with a pause of
+    sleep_seconds in between so the table is never locked for long and other queries get through.
+
+    :param max_age_days: The age in days past which a history record is pruned.
+    :param chunk_size: The number of history records to archive and delete at once.
+    :param sleep_seconds: The number of seconds to wait between chunks.
+    :param archive_dir: The directory to write the records to as gzip compressed NDJSON before deleting them, they are
+    deleted without being archived when not set.
+    :param dry_run: Only count the records that would be pruned.
+    :return: The number of records pruned, the archive they were written to, how long it took and the rows per second.
+    """
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+    history = Alert.history.filter(history_date__lt=cutoff).order_by("history_id")
+    archive = HistoryArchive(get_archive_path(archive_dir, cutoff)) if archive_dir and not dry_run else None
+
+    number_pruned = 0
+    last_history_id = 0
+    started = time.monotonic()
+    try:
+        while True:
+            if dry_run:
+                chunk = list(history.filter(history_id__gt=last_history_id).values_list("history_id", flat=True)[:chunk_size])
+                history_ids = chunk
+            else:
+                chunk = list(history.filter(history_id__gt=last_history_id).values()[:chunk_size])
+                history_ids = [record["history_id"] for record in chunk]
+
+            if not history_ids:
+                break
+
+            if not dry_run:
+                if archive is not None:
+                    archive.write(chunk)
+
+                Alert.history.filter(history_id__in=history_ids).delete()
+
+            number_pruned += len(history_ids)
+            last_history_id = history_ids[-1]
+
+            if len(history_ids) < chunk_size:
+                break
+
+            if sleep_seconds:
+                time.sleep(sleep_seconds)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    seconds = time.monotonic() - started
+    rows_per_second = number_pruned / seconds if seconds else 0
+    logger.info(
+        f"Pruned {number_pruned} alert history records older than {cutoff} in {seconds:.2f}s ({rows_per_second:.0f} rows/s)"
+        f"{' (dry run)' if dry_run else ''}"
+    )
+
+    return {
+        "pruned": number_pruned,
+        "archive": archive.path if archive is not None and number_pruned else None,
+        "seconds": seconds,
+        "rows_per_second": rows_per_second,
+    }
@@ -0,0 +1,77 @@
+import json
+import statistics
+import time
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.http import JsonResponse
+
+from alerts.models import Alert, Vehicle
+from alerts.responses import orjson, FastJsonResponse
+from alerts.serializers import ALERT_VALUES_FIELDS, AlertSerializer, serialize_alerts
+
+
+def serializer_path(user: User) -> bytes:
+    alerts = Alert.objects.filter(user=user).select_related("vehicle")
+    return JsonResponse(AlertSerializer(alerts, many=True).data, safe=False).content
+
+
+def fast_path(user: User) -> bytes:
+    alerts = Alert.objects.filter(user=user).values(*ALERT_VALUES_FIELDS)
+    return FastJsonResponse(serialize_alerts(alerts)).content
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare serializing a user's alerts with AlertSerializer and JsonResponse to the values() and orjson fast path. "
+        "The alerts are created in a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="The numbers of alerts to serialize.")
+        parser.add_argument("--repeat", type=int, default=20, help="The number of times to time each path for each size.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        encoder = "orjson" if orjson is not None else "json (orjson is not installed)"
+        self.stdout.write(f"Encoding the fast path with {encoder}, median of {options['repeat']} runs.")
+
+        with transaction.atomic():
+            for size in options["sizes"]:
+                self.__benchmark(size, options["repeat"])
+
+            transaction.set_rollback(True)
+
+    def __benchmark(self, size: int, repeat: int):
+        user = User.objects.create_user(f"benchmark-{uuid4()}", password=str(uuid4()))
+        vehicles = [
+            Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_name="Corolla", model_year=str(1990 + year))
+            for year in range(10)
+        ]
+        Alert.objects.bulk_create(
+            [Alert(user=user, vehicle=vehicles[index % len(vehicles)], branch="Ottawa" if index % 2 else None) for index in range(size)]
+        )
+
+        if json.loads(serializer_path(user)) != json.loads(fast_path(user)):
+            raise CommandError(f"The two paths serialized {size} alerts differently.")
+
+        timings = {}
+        for name, path in (("serializer", serializer_path), ("fast", fast_path)):
+            durations = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                path(user)
+                durations.append(time.perf_counter() - started)
+
+            timings[name] = statistics.median(durations) * 1000
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{size} alerts: serializer {timings['serializer']:.2f}ms, fast {timings['fast']:.2f}ms "
+                f"({timings['serializer'] / timings['fast']:.1f}x)"
+            )
+        )
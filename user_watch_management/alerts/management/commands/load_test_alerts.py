@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from user_watch.percentiles import get_percentile
+
+
+def run_load_test(url: str, method: str, number_of_requests: int, concurrency: int, headers: dict, body: Optional[str] = None) -> dict:
+    """
+    Send number_of_requests requests to url from concurrency threads at once, each thread reusing its own connection.
+
+    :param url: The URL to send the requests to.
+    :param method: The HTTP method of the requests.
+    :param number_of_requests: The total number of requests to send.
+    :param concurrency: The number of requests in flight at once.
+    :param headers: The headers of every request.
+    :param body: The body of every request.
+    :return: The number of requests per second, the latency percentiles in milliseconds and the count of each status code
+    (or error).
+    """
+    local = threading.local()
+
+    def send(_) -> tuple[str, float]:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+
+        started = time.perf_counter()
+        try:
+            response = local.session.request(method, url, headers=headers, data=body, timeout=30)
+            outcome = str(response.status_code)
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+
+        return outcome, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(number_of_requests)))
+    seconds = time.perf_counter() - started
+
+    durations = [duration for _, duration in results]
+    return {
+        "requests_per_second": number_of_requests / seconds,
+        "p50": get_percentile(durations, 50),
+        "p95": get_percentile(durations, 95),
+        "p99": get_percentile(durations, 99),
+        "outcomes": Counter(outcome for outcome, _ in results),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent requests to a running deployment and report its throughput and latency, to compare the WSGI "
+        "deployment with the ASGI one (uvicorn user_watch.asgi:application) under the same load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000", help="The base URL of the deployment.")
+        parser.add_argument("--path", default="/alerts/v1/get-alerts", help="The path to send the requests to.")
+        parser.add_argument("--method", default="GET", help="The HTTP method of the requests.")
+        parser.add_argument("--body", help="The JSON body of the requests.")
+        parser.add_argument("--requests", type=int, default=1000, help="The total number of requests to send.")
+        parser.add_argument("--concurrency", type=int, default=50, help="The number of requests in flight at once.")
+        parser.add_argument("--token", help="The access token to authenticate the requests with.")
+        parser.add_argument("--username", help="The user to get an access token for, instead of --token.")
+        parser.add_argument("--password", help="The password of --username.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1.")
+
+        base_url = options["url"].rstrip("/")
+        headers = {"Content-Type": "application/json"}
+
+        token = options["token"]
+        if options["username"]:
+            response = requests.post(
+                f"{base_url}/api/v1/token/", json={"username": options["username"], "password": options["password"]}, timeout=30
+            )
+            if not response.ok:
+                raise CommandError(f"Could not get an access token, the deployment responded with {response.status_code}.")
+            token = response.json()["access"]
+
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        result = run_load_test(
+            url=f"{base_url}{options['path']}",
+            method=options["method"].upper(),
+            number_of_requests=options["requests"],
+            concurrency=options["concurrency"],
+            headers=headers,
+            body=options["body"],
+        )
+
+        outcomes = ", ".join(f"{outcome}: {count}" for outcome, count in sorted(result["outcomes"].items()))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['requests']} requests with {options['concurrency']} at once: {result['requests_per_second']:.1f} req/s, "
+                f"p50 {result['p50']:.1f}ms, p95 {result['p95']:.1f}ms, p99 {result['p99']:.1f}ms ({outcomes})"
+            )
+        )
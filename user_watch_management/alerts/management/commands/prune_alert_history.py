@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from alerts.history_retention import prune_alert_history
+
+
+class Command(BaseCommand):
+    help = "Delete the alert history older than the retention period in chunks, optionally archiving it first."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.ALERT_HISTORY_RETENTION_DAYS,
+            help="The age in days past which a history record is pruned.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.ALERT_HISTORY_PRUNE_CHUNK_SIZE,
+            help="The number of history records to archive and delete at once.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=settings.ALERT_HISTORY_PRUNE_SLEEP_SECONDS,
+            help="The number of seconds to wait between chunks.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.ALERT_HISTORY_ARCHIVE_DIR or None,
+            help="The directory to write the history records to as gzip compressed NDJSON before deleting them.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the history records that would be pruned.")
+
+    def handle(self, *args, **options):
+        result = prune_alert_history(
+            max_age_days=options["days"],
+            chunk_size=options["chunk_size"],
+            sleep_seconds=options["sleep"],
+            archive_dir=options["archive_dir"],
+            dry_run=options["dry_run"],
+        )
+        archived = f" and archived them to {result['archive']}" if result["archive"] else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would prune' if options['dry_run'] else 'Pruned'} {result['pruned']} alert history records{archived} in "
+                f"{result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)."
+            )
+        )
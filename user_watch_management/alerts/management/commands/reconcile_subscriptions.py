@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from alerts.reconciliation import reconcile_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Bring the alert producer's subscriptions back in line with the alerts, only sending the differences."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.SUBSCRIPTION_RECONCILE_CHUNK_SIZE,
+            help="The number of subscriptions to compare and send at once.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the differences without sending them.")
+
+    def handle(self, *args, **options):
+        counts = reconcile_subscriptions(chunk_size=options["chunk_size"], dry_run=options["dry_run"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Added {counts['added']}, removed {counts['removed']} and left {counts['unchanged']} subscriptions alone "
+                f"({counts['skipped']} skipped, {counts['errors']} errors)."
+            )
+        )
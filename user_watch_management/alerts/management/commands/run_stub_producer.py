@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from alerts.producer_stub import StubProducerServer
+
+
+class Command(BaseCommand):
+    help = "Run an in memory stand-in for the alert producer's subscription API to develop and benchmark offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="The host to listen on.")
+        parser.add_argument("--port", type=int, default=8080, help="The port to listen on.")
+        parser.add_argument("--latency", type=float, default=0, help="The number of seconds to wait before answering each request.")
+        parser.add_argument("--failure-rate", type=float, default=0, help="The share of requests (0 to 1) answered with a 503.")
+
+    def handle(self, *args, **options):
+        server = StubProducerServer(
+            host=options["host"], port=options["port"], latency=options["latency"], failure_rate=options["failure_rate"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Serving a stub alert producer at {server.url}"))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f"Handled {server.number_of_requests} requests.")
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alerts", "0002_alert_external_id_historicalalert_external_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="digest",
+            field=models.BooleanField(
+                default=False,
+                help_text="If the user wants the listings for this alert grouped into a periodic digest email instead of one email per listing.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="historicalalert",
+            name="digest",
+            field=models.BooleanField(
+                default=False,
+                help_text="If the user wants the listings for this alert grouped into a periodic digest email instead of one email per listing.",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alerts", "0003_alert_digest_historicalalert_digest"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(fields=["user", "created", "id"], name="alert_user_created_id_idx"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alerts", "0004_alert_alert_user_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vehicle",
+            name="manufacturer_key",
+            field=models.CharField(
+                default="", editable=False, help_text="The normalized manufacturer name (example toyota).", max_length=64
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="vehicle",
+            name="model_key",
+            field=models.CharField(default="", editable=False, help_text="The normalized model name (example corolla).", max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="vehicle",
+            name="year_key",
+            field=models.CharField(default="", editable=False, help_text="The normalized model year (example 1996).", max_length=4),
+            preserve_default=False,
+        ),
+    ]
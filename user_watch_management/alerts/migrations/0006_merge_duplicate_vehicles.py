@@ -0,0 +1,72 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Min
+
+CHUNK_SIZE = 1000
+
+
+def normalize_vehicle_value(value) -> str:
+    # A copy of alerts.models.normalize_vehicle_value so the migration doesn't change if the model code does.
+    return str(value or "").strip().lower()
+
+
+def fill_vehicle_keys(apps, schema_editor):
+    Vehicle = apps.get_model("alerts", "Vehicle")
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            vehicles = list(Vehicle.objects.filter(id__gt=last_id).order_by("id")[:CHUNK_SIZE])
+            if not vehicles:
+                return
+
+            for vehicle in vehicles:
+                vehicle.manufacturer_key = normalize_vehicle_value(vehicle.manufacturer_name)
+                vehicle.model_key = normalize_vehicle_value(vehicle.model_name)
+                vehicle.year_key = normalize_vehicle_value(vehicle.model_year)
+
+            Vehicle.objects.bulk_update(vehicles, ["manufacturer_key", "model_key", "year_key"])
+
+        last_id = vehicles[-1].id
+
+
+def merge_duplicate_vehicles(apps, schema_editor):
+    Vehicle = apps.get_model("alerts", "Vehicle")
+    Alert = apps.get_model("alerts", "Alert")
+    HistoricalAlert = apps.get_model("alerts", "HistoricalAlert")
+
+    duplicate_groups = list(
+        Vehicle.objects.values("manufacturer_key", "model_key", "year_key")
+        .annotate(number_of_vehicles=Count("id"), canonical_id=Min("id"))
+        .filter(number_of_vehicles__gt=1)
+        .order_by("canonical_id")
+    )
+
+    for start in range(0, len(duplicate_groups), CHUNK_SIZE):
+        # Each chunk is its own transaction so the rows of a large table are never all locked at once.
+        with transaction.atomic():
+            for group in duplicate_groups[start : start + CHUNK_SIZE]:
+                duplicate_ids = list(
+                    Vehicle.objects.filter(
+                        manufacturer_key=group["manufacturer_key"], model_key=group["model_key"], year_key=group["year_key"]
+                    )
+                    .exclude(id=group["canonical_id"])
+                    .values_list("id", flat=True)
+                )
+
+                Alert.objects.filter(vehicle_id__in=duplicate_ids).update(vehicle_id=group["canonical_id"])
+                HistoricalAlert.objects.filter(vehicle_id__in=duplicate_ids).update(vehicle_id=group["canonical_id"])
+                Vehicle.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # The vehicles are updated in chunks, each in their own transaction.
+    atomic = False
+
+    dependencies = [
+        ("alerts", "0005_vehicle_manufacturer_key_vehicle_model_key_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_vehicle_keys, migrations.RunPython.noop),
+        migrations.RunPython(merge_duplicate_vehicles, migrations.RunPython.noop),
+    ]
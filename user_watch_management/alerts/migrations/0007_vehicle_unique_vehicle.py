@@ -0,0 +1,17 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alerts", "0006_merge_duplicate_vehicles"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="vehicle",
+            constraint=models.UniqueConstraint(fields=("manufacturer_key", "model_key", "year_key"), name="unique_vehicle"),
+        ),
+    ]
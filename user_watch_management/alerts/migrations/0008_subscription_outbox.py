@@ -0,0 +1,70 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def mark_existing_alerts_active(apps, schema_editor):
+    # Alerts created before the outbox were subscribed to synchronously, so they are already active.
+    Alert = apps.get_model("alerts", "Alert")
+    Alert.objects.update(subscription_status="active")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alerts", "0007_vehicle_unique_vehicle"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="subscription_status",
+            field=models.CharField(
+                choices=[("pending", "Pending"), ("active", "Active"), ("failed", "Failed")],
+                default="pending",
+                help_text="If the alert producer was told about the alert yet (pending), did (active) or gave up (failed).",
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name="historicalalert",
+            name="subscription_status",
+            field=models.CharField(
+                choices=[("pending", "Pending"), ("active", "Active"), ("failed", "Failed")],
+                default="pending",
+                help_text="If the alert producer was told about the alert yet (pending), did (active) or gave up (failed).",
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(mark_existing_alerts_active, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="SubscriptionOutboxEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("modified", models.DateTimeField(auto_now=True)),
+                ("client_id", models.UUIDField(db_index=True)),
+                ("action", models.CharField(choices=[("subscribe", "Subscribe"), ("unsubscribe", "Unsubscribe")], max_length=16)),
+                ("payload", models.JSONField(help_text="The body sent to the alert producer.")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("sent", "Sent"), ("failed", "Failed")], default="pending", max_length=16
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("next_attempt_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("alert", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to="alerts.alert")),
+            ],
+            options={
+                "verbose_name_plural": "subscription outbox entries",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="subscriptionoutboxentry",
+            index=models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_attempt_idx"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:24
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alerts", "0008_subscription_outbox"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alert",
+            name="external_id",
+            field=models.UUIDField(db_index=True, default=uuid.uuid4),
+        ),
+        migrations.AlterField(
+            model_name="historicalalert",
+            name="external_id",
+            field=models.UUIDField(db_index=True, default=uuid.uuid4),
+        ),
+    ]
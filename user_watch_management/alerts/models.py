@@ -1,20 +1,97 @@
 import uuid
+from typing import Iterable, Optional
+
 from django.conf import settings
 from django.db import models
-
-from simple_history.models import HistoricalRecords
+from django.db.models import Q
+from django.utils import timezone
 
 from alerts.constants import DEFAULT_MIN_CHAR_LENGTH, MIN_CHAR_FOR_YEAR
+from alerts.history import DeferredHistoricalRecords
+
+
+def normalize_vehicle_value(value) -> str:
+    """
+    Normalize a vehicle value so differently formatted values (ex: "Toyota" and " toyota") are the same vehicle.
+
+    :param value: The value to normalize.
+    :returns: The normalized value.
+    """
+    return str(value or "").strip().lower()
+
+
+class VehicleManager(models.Manager):
+    """
+    The manager of the vehicle catalog.
+    """
+
+    def get_canonical(self, manufacturer_name: str, model_name: str, model_year: str) -> "Vehicle":
+        """
+        Get the vehicle from the catalog, adding it if this is the first time anyone is watching for it.
+
+        :param manufacturer_name: The name of the manufacturer the vehicle was made by (example Toyota).
+        :param model_name: The model name of the vehicle (example Corolla).
+        :param model_year: The model's year (example 1996)
+        :returns: The canonical vehicle shared by every alert watching for it.
+        """
+        manufacturer_key, model_key, year_key = Vehicle.build_keys(manufacturer_name, model_name, model_year)
+        vehicle, _ = self.get_or_create(
+            manufacturer_key=manufacturer_key,
+            model_key=model_key,
+            year_key=year_key,
+            defaults={"manufacturer_name": manufacturer_name, "model_name": model_name, "model_year": model_year},
+        )
+
+        return vehicle
+
+    def get_canonical_many(self, vehicles: Iterable[tuple[str, str, str]]) -> dict[tuple[str, str, str], "Vehicle"]:
+        """
+        Get many vehicles from the catalog at once, adding the ones that aren't in it yet.
+
+        :param vehicles: The (manufacturer name, model name, model year) of each vehicle.
+        :returns: The canonical vehicles keyed on their normalized (manufacturer, model, year) keys.
+        """
+        names_by_keys = {Vehicle.build_keys(*names): names for names in vehicles}
+        if not names_by_keys:
+            return {}
+
+        def find(keys):
+            query = Q()
+            for manufacturer_key, model_key, year_key in keys:
+                query |= Q(manufacturer_key=manufacturer_key, model_key=model_key, year_key=year_key)
+
+            return {(vehicle.manufacturer_key, vehicle.model_key, vehicle.year_key): vehicle for vehicle in self.filter(query)}
+
+        vehicles_by_keys = find(names_by_keys)
+        missing_keys = names_by_keys.keys() - vehicles_by_keys.keys()
+        if missing_keys:
+            new_vehicles = []
+            for keys in missing_keys:
+                manufacturer_name, model_name, model_year = names_by_keys[keys]
+                vehicle = Vehicle(manufacturer_name=manufacturer_name, model_name=model_name, model_year=model_year)
+                # bulk_create doesn't call save() which is what normally syncs the keys.
+                vehicle.manufacturer_key, vehicle.model_key, vehicle.year_key = keys
+                new_vehicles.append(vehicle)
+
+            # Another request may have added some of the same vehicles in the meantime, keep theirs.
+            self.bulk_create(new_vehicles, ignore_conflicts=True)
+            vehicles_by_keys.update(find(missing_keys))
+
+        return vehicles_by_keys
 
 
 class Vehicle(models.Model):
     """
-    A model representing a vehicle on Kenny U-Pull's website.
+    A model representing a vehicle on Kenny U-Pull's website. There is a single vehicle for each (manufacturer, model, year)
+    which is shared by every alert watching for it.
 
     :param id: Autogenerated by Django and the primary key of the table.
     :param manufacturer_name: The name of the manufacturer the vehicle was made by (example Toyota).
     :param model_name: The model name of the vehicle (example Corolla).
     :param model_year: The model's year (example 1996)
+    :param manufacturer_key: The normalized manufacturer name used to identify the vehicle (example toyota).
+    :param model_key: The normalized model name used to identify the vehicle (example corolla).
+    :param year_key: The normalized model year used to identify the vehicle (example 1996).
     """
 
     manufacturer_name = models.CharField(
@@ -22,6 +99,51 @@ class Vehicle(models.Model):
     )
     model_name = models.CharField(max_length=DEFAULT_MIN_CHAR_LENGTH, help_text="The model name of the vehicle (example Corolla).")
     model_year = models.CharField(max_length=MIN_CHAR_FOR_YEAR, help_text="The model's year (example 1996)")
+    manufacturer_key = models.CharField(
+        max_length=DEFAULT_MIN_CHAR_LENGTH, editable=False, help_text="The normalized manufacturer name (example toyota)."
+    )
+    model_key = models.CharField(
+        max_length=DEFAULT_MIN_CHAR_LENGTH, editable=False, help_text="The normalized model name (example corolla)."
+    )
+    year_key = models.CharField(max_length=MIN_CHAR_FOR_YEAR, editable=False, help_text="The normalized model year (example 1996).")
+
+    objects = VehicleManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["manufacturer_key", "model_key", "year_key"], name="unique_vehicle"),
+        ]
+
+    @staticmethod
+    def build_keys(manufacturer_name: str, model_name: str, model_year: str) -> tuple[str, str, str]:
+        """
+        Build the normalized keys identifying a vehicle.
+
+        :param manufacturer_name: The name of the manufacturer the vehicle was made by (example Toyota).
+        :param model_name: The model name of the vehicle (example Corolla).
+        :param model_year: The model's year (example 1996)
+        :returns: The (manufacturer, model, year) keys.
+        """
+        return normalize_vehicle_value(manufacturer_name), normalize_vehicle_value(model_name), normalize_vehicle_value(model_year)
+
+    @property
+    def keys(self) -> tuple[str, str, str]:
+        """
+        The normalized keys identifying this vehicle.
+        :returns: The (manufacturer, model, year) keys.
+        """
+        return Vehicle.build_keys(self.manufacturer_name, self.model_name, self.model_year)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the vehicle, keeping its normalized keys in sync with its names.
+        """
+        self.manufacturer_key, self.model_key, self.year_key = self.keys
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "manufacturer_key", "model_key", "year_key"}
+
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         """
@@ -31,6 +153,16 @@ class Vehicle(models.Model):
         return f"{self.model_year} {self.manufacturer_name} {self.model_name}"
 
 
+class SubscriptionStatus(models.TextChoices):
+    """
+    Where an alert's subscription with the alert producer is at.
+    """
+
+    PENDING = "pending"
+    ACTIVE = "active"
+    FAILED = "failed"
+
+
 class Alert(models.Model):
     """
     A model representing the user's alert they set up in order to watch a specific vehicle on Kenny U-Pull's website.
@@ -41,7 +173,10 @@ class Alert(models.Model):
     :param user: The user the alert belongs to.
     :param vehicle: The vehicle the user is trying to look up which links to the alerts_vehicle table.
     :param branch: The Kenny U-Pull branch to look at if specified (defaults to all if null)
-    :param history: Not actually a field auto generates a historical table of all changes done to the given record.
+    :param digest: If the user wants the listings for this alert grouped into a periodic digest email instead of one email per listing.
+    :param subscription_status: If the alert producer was told about the alert yet (pending), did (active) or gave up (failed).
+    :param history: Not actually a field auto generates a historical table of all changes done to the given record, written
+    in bulk at the end of the request when ALERT_HISTORY_DEFERRED is on.
     """
 
     created = models.DateTimeField(auto_now_add=True)
@@ -55,9 +190,25 @@ class Alert(models.Model):
         null=True,
         blank=True,
     )
-    external_id = models.UUIDField(default=uuid.uuid4)
+    external_id = models.UUIDField(default=uuid.uuid4, db_index=True)
+    digest = models.BooleanField(
+        default=False,
+        help_text="If the user wants the listings for this alert grouped into a periodic digest email instead of one email per listing.",
+    )
+    subscription_status = models.CharField(
+        max_length=16,
+        choices=SubscriptionStatus.choices,
+        default=SubscriptionStatus.PENDING,
+        help_text="If the alert producer was told about the alert yet (pending), did (active) or gave up (failed).",
+    )
+
+    history = DeferredHistoricalRecords()
 
-    history = HistoricalRecords()
+    class Meta:
+        indexes = [
+            # Used to page through a user's alerts in a stable (created, id) order.
+            models.Index(fields=["user", "created", "id"], name="alert_user_created_id_idx"),
+        ]
 
     def __str__(self) -> str:
         """
@@ -70,3 +221,82 @@ class Alert(models.Model):
             string_version = f"{string_version} at {self.branch}"
 
         return string_version
+
+
+class SubscriptionOutboxEntry(models.Model):
+    """
+    A model representing a call to the alert producer that still has to be made. Entries are written in the same
+    transaction as the alert they are for and sent by the relay_subscription_outbox task once it commits, so no request
+    ever waits on the alert producer.
+
+    :param id: Autogenerated by Django and the primary key of the table.
+    :param created: When the record was first inserted into the table.
+    :param modified: Recording the date and time when the record was modified.
+    :param alert: The alert the call is for, null once the alert is deleted (which is when unsubscribes are sent).
+    :param client_id: The external id of the alert, calls for the same alert are always sent in the order they were made.
+    :param action: If the vehicle should be subscribed to or unsubscribed from.
+    :param payload: The body sent to the alert producer.
+    :param status: If the entry is waiting to be sent, was sent or was given up on.
+    :param attempts: The number of times sending the entry was attempted.
+    :param next_attempt_at: When the entry can be sent (or retried) next.
+    :param last_error: The error of the last failed attempt.
+    """
+
+    class Action(models.TextChoices):
+        SUBSCRIBE = "subscribe"
+        UNSUBSCRIBE = "unsubscribe"
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        SENT = "sent"
+        FAILED = "failed"
+
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    alert = models.ForeignKey(Alert, on_delete=models.SET_NULL, null=True, blank=True)
+    client_id = models.UUIDField(db_index=True)
+    action = models.CharField(max_length=16, choices=Action.choices)
+    payload = models.JSONField(help_text="The body sent to the alert producer.")
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        verbose_name_plural = "subscription outbox entries"
+        indexes = [
+            # Used by the relay to find the entries that are due.
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_attempt_idx"),
+        ]
+
+    @classmethod
+    def for_alert(cls, action: str, alert: Alert, vehicle: Optional[Vehicle] = None) -> "SubscriptionOutboxEntry":
+        """
+        Build an (unsaved) entry telling the alert producer about the alert's vehicle.
+
+        :param action: The action to take (ex: SubscriptionOutboxEntry.Action.SUBSCRIBE).
+        :param alert: The alert the entry is for.
+        :param vehicle: The vehicle to use instead of the alert's current one (ex: the vehicle it was moved away from).
+        :returns: The entry.
+        """
+        vehicle = vehicle or alert.vehicle
+        return cls(
+            # An unsubscribe outlives the alert, so don't link it to an alert that is about to be deleted.
+            alert=alert if action == cls.Action.SUBSCRIBE else None,
+            client_id=alert.external_id,
+            action=action,
+            payload={
+                "model": vehicle.model_name,
+                "manufacturer": vehicle.manufacturer_name,
+                "year": vehicle.model_year,
+                "client_id": str(alert.external_id),
+            },
+        )
+
+    def __str__(self) -> str:
+        """
+        String representation of an outbox entry which should be human readable.
+        :returns: A string representing the outbox entry in question.
+        """
+        return f"{self.action} {self.client_id} ({self.status})"
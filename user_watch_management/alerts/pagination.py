@@ -0,0 +1,34 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from alerts.constants import INVALID_CURSOR_MESSAGE
+from alerts.exceptions import InvalidCursorException
+
+
+def encode_cursor(created: datetime, alert_id: int) -> str:
+    """
+    Encode the position of an alert in the (created, id) ordering into an opaque cursor.
+
+    :param created: When the last alert of a page was created.
+    :param alert_id: The id of the last alert of a page.
+    :return: The cursor to pass back to get the next page.
+    """
+    position = json.dumps([created.isoformat(), alert_id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor created by encode_cursor.
+
+    :param cursor: The cursor given by the client.
+    :return: The created date and the id of the last alert of the previous page.
+    :raises InvalidCursorException: Raised if the cursor was not created by encode_cursor.
+    """
+    try:
+        created, alert_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created), int(alert_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursorException(INVALID_CURSOR_MESSAGE)
@@ -0,0 +1,205 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Iterator, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from alerts.exceptions import SubscriptionFailureException
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the alert producer couldn't handle the request right now rather than rejecting it.
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Methods that can safely be sent again after a read timeout, when the first request may have gone through.
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE"}
+
+
+class AlertProducerClient:
+    """
+    A client for the alert producer's subscription API that reuses a pool of keep-alive connections instead of opening a
+    new connection for every call. Every call is bounded by ALERT_PRODUCER_CONNECT_TIMEOUT_SECONDS and
+    ALERT_PRODUCER_READ_TIMEOUT_SECONDS and is retried up to ALERT_PRODUCER_MAX_RETRIES times with a jittered backoff when
+    the alert producer can't be reached.
+
+    subscribe_many and unsubscribe_many send a whole group of subscriptions in one request when the alert producer has
+    bulk endpoints configured (ALERT_PRODUCER_BULK_SUBSCRIBE_URL and ALERT_PRODUCER_BULK_UNSUBSCRIBE_URL) and fall back
+    to one request per subscription over the pooled connections otherwise.
+
+    A subscription is the body the alert producer expects (ex: {"manufacturer": "Toyota", "model": "Corolla",
+    "year": "1996", "client_id": "..."}).
+    """
+
+    def __init__(
+        self,
+        subscribe_url: Optional[str] = None,
+        unsubscribe_url: Optional[str] = None,
+        bulk_subscribe_url: Optional[str] = None,
+        bulk_unsubscribe_url: Optional[str] = None,
+        subscriptions_url: Optional[str] = None,
+        max_retries: Optional[int] = None,
+    ):
+        self.subscribe_url = subscribe_url or settings.ALERT_PRODUCER_URL
+        self.unsubscribe_url = unsubscribe_url or settings.ALERT_PRODUCER_UNSUBSCRIBE_URL
+        self.bulk_subscribe_url = settings.ALERT_PRODUCER_BULK_SUBSCRIBE_URL if bulk_subscribe_url is None else bulk_subscribe_url
+        self.bulk_unsubscribe_url = settings.ALERT_PRODUCER_BULK_UNSUBSCRIBE_URL if bulk_unsubscribe_url is None else bulk_unsubscribe_url
+        self.subscriptions_url = subscriptions_url or settings.ALERT_PRODUCER_SUBSCRIPTIONS_URL
+        self.max_retries = settings.ALERT_PRODUCER_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = (settings.ALERT_PRODUCER_CONNECT_TIMEOUT_SECONDS, settings.ALERT_PRODUCER_READ_TIMEOUT_SECONDS)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.ALERT_PRODUCER_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def subscribe(self, subscription: dict):
+        """
+        Subscribe to the vehicle of a subscription.
+
+        :param subscription: The subscription to create.
+        :raises SubscriptionFailureException: Raised if the alert producer did not accept the subscription.
+        :raises requests.RequestException: Raised if the alert producer could not be reached in time.
+        """
+        self.__check(self.__request("POST", self.subscribe_url, subscription), subscription)
+
+    def unsubscribe(self, subscription: dict):
+        """
+        Unsubscribe from the vehicle of a subscription.
+
+        :param subscription: The subscription to remove.
+        :raises SubscriptionFailureException: Raised if the alert producer did not accept the unsubscribe.
+        :raises requests.RequestException: Raised if the alert producer could not be reached in time.
+        """
+        self.__check(self.__request("DELETE", self.unsubscribe_url, subscription), subscription)
+
+    def subscribe_many(self, subscriptions: list[dict]) -> list[Optional[str]]:
+        """
+        Subscribe to the vehicles of many subscriptions.
+
+        :param subscriptions: The subscriptions to create.
+        :return: The error of each subscription in the same order as the subscriptions, None for the ones that went through.
+        """
+        return self.__send_many("POST", self.bulk_subscribe_url, self.subscribe, subscriptions)
+
+    def unsubscribe_many(self, subscriptions: list[dict]) -> list[Optional[str]]:
+        """
+        Unsubscribe from the vehicles of many subscriptions.
+
+        :param subscriptions: The subscriptions to remove.
+        :return: The error of each subscription in the same order as the subscriptions, None for the ones that went through.
+        """
+        return self.__send_many("DELETE", self.bulk_unsubscribe_url, self.unsubscribe, subscriptions)
+
+    def iter_subscriptions(self, page_size: int) -> Iterator[dict]:
+        """
+        Iterate over every subscription of the alert producer ordered by client_id, one page at a time.
+
+        :param page_size: The number of subscriptions to get per request.
+        :return: The subscriptions with their id, client_id, manufacturer, model and year.
+        :raises SubscriptionFailureException: Raised if the alert producer did not answer with a page.
+        :raises requests.RequestException: Raised if the alert producer could not be reached in time.
+        """
+        after_client_id, after_id = "", 0
+        while True:
+            params = {"after_client_id": after_client_id, "after_id": after_id, "limit": page_size}
+            response = self.__request("GET", self.subscriptions_url, params=params)
+            self.__check(response, "the list of subscriptions")
+
+            page = response.json()["results"]
+            yield from page
+
+            if len(page) < page_size:
+                return
+
+            after_client_id, after_id = page[-1]["client_id"], page[-1]["id"]
+
+    def close(self):
+        """
+        Close every pooled connection.
+        """
+        self.session.close()
+
+    def __send_many(self, method: str, bulk_url: str, send_one, subscriptions: list[dict]) -> list[Optional[str]]:
+        if not bulk_url:
+            errors = []
+            for subscription in subscriptions:
+                try:
+                    send_one(subscription)
+                    errors.append(None)
+                except (SubscriptionFailureException, requests.RequestException) as e:
+                    errors.append(str(e))
+
+            return errors
+
+        errors = []
+        chunk_size = settings.ALERT_PRODUCER_BULK_SIZE
+        for start in range(0, len(subscriptions), chunk_size):
+            chunk = subscriptions[start : start + chunk_size]
+            try:
+                response = self.__request(method, bulk_url, {"subscriptions": chunk})
+                self.__check(response, f"{len(chunk)} subscriptions")
+                # The alert producer answers with the result of each subscription in the same order.
+                body = response.json()
+                results = body.get("results") if isinstance(body, dict) else None
+                if not isinstance(results, list) or len(results) != len(chunk) or not all(isinstance(result, dict) for result in results):
+                    raise SubscriptionFailureException(f"The alert producer answered with malformed results for {len(chunk)} subscriptions")
+
+                errors.extend(None if result.get("ok") else result.get("error") or "Rejected by the alert producer" for result in results)
+            except (SubscriptionFailureException, requests.RequestException, ValueError) as e:
+                errors.extend([str(e)] * len(chunk))
+
+        return errors
+
+    def __request(self, method: str, url: str, payload: Optional[dict] = None, params: Optional[dict] = None) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, json=payload, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A read timeout could mean the alert producer got the request, only resend it when that is safe.
+                was_sent = isinstance(e, requests.ReadTimeout) and method not in IDEMPOTENT_METHODS
+                if is_last_attempt or was_sent:
+                    raise
+
+                logger.warning(f"Failed to reach the alert producer at {url}, retrying. Error {e}")
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+                    return response
+
+                logger.warning(f"The alert producer at {url} responded with {response.status_code}, retrying.")
+
+            time.sleep(self.__get_backoff(attempt))
+
+    def __get_backoff(self, attempt: int) -> float:
+        # Full jitter so clients that failed together don't retry together.
+        return random.uniform(0, settings.ALERT_PRODUCER_RETRY_BACKOFF_SECONDS * 2**attempt)
+
+    def __check(self, response: requests.Response, subscription):
+        if not response.ok:
+            raise SubscriptionFailureException(f"The alert producer responded with {response.status_code} to {subscription}")
+
+
+_client: Optional[AlertProducerClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def get_producer_client() -> AlertProducerClient:
+    """
+    Get the alert producer client of the current process. A forked process gets its own client rather than sharing the
+    connections of its parent.
+
+    :return: The alert producer client of this process.
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = AlertProducerClient()
+            _client_pid = os.getpid()
+
+        return _client
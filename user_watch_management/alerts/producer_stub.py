@@ -0,0 +1,189 @@
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBE_PATH = "/v1/subscribe-vehicle"
+UNSUBSCRIBE_PATH = "/v1/unsubscribe-from-vehicle"
+BULK_SUBSCRIBE_PATH = "/v1/bulk-subscribe-vehicle"
+BULK_UNSUBSCRIBE_PATH = "/v1/bulk-unsubscribe-from-vehicle"
+SUBSCRIPTIONS_PATH = "/v1/subscriptions"
+
+
+def _subscription_key(subscription: dict) -> tuple:
+    return (
+        subscription.get("client_id"),
+        subscription.get("manufacturer"),
+        subscription.get("model"),
+        subscription.get("year"),
+    )
+
+
+class StubProducerServer:
+    """
+    An in memory stand-in for the alert producer's subscription API, used to run the tests and benchmarks without the Go
+    service. It serves the same subscribe, unsubscribe and list endpoints plus bulk versions of them, and can add latency
+    and fail a share of the requests to see how the callers behave.
+
+    :param host: The host to listen on.
+    :param port: The port to listen on, 0 picks a free port.
+    :param latency: The number of seconds to wait before answering each request.
+    :param failure_rate: The share of requests (0 to 1) answered with a 503.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0, failure_rate: float = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.subscriptions: set[tuple] = set()
+        # The id of each subscription, given the first time it is listed and kept like the alert producer's row ids.
+        self.__ids: dict[tuple, int] = {}
+        self.__last_id = 0
+        self.number_of_requests = 0
+        self.number_of_connections = 0
+
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__server = ThreadingHTTPServer((host, port), self._build_handler())
+        self.__server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubProducerServer":
+        """
+        Start serving in a background thread.
+
+        :return: The server, to chain with the constructor.
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Serve in the current thread until interrupted.
+        """
+        self.__server.serve_forever()
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def _count_connection(self):
+        with self.__lock:
+            self.number_of_connections += 1
+
+    def _apply(self, path: str, subscription: dict):
+        with self.__lock:
+            if path in (SUBSCRIBE_PATH, BULK_SUBSCRIBE_PATH):
+                self.subscriptions.add(_subscription_key(subscription))
+            else:
+                self.subscriptions.discard(_subscription_key(subscription))
+                self.__ids.pop(_subscription_key(subscription), None)
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str):
+        with self.__lock:
+            self.number_of_requests += 1
+
+        # Always read the body so the connection can be kept alive for the next request.
+        raw_body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+
+        expected_method = "POST" if handler.path in (SUBSCRIBE_PATH, BULK_SUBSCRIBE_PATH) else "DELETE"
+        if handler.path not in (SUBSCRIBE_PATH, UNSUBSCRIBE_PATH, BULK_SUBSCRIBE_PATH, BULK_UNSUBSCRIBE_PATH):
+            return self._respond(handler, 404, {"error": "Not found"})
+
+        if method != expected_method:
+            return self._respond(handler, 405, {"error": "Method not allowed"})
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            return self._respond(handler, 503, {"error": "Unavailable"})
+
+        try:
+            body = json.loads(raw_body or b"{}")
+        except ValueError:
+            return self._respond(handler, 400, {"error": "Invalid JSON"})
+
+        if handler.path in (BULK_SUBSCRIBE_PATH, BULK_UNSUBSCRIBE_PATH):
+            subscriptions = body.get("subscriptions", [])
+            for subscription in subscriptions:
+                self._apply(handler.path, subscription)
+
+            return self._respond(handler, 200, {"results": [{"ok": True} for _ in subscriptions]})
+
+        self._apply(handler.path, body)
+        return self._respond(handler, 201 if handler.path == SUBSCRIBE_PATH else 200, body)
+
+    def _list(self, handler: BaseHTTPRequestHandler):
+        with self.__lock:
+            self.number_of_requests += 1
+            for subscription in sorted(self.subscriptions, key=lambda subscription: (subscription[0] or "", subscription[1:])):
+                if subscription not in self.__ids:
+                    self.__last_id += 1
+                    self.__ids[subscription] = self.__last_id
+
+            subscriptions = sorted((subscription[0] or "", self.__ids[subscription], subscription) for subscription in self.subscriptions)
+
+        url = urlparse(handler.path)
+        if url.path != SUBSCRIPTIONS_PATH:
+            return self._respond(handler, 404, {"error": "Not found"})
+
+        query = parse_qs(url.query)
+        after_client_id = query.get("after_client_id", [""])[0]
+        after_id = int(query.get("after_id", ["0"])[0])
+        limit = int(query.get("limit", ["1000"])[0])
+
+        # Subscriptions added or removed between pages don't move the others, like with the alert producer's keyset paging.
+        page = []
+        for client_id, subscription_id, (_, manufacturer, model, year) in subscriptions:
+            if (client_id, subscription_id) > (after_client_id, after_id):
+                page.append({"id": subscription_id, "client_id": client_id, "manufacturer": manufacturer, "model": model, "year": year})
+                if len(page) >= limit:
+                    break
+
+        return self._respond(handler, 200, {"results": page})
+
+    def _respond(self, handler: BaseHTTPRequestHandler, status_code: int, body: dict):
+        content = json.dumps(body).encode()
+        handler.send_response(status_code)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def _build_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive so the pooled client connections are reused like they would be with the real service.
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server._count_connection()
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+            def do_DELETE(self):
+                server._handle(self, "DELETE")
+
+            def do_GET(self):
+                server._list(self)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
@@ -0,0 +1,218 @@
+import logging
+import uuid
+from itertools import groupby
+from typing import Iterator, Optional
+
+from alerts.exceptions import OutOfOrderException
+from alerts.models import Alert, SubscriptionOutboxEntry, SubscriptionStatus, Vehicle
+from alerts.producer_client import AlertProducerClient, get_producer_client
+from alerts.subscriptions import update_subscription_statuses
+
+logger = logging.getLogger(__name__)
+
+
+def iter_alert_subscriptions(chunk_size: int) -> Iterator[dict]:
+    """
+    Iterate over the subscription every alert should have, ordered by client_id. The alerts are loaded chunk_size at a
+    time with keyset pagination on external_id so memory use doesn't grow with the number of alerts.
+
+    :param chunk_size: The number of alerts to load at once.
+    :return: The subscriptions, with the id of their alert.
+    """
+    last_external_id = None
+    while True:
+        alerts = Alert.objects.order_by("external_id").values_list(
+            "id", "external_id", "vehicle__manufacturer_name", "vehicle__model_name", "vehicle__model_year"
+        )
+        if last_external_id is not None:
+            alerts = alerts.filter(external_id__gt=last_external_id)
+
+        chunk = list(alerts[:chunk_size])
+        for alert_id, external_id, manufacturer_name, model_name, model_year in chunk:
+            yield {
+                "alert_id": alert_id,
+                "client_id": str(external_id),
+                "manufacturer": manufacturer_name,
+                "model": model_name,
+                "year": model_year,
+            }
+
+        if len(chunk) < chunk_size:
+            return
+
+        last_external_id = chunk[-1][1]
+
+
+def group_by_client_id(subscriptions: Iterator[dict], side: str) -> Iterator[tuple[str, list[dict]]]:
+    """
+    Group consecutive subscriptions with the same client_id, making sure they really are ordered by client_id.
+
+    :param subscriptions: The subscriptions ordered by client_id.
+    :param side: Which side the subscriptions are from, used in the error message.
+    :return: The client_id and subscriptions of each group.
+    :raises OutOfOrderException: Raised if a client_id comes before the one of the previous group.
+    """
+    previous_client_id = None
+    for client_id, group in groupby(subscriptions, key=lambda subscription: subscription["client_id"].lower()):
+        if previous_client_id is not None and client_id <= previous_client_id:
+            raise OutOfOrderException(f"The {side} subscriptions are not ordered by client_id ({client_id} after {previous_client_id})")
+
+        previous_client_id = client_id
+        yield client_id, list(group)
+
+
+def subscription_key(subscription: dict) -> tuple[str, str, str]:
+    return Vehicle.build_keys(subscription["manufacturer"], subscription["model"], subscription["year"])
+
+
+def to_payload(subscription: dict) -> dict:
+    return {key: subscription[key] for key in ("model", "manufacturer", "year", "client_id")}
+
+
+class SubscriptionReconciler:
+    """
+    Bring the alert producer's subscriptions back in line with the alerts. Both sides are streamed ordered by client_id
+    and merged, so only chunk_size subscriptions of each side are in memory at once, and only the differences are sent to
+    the alert producer with batched subscribe and unsubscribe calls.
+
+    Alerts with subscription changes still waiting in the outbox are left alone since the relay is about to send them, as
+    are alerts that changed since they were streamed.
+
+    :param chunk_size: The number of subscriptions of each side to load at once and of differences to send at once.
+    :param dry_run: Only count the differences without sending them.
+    :param client: The alert producer client to use, defaults to the client of this process.
+    """
+
+    def __init__(self, chunk_size: int, dry_run: bool = False, client: Optional[AlertProducerClient] = None):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.client = client or get_producer_client()
+
+        self.counts = {"added": 0, "removed": 0, "unchanged": 0, "skipped": 0, "errors": 0}
+        self.__to_subscribe: list[dict] = []
+        self.__to_unsubscribe: list[dict] = []
+
+    def reconcile(self) -> dict[str, int]:
+        """
+        Reconcile every subscription.
+
+        :return: The number of subscriptions added, removed, left alone, skipped because of pending outbox entries and
+        that failed to be sent.
+        :raises OutOfOrderException: Raised if either side isn't ordered by client_id, the differences found up to that
+        point are still sent.
+        """
+        desired = group_by_client_id(iter_alert_subscriptions(self.chunk_size), "alert")
+        actual = group_by_client_id(self.client.iter_subscriptions(self.chunk_size), "alert producer")
+
+        try:
+            desired_group, actual_group = next(desired, None), next(actual, None)
+            while desired_group or actual_group:
+                if actual_group is None or (desired_group and desired_group[0] < actual_group[0]):
+                    self.__compare(desired_group[1], [])
+                    desired_group = next(desired, None)
+                elif desired_group is None or actual_group[0] < desired_group[0]:
+                    self.__compare([], actual_group[1])
+                    actual_group = next(actual, None)
+                else:
+                    self.__compare(desired_group[1], actual_group[1])
+                    desired_group, actual_group = next(desired, None), next(actual, None)
+        finally:
+            self.__flush()
+
+        return self.counts
+
+    def __compare(self, desired_subscriptions: list[dict], actual_subscriptions: list[dict]):
+        desired_keys = {subscription_key(subscription) for subscription in desired_subscriptions}
+        actual_keys = {subscription_key(subscription) for subscription in actual_subscriptions}
+
+        self.counts["unchanged"] += len(desired_keys & actual_keys)
+        self.__to_unsubscribe.extend(
+            subscription for subscription in actual_subscriptions if subscription_key(subscription) not in desired_keys
+        )
+        self.__to_subscribe.extend(
+            subscription for subscription in desired_subscriptions if subscription_key(subscription) not in actual_keys
+        )
+
+        if len(self.__to_subscribe) + len(self.__to_unsubscribe) >= self.chunk_size:
+            self.__flush()
+
+    def __flush(self):
+        to_subscribe, self.__to_subscribe = self.__to_subscribe, []
+        to_unsubscribe, self.__to_unsubscribe = self.__to_unsubscribe, []
+        if not to_subscribe and not to_unsubscribe:
+            return
+
+        # Alerts can change while the two sides are being streamed, so check the differences against their current state.
+        client_ids = set()
+        for subscription in to_subscribe + to_unsubscribe:
+            try:
+                client_ids.add(uuid.UUID(subscription["client_id"]))
+            except ValueError:
+                # Not a client_id we handed out, there is no alert for it.
+                pass
+
+        current_keys = {
+            str(external_id): Vehicle.build_keys(manufacturer_name, model_name, model_year)
+            for external_id, manufacturer_name, model_name, model_year in Alert.objects.filter(external_id__in=client_ids).values_list(
+                "external_id", "vehicle__manufacturer_name", "vehicle__model_name", "vehicle__model_year"
+            )
+        }
+        # Alerts with subscription changes still waiting in the outbox are left to the relay.
+        pending_client_ids = {
+            str(client_id)
+            for client_id in SubscriptionOutboxEntry.objects.filter(
+                status=SubscriptionOutboxEntry.Status.PENDING, client_id__in=client_ids
+            ).values_list("client_id", flat=True)
+        }
+
+        def is_still_needed(subscription: dict, should_be_subscribed: bool) -> bool:
+            client_id = subscription["client_id"].lower()
+            if client_id in pending_client_ids:
+                return False
+
+            return (current_keys.get(client_id) == subscription_key(subscription)) == should_be_subscribed
+
+        number_of_differences = len(to_subscribe) + len(to_unsubscribe)
+        to_subscribe = [subscription for subscription in to_subscribe if is_still_needed(subscription, True)]
+        to_unsubscribe = [subscription for subscription in to_unsubscribe if is_still_needed(subscription, False)]
+        self.counts["skipped"] += number_of_differences - len(to_subscribe) - len(to_unsubscribe)
+
+        if self.dry_run:
+            self.counts["added"] += len(to_subscribe)
+            self.counts["removed"] += len(to_unsubscribe)
+            return
+
+        # Unsubscribe first so an alert that moved to another vehicle never has both subscriptions.
+        if to_unsubscribe:
+            errors = self.client.unsubscribe_many([to_payload(subscription) for subscription in to_unsubscribe])
+            self.__count(errors, "removed")
+
+        if to_subscribe:
+            errors = self.client.subscribe_many([to_payload(subscription) for subscription in to_subscribe])
+            self.__count(errors, "added")
+            update_subscription_statuses(
+                {subscription["alert_id"] for subscription, error in zip(to_subscribe, errors) if error is None},
+                SubscriptionStatus.ACTIVE,
+            )
+
+    def __count(self, errors: list[Optional[str]], key: str):
+        for error in errors:
+            if error is None:
+                self.counts[key] += 1
+            else:
+                self.counts["errors"] += 1
+                logger.warning(f"Failed to reconcile a subscription with error {error}")
+
+
+def reconcile_subscriptions(chunk_size: int, dry_run: bool = False) -> dict[str, int]:
+    """
+    Bring the alert producer's subscriptions back in line with the alerts, see SubscriptionReconciler.
+
+    :param chunk_size: The number of subscriptions of each side to load at once and of differences to send at once.
+    :param dry_run: Only count the differences without sending them.
+    :return: The number of subscriptions added, removed, left alone, skipped and that failed to be sent.
+    """
+    counts = SubscriptionReconciler(chunk_size=chunk_size, dry_run=dry_run).reconcile()
+    logger.info(f"Reconciled the alert producer's subscriptions: {counts}")
+
+    return counts
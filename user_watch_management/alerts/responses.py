@@ -0,0 +1,37 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    # Optional, the responses are encoded with the json module like JsonResponse without it.
+    orjson = None
+
+
+def encode_json(data) -> bytes:
+    """
+    Encode data to JSON with orjson when it is installed and ALERT_FAST_SERIALIZATION is on, and the same way as
+    JsonResponse otherwise.
+
+    :param data: The data to encode, only made of JSON types (ex: the output of a serializer).
+    :return: The encoded data.
+    """
+    if orjson is not None and settings.ALERT_FAST_SERIALIZATION:
+        return orjson.dumps(data)
+
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    A JsonResponse encoded with encode_json. Like JsonResponse with safe=False, any JSON serializable data is accepted.
+
+    :param data: The data to encode.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=encode_json(data), **kwargs)
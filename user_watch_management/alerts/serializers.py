@@ -1,7 +1,23 @@
+from typing import Iterable
+
+from django.utils import timezone
 from rest_framework import serializers
 from alerts.models import Alert
 from alerts.models import Vehicle
 
+# The columns serialize_alerts reads, the same as the fields of AlertSerializer.
+ALERT_VALUES_FIELDS = (
+    "id",
+    "vehicle__manufacturer_name",
+    "vehicle__model_name",
+    "vehicle__model_year",
+    "branch",
+    "digest",
+    "subscription_status",
+    "created",
+    "modified",
+)
+
 
 class VehicleSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,12 +25,19 @@ class VehicleSerializer(serializers.ModelSerializer):
         fields = ["manufacturer_name", "model_name", "model_year"]
 
 
+class UpdateVehicleSerializer(serializers.Serializer):
+    # The fields that aren't given (or are empty) keep the alert's current names, see get_new_vehicle_names.
+    manufacturer_name = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    model_name = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    model_year = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
 class AlertSerializer(serializers.ModelSerializer):
     vehicle = VehicleSerializer()
 
     class Meta:
         model = Alert
-        fields = ["id", "vehicle", "branch", "created", "modified"]
+        fields = ["id", "vehicle", "branch", "digest", "subscription_status", "created", "modified"]
         extra_kwargs = {"branch": {"required": False}}
 
 
@@ -23,5 +46,35 @@ class CreateAlertSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Alert
-        fields = ["branch", "vehicle"]
-        extra_kwargs = {"branch": {"required": False}}
+        fields = ["branch", "vehicle", "digest"]
+        extra_kwargs = {"branch": {"required": False}, "digest": {"required": False}}
+
+
+def serialize_alerts(alert_values: Iterable[dict]) -> list[dict]:
+    """
+    Serialize alerts exactly like AlertSerializer(alerts, many=True).data but from a values() projection, skipping the
+    model instances and the serializer field introspection that dominate the time spent on large lists of alerts.
+
+    :param alert_values: The alerts to serialize as returned by alerts.values(*ALERT_VALUES_FIELDS).
+    :return: The serialized alerts.
+    """
+    # Format the dates with the serializer's own field so they are formatted the same way (ex: the timezone suffix), only
+    # looking up the current timezone once rather than for every date.
+    format_datetime = serializers.DateTimeField(default_timezone=timezone.get_current_timezone()).to_representation
+
+    return [
+        {
+            "id": alert["id"],
+            "vehicle": {
+                "manufacturer_name": alert["vehicle__manufacturer_name"],
+                "model_name": alert["vehicle__model_name"],
+                "model_year": alert["vehicle__model_year"],
+            },
+            "branch": alert["branch"],
+            "digest": alert["digest"],
+            "subscription_status": alert["subscription_status"],
+            "created": format_datetime(alert["created"]),
+            "modified": format_datetime(alert["modified"]),
+        }
+        for alert in alert_values
+    ]
@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from alerts.cache import invalidate_alert_list
+from alerts.models import Alert, Vehicle
+
+# Sent with the alerts created or updated in bulk, which doesn't send post_save for each of them.
+alerts_bulk_saved = Signal()
+
+
+def _invalidate_alert_lists(user_ids: set[int]):
+    """
+    Invalidate the cached lists of alerts of the users right away and again once the transaction commits, so a list
+    cached by a reader that saw the data before the commit is never served.
+    """
+
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_alert_list(user_id)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Alert, dispatch_uid="alerts_invalidate_alert_list_on_save")
+@receiver(post_delete, sender=Alert, dispatch_uid="alerts_invalidate_alert_list_on_delete")
+def invalidate_alert_list_of_alert(sender, instance: Alert, **kwargs):
+    _invalidate_alert_lists({instance.user_id})
+
+
+@receiver(alerts_bulk_saved, sender=Alert, dispatch_uid="alerts_invalidate_alert_list_on_bulk_save")
+def invalidate_alert_list_of_alerts(sender, alerts: list[Alert], **kwargs):
+    _invalidate_alert_lists({alert.user_id for alert in alerts})
+
+
+@receiver(post_save, sender=Vehicle, dispatch_uid="alerts_invalidate_alert_list_on_vehicle_save")
+def invalidate_alert_list_of_vehicle(sender, instance: Vehicle, created: bool, **kwargs):
+    if created:
+        # A brand new vehicle has no alerts yet.
+        return
+
+    _invalidate_alert_lists(set(Alert.objects.filter(vehicle=instance).values_list("user_id", flat=True)))
@@ -0,0 +1,23 @@
+from django.utils import timezone
+
+from alerts.cache import invalidate_alert_list
+from alerts.models import Alert
+
+
+def update_subscription_statuses(alert_ids: set[int], subscription_status: str):
+    """
+    Record the outcome of subscribing the alerts and invalidate the cached lists of alerts of their users.
+
+    :param alert_ids: The ids of the alerts.
+    :param subscription_status: The new subscription status of the alerts.
+    """
+    if not alert_ids:
+        return
+
+    alerts = Alert.objects.filter(id__in=alert_ids)
+    user_ids = set(alerts.values_list("user_id", flat=True))
+    # Bump modified as well so clients polling the alert with a conditional GET see the new status.
+    alerts.update(subscription_status=subscription_status, modified=timezone.now())
+
+    for user_id in user_ids:
+        invalidate_alert_list(user_id)
@@ -0,0 +1,189 @@
+from datetime import timedelta
+from typing import Optional
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from alerts.history_retention import prune_alert_history
+from alerts.models import SubscriptionOutboxEntry, SubscriptionStatus
+from alerts.producer_client import get_producer_client
+from alerts.reconciliation import reconcile_subscriptions
+from alerts.subscriptions import update_subscription_statuses
+from user_watch.query_profiler import profile_task_queries
+
+logger = logging.getLogger(__name__)
+
+
+def claim_outbox_entries(batch_size: int) -> list[SubscriptionOutboxEntry]:
+    """
+    Claim the next entries of the outbox that are due. The claimed entries are leased for SUBSCRIPTION_OUTBOX_LEASE_SECONDS
+    so another relay running at the same time skips them, and a relay that dies part way through only delays them.
+
+    :param batch_size: The maximum number of entries to claim.
+    :return: The claimed entries, oldest first.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            SubscriptionOutboxEntry.objects.select_for_update(skip_locked=True)
+            .filter(status=SubscriptionOutboxEntry.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("id")[:batch_size]
+        )
+        SubscriptionOutboxEntry.objects.filter(id__in=[entry.id for entry in entries]).update(
+            next_attempt_at=now + timedelta(seconds=settings.SUBSCRIPTION_OUTBOX_LEASE_SECONDS)
+        )
+
+    return entries
+
+
+def send_outbox_entries(entries: list[SubscriptionOutboxEntry]) -> list[Optional[str]]:
+    """
+    Send the outbox entries to the alert producer, grouping the subscribes and the unsubscribes into one call each.
+
+    :param entries: The entries to send, at most one per alert since the order between the groups isn't kept.
+    :return: The error of each entry in the same order as the entries, None for the ones that went through.
+    """
+    client = get_producer_client()
+    errors_by_entry_id = {}
+    for action, send_many in (
+        (SubscriptionOutboxEntry.Action.SUBSCRIBE, client.subscribe_many),
+        (SubscriptionOutboxEntry.Action.UNSUBSCRIBE, client.unsubscribe_many),
+    ):
+        entries_for_action = [entry for entry in entries if entry.action == action]
+        if entries_for_action:
+            errors = send_many([entry.payload for entry in entries_for_action])
+            errors_by_entry_id.update(zip([entry.id for entry in entries_for_action], errors))
+
+    return [errors_by_entry_id[entry.id] for entry in entries]
+
+
+def get_retry_delay(attempts: int) -> float:
+    """
+    Get how long to wait before retrying an entry, doubling with every failed attempt.
+
+    :param attempts: The number of failed attempts so far.
+    :return: The number of seconds to wait.
+    """
+    return min(settings.SUBSCRIPTION_OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.SUBSCRIPTION_OUTBOX_RETRY_MAX_SECONDS)
+
+
+@shared_task
+@profile_task_queries
+def relay_subscription_outbox(batch_size: Optional[int] = None) -> dict[str, int]:
+    """
+    Send the due entries of the subscription outbox to the alert producer. Failed entries are retried with an exponential
+    backoff until SUBSCRIPTION_OUTBOX_MAX_ATTEMPTS is reached, at which point the alert is marked as failed.
+
+    Entries for the same alert are always sent in the order they were made, so a later entry waits while an earlier one
+    is being retried.
+
+    :param batch_size: The maximum number of entries to send, defaults to SUBSCRIPTION_OUTBOX_BATCH_SIZE.
+    :return: The number of entries sent, waiting on a retry and given up on.
+    """
+    batch_size = batch_size or settings.SUBSCRIPTION_OUTBOX_BATCH_SIZE
+    entries = claim_outbox_entries(batch_size)
+    if not entries:
+        return {"sent": 0, "retrying": 0, "failed": 0}
+
+    # Client ids with an older entry that wasn't claimed (it is waiting on a retry or claimed by another relay).
+    blocked_client_ids = set(
+        SubscriptionOutboxEntry.objects.filter(
+            status=SubscriptionOutboxEntry.Status.PENDING,
+            client_id__in={entry.client_id for entry in entries},
+            id__lt=entries[-1].id,
+        )
+        .exclude(id__in=[entry.id for entry in entries])
+        .values_list("client_id", flat=True)
+    )
+
+    now = timezone.now()
+    processed_entries = []
+    activated_alert_ids = set()
+    failed_alert_ids = set()
+    number_retrying = 0
+
+    remaining_entries = entries
+    while remaining_entries:
+        # Each round sends the oldest remaining entry of every alert, so an alert's entries go out in order. Entries of a
+        # blocked alert are left leased and picked up again once the lease runs out.
+        round_entries, next_entries, client_ids_in_round = [], [], set()
+        for entry in remaining_entries:
+            if entry.client_id in blocked_client_ids:
+                continue
+
+            if entry.client_id in client_ids_in_round:
+                next_entries.append(entry)
+            else:
+                round_entries.append(entry)
+                client_ids_in_round.add(entry.client_id)
+
+        remaining_entries = next_entries
+
+        for entry, error in zip(round_entries, send_outbox_entries(round_entries)):
+            entry.attempts += 1
+            entry.modified = now
+            processed_entries.append(entry)
+
+            if error is None:
+                entry.status = SubscriptionOutboxEntry.Status.SENT
+                entry.last_error = ""
+                if entry.action == SubscriptionOutboxEntry.Action.SUBSCRIBE and entry.alert_id:
+                    activated_alert_ids.add(entry.alert_id)
+                continue
+
+            entry.last_error = error
+            blocked_client_ids.add(entry.client_id)
+
+            if entry.attempts >= settings.SUBSCRIPTION_OUTBOX_MAX_ATTEMPTS:
+                logger.error(f"Giving up on {entry} after {entry.attempts} attempts with error {error}")
+                entry.status = SubscriptionOutboxEntry.Status.FAILED
+                if entry.action == SubscriptionOutboxEntry.Action.SUBSCRIBE and entry.alert_id:
+                    failed_alert_ids.add(entry.alert_id)
+            else:
+                logger.warning(f"Failed to send {entry}, retrying later. Error {error}")
+                entry.next_attempt_at = now + timedelta(seconds=get_retry_delay(entry.attempts))
+                number_retrying += 1
+
+    SubscriptionOutboxEntry.objects.bulk_update(processed_entries, ["status", "attempts", "next_attempt_at", "last_error", "modified"])
+    update_subscription_statuses(activated_alert_ids, SubscriptionStatus.ACTIVE)
+    update_subscription_statuses(failed_alert_ids, SubscriptionStatus.FAILED)
+
+    if len(entries) >= batch_size:
+        # There are likely more entries waiting.
+        relay_subscription_outbox.delay(batch_size=batch_size)
+
+    number_sent = sum(entry.status == SubscriptionOutboxEntry.Status.SENT for entry in processed_entries)
+    return {"sent": number_sent, "retrying": number_retrying, "failed": len(processed_entries) - number_sent - number_retrying}
+
+
+@shared_task
+@profile_task_queries
+def reconcile_producer_subscriptions(chunk_size: Optional[int] = None) -> dict[str, int]:
+    """
+    Bring the alert producer's subscriptions back in line with the alerts, adding the missing subscriptions and removing
+    the ones without an alert.
+
+    :param chunk_size: The number of subscriptions to compare and send at once, defaults to SUBSCRIPTION_RECONCILE_CHUNK_SIZE.
+    :return: The number of subscriptions added, removed, left alone, skipped and that failed to be sent.
+    """
+    return reconcile_subscriptions(chunk_size=chunk_size or settings.SUBSCRIPTION_RECONCILE_CHUNK_SIZE)
+
+
+@shared_task
+@profile_task_queries
+def prune_historical_alerts() -> dict:
+    """
+    Delete the alert history records older than ALERT_HISTORY_RETENTION_DAYS in chunks, archiving them to
+    ALERT_HISTORY_ARCHIVE_DIR first when it is set.
+
+    :return: The number of records pruned, the archive they were written to, how long it took and the rows per second.
+    """
+    return prune_alert_history(
+        max_age_days=settings.ALERT_HISTORY_RETENTION_DAYS,
+        chunk_size=settings.ALERT_HISTORY_PRUNE_CHUNK_SIZE,
+        sleep_seconds=settings.ALERT_HISTORY_PRUNE_SLEEP_SECONDS,
+        archive_dir=settings.ALERT_HISTORY_ARCHIVE_DIR or None,
+    )
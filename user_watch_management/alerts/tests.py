@@ -1,19 +1,74 @@
+import gzip
+import inspect
 import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from typing import Optional
 from unittest import mock
 from uuid import uuid4
-from django.test import TestCase
-from requests import Response
-
-from alerts.models import Vehicle, Alert
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import JsonResponse
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import requests
+from simple_history.models import HistoricalRecords
+from simple_history.signals import post_create_historical_record, pre_create_historical_record
+
+from alerts.models import Vehicle, Alert, SubscriptionOutboxEntry, SubscriptionStatus
 from django.contrib.auth.models import User
 
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from alerts.constants import ALERT_NOT_UPDATED_MESSAGE
-from alerts.utils import handle_create_alert
+from alerts.cache import (
+    get_alert_list_cache_stats,
+    get_alert_list_version,
+    get_cached_alert_list,
+    invalidate_alert_list,
+    set_cached_alert_list,
+)
+from alerts.constants import (
+    ALERT_NOT_UPDATED_MESSAGE,
+    INVALID_ALERT_ID_MESSAGE,
+    INVALID_BULK_ALERTS_MESSAGE,
+    INVALID_CURSOR_MESSAGE,
+    INVALID_DIGEST_MESSAGE,
+    INVALID_PAGE_SIZE_MESSAGE,
+    MAX_BULK_ALERT_OPERATIONS,
+)
 from alerts.exceptions import SubscriptionFailureException
+from alerts.history import get_current_history_batch, history_batch
+from alerts.history_retention import prune_alert_history
+from alerts.producer_client import AlertProducerClient
+from alerts.producer_stub import (
+    BULK_SUBSCRIBE_PATH,
+    BULK_UNSUBSCRIBE_PATH,
+    SUBSCRIBE_PATH,
+    SUBSCRIPTIONS_PATH,
+    UNSUBSCRIBE_PATH,
+    StubProducerServer,
+)
+from alerts.reconciliation import reconcile_subscriptions
+from alerts.responses import FastJsonResponse
+from alerts.serializers import ALERT_VALUES_FIELDS, AlertSerializer, serialize_alerts
+from alerts.tasks import relay_subscription_outbox, send_outbox_entries
+from alerts.utils import handle_create_alert
+from user_watch.exceptions import RepeatedQueriesException
+from user_watch.query_profiler import (
+    assert_query_budget,
+    get_query_template,
+    profile_queries,
+    profile_task_queries,
+    report_query_profile,
+)
 
 
 def create_alert_as_dict(alert: Alert) -> dict:
@@ -25,6 +80,8 @@ def create_alert_as_dict(alert: Alert) -> dict:
             "model_name": alert.vehicle.model_name,
         },
         "branch": alert.branch,
+        "digest": alert.digest,
+        "subscription_status": alert.subscription_status,
         "created": alert.created.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
         "modified": alert.modified.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
     }
@@ -36,7 +93,7 @@ class AlertTests(TestCase):
         model_name = "Corolla"
         model_year = "1996"
 
-        vehicle = Vehicle.objects.create(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
 
         username_and_email = "john_doe@testing.com"
         user = User.objects.create_user(username_and_email, username_and_email, str(uuid4()))
@@ -64,12 +121,88 @@ class VehicleTests(TestCase):
 
         self.assertEqual(str(vehicle), f"{vehicle.model_year} {vehicle.manufacturer_name} {vehicle.model_name}")
 
+    def test_get_canonical_shares_one_vehicle(self):
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_name="Corolla", model_year="1996")
+
+        same_vehicle = Vehicle.objects.get_canonical(manufacturer_name=" toyota", model_name="COROLLA", model_year="1996 ")
+
+        self.assertEqual(same_vehicle, vehicle)
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertEqual((vehicle.manufacturer_key, vehicle.model_key, vehicle.year_key), ("toyota", "corolla", "1996"))
+        # The vehicle keeps the names it was first added with.
+        self.assertEqual(str(same_vehicle), "1996 Toyota Corolla")
+
+    def test_duplicate_vehicle_is_rejected(self):
+        Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_name="Corolla", model_year="1996")
+
+        with self.assertRaises(IntegrityError):
+            Vehicle.objects.create(manufacturer_name="TOYOTA", model_name="corolla", model_year="1996")
+
+
+class MergeDuplicateVehiclesMigrationTests(TransactionTestCase):
+    migrate_from = [("alerts", "0005_vehicle_manufacturer_key_vehicle_model_key_and_more")]
+    migrate_to = [("alerts", "0006_merge_duplicate_vehicles")]
+
+    def setUp(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        return super().tearDown()
+
+    def test_duplicate_vehicles_are_merged_keeping_their_alerts(self):
+        User = self.apps.get_model("auth", "User")
+        Vehicle = self.apps.get_model("alerts", "Vehicle")
+        Alert = self.apps.get_model("alerts", "Alert")
+        HistoricalAlert = self.apps.get_model("alerts", "HistoricalAlert")
+
+        user = User.objects.create(username="tester@test.com", email="tester@test.com")
+        honda = Vehicle.objects.create(manufacturer_name="Honda", model_name="Civic", model_year="2001")
+        lowercase_honda = Vehicle.objects.create(manufacturer_name="honda", model_name="civic", model_year="2001")
+        padded_honda = Vehicle.objects.create(manufacturer_name=" HONDA", model_name="Civic ", model_year="2001")
+        toyota = Vehicle.objects.create(manufacturer_name="Toyota", model_name="Corolla", model_year="1996")
+        alert_ids = [Alert.objects.create(user=user, vehicle=vehicle).id for vehicle in (honda, lowercase_honda, padded_honda, toyota)]
+        HistoricalAlert.objects.create(
+            id=alert_ids[1],
+            user=user,
+            vehicle=lowercase_honda,
+            created=timezone.now(),
+            modified=timezone.now(),
+            history_date=timezone.now(),
+            history_type="+",
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        apps = executor.loader.project_state(self.migrate_to).apps
+        Vehicle = apps.get_model("alerts", "Vehicle")
+        Alert = apps.get_model("alerts", "Alert")
+        HistoricalAlert = apps.get_model("alerts", "HistoricalAlert")
+
+        self.assertEqual(
+            list(Vehicle.objects.order_by("id").values_list("id", "manufacturer_key", "model_key", "year_key")),
+            [(honda.id, "honda", "civic", "2001"), (toyota.id, "toyota", "corolla", "1996")],
+        )
+        # The alerts are kept, moved to the vehicle that was added first.
+        self.assertEqual(
+            list(Alert.objects.order_by("id").values_list("id", "vehicle_id")),
+            [(alert_ids[0], honda.id), (alert_ids[1], honda.id), (alert_ids[2], honda.id), (alert_ids[3], toyota.id)],
+        )
+        self.assertEqual(HistoricalAlert.objects.get().vehicle_id, honda.id)
+
 
 class GetAlertsTests(TestCase):
     test_url = "/alerts/v1/get-alerts"
 
     def setUp(self) -> None:
         self.maxDiff = None
+        cache.clear()
         username_and_email = "tester@test.com"
         self.client = APIClient()
         self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
@@ -83,7 +216,7 @@ class GetAlertsTests(TestCase):
         model_name = "Corolla"
         model_year = "1996"
 
-        vehicle = Vehicle.objects.create(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
         user = user if user else self.user
 
         return Alert.objects.create(user=user, vehicle=vehicle, branch=branch)
@@ -166,6 +299,225 @@ class GetAlertsTests(TestCase):
         content = json.loads(response.content)
         self.assertEqual(content, expected_content)
 
+    def test_get_alerts_not_modified(self):
+        self.__set_up_an_alert()
+        response = self.client.get(self.test_url)
+        self.assertEqual(response.status_code, 200)
+
+        # Only the count and last modified date of their alerts, the authenticated user is cached.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.test_url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_get_alerts_modified_after_an_update(self):
+        alert = self.__set_up_an_alert()
+        etag = self.client.get(self.test_url)["ETag"]
+
+        alert.branch = "Test Branch"
+        alert.save()
+        response = self.client.get(self.test_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content), [create_alert_as_dict(alert)])
+
+    def test_get_alerts_modified_after_a_delete(self):
+        self.__set_up_an_alert()
+        alert = self.__set_up_an_alert()
+        etag = self.client.get(self.test_url)["ETag"]
+
+        alert.delete()
+        response = self.client.get(self.test_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+
+# A Redis cache nothing listens on.
+UNAVAILABLE_CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:1"}}
+
+
+class AlertListCacheTests(TestCase):
+    test_url = "/alerts/v1/get-alerts"
+
+    def setUp(self) -> None:
+        self.maxDiff = None
+        cache.clear()
+        username_and_email = "tester@test.com"
+        self.client = APIClient()
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        return super().setUp()
+
+    def __set_up_an_alert(self) -> Alert:
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+
+        return Alert.objects.create(user=self.user, vehicle=vehicle)
+
+    def test_get_alerts_is_served_from_the_cache(self):
+        alert = self.__set_up_an_alert()
+        stats_before = get_alert_list_cache_stats()
+        self.client.get(self.test_url)
+
+        # Only the query for the ETag, the authenticated user and the alerts themselves come from the cache.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.test_url)
+
+        self.assertEqual(json.loads(response.content), [create_alert_as_dict(alert)])
+        stats = get_alert_list_cache_stats()
+        self.assertEqual(stats["hits"] - stats_before["hits"], 1)
+        self.assertEqual(stats["misses"] - stats_before["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], stats["hits"] / (stats["hits"] + stats["misses"]))
+
+    def test_update_alert_invalidates_the_cache(self):
+        alert = self.__set_up_an_alert()
+        self.client.get(self.test_url)
+
+        self.client.put(f"/alerts/v1/update-alert/{alert.id}", data={"branch": "Test Branch"}, format="json")
+        response = self.client.get(self.test_url)
+
+        self.assertEqual(json.loads(response.content)[0]["branch"], "Test Branch")
+
+    def test_delete_alert_invalidates_the_cache(self):
+        alert = self.__set_up_an_alert()
+        self.client.get(self.test_url)
+
+        self.client.delete(f"/alerts/v1/delete-alert/{alert.id}")
+        response = self.client.get(self.test_url)
+
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_list_cached_by_a_reader_racing_a_writer_is_never_served(self):
+        self.__set_up_an_alert()
+        version = get_alert_list_version(self.user.id)
+
+        # A writer commits a change after the reader loaded the alerts but before the reader cached them.
+        invalidate_alert_list(self.user.id)
+        set_cached_alert_list(self.user.id, version, [])
+
+        self.assertIsNone(get_cached_alert_list(self.user.id, get_alert_list_version(self.user.id)))
+
+    def test_alerts_are_read_and_written_while_the_cache_is_unavailable(self):
+        with override_settings(CACHES=UNAVAILABLE_CACHES), self.assertLogs("alerts.cache", level="WARNING") as logs:
+            alert = self.__set_up_an_alert()
+            response = self.client.put(f"/alerts/v1/update-alert/{alert.id}", data={"branch": "Test Branch"}, format="json")
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get(self.test_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content)[0]["branch"], "Test Branch")
+
+        self.assertTrue(any("Failed to invalidate the cached alert list" in output for output in logs.output))
+
+    def test_cache_stats_are_only_for_admins(self):
+        response = self.client.get("/alerts/v1/alert-list-cache-stats")
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get("/alerts/v1/alert-list-cache-stats")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), get_alert_list_cache_stats())
+
+    def test_cache_stats_are_read_while_the_cache_is_unavailable(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.__set_up_an_alert()
+
+        with override_settings(CACHES=UNAVAILABLE_CACHES), self.assertLogs("alerts.cache", level="WARNING"):
+            self.client.get(self.test_url)
+            response = self.client.get("/alerts/v1/alert-list-cache-stats")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), get_alert_list_cache_stats())
+
+
+class GetAlertsV2Tests(TestCase):
+    test_url = "/alerts/v2/alerts"
+
+    def setUp(self) -> None:
+        self.maxDiff = None
+        username_and_email = "tester@test.com"
+        self.client = APIClient()
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        return super().setUp()
+
+    def __set_up_an_alert(self, user: Optional[User] = None) -> Alert:
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+        user = user if user else self.user
+
+        return Alert.objects.create(user=user, vehicle=vehicle)
+
+    def test_get_alerts_pages_through_every_alert(self):
+        alerts = [self.__set_up_an_alert() for _ in range(5)]
+        # Alerts created within the same instant are still ordered by their id.
+        Alert.objects.filter(id__in=[alert.id for alert in alerts[1:3]]).update(created=alerts[1].created)
+        for alert in alerts:
+            alert.refresh_from_db()
+        self.__set_up_an_alert(user=User.objects.create_user("other@test.com", "other@test.com", str(uuid4())))
+
+        pages = []
+        cursor = None
+        while True:
+            params = {"page_size": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get(self.test_url, params)
+            self.assertEqual(response.status_code, 200)
+
+            content = json.loads(response.content)
+            pages.append(content["results"])
+            cursor = content["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, [[create_alert_as_dict(alert) for alert in alerts[start : start + 2]] for start in range(0, 5, 2)])
+
+    def test_get_alerts_does_not_query_per_alert(self):
+        for _ in range(5):
+            self.__set_up_an_alert()
+
+        # One query to load the authenticated user and one for the page of alerts and their vehicles.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.test_url)
+
+        self.assertEqual(len(json.loads(response.content)["results"]), 5)
+
+    def test_get_alerts_page_size_is_capped(self):
+        for _ in range(3):
+            self.__set_up_an_alert()
+
+        with mock.patch("alerts.views.MAX_ALERTS_PAGE_SIZE", 2):
+            response = self.client.get(self.test_url, {"page_size": 1000})
+
+        content = json.loads(response.content)
+        self.assertEqual(len(content["results"]), 2)
+        self.assertIsNotNone(content["next_cursor"])
+
+    def test_get_alerts_with_no_alerts(self):
+        response = self.client.get(self.test_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"results": [], "next_cursor": None})
+
+    def test_get_alerts_with_invalid_cursor(self):
+        response = self.client.get(self.test_url, {"cursor": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {"error": INVALID_CURSOR_MESSAGE})
+
+    def test_get_alerts_with_invalid_page_size(self):
+        response = self.client.get(self.test_url, {"page_size": "zero"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {"error": INVALID_PAGE_SIZE_MESSAGE})
+
 
 class CreateAlertsTests(TestCase):
     test_url = "/alerts/v1/create-alert"
@@ -187,7 +539,11 @@ class CreateAlertsTests(TestCase):
         model_year = "1996"
         branch = "Test Branch"
 
-        alert = Alert.objects.create(user=self.user, vehicle=Vehicle.objects.create(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name), branch=branch)
+        alert = Alert.objects.create(
+            user=self.user,
+            vehicle=Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name),
+            branch=branch,
+        )
         mock_handle_create_alert.return_value = alert
 
         data = {
@@ -212,6 +568,8 @@ class CreateAlertsTests(TestCase):
                 "model_name": model_name,
             },
             "branch": alert.branch,
+            "digest": False,
+            "subscription_status": "pending",
             "created": alert.created,
             "modified": alert.modified,
         }
@@ -223,7 +581,10 @@ class CreateAlertsTests(TestCase):
         model_name = "Corolla"
         model_year = "1996"
 
-        alert = Alert.objects.create(user=self.user, vehicle=Vehicle.objects.create(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name))
+        alert = Alert.objects.create(
+            user=self.user,
+            vehicle=Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name),
+        )
         mock_handle_create_alert.return_value = alert
 
         data = {
@@ -246,6 +607,8 @@ class CreateAlertsTests(TestCase):
                 "model_name": model_name,
             },
             "branch": None,
+            "digest": False,
+            "subscription_status": "pending",
             "created": alert.created,
             "modified": alert.modified,
         }
@@ -326,7 +689,7 @@ class UpdateAlertsTests(TestCase):
         model_name = "Corolla"
         model_year = "1996"
 
-        vehicle = Vehicle.objects.create(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
         user = user if user else self.user
 
         return Alert.objects.create(user=user, vehicle=vehicle, branch=branch)
@@ -363,6 +726,8 @@ class UpdateAlertsTests(TestCase):
                 "model_name": model_name,
             },
             "branch": branch,
+            "digest": False,
+            "subscription_status": "pending",
             "created": mock.ANY,
             "modified": mock.ANY,
         }
@@ -405,6 +770,8 @@ class UpdateAlertsTests(TestCase):
                 "model_name": model_name,
             },
             "branch": None,
+            "digest": False,
+            "subscription_status": "pending",
             "created": mock.ANY,
             "modified": mock.ANY,
         }
@@ -418,6 +785,37 @@ class UpdateAlertsTests(TestCase):
         self.assertEqual(alert.vehicle.model_name, model_name)
         self.assertEqual(alert.vehicle.model_year, model_year)
 
+    def test_update_alert_does_not_change_other_alerts_watching_the_same_vehicle(self):
+        other_user = User.objects.create_user("other@test.com", "other@test.com", password=str(uuid4()))
+        alert = self.__set_up_an_alert()
+        other_alert = self.__set_up_an_alert(user=other_user)
+        self.assertEqual(alert.vehicle, other_alert.vehicle)
+
+        url = f"{self.test_url}/{alert.id}"
+        response = self.client.put(url, data={"vehicle": {"model_name": "Camry"}}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        alert.refresh_from_db()
+        other_alert.refresh_from_db()
+        self.assertEqual(alert.vehicle.model_name, "Camry")
+        self.assertEqual(other_alert.vehicle.model_name, "Corolla")
+
+    def test_update_alert_to_another_spelling_of_its_vehicle(self):
+        alert = self.__set_up_an_alert()
+
+        url = f"{self.test_url}/{alert.id}"
+        response = self.client.put(url, data={"vehicle": {"manufacturer_name": "TOYOTA"}, "branch": alert.branch}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["vehicle"]["manufacturer_name"], "Toyota")
+        modified = alert.modified
+        alert.refresh_from_db()
+        # The alert already watches for the vehicle, so nothing is saved or sent to the alert producer.
+        self.assertEqual(alert.modified, modified)
+        self.assertEqual(alert.vehicle.manufacturer_name, "Toyota")
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertFalse(SubscriptionOutboxEntry.objects.exists())
+
     def test_update_alert_with_data_missing_model_year(self):
         manufacturer_name = "Honda"
         model_name = "Civic"
@@ -446,6 +844,8 @@ class UpdateAlertsTests(TestCase):
                 "model_name": model_name,
             },
             "branch": None,
+            "digest": False,
+            "subscription_status": "pending",
             "created": mock.ANY,
             "modified": mock.ANY,
         }
@@ -487,6 +887,8 @@ class UpdateAlertsTests(TestCase):
                 "model_name": current_model_name,
             },
             "branch": None,
+            "digest": False,
+            "subscription_status": "pending",
             "created": mock.ANY,
             "modified": mock.ANY,
         }
@@ -528,6 +930,8 @@ class UpdateAlertsTests(TestCase):
                 "model_name": model_name,
             },
             "branch": None,
+            "digest": False,
+            "subscription_status": "pending",
             "created": mock.ANY,
             "modified": mock.ANY,
         }
@@ -568,6 +972,8 @@ class UpdateAlertsTests(TestCase):
                 "model_name": alert.vehicle.model_name,
             },
             "branch": branch,
+            "digest": False,
+            "subscription_status": "pending",
             "created": mock.ANY,
             "modified": mock.ANY,
         }
@@ -581,6 +987,42 @@ class UpdateAlertsTests(TestCase):
         self.assertEqual(alert.vehicle.manufacturer_name, previous_manufacturer_name)
         self.assertEqual(alert.vehicle.model_name, previous_model_name)
 
+    def test_update_alert_digest(self):
+        alert = self.__set_up_an_alert()
+
+        url = f"{self.test_url}/{alert.id}"
+        response = self.client.put(url, data={"digest": True}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)["digest"])
+
+        alert.refresh_from_db()
+        self.assertTrue(alert.digest)
+
+    def test_update_alert_with_invalid_digest(self):
+        alert = self.__set_up_an_alert()
+
+        url = f"{self.test_url}/{alert.id}"
+        response = self.client.put(url, data={"digest": "false"}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)["error"], INVALID_DIGEST_MESSAGE)
+
+        alert.refresh_from_db()
+        self.assertFalse(alert.digest)
+
+    def test_update_alert_with_invalid_vehicle(self):
+        alert = self.__set_up_an_alert()
+
+        url = f"{self.test_url}/{alert.id}"
+        for vehicle in ["honda", ["honda"], {"manufacturer_name": {"name": "honda"}}]:
+            response = self.client.put(url, data={"vehicle": vehicle}, format="json")
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("vehicle", json.loads(response.content))
+
+        self.assertEqual(Alert.objects.get().vehicle, alert.vehicle)
+
     def test_update_alert_invalid_id(self):
         branch = "New branch"
 
@@ -642,7 +1084,7 @@ class DeleteAlertTestCase(TestCase):
         return super().setUp()
 
     def __set_up_an_alert(self) -> Alert:
-        vehicle = Vehicle.objects.create(
+        vehicle = Vehicle.objects.get_canonical(
             manufacturer_name="Honda",
             model_name="Civic",
             model_year="2001",
@@ -703,7 +1145,7 @@ class GetAlertTestCase(TestCase):
         return super().setUp()
 
     def __set_up_an_alert(self) -> Alert:
-        vehicle = Vehicle.objects.create(
+        vehicle = Vehicle.objects.get_canonical(
             manufacturer_name="Honda",
             model_name="Civic",
             model_year="2001",
@@ -727,6 +1169,29 @@ class GetAlertTestCase(TestCase):
         expected_content = create_alert_as_dict(alert=alert)
         self.assertDictEqual(content, expected_content)
 
+    def test_get_alert_not_modified(self):
+        alert = self.__set_up_an_alert()
+        response = self.client.get(f"{self.test_url}/{alert.id}")
+
+        not_modified_response = self.client.get(f"{self.test_url}/{alert.id}", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified_response.status_code, 304)
+
+        not_modified_response = self.client.get(f"{self.test_url}/{alert.id}", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(not_modified_response.status_code, 304)
+
+    def test_get_alert_modified_after_a_vehicle_update(self):
+        alert = self.__set_up_an_alert()
+        etag = self.client.get(f"{self.test_url}/{alert.id}")["ETag"]
+
+        update_response = self.client.put(
+            f"/alerts/v1/update-alert/{alert.id}", data={"vehicle": {"model_name": "Accord"}, "branch": alert.branch}, format="json"
+        )
+        self.assertEqual(update_response.status_code, 200)
+        response = self.client.get(f"{self.test_url}/{alert.id}", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["vehicle"]["model_name"], "Accord")
+
     def test_get_alert_with_invalid_id(self):
         self.__set_up_an_alert()
 
@@ -745,57 +1210,1079 @@ class GetAlertTestCase(TestCase):
 
 
 class HandleCreateAlertTestCase(TestCase):
-
-    @mock.patch('requests.post', return_value=mock.MagicMock(status_code=201, ok=True))
-    def test_handle_create_alert_success(self, mock_post):
+    @mock.patch("alerts.utils.relay_subscription_outbox")
+    def test_handle_create_alert_success(self, mock_relay):
         username_and_email = "tester@test.com"
         user = User.objects.create_user(username_and_email, username_and_email, str(uuid4()))
 
-        alert = handle_create_alert(
-            user=user,
-            manufacturer_name="Honda",
-            model_name="Civic",
-            model_year="2001",
-            branch="Test branch",
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = handle_create_alert(
+                user=user,
+                manufacturer_name="Honda",
+                model_name="Civic",
+                model_year="2001",
+                branch="Test branch",
+            )
 
         self.assertEqual(alert.user, user)
         self.assertEqual(alert.vehicle.manufacturer_name, "Honda")
         self.assertEqual(alert.vehicle.model_name, "Civic")
         self.assertEqual(alert.vehicle.model_year, "2001")
         self.assertEqual(alert.branch, "Test branch")
+        self.assertFalse(alert.digest)
+        self.assertEqual(alert.subscription_status, SubscriptionStatus.PENDING)
 
         self.assertTrue(
             Vehicle.objects.filter(
                 model_name="Civic",
                 manufacturer_name="Honda",
                 model_year="2001",
-        ).exists()
+            ).exists()
         )
 
-    @mock.patch('requests.post', return_value=mock.MagicMock(status_code=500, ok=False))
-    def test_handle_create_alert_failure(self, mock_post):
+        # The subscription is written to the outbox with the alert and relayed once committed.
+        entry = SubscriptionOutboxEntry.objects.get()
+        self.assertEqual(entry.alert, alert)
+        self.assertEqual(entry.action, SubscriptionOutboxEntry.Action.SUBSCRIBE)
+        self.assertEqual(entry.payload, {"model": "Civic", "manufacturer": "Honda", "year": "2001", "client_id": str(alert.external_id)})
+        mock_relay.delay.assert_called_once()
+
+    @mock.patch("alerts.utils.relay_subscription_outbox")
+    def test_handle_create_alert_does_not_fail_when_the_relay_can_not_be_queued(self, mock_relay):
         username_and_email = "tester@test.com"
         user = User.objects.create_user(username_and_email, username_and_email, str(uuid4()))
+        mock_relay.delay.side_effect = ConnectionError("broker down")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = handle_create_alert(user=user, manufacturer_name="Honda", model_name="Civic", model_year="2001")
+
+        self.assertTrue(Alert.objects.filter(id=alert.id).exists())
+        self.assertEqual(SubscriptionOutboxEntry.objects.filter(alert=alert).count(), 1)
+
+
+def build_stub_producer_client(stub_producer: StubProducerServer, bulk: bool = False, max_retries: int = 0) -> AlertProducerClient:
+    return AlertProducerClient(
+        subscribe_url=f"{stub_producer.url}{SUBSCRIBE_PATH}",
+        unsubscribe_url=f"{stub_producer.url}{UNSUBSCRIBE_PATH}",
+        bulk_subscribe_url=f"{stub_producer.url}{BULK_SUBSCRIBE_PATH}" if bulk else "",
+        bulk_unsubscribe_url=f"{stub_producer.url}{BULK_UNSUBSCRIBE_PATH}" if bulk else "",
+        max_retries=max_retries,
+    )
+
+
+class AlertProducerClientTests(TestCase):
+    subscription = {"manufacturer": "Honda", "model": "Civic", "year": "2001", "client_id": "a"}
+
+    def setUp(self) -> None:
+        self.stub_producer = StubProducerServer().start()
+        self.addCleanup(self.stub_producer.stop)
+
+        # Don't actually wait between retries.
+        sleep_patcher = mock.patch("alerts.producer_client.time.sleep")
+        self.mock_sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+        return super().setUp()
+
+    def test_subscribe_and_unsubscribe_reuse_one_connection(self):
+        client = build_stub_producer_client(self.stub_producer)
+
+        client.subscribe(self.subscription)
+        self.assertEqual(self.stub_producer.subscriptions, {("a", "Honda", "Civic", "2001")})
+
+        client.unsubscribe(self.subscription)
+        client.subscribe(self.subscription)
+        client.close()
+
+        self.assertEqual(self.stub_producer.number_of_requests, 3)
+        self.assertEqual(self.stub_producer.number_of_connections, 1)
+
+    def test_retries_when_the_producer_is_unavailable(self):
+        self.stub_producer.failure_rate = 1
+        client = build_stub_producer_client(self.stub_producer, max_retries=2)
 
         with self.assertRaises(SubscriptionFailureException):
-            handle_create_alert(
-                user=user,
-                manufacturer_name="Honda",
-                model_name="Civic",
-                model_year="2001",
-                branch="Test branch",
-            )
+            client.subscribe(self.subscription)
 
-        self.assertFalse(
-            Alert.objects.filter(user=user).exists()
-        )
+        self.assertEqual(self.stub_producer.number_of_requests, 3)
+        self.assertEqual(self.mock_sleep.call_count, 2)
 
-        self.assertFalse(
-            Vehicle.objects.filter(
-                model_name="Civic",
-                manufacturer_name="Honda",
-                model_year="2001",
-        ).exists()
+    def test_retries_when_the_producer_can_not_be_reached(self):
+        client = AlertProducerClient(subscribe_url="http://127.0.0.1:1/v1/subscribe-vehicle", max_retries=1)
+
+        with self.assertRaises(requests.ConnectionError):
+            client.subscribe(self.subscription)
+
+        self.mock_sleep.assert_called_once()
+
+    def test_subscribe_many_fails_the_chunk_on_malformed_results(self):
+        client = build_stub_producer_client(self.stub_producer, bulk=True)
+        subscriptions = [{**self.subscription, "client_id": str(client_id)} for client_id in range(3)]
 
+        for body in ({"results": [{"ok": True}]}, {"results": [{"ok": True}, "ok", None]}, {"results": {"ok": True}}, [], {}):
+            response = mock.Mock(ok=True, status_code=200)
+            response.json.return_value = body
+            with mock.patch.object(client.session, "request", return_value=response):
+                errors = client.subscribe_many(subscriptions)
+
+            self.assertEqual(len(errors), 3, body)
+            self.assertTrue(all("malformed results" in error for error in errors), body)
+
+    def test_send_outbox_entries_with_a_short_bulk_response(self):
+        user = User.objects.create_user("tester@test.com", "tester@test.com", password=str(uuid4()))
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Honda", model_name="Civic", model_year="2001")
+        alerts = Alert.objects.bulk_create([Alert(user=user, vehicle=vehicle) for _ in range(2)])
+        entries = SubscriptionOutboxEntry.objects.bulk_create(
+            [SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.SUBSCRIBE, alert) for alert in alerts]
         )
+        client = build_stub_producer_client(self.stub_producer, bulk=True)
+        response = mock.Mock(ok=True, status_code=200)
+        response.json.return_value = {"results": [{"ok": True}]}
+
+        with mock.patch("alerts.tasks.get_producer_client", return_value=client), mock.patch.object(
+            client.session, "request", return_value=response
+        ):
+            errors = send_outbox_entries(entries)
+
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all(error is not None for error in errors))
+
+    def test_subscribe_many_sends_one_request_with_bulk_endpoints(self):
+        client = build_stub_producer_client(self.stub_producer, bulk=True)
+        subscriptions = [{**self.subscription, "client_id": str(client_id)} for client_id in range(3)]
+
+        errors = client.subscribe_many(subscriptions)
+
+        self.assertEqual(errors, [None, None, None])
+        self.assertEqual(self.stub_producer.number_of_requests, 1)
+        self.assertEqual(len(self.stub_producer.subscriptions), 3)
+
+        self.assertEqual(client.unsubscribe_many(subscriptions[:2]), [None, None])
+        self.assertEqual(self.stub_producer.subscriptions, {("2", "Honda", "Civic", "2001")})
+
+    def test_subscribe_many_falls_back_to_one_request_per_subscription(self):
+        client = build_stub_producer_client(self.stub_producer)
+        subscriptions = [{**self.subscription, "client_id": str(client_id)} for client_id in range(3)]
+
+        self.assertEqual(client.subscribe_many(subscriptions), [None, None, None])
+        self.assertEqual(self.stub_producer.number_of_requests, 3)
+
+        self.stub_producer.failure_rate = 1
+        errors = client.subscribe_many(subscriptions[:1])
+        self.assertIn("503", errors[0])
+
+
+class SubscriptionOutboxRelayTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, str(uuid4()))
+        self.client = APIClient()
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        self.stub_producer = StubProducerServer().start()
+        self.addCleanup(self.stub_producer.stop)
+        client_patcher = mock.patch("alerts.tasks.get_producer_client", return_value=build_stub_producer_client(self.stub_producer))
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+
+        return super().setUp()
+
+    def __set_up_an_alert(self) -> Alert:
+        with mock.patch("alerts.utils.relay_subscription_outbox"):
+            return handle_create_alert(user=self.user, manufacturer_name="Honda", model_name="Civic", model_year="2001")
+
+    def test_relay_subscribes_and_activates_the_alert(self):
+        alert = self.__set_up_an_alert()
+
+        result = relay_subscription_outbox()
+
+        self.assertEqual(result, {"sent": 1, "retrying": 0, "failed": 0})
+        self.assertEqual(self.stub_producer.subscriptions, {(str(alert.external_id), "Honda", "Civic", "2001")})
+        alert.refresh_from_db()
+        self.assertEqual(alert.subscription_status, SubscriptionStatus.ACTIVE)
+        self.assertEqual(SubscriptionOutboxEntry.objects.get().status, SubscriptionOutboxEntry.Status.SENT)
+
+        # Nothing is left to send.
+        self.assertEqual(relay_subscription_outbox(), {"sent": 0, "retrying": 0, "failed": 0})
+        self.assertEqual(self.stub_producer.number_of_requests, 1)
+
+    def test_relay_retries_with_a_backoff(self):
+        self.stub_producer.failure_rate = 1
+        self.__set_up_an_alert()
+
+        result = relay_subscription_outbox()
+
+        self.assertEqual(result, {"sent": 0, "retrying": 1, "failed": 0})
+        entry = SubscriptionOutboxEntry.objects.get()
+        self.assertEqual(entry.status, SubscriptionOutboxEntry.Status.PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+        self.assertIn("503", entry.last_error)
+
+        # The entry isn't due yet.
+        self.assertEqual(relay_subscription_outbox(), {"sent": 0, "retrying": 0, "failed": 0})
+        self.assertEqual(self.stub_producer.number_of_requests, 1)
+
+    def test_relay_gives_up_after_the_max_attempts(self):
+        self.stub_producer.failure_rate = 1
+        alert = self.__set_up_an_alert()
+        SubscriptionOutboxEntry.objects.update(attempts=settings.SUBSCRIPTION_OUTBOX_MAX_ATTEMPTS - 1)
+
+        result = relay_subscription_outbox()
+
+        self.assertEqual(result, {"sent": 0, "retrying": 0, "failed": 1})
+        alert.refresh_from_db()
+        self.assertEqual(alert.subscription_status, SubscriptionStatus.FAILED)
+        self.assertEqual(SubscriptionOutboxEntry.objects.get().status, SubscriptionOutboxEntry.Status.FAILED)
+
+    def test_relay_keeps_the_order_of_an_alerts_entries(self):
+        alert = self.__set_up_an_alert()
+        with mock.patch("alerts.utils.relay_subscription_outbox"):
+            self.client.delete(f"/alerts/v1/delete-alert/{alert.id}")
+
+        self.stub_producer.failure_rate = 1
+        result = relay_subscription_outbox()
+
+        # The unsubscribe waits for the subscribe before it to go through.
+        self.assertEqual(result, {"sent": 0, "retrying": 1, "failed": 0})
+        self.assertEqual(self.stub_producer.number_of_requests, 1)
+
+        self.stub_producer.failure_rate = 0
+        SubscriptionOutboxEntry.objects.update(next_attempt_at=timezone.now())
+        result = relay_subscription_outbox()
+
+        self.assertEqual(result, {"sent": 2, "retrying": 0, "failed": 0})
+        self.assertEqual(self.stub_producer.subscriptions, set())
+
+    @mock.patch("alerts.tasks.relay_subscription_outbox.delay")
+    def test_relay_requeues_itself_when_the_batch_is_full(self, mock_delay):
+        self.__set_up_an_alert()
+        self.__set_up_an_alert()
+
+        result = relay_subscription_outbox(batch_size=1)
+
+        self.assertEqual(result, {"sent": 1, "retrying": 0, "failed": 0})
+        mock_delay.assert_called_once_with(batch_size=1)
+
+    def test_relay_invalidates_the_cached_alert_list(self):
+        self.__set_up_an_alert()
+        self.assertEqual(json.loads(self.client.get("/alerts/v1/get-alerts").content)[0]["subscription_status"], "pending")
+
+        relay_subscription_outbox()
+
+        self.assertEqual(json.loads(self.client.get("/alerts/v1/get-alerts").content)[0]["subscription_status"], "active")
+
+    def test_update_alert_vehicle_moves_the_subscription(self):
+        alert = self.__set_up_an_alert()
+
+        with mock.patch("alerts.utils.relay_subscription_outbox"):
+            response = self.client.put(
+                f"/alerts/v1/update-alert/{alert.id}",
+                data={"vehicle": {"manufacturer_name": "Toyota", "model_name": "Corolla", "model_year": "1996"}},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        entries = list(SubscriptionOutboxEntry.objects.order_by("id").values_list("action", "payload__manufacturer"))
+        self.assertEqual(entries, [("subscribe", "Honda"), ("unsubscribe", "Honda"), ("subscribe", "Toyota")])
+
+    def test_delete_alert_unsubscribes(self):
+        alert = self.__set_up_an_alert()
+
+        with mock.patch("alerts.utils.relay_subscription_outbox"):
+            response = self.client.delete(f"/alerts/v1/delete-alert/{alert.id}")
+
+        self.assertEqual(response.status_code, 204)
+        entry = SubscriptionOutboxEntry.objects.get(action=SubscriptionOutboxEntry.Action.UNSUBSCRIBE)
+        self.assertIsNone(entry.alert)
+        self.assertEqual(entry.client_id, alert.external_id)
+
+
+class ReconcileSubscriptionsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, str(uuid4()))
+
+        self.stub_producer = StubProducerServer().start()
+        self.addCleanup(self.stub_producer.stop)
+        self.producer_client = AlertProducerClient(
+            subscribe_url=f"{self.stub_producer.url}{SUBSCRIBE_PATH}",
+            unsubscribe_url=f"{self.stub_producer.url}{UNSUBSCRIBE_PATH}",
+            bulk_subscribe_url="",
+            bulk_unsubscribe_url="",
+            subscriptions_url=f"{self.stub_producer.url}{SUBSCRIPTIONS_PATH}",
+            max_retries=0,
+        )
+        client_patcher = mock.patch("alerts.reconciliation.get_producer_client", return_value=self.producer_client)
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+
+        return super().setUp()
+
+    def __set_up_an_alert(self, manufacturer_name: str = "Honda", subscribed_to: Optional[str] = None) -> Alert:
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_name="Civic", model_year="2001")
+        alert = Alert.objects.create(user=self.user, vehicle=vehicle)
+        if subscribed_to:
+            self.stub_producer.subscriptions.add((str(alert.external_id), subscribed_to, "Civic", "2001"))
+
+        return alert
+
+    def test_reconcile_only_sends_the_differences(self):
+        in_sync = self.__set_up_an_alert(subscribed_to="HONDA")
+        missing = self.__set_up_an_alert()
+        moved = self.__set_up_an_alert(manufacturer_name="Acura", subscribed_to="Honda")
+        self.stub_producer.subscriptions.add((str(uuid4()), "Honda", "Civic", "2001"))
+
+        counts = reconcile_subscriptions(chunk_size=2)
+
+        self.assertEqual(counts, {"added": 2, "removed": 2, "unchanged": 1, "skipped": 0, "errors": 0})
+        self.assertEqual(
+            self.stub_producer.subscriptions,
+            {
+                (str(in_sync.external_id), "HONDA", "Civic", "2001"),
+                (str(missing.external_id), "Honda", "Civic", "2001"),
+                (str(moved.external_id), "Acura", "Civic", "2001"),
+            },
+        )
+        missing.refresh_from_db()
+        self.assertEqual(missing.subscription_status, SubscriptionStatus.ACTIVE)
+
+        # Everything is in sync now.
+        self.assertEqual(reconcile_subscriptions(chunk_size=2), {"added": 0, "removed": 0, "unchanged": 3, "skipped": 0, "errors": 0})
+
+    def test_reconcile_skips_alerts_waiting_in_the_outbox(self):
+        with mock.patch("alerts.utils.relay_subscription_outbox"):
+            handle_create_alert(user=self.user, manufacturer_name="Honda", model_name="Civic", model_year="2001")
+
+        counts = reconcile_subscriptions(chunk_size=10)
+
+        self.assertEqual(counts, {"added": 0, "removed": 0, "unchanged": 0, "skipped": 1, "errors": 0})
+        self.assertEqual(self.stub_producer.subscriptions, set())
+
+    def test_reconcile_dry_run_does_not_send_anything(self):
+        self.__set_up_an_alert()
+        self.stub_producer.subscriptions.add((str(uuid4()), "Honda", "Civic", "2001"))
+        subscriptions = set(self.stub_producer.subscriptions)
+
+        out = StringIO()
+        call_command("reconcile_subscriptions", "--dry-run", stdout=out)
+
+        self.assertIn("Added 1, removed 1 and left 0 subscriptions alone", out.getvalue())
+        self.assertEqual(self.stub_producer.subscriptions, subscriptions)
+
+
+class BulkAlertsTests(TestCase):
+    test_url = "/alerts/v1/bulk-alerts"
+
+    def setUp(self) -> None:
+        cache.clear()
+        username_and_email = "tester@test.com"
+        self.client = APIClient()
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        relay_patcher = mock.patch("alerts.utils.relay_subscription_outbox")
+        self.mock_relay = relay_patcher.start()
+        self.addCleanup(relay_patcher.stop)
+
+        return super().setUp()
+
+    def __build_alert_data(self, model_year: str, branch: Optional[str] = None) -> dict:
+        return {"vehicle": {"manufacturer_name": "Honda", "model_name": "Civic", "model_year": model_year}, "branch": branch}
+
+    def __set_up_an_alert(self, model_year: str = "2001") -> Alert:
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Honda", model_name="Civic", model_year=model_year)
+        return Alert.objects.create(user=self.user, vehicle=vehicle)
+
+    def test_bulk_create_alerts(self):
+        data = [self.__build_alert_data("2001", "Ottawa"), {"vehicle": {"manufacturer_name": "Honda"}}, self.__build_alert_data("2001")]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.test_url, data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [201, 400, 201])
+        self.assertIn("model_name", results[1]["errors"]["vehicle"])
+        self.assertEqual(results[0]["alert"]["branch"], "Ottawa")
+        self.assertEqual(results[2]["alert"]["subscription_status"], "pending")
+
+        alerts = Alert.objects.filter(user=self.user)
+        self.assertEqual(alerts.count(), 2)
+        # Both alerts share the one vehicle.
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.assertEqual(Alert.history.filter(history_type="+", history_user=self.user).count(), 2)
+        self.assertEqual(SubscriptionOutboxEntry.objects.filter(action=SubscriptionOutboxEntry.Action.SUBSCRIBE).count(), 2)
+        self.mock_relay.delay.assert_called_once()
+
+    def test_bulk_create_alerts_does_not_query_per_alert(self):
+        def count_queries(number_of_alerts: int) -> int:
+            data = [self.__build_alert_data(str(2000 + year)) for year in range(number_of_alerts)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.test_url, data=data, format="json")
+
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        # Cache the authenticated user first so both counts are without loading it.
+        count_queries(1)
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_bulk_create_alerts_invalidates_the_cached_alert_list(self):
+        self.client.get("/alerts/v1/get-alerts")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.test_url, data=[self.__build_alert_data("2001")], format="json")
+
+        self.assertEqual(len(json.loads(self.client.get("/alerts/v1/get-alerts").content)), 1)
+
+    def test_bulk_alerts_with_invalid_data(self):
+        too_many = [self.__build_alert_data("2001")] * (MAX_BULK_ALERT_OPERATIONS + 1)
+
+        for data in ([], {"vehicle": {}}, too_many):
+            response = self.client.post(self.test_url, data=data, format="json")
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content), {"error": INVALID_BULK_ALERTS_MESSAGE})
+
+        self.assertFalse(Alert.objects.exists())
+
+    def test_bulk_update_alerts(self):
+        moved = self.__set_up_an_alert()
+        unchanged = self.__set_up_an_alert()
+        data = [
+            {"id": moved.id, "vehicle": {"model_year": "2002"}, "branch": "Ottawa"},
+            {"id": 100000, "branch": "Ottawa"},
+            {"id": unchanged.id},
+            {"id": moved.id, "branch": "Montreal"},
+        ]
+
+        response = self.client.put(self.test_url, data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [200, 404, 400, 400])
+        self.assertEqual(results[0]["alert"]["vehicle"]["model_year"], "2002")
+
+        moved.refresh_from_db()
+        self.assertEqual(moved.branch, "Ottawa")
+        self.assertEqual(moved.vehicle.model_year, "2002")
+        self.assertEqual(moved.history.filter(history_type="~").count(), 1)
+        self.assertEqual(
+            [(entry.action, entry.payload["year"]) for entry in SubscriptionOutboxEntry.objects.order_by("id")],
+            [("unsubscribe", "2001"), ("subscribe", "2002")],
+        )
+
+    def test_bulk_update_alerts_to_another_spelling_of_their_vehicle(self):
+        alert = self.__set_up_an_alert()
+        data = [{"id": alert.id, "vehicle": {"manufacturer_name": "HONDA", "model_name": "civic"}}, {"id": alert.id, "branch": "Ottawa"}]
+
+        response = self.client.put(self.test_url, data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        # Only the first operation on an alert is applied.
+        self.assertEqual([result["status"] for result in results], [200, 400])
+        self.assertEqual(results[0]["alert"]["vehicle"]["manufacturer_name"], "Honda")
+        self.assertEqual(Alert.objects.get().vehicle, alert.vehicle)
+        self.assertFalse(SubscriptionOutboxEntry.objects.exists())
+
+    def test_bulk_update_alerts_with_invalid_digest(self):
+        alert = self.__set_up_an_alert()
+        other_alert = self.__set_up_an_alert()
+        data = [{"id": alert.id, "digest": "false", "branch": "Ottawa"}, {"id": other_alert.id, "digest": True}]
+
+        response = self.client.put(self.test_url, data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual(results[0], {"id": alert.id, "status": 400, "error": INVALID_DIGEST_MESSAGE})
+        self.assertEqual(results[1]["status"], 200)
+        alert.refresh_from_db()
+        other_alert.refresh_from_db()
+        self.assertEqual((alert.digest, alert.branch), (False, None))
+        self.assertTrue(other_alert.digest)
+
+    def test_bulk_update_alerts_with_invalid_vehicle(self):
+        alert = self.__set_up_an_alert()
+        other_alert = self.__set_up_an_alert()
+        data = [{"id": alert.id, "vehicle": "honda", "branch": "Ottawa"}, {"id": other_alert.id, "branch": "Ottawa"}]
+
+        response = self.client.put(self.test_url, data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual(results[0]["status"], 400)
+        self.assertIn("vehicle", results[0]["errors"])
+        self.assertEqual(results[1]["status"], 200)
+        alert.refresh_from_db()
+        other_alert.refresh_from_db()
+        self.assertIsNone(alert.branch)
+        self.assertEqual(other_alert.branch, "Ottawa")
+
+    def test_bulk_delete_alerts(self):
+        alert = self.__set_up_an_alert()
+        other_user = User.objects.create_user("other@test.com", "other@test.com", password=str(uuid4()))
+        other_alert = Alert.objects.create(user=other_user, vehicle=alert.vehicle)
+
+        response = self.client.delete(self.test_url, data=[alert.id, other_alert.id], format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [204, 404])
+        self.assertFalse(Alert.objects.filter(id=alert.id).exists())
+        self.assertTrue(Alert.objects.filter(id=other_alert.id).exists())
+        self.assertEqual(SubscriptionOutboxEntry.objects.get().client_id, alert.external_id)
+
+    def test_bulk_update_alerts_with_malformed_ids(self):
+        alert = self.__set_up_an_alert()
+        data = [
+            {"id": [alert.id], "branch": "Ottawa"},
+            {"id": True, "branch": "Ottawa"},
+            {"id": str(alert.id)},
+            "invalid",
+            {"id": alert.id, "branch": "Ottawa"},
+        ]
+
+        response = self.client.put(self.test_url, data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [400, 400, 400, 400, 200])
+        self.assertEqual(results[0], {"id": [alert.id], "status": 400, "error": INVALID_ALERT_ID_MESSAGE})
+        alert.refresh_from_db()
+        self.assertEqual(alert.branch, "Ottawa")
+
+    def test_bulk_delete_alerts_with_malformed_ids(self):
+        alert = self.__set_up_an_alert()
+        kept_alert = self.__set_up_an_alert()
+
+        response = self.client.delete(self.test_url, data=[alert.id, [kept_alert.id], True, {"id": kept_alert.id}, None], format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [204, 400, 400, 400, 400])
+        self.assertEqual(results[1]["error"], INVALID_ALERT_ID_MESSAGE)
+        self.assertFalse(Alert.objects.filter(id=alert.id).exists())
+        self.assertTrue(Alert.objects.filter(id=kept_alert.id).exists())
+
+
+class DeferredAlertHistoryTests(TestCase):
+    history_fields = ("id", "history_type", "user_id", "vehicle_id", "branch", "digest", "subscription_status", "external_id")
+
+    def setUp(self) -> None:
+        username_and_email = "tester@test.com"
+        self.client = APIClient()
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.vehicle = Vehicle.objects.get_canonical(manufacturer_name="Honda", model_name="Civic", model_year="2001")
+
+        relay_patcher = mock.patch("alerts.utils.relay_subscription_outbox")
+        relay_patcher.start()
+        self.addCleanup(relay_patcher.stop)
+
+        return super().setUp()
+
+    def __make_changes(self) -> Alert:
+        alert = Alert.objects.create(user=self.user, vehicle=self.vehicle)
+        alert.branch = "Ottawa"
+        alert.save()
+        alert.digest = True
+        alert.save()
+
+        return alert
+
+    def __get_history(self, alert_id: int) -> list[tuple]:
+        return list(Alert.history.filter(id=alert_id).order_by("history_date").values_list(*self.history_fields))
+
+    def test_history_is_written_right_away_when_not_deferred(self):
+        with CaptureQueriesContext(connection) as queries, history_batch():
+            alert = self.__make_changes()
+
+        self.assertEqual(len(self.__get_history(alert.id)), 3)
+        history_inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "alerts_historicalalert"')]
+        self.assertEqual(len(history_inserts), 3)
+
+    @override_settings(ALERT_HISTORY_DEFERRED=True)
+    def test_deferred_history_is_written_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries, history_batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                alert = self.__make_changes()
+
+            self.assertEqual(self.__get_history(alert.id), [])
+
+        history_inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "alerts_historicalalert"')]
+        self.assertEqual(len(history_inserts), 1)
+        self.assertEqual([record[1] for record in self.__get_history(alert.id)], ["+", "~", "~"])
+
+    def test_deferred_history_matches_the_history_written_right_away(self):
+        immediate_alert = self.__make_changes()
+        immediate_history = self.__get_history(immediate_alert.id)
+
+        with override_settings(ALERT_HISTORY_DEFERRED=True), history_batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                deferred_alert = self.__make_changes()
+            written_after = timezone.now()
+
+        deferred_history = self.__get_history(deferred_alert.id)
+        self.assertEqual(
+            [(record[1], *record[2:7]) for record in deferred_history],
+            [(record[1], *record[2:7]) for record in immediate_history],
+        )
+        self.assertTrue(all(record[7] == deferred_alert.external_id for record in deferred_history))
+        # The history dates are the ones of the changes, not of when the history was written.
+        history_dates = list(Alert.history.filter(id=deferred_alert.id).order_by("history_id").values_list("history_date", flat=True))
+        self.assertEqual(history_dates, sorted(history_dates))
+        self.assertLess(history_dates[-1], written_after)
+
+    @override_settings(ALERT_HISTORY_DEFERRED=True)
+    def test_deferred_history_of_rolled_back_changes_is_discarded(self):
+        alert = Alert.objects.create(user=self.user, vehicle=self.vehicle)
+
+        with history_batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        alert.branch = "Ottawa"
+                        alert.save()
+                        raise IntegrityError()
+                except IntegrityError:
+                    alert.branch = None
+
+                alert.digest = True
+                alert.save()
+
+        self.assertEqual([record[1] for record in self.__get_history(alert.id)], ["+", "~"])
+        self.assertIsNone(Alert.history.filter(id=alert.id).latest().branch)
+
+    @override_settings(ALERT_HISTORY_DEFERRED=True)
+    def test_deferred_history_of_a_request(self):
+        alert = Alert.objects.create(user=self.user, vehicle=self.vehicle)
+        data = [
+            {"id": alert.id, "vehicle": {"manufacturer_name": "Honda", "model_name": "Civic", "model_year": "2001"}, "branch": "Ottawa"}
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put("/alerts/v1/bulk-alerts", data=data, format="json")
+            delete_response = self.client.delete(f"/alerts/v1/delete-alert/{alert.id}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(delete_response.status_code, 204)
+        history = Alert.history.filter(id=alert.id).order_by("history_date")
+        self.assertEqual([record.history_type for record in history], ["+", "~", "-"])
+        self.assertEqual(history[1].branch, "Ottawa")
+
+    @override_settings(ALERT_HISTORY_DEFERRED=True)
+    def test_deferred_history_sends_the_history_signals_once_per_change(self):
+        received = []
+
+        def receive(signal, history_instance, **kwargs):
+            received.append((signal, history_instance.history_type))
+
+        for signal in (pre_create_historical_record, post_create_historical_record):
+            signal.connect(receive, sender=Alert.history.model, dispatch_uid="deferred-history-test")
+            self.addCleanup(signal.disconnect, sender=Alert.history.model, dispatch_uid="deferred-history-test")
+
+        with self.captureOnCommitCallbacks(execute=True), history_batch():
+            self.__make_changes()
+
+        self.assertEqual(
+            received,
+            [
+                (signal, history_type)
+                for history_type in ("+", "~", "~")
+                for signal in (pre_create_historical_record, post_create_historical_record)
+            ],
+        )
+        self.assertEqual(len(self.__get_history(Alert.objects.get().id)), 3)
+
+    def test_simple_history_hooks_are_unchanged(self):
+        # DeferredHistoricalRecords wraps these, review it before upgrading django-simple-history if this fails.
+        self.assertEqual(
+            list(inspect.signature(HistoricalRecords.create_historical_record).parameters), ["self", "instance", "history_type", "using"]
+        )
+        self.assertEqual(
+            list(inspect.signature(HistoricalRecords.create_historical_record_m2ms).parameters), ["self", "history_instance", "instance"]
+        )
+        self.assertIn("bases", inspect.signature(HistoricalRecords.__init__).parameters)
+        self.assertIn("history_instance.save(using=using)", inspect.getsource(HistoricalRecords.create_historical_record))
+
+
+class PruneAlertHistoryTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user("tester@test.com", "tester@test.com", password=str(uuid4()))
+        self.vehicle = Vehicle.objects.get_canonical(manufacturer_name="Honda", model_name="Civic", model_year="2001")
+
+        for branch in range(3):
+            alert = Alert.objects.create(user=self.user, vehicle=self.vehicle)
+            alert.branch = str(branch)
+            alert.save()
+
+        # Age the history of the first two alerts past the retention period.
+        self.old_alert_ids = list(Alert.objects.order_by("id").values_list("id", flat=True)[:2])
+        Alert.history.filter(id__in=self.old_alert_ids).update(history_date=timezone.now() - timedelta(days=400))
+
+        return super().setUp()
+
+    def test_prune_alert_history_in_chunks(self):
+        with mock.patch("alerts.history_retention.time.sleep") as mock_sleep:
+            result = prune_alert_history(max_age_days=365, chunk_size=3, sleep_seconds=0.5)
+
+        self.assertEqual(result["pruned"], 4)
+        self.assertIsNone(result["archive"])
+        self.assertFalse(Alert.history.filter(id__in=self.old_alert_ids).exists())
+        self.assertEqual(Alert.history.count(), 2)
+        # One pause between the full first chunk and the second one.
+        mock_sleep.assert_called_once_with(0.5)
+
+    def test_prune_alert_history_with_archive(self):
+        expected_records = list(Alert.history.filter(id__in=self.old_alert_ids).order_by("history_id").values("history_id", "id", "branch"))
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            result = prune_alert_history(max_age_days=365, chunk_size=3, archive_dir=archive_dir)
+
+            self.assertEqual(os.listdir(archive_dir), [os.path.basename(result["archive"])])
+            with gzip.open(result["archive"], "rt") as archive:
+                records = [json.loads(line) for line in archive]
+
+        self.assertEqual(result["pruned"], 4)
+        self.assertEqual([{key: record[key] for key in ("history_id", "id", "branch")} for record in records], expected_records)
+        self.assertEqual(records[0]["history_type"], "+")
+        self.assertFalse(Alert.history.filter(id__in=self.old_alert_ids).exists())
+
+    def test_prune_alert_history_without_old_records_does_not_create_an_archive(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            result = prune_alert_history(max_age_days=500, chunk_size=3, archive_dir=archive_dir)
+
+            self.assertEqual(os.listdir(archive_dir), [])
+
+        self.assertEqual(result["pruned"], 0)
+        self.assertEqual(Alert.history.count(), 6)
+
+    def test_prune_alert_history_command_dry_run(self):
+        out = StringIO()
+        call_command("prune_alert_history", "--days", "365", "--chunk-size", "3", "--sleep", "0", "--dry-run", stdout=out)
+
+        self.assertIn("Would prune 4 alert history records", out.getvalue())
+        self.assertIn("rows/s", out.getvalue())
+        self.assertEqual(Alert.history.count(), 6)
+
+
+class FastAlertSerializationTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user("tester@test.com", "tester@test.com", password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Honda", model_name="Civic", model_year="2001")
+        Alert.objects.create(user=self.user, vehicle=vehicle, branch="Ottawa", digest=True)
+        alert = Alert.objects.create(user=self.user, vehicle=vehicle)
+        # A date without microseconds is formatted without them.
+        Alert.objects.filter(id=alert.id).update(created=timezone.now().replace(microsecond=0))
+
+        return super().setUp()
+
+    def test_serialize_alerts_matches_alert_serializer(self):
+        alerts = Alert.objects.filter(user=self.user).order_by("id")
+
+        self.assertEqual(
+            serialize_alerts(alerts.values(*ALERT_VALUES_FIELDS)),
+            json.loads(json.dumps(AlertSerializer(alerts.select_related("vehicle"), many=True).data)),
+        )
+
+    def test_fast_json_response_without_orjson_matches_json_response(self):
+        data = serialize_alerts(Alert.objects.filter(user=self.user).values(*ALERT_VALUES_FIELDS))
+
+        with mock.patch("alerts.responses.orjson", None):
+            response = FastJsonResponse(data, status=200)
+
+        self.assertEqual(response.content, JsonResponse(data, safe=False).content)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_get_alerts_is_the_same_with_and_without_the_fast_path(self):
+        with override_settings(ALERT_FAST_SERIALIZATION=False):
+            slow_response = self.client.get("/alerts/v1/get-alerts")
+            slow_page = self.client.get("/alerts/v2/alerts", {"page_size": 1})
+
+        cache.clear()
+        fast_response = self.client.get("/alerts/v1/get-alerts")
+        fast_page = self.client.get("/alerts/v2/alerts", {"page_size": 1})
+
+        self.assertEqual(json.loads(fast_response.content), json.loads(slow_response.content))
+        self.assertEqual(json.loads(fast_page.content), json.loads(slow_page.content))
+        self.assertIsNotNone(json.loads(fast_page.content)["next_cursor"])
+
+    def test_benchmark_alert_serialization_command(self):
+        out = StringIO()
+        call_command("benchmark_alert_serialization", "--sizes", "3", "--repeat", "1", stdout=out)
+
+        self.assertIn("3 alerts: serializer", out.getvalue())
+        # The alerts created for the benchmark are rolled back.
+        self.assertEqual(Alert.objects.count(), 2)
+
+
+class AsgiAlertViewsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user("tester@test.com", "tester@test.com", password=str(uuid4()))
+        self.authorization = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Honda", model_name="Civic", model_year="2001")
+        self.alert = Alert.objects.create(user=self.user, vehicle=vehicle, branch="Ottawa")
+
+        relay_patcher = mock.patch("alerts.utils.relay_subscription_outbox")
+        relay_patcher.start()
+        self.addCleanup(relay_patcher.stop)
+
+        return super().setUp()
+
+    async def test_get_alerts(self):
+        # Through the ASGI request handler like under uvicorn, which runs the views in a thread.
+        client = AsyncClient()
+        response = await client.get("/alerts/v1/get-alerts", AUTHORIZATION=self.authorization)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [create_alert_as_dict(self.alert)])
+
+        response = await client.get("/alerts/v1/get-alerts", AUTHORIZATION=self.authorization, IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(response.status_code, 304)
+
+    async def test_create_and_delete_alert(self):
+        client = AsyncClient()
+        data = {"vehicle": {"manufacturer_name": "Toyota", "model_name": "Corolla", "model_year": "1996"}}
+
+        response = await client.post(
+            "/alerts/v1/create-alert", data=data, content_type="application/json", AUTHORIZATION=self.authorization
+        )
+
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.content)["id"]
+
+        response = await client.delete(f"/alerts/v1/delete-alert/{alert_id}", AUTHORIZATION=self.authorization)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Alert.objects.filter(id=alert_id).aexists())
+
+    @override_settings(DEBUG=True)
+    def test_asgi_handler_does_not_adapt_the_middleware(self):
+        # Django only logs the middleware it adapts in debug.
+        with mock.patch("django.core.handlers.base.logger") as mock_logger:
+            ASGIHandler()
+
+        adapted = [call for call in mock_logger.debug.call_args_list if "adapted" in call.args[0]]
+        self.assertEqual(adapted, [])
+
+    @override_settings(QUERY_PROFILER_ENABLED=True)
+    async def test_views_are_profiled(self):
+        response = await AsyncClient().get("/alerts/v1/get-alerts", AUTHORIZATION=self.authorization)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+    @override_settings(ALERT_HISTORY_DEFERRED=True)
+    async def test_views_make_their_changes_in_a_history_batch(self):
+        batches = []
+
+        def record_history_batch(**kwargs):
+            batches.append(get_current_history_batch())
+            return handle_create_alert(**kwargs)
+
+        data = {"vehicle": {"manufacturer_name": "Toyota", "model_name": "Corolla", "model_year": "1996"}}
+        with mock.patch("alerts.views.handle_create_alert", side_effect=record_history_batch):
+            response = await AsyncClient().post(
+                "/alerts/v1/create-alert", data=data, content_type="application/json", AUTHORIZATION=self.authorization
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(batches), 1)
+        self.assertIsNotNone(batches[0])
+
+
+class LoadTestAlertsTests(TestCase):
+    def test_load_test_alerts_command(self):
+        stub = StubProducerServer().start()
+        self.addCleanup(stub.stop)
+
+        out = StringIO()
+        call_command(
+            "load_test_alerts", "--url", stub.url, "--path", SUBSCRIPTIONS_PATH, "--requests", "20", "--concurrency", "4", stdout=out
+        )
+
+        self.assertIn("20 requests with 4 at once", out.getvalue())
+        self.assertIn("200: 20", out.getvalue())
+        # Every thread reuses its connection.
+        self.assertLessEqual(stub.number_of_connections, 4)
+
+
+class QueryProfilerTests(TestCase):
+    def setUp(self) -> None:
+        username_and_email = "tester@test.com"
+        self.client = APIClient()
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+
+        return super().setUp()
+
+    def __query_per_alert(self):
+        for alert in Alert.objects.filter(user=self.user):
+            str(alert.vehicle)
+
+    def test_get_query_template_ignores_the_values(self):
+        self.assertEqual(
+            get_query_template("SELECT * FROM alerts_alert WHERE id = 12 AND branch = 'It''s here'"),
+            get_query_template("SELECT *  FROM alerts_alert\nWHERE id = 7 AND branch = 'Other'"),
+        )
+        self.assertEqual(
+            get_query_template("SELECT * FROM alerts_alert WHERE id IN (%s, %s, %s)"), "SELECT * FROM alerts_alert WHERE id IN (...)"
+        )
+        self.assertEqual(get_query_template('SAVEPOINT "s139905938672512_x4"'), get_query_template('SAVEPOINT "s139905938672512_x5"'))
+
+    def test_profile_queries_counts_the_repeated_queries(self):
+        Alert.objects.bulk_create([Alert(user=self.user, vehicle=self.vehicle) for _ in range(3)])
+
+        with profile_queries() as profile:
+            self.__query_per_alert()
+
+        self.assertEqual(profile.number_of_queries, 4)
+        self.assertGreater(profile.total_seconds, 0)
+        self.assertEqual(list(profile.get_repeated_queries(3).values()), [3])
+        self.assertEqual(profile.get_repeated_queries(4), {})
+
+    @override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_REPEAT_THRESHOLD=2)
+    def test_middleware_adds_the_server_timing_header(self):
+        Alert.objects.bulk_create([Alert(user=self.user, vehicle=self.vehicle) for _ in range(3)])
+
+        with self.assertNoLogs("user_watch.query_profiler", level="WARNING"):
+            response = self.client.get("/alerts/v2/alerts")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["Server-Timing"], r'^db;dur=\d+\.\d;desc="2 queries"$')
+
+    def test_middleware_is_off_by_default(self):
+        response = self.client.get("/alerts/v2/alerts")
+
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_REPEAT_THRESHOLD=3)
+    def test_repeated_queries_are_logged(self):
+        Alert.objects.bulk_create([Alert(user=self.user, vehicle=self.vehicle) for _ in range(3)])
+
+        with profile_queries() as profile:
+            self.__query_per_alert()
+
+        with self.assertLogs("user_watch.query_profiler", level="WARNING") as logs:
+            report_query_profile(profile, "test")
+
+        self.assertIn("test ran 4 queries", logs.output[0])
+        self.assertEqual(logs.records[0].query_profile["number_of_queries"], 4)
+        self.assertEqual(list(logs.records[0].query_profile["repeated_queries"].values()), [3])
+
+    @override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_REPEAT_THRESHOLD=3, QUERY_PROFILER_RAISE=True)
+    def test_repeated_queries_fail_the_task(self):
+        Alert.objects.bulk_create([Alert(user=self.user, vehicle=self.vehicle) for _ in range(3)])
+
+        with self.assertRaises(RepeatedQueriesException):
+            profile_task_queries(self.__query_per_alert)()
+
+        Alert.objects.filter(user=self.user).delete()
+        profile_task_queries(self.__query_per_alert)()
+
+    def test_assert_query_budget(self):
+        Alert.objects.bulk_create([Alert(user=self.user, vehicle=self.vehicle) for _ in range(3)])
+
+        with assert_query_budget(max_queries=4, max_repeats=3):
+            self.__query_per_alert()
+
+        with self.assertRaisesRegex(AssertionError, "run 3 times, more than the budget of 1"):
+            with assert_query_budget(max_queries=4, max_repeats=1):
+                self.__query_per_alert()
+
+        with self.assertRaisesRegex(AssertionError, "4 queries were run, more than the budget of 3"):
+            with assert_query_budget(max_queries=3):
+                self.__query_per_alert()
+
+
+class QueryBudgetTests(TestCase):
+    """
+    The number of queries of each endpoint, which must not grow with the number of alerts.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        username_and_email = "tester@test.com"
+        self.client = APIClient()
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        vehicles = Vehicle.objects.get_canonical_many([("Toyota", "Corolla", str(year)) for year in range(1990, 2000)]).values()
+        self.alerts = Alert.objects.bulk_create([Alert(user=self.user, vehicle=vehicle) for vehicle in vehicles])
+        self.vehicle_data = {"manufacturer_name": "Honda", "model_name": "Civic", "model_year": "2001"}
+
+        return super().setUp()
+
+    def test_get_alerts(self):
+        # The user, the list's version for its cache key and the alerts with their vehicles.
+        with assert_query_budget(max_queries=3, max_repeats=1):
+            response = self.client.get("/alerts/v1/get-alerts")
+
+        self.assertEqual(len(json.loads(response.content)), 10)
+
+    def test_get_alerts_v2(self):
+        with assert_query_budget(max_queries=2, max_repeats=1):
+            response = self.client.get("/alerts/v2/alerts")
+
+        self.assertEqual(len(json.loads(response.content)["results"]), 10)
+
+    def test_get_alert(self):
+        # The user, when the alert was modified for its Last-Modified header and the alert with its vehicle.
+        with assert_query_budget(max_queries=3, max_repeats=1):
+            response = self.client.get(f"/alerts/v1/get-alert/{self.alerts[0].id}")
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_alert(self):
+        with assert_query_budget(max_queries=10):
+            response = self.client.post("/alerts/v1/create-alert", data={"vehicle": self.vehicle_data}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_update_alert(self):
+        with assert_query_budget(max_queries=11):
+            response = self.client.put(f"/alerts/v1/update-alert/{self.alerts[0].id}", data={"vehicle": self.vehicle_data}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_alert(self):
+        with assert_query_budget(max_queries=9):
+            response = self.client.delete(f"/alerts/v1/delete-alert/{self.alerts[0].id}")
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_bulk_alerts(self):
+        data = [{"id": alert.id, "branch": "Test Branch"} for alert in self.alerts]
+
+        with assert_query_budget(max_queries=7, max_repeats=1):
+            response = self.client.put("/alerts/v1/bulk-alerts", data=data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_alert_list(self):
+        admin = User.objects.create_superuser("admin@test.com", "admin@test.com", password=str(uuid4()))
+        client = APIClient()
+        client.force_login(admin)
+
+        # The admin counts the alerts twice, once filtered and once in total.
+        with assert_query_budget(max_queries=5, max_repeats=2):
+            response = client.get("/admin/alerts/alert/")
+
+        self.assertEqual(response.status_code, 200)
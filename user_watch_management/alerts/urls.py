@@ -7,4 +7,7 @@ urlpatterns = [
     path("v1/create-alert", views.create_alert),
     path("v1/update-alert/<int:alert_id>", views.update_alert),
     path("v1/delete-alert/<int:alert_id>", views.delete_alert),
+    path("v1/bulk-alerts", views.bulk_alerts),
+    path("v1/alert-list-cache-stats", views.get_alert_list_cache_stats_view),
+    path("v2/alerts", views.get_alerts_v2),
 ]
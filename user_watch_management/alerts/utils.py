@@ -1,48 +1,256 @@
+import logging
 from typing import Optional
 
-from alerts.models import Alert, Vehicle
+from alerts.models import Alert, SubscriptionOutboxEntry, SubscriptionStatus, Vehicle
+from alerts.signals import alerts_bulk_saved
+from alerts.tasks import relay_subscription_outbox
 from django.db import transaction
-from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
-import requests
+logger = logging.getLogger(__name__)
 
-from alerts.exceptions import SubscriptionFailureException
 
+def relay_subscription_outbox_on_commit():
+    """
+    Relay the outbox to the alert producer as soon as the current transaction commits. If the task can't be queued the
+    entries are still sent by the next scheduled relay.
+    """
+
+    def relay():
+        try:
+            relay_subscription_outbox.delay()
+        except Exception as e:
+            logger.warning(f"Failed to queue the subscription outbox relay, it will run on its next schedule. Error {e}")
+
+    transaction.on_commit(relay)
+
+
+def queue_subscription_changes(entries: list[SubscriptionOutboxEntry]):
+    """
+    Write subscription changes to the outbox, to be sent to the alert producer once the current transaction commits.
+
+    :param entries: The changes to send (see SubscriptionOutboxEntry.for_alert).
+    """
+    if not entries:
+        return
 
-def handle_create_alert(manufacturer_name: str, model_name: str, model_year: int, user: User, branch: Optional[str] = None) -> Alert:
+    SubscriptionOutboxEntry.objects.bulk_create(entries)
+    relay_subscription_outbox_on_commit()
+
+
+def handle_create_alert(
+    manufacturer_name: str, model_name: str, model_year: int, user: User, branch: Optional[str] = None, digest: bool = False
+) -> Alert:
     """
-    Handle creating the alert for the user and subscribing to the alert. This will not save to the database if
-    we are unable to get a response from the alert producer.
+    Handle creating the alert for the user and subscribing to the alert. The subscription is written to the outbox in
+    the same transaction as the alert and sent to the alert producer in the background, the alert's subscription_status
+    tells if it went through.
 
     :param manufacturer_name: The manufacturer name of the vehicle (ex: "Toyota")
     :param model_name: The model name of the vehicle (ex: "Corolla")
     :param model_year: The model year of the vehicle (ex: 2021)
     :param user: The user that is creating the alert.
     :param branch: The branch of the vehicle (ex: "Ottawa")
+    :param digest: If the listings for the alert should be grouped into a periodic digest email.
     :return: The alert that was created.
-    :raises SubscriptionFailureException: Raised if we are unable to subscribe to the alert.
     """
     with transaction.atomic():
-        vehicle = Vehicle.objects.create(
+        vehicle = Vehicle.objects.get_canonical(
             manufacturer_name=manufacturer_name,
             model_name=model_name,
             model_year=model_year,
         )
 
-        alert = Alert.objects.create(user=user, vehicle=vehicle, branch=branch)
+        alert = Alert.objects.create(user=user, vehicle=vehicle, branch=branch, digest=digest)
 
-        response = requests.post(
-            settings.ALERT_PRODUCER_URL,
-            json={
-                "model": vehicle.model_name,
-                "manufacturer": vehicle.manufacturer_name,
-                "year": vehicle.model_year,
-                "client_id": str(alert.external_id),
-            }
-        )
-        if not response.ok:
-            # Break the transaction and delete the alert if we are unable to subscribe to the alert.
-            raise SubscriptionFailureException("Failed to subscribe to alert.")
+        queue_subscription_changes([SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.SUBSCRIBE, alert)])
 
         return alert
+
+
+def handle_delete_alert(alert: Alert):
+    """
+    Handle deleting the alert and unsubscribing from it. The unsubscribe is written to the outbox in the same transaction
+    as the deletion and sent to the alert producer in the background.
+
+    :param alert: The alert to delete (its vehicle should already be loaded to avoid an extra query).
+    """
+    with transaction.atomic():
+        queue_subscription_changes([SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.UNSUBSCRIBE, alert)])
+        alert.delete()
+
+
+def get_new_vehicle_names(alert: Alert, vehicle_data: dict) -> tuple[str, str, str]:
+    """
+    Get the names of the vehicle the alert should watch for after an update, keeping the current names of the fields that
+    aren't being updated.
+
+    :param alert: The alert being updated (its vehicle should already be loaded to avoid an extra query).
+    :param vehicle_data: The vehicle fields to update.
+    :return: The (manufacturer name, model name, model year) of the vehicle.
+    """
+    return (
+        vehicle_data.get("manufacturer_name") or alert.vehicle.manufacturer_name,
+        vehicle_data.get("model_name") or alert.vehicle.model_name,
+        vehicle_data.get("model_year") or alert.vehicle.model_year,
+    )
+
+
+def is_vehicle_respelled(alert: Alert, vehicle_data: dict) -> bool:
+    """
+    Check if an update renames the alert's vehicle to another spelling of the same vehicle (ex: "Honda" to "HONDA"). The
+    alert stays on its vehicle, whose names are kept since it is shared by every alert watching for it.
+
+    :param alert: The alert being updated (its vehicle should already be loaded to avoid an extra query).
+    :param vehicle_data: The vehicle fields to update.
+    :return: True if the names differ from the vehicle's but identify the same vehicle, False otherwise.
+    """
+    new_vehicle_names = get_new_vehicle_names(alert, vehicle_data)
+    current_vehicle_names = (alert.vehicle.manufacturer_name, alert.vehicle.model_name, alert.vehicle.model_year)
+    return new_vehicle_names != current_vehicle_names and Vehicle.build_keys(*new_vehicle_names) == alert.vehicle.keys
+
+
+def is_valid_digest(data: dict) -> bool:
+    """
+    Check the digest of an update is a boolean, so a value like "false" isn't taken as true.
+
+    :param data: The fields to update.
+    :return: True if the digest is a boolean or isn't being updated, False otherwise.
+    """
+    digest = data.get("digest")
+    return digest is None or isinstance(digest, bool)
+
+
+def apply_alert_changes(alert: Alert, data: dict, vehicles_by_keys: Optional[dict] = None) -> list[str]:
+    """
+    Apply the changes of an update to the alert without saving it.
+
+    :param alert: The alert to update (its vehicle should already be loaded to avoid an extra query).
+    :param data: The fields to update (vehicle, branch and digest, see is_valid_digest).
+    :param vehicles_by_keys: The canonical vehicles already loaded for a bulk update, see Vehicle.objects.get_canonical_many.
+    :return: The fields that changed.
+    """
+    changed_fields = []
+
+    new_vehicle_names = get_new_vehicle_names(alert, data.get("vehicle") or {})
+    new_vehicle_keys = Vehicle.build_keys(*new_vehicle_names)
+    if new_vehicle_keys != alert.vehicle.keys:
+        # Vehicles are shared by every alert watching for them, so move the alert to the new vehicle instead of
+        # editing the current one.
+        if vehicles_by_keys is not None:
+            alert.vehicle = vehicles_by_keys[new_vehicle_keys]
+        else:
+            alert.vehicle = Vehicle.objects.get_canonical(*new_vehicle_names)
+        alert.subscription_status = SubscriptionStatus.PENDING
+        changed_fields.append("vehicle")
+
+    new_branch = data.get("branch")
+    if new_branch != alert.branch:
+        alert.branch = new_branch
+        changed_fields.append("branch")
+
+    new_digest = data.get("digest")
+    if new_digest is not None and new_digest != alert.digest:
+        alert.digest = new_digest
+        changed_fields.append("digest")
+
+    return changed_fields
+
+
+def handle_bulk_create_alerts(alerts_data: list[dict], user: User) -> list[Alert]:
+    """
+    Handle creating many alerts for the user at once. The vehicles, alerts, their history and their subscriptions are
+    each written with a single bulk insert in one transaction, and the subscriptions are sent to the alert producer
+    together once it commits.
+
+    :param alerts_data: The validated data of each alert (see CreateAlertSerializer).
+    :param user: The user that is creating the alerts.
+    :return: The alerts that were created in the same order as the data.
+    """
+    with transaction.atomic():
+        vehicles_by_keys = Vehicle.objects.get_canonical_many(
+            (data["vehicle"]["manufacturer_name"], data["vehicle"]["model_name"], data["vehicle"]["model_year"]) for data in alerts_data
+        )
+
+        alerts = [
+            Alert(
+                user=user,
+                vehicle=vehicles_by_keys[
+                    Vehicle.build_keys(data["vehicle"]["manufacturer_name"], data["vehicle"]["model_name"], data["vehicle"]["model_year"])
+                ],
+                branch=data.get("branch"),
+                digest=data.get("digest", False),
+            )
+            for data in alerts_data
+        ]
+        alerts = bulk_create_with_history(alerts, Alert, default_user=user)
+        alerts_bulk_saved.send(sender=Alert, alerts=alerts)
+
+        queue_subscription_changes([SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.SUBSCRIBE, alert) for alert in alerts])
+
+        return alerts
+
+
+def handle_bulk_update_alerts(alerts: list[Alert], alerts_data: list[dict], user: User) -> list[list[str]]:
+    """
+    Handle updating many of the user's alerts at once. The alerts and their history are each written with a single bulk
+    query in one transaction and the subscriptions of the alerts that moved to another vehicle are sent to the alert
+    producer together once it commits.
+
+    :param alerts: The alerts to update (their vehicles should already be loaded to avoid extra queries).
+    :param alerts_data: The fields to update of each alert, in the same order as the alerts.
+    :param user: The user that is updating the alerts.
+    :return: The fields that changed for each alert, alerts without changes are not saved.
+    """
+    with transaction.atomic():
+        vehicles_by_keys = Vehicle.objects.get_canonical_many(
+            get_new_vehicle_names(alert, data.get("vehicle") or {}) for alert, data in zip(alerts, alerts_data)
+        )
+
+        now = timezone.now()
+        changed_fields_of_alerts = []
+        changed_alerts = []
+        subscription_changes = []
+        for alert, data in zip(alerts, alerts_data):
+            previous_vehicle = alert.vehicle
+            changed_fields = apply_alert_changes(alert, data, vehicles_by_keys=vehicles_by_keys)
+            changed_fields_of_alerts.append(changed_fields)
+            if not changed_fields:
+                continue
+
+            # bulk_update doesn't go through save() which is what normally sets modified.
+            alert.modified = now
+            changed_alerts.append(alert)
+
+            if "vehicle" in changed_fields:
+                subscription_changes.append(
+                    SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.UNSUBSCRIBE, alert, vehicle=previous_vehicle)
+                )
+                subscription_changes.append(SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.SUBSCRIBE, alert))
+
+        if changed_alerts:
+            bulk_update_with_history(
+                changed_alerts,
+                Alert,
+                ["vehicle", "branch", "digest", "subscription_status", "modified"],
+                default_user=user,
+            )
+            alerts_bulk_saved.send(sender=Alert, alerts=changed_alerts)
+            queue_subscription_changes(subscription_changes)
+
+        return changed_fields_of_alerts
+
+
+def handle_bulk_delete_alerts(alerts: list[Alert]):
+    """
+    Handle deleting many alerts at once, unsubscribing from all of them together once the deletion commits.
+
+    :param alerts: The alerts to delete (their vehicles should already be loaded to avoid extra queries).
+    """
+    with transaction.atomic():
+        queue_subscription_changes(
+            [SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.UNSUBSCRIBE, alert) for alert in alerts]
+        )
+        Alert.objects.filter(id__in=[alert.id for alert in alerts]).delete()
@@ -1,41 +1,135 @@
+from typing import Optional
+
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework import status
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+
+from alerts.models import Alert, SubscriptionOutboxEntry
+from alerts.responses import FastJsonResponse
+from alerts.serializers import ALERT_VALUES_FIELDS, AlertSerializer, CreateAlertSerializer, UpdateVehicleSerializer, serialize_alerts
+from alerts.cache import get_alert_list_cache_stats, get_alert_list_version, get_cached_alert_list, set_cached_alert_list
+from alerts.conditional import alert_etag, alert_last_modified, alerts_etag, alerts_last_modified
+from alerts.constants import (
+    ALERT_NOT_UPDATED_MESSAGE,
+    ALERT_DOES_NOT_EXIST_MESSAGE,
+    DEFAULT_ALERTS_PAGE_SIZE,
+    INVALID_ALERT_ID_MESSAGE,
+    INVALID_BULK_ALERTS_MESSAGE,
+    INVALID_DIGEST_MESSAGE,
+    INVALID_PAGE_SIZE_MESSAGE,
+    MAX_ALERTS_PAGE_SIZE,
+    MAX_BULK_ALERT_OPERATIONS,
+)
+from alerts.exceptions import InvalidCursorException
+from alerts.pagination import decode_cursor, encode_cursor
+from alerts.utils import (
+    apply_alert_changes,
+    handle_bulk_create_alerts,
+    handle_bulk_delete_alerts,
+    handle_bulk_update_alerts,
+    handle_create_alert,
+    handle_delete_alert,
+    is_valid_digest,
+    is_vehicle_respelled,
+    queue_subscription_changes,
+)
+
 
-from alerts.models import Alert
-from alerts.serializers import AlertSerializer, CreateAlertSerializer
-from alerts.constants import ALERT_NOT_UPDATED_MESSAGE, ALERT_DOES_NOT_EXIST_MESSAGE
-from alerts.exceptions import SubscriptionFailureException
-from alerts.utils import handle_create_alert
+@api_view(["GET"])
+@csrf_exempt
+@permission_classes([IsAuthenticated])
+@condition(etag_func=alerts_etag, last_modified_func=alerts_last_modified)
+def get_alerts(request) -> FastJsonResponse:
+    """
+    Get all alerts for a user. Returns a 304 without loading the alerts if they haven't changed since the client's copy.
+    """
+    user = request.user.id
+    version = get_alert_list_version(user)
+    alert_list = get_cached_alert_list(user, version)
+
+    if alert_list is None:
+        alerts = Alert.objects.filter(user=user)
+        if settings.ALERT_FAST_SERIALIZATION:
+            alert_list = serialize_alerts(alerts.values(*ALERT_VALUES_FIELDS))
+        else:
+            alert_list = AlertSerializer(alerts.select_related("vehicle"), many=True).data
+        set_cached_alert_list(user, version, alert_list)
+
+    return FastJsonResponse(alert_list, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@csrf_exempt
+@permission_classes([IsAdminUser])
+def get_alert_list_cache_stats_view(request) -> JsonResponse:
+    """
+    Get the hit and miss counts of the cached lists of alerts, used to size the cache.
+    """
+    return JsonResponse(get_alert_list_cache_stats(), status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
 @csrf_exempt
 @permission_classes([IsAuthenticated])
-def get_alerts(request) -> JsonResponse:
+def get_alerts_v2(request) -> FastJsonResponse:
     """
-    Get all alerts for a user.
+    Get a page of a user's alerts ordered by when they were created. The response includes the cursor to pass back
+    to get the next page, it is null once there are no more alerts.
     """
     user = request.user.id
-    alerts = Alert.objects.filter(user=user)
-    serializer = AlertSerializer(alerts, many=True)
 
-    return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+    try:
+        page_size = min(int(request.query_params.get("page_size", DEFAULT_ALERTS_PAGE_SIZE)), MAX_ALERTS_PAGE_SIZE)
+    except ValueError:
+        page_size = 0
+
+    if page_size < 1:
+        return JsonResponse({"error": INVALID_PAGE_SIZE_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+    alerts = Alert.objects.filter(user=user).order_by("created", "id")
+
+    if cursor := request.query_params.get("cursor"):
+        try:
+            created, alert_id = decode_cursor(cursor)
+        except InvalidCursorException as e:
+            return JsonResponse({"error": e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        alerts = alerts.filter(Q(created__gt=created) | Q(created=created, id__gt=alert_id))
+
+    # Fetch one extra alert to know if there is a next page.
+    next_cursor = None
+    if settings.ALERT_FAST_SERIALIZATION:
+        page = list(alerts.values(*ALERT_VALUES_FIELDS)[: page_size + 1])
+        results = serialize_alerts(page[:page_size])
+        if len(page) > page_size:
+            next_cursor = encode_cursor(page[page_size - 1]["created"], page[page_size - 1]["id"])
+    else:
+        page = list(alerts.select_related("vehicle")[: page_size + 1])
+        results = AlertSerializer(page[:page_size], many=True).data
+        if len(page) > page_size:
+            next_cursor = encode_cursor(page[page_size - 1].created, page[page_size - 1].id)
+
+    return FastJsonResponse({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
 @csrf_exempt
 @permission_classes([IsAuthenticated])
+@condition(etag_func=alert_etag, last_modified_func=alert_last_modified)
 def get_alert(request, alert_id: int):
     """
-    Get an alert for a user.
+    Get an alert for a user. Returns a 304 without loading the alert if it hasn't changed since the client's copy.
     """
     user = request.user.id
 
     try:
-        alert = Alert.objects.get(user=user, id=alert_id)
+        alert = Alert.objects.select_related("vehicle").get(user=user, id=alert_id)
         serializer = AlertSerializer(alert)
 
         return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
@@ -49,7 +143,8 @@ def get_alert(request, alert_id: int):
 @permission_classes([IsAuthenticated])
 def create_alert(request):
     """
-    Create an alert for a user.
+    Create an alert for a user. The alert producer is subscribed to in the background, poll the alert's
+    subscription_status to know when it went through.
     """
     user = request.user
     data = request.data
@@ -67,6 +162,7 @@ def create_alert(request):
             model_year=valid_data["vehicle"]["model_year"],
             user=user,
             branch=valid_data.get("branch"),
+            digest=valid_data.get("digest", False),
         )
 
         alert_serializer = AlertSerializer(alert)
@@ -89,40 +185,34 @@ def update_alert(request, alert_id: int):
     data["user"] = user
 
     try:
-        alert = Alert.objects.get(user=user, id=alert_id)
-        alert_fields_to_update = []
-        vehicle_fields_to_update = []
-
-        if new_manufacturer_name := data.get("vehicle", {}).get("manufacturer_name"):
-            if new_manufacturer_name != alert.vehicle.manufacturer_name:
-                alert.vehicle.manufacturer_name = new_manufacturer_name
-                vehicle_fields_to_update.append("vehicle__manufacturer_name")
-
-        if new_model_name := data.get("vehicle", {}).get("model_name"):
-            if new_model_name != alert.vehicle.model_name:
-                alert.vehicle.model_name = new_model_name
-                vehicle_fields_to_update.append("vehicle__model_name")
-
-        if new_model_year := data.get("vehicle", {}).get("model_year"):
-            if new_model_year != alert.vehicle.model_year:
-                alert.vehicle.model_year = new_model_year
-                vehicle_fields_to_update.append("vehicle__model_year")
-
-        new_branch = data.get("branch")
-        if new_branch != alert.branch:
-            alert.branch = new_branch
-            alert_fields_to_update.append("branch")
-
-        if not vehicle_fields_to_update and not alert_fields_to_update:
-            return JsonResponse({"error": ALERT_NOT_UPDATED_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+        alert = Alert.objects.select_related("vehicle").get(user=user, id=alert_id)
+        if not is_valid_digest(data):
+            return JsonResponse({"error": INVALID_DIGEST_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+        vehicle_errors = _validate_vehicle_update(data)
+        if vehicle_errors:
+            return JsonResponse(vehicle_errors, status=status.HTTP_400_BAD_REQUEST)
+
+        previous_vehicle = alert.vehicle
+        alert_fields_to_update = apply_alert_changes(alert, data)
 
-        if vehicle_fields_to_update:
-            alert.vehicle.save()
+        if not alert_fields_to_update:
+            if is_vehicle_respelled(alert, data.get("vehicle") or {}):
+                # Another spelling of the alert's vehicle, the alert already watches for it.
+                return JsonResponse(AlertSerializer(alert).data, status=status.HTTP_200_OK)
 
-        if alert_fields_to_update:
+            return JsonResponse({"error": ALERT_NOT_UPDATED_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
             alert.save()
 
-        # TODO - update subscription from alert producer
+            if "vehicle" in alert_fields_to_update:
+                queue_subscription_changes(
+                    [
+                        SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.UNSUBSCRIBE, alert, vehicle=previous_vehicle),
+                        SubscriptionOutboxEntry.for_alert(SubscriptionOutboxEntry.Action.SUBSCRIBE, alert),
+                    ]
+                )
 
         serializer = AlertSerializer(alert)
 
@@ -142,11 +232,141 @@ def delete_alert(request, alert_id: int):
     user = request.user.id
 
     try:
-        alert = Alert.objects.get(user=user, id=alert_id)
-        alert.delete()
+        alert = Alert.objects.select_related("vehicle").get(user=user, id=alert_id)
+        handle_delete_alert(alert)
 
-        # TODO - delete subscription from alert producer
         return JsonResponse({}, status=status.HTTP_204_NO_CONTENT)
 
     except Alert.DoesNotExist:
         return JsonResponse({"error": ALERT_DOES_NOT_EXIST_MESSAGE}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(["POST", "PUT", "DELETE"])
+@csrf_exempt
+@permission_classes([IsAuthenticated])
+def bulk_alerts(request):
+    """
+    Create (POST), update (PUT) or delete (DELETE) up to MAX_BULK_ALERT_OPERATIONS alerts for a user in one request.
+
+    POST takes a list of alerts like create-alert, PUT a list of alerts with their id like update-alert and DELETE a
+    list of alert ids. The response has the status of each operation in the same order as the request, the valid
+    operations are applied even if others aren't.
+    """
+    data = request.data
+    if not isinstance(data, list) or not data or len(data) > MAX_BULK_ALERT_OPERATIONS:
+        return JsonResponse({"error": INVALID_BULK_ALERTS_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        if request.method == "POST":
+            results = _bulk_create_alerts(request.user, data)
+        elif request.method == "PUT":
+            results = _bulk_update_alerts(request.user, data)
+        else:
+            results = _bulk_delete_alerts(request.user, data)
+
+        return JsonResponse({"results": results}, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _bulk_create_alerts(user, data: list) -> list[dict]:
+    results = []
+    valid_data = []
+    for alert_data in data:
+        create_serializer = CreateAlertSerializer(data=alert_data)
+        if create_serializer.is_valid():
+            results.append(None)
+            valid_data.append(create_serializer.validated_data)
+        else:
+            results.append({"status": status.HTTP_400_BAD_REQUEST, "errors": create_serializer.errors})
+
+    created_alerts = iter(handle_bulk_create_alerts(valid_data, user) if valid_data else [])
+    return [result or {"status": status.HTTP_201_CREATED, "alert": AlertSerializer(next(created_alerts)).data} for result in results]
+
+
+def _is_alert_id(value) -> bool:
+    # JSON true and false are bools, which are ints in Python.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _validate_vehicle_update(data: dict) -> Optional[dict]:
+    """
+    Validate the vehicle of an update is an object of names, replacing it with the validated names.
+
+    :param data: The fields to update.
+    :return: The errors, None if the vehicle is valid or isn't being updated.
+    """
+    if data.get("vehicle") is None:
+        return None
+
+    vehicle_serializer = UpdateVehicleSerializer(data=data["vehicle"])
+    if not vehicle_serializer.is_valid():
+        return {"vehicle": vehicle_serializer.errors}
+
+    data["vehicle"] = vehicle_serializer.validated_data
+    return None
+
+
+def _bulk_update_alerts(user, data: list) -> list[dict]:
+    alert_ids = [alert_data.get("id") if isinstance(alert_data, dict) else None for alert_data in data]
+    alerts_by_id = (
+        Alert.objects.select_related("vehicle").filter(user=user).in_bulk([alert_id for alert_id in alert_ids if _is_alert_id(alert_id)])
+    )
+
+    # Only the first operation on an alert is applied.
+    positions = {}
+    for position, alert_id in enumerate(alert_ids):
+        if _is_alert_id(alert_id) and alert_id in alerts_by_id:
+            positions.setdefault(alert_id, position)
+
+    # An operation with an invalid digest or vehicle isn't applied.
+    vehicle_errors_by_position = {position: _validate_vehicle_update(data[position]) for position in positions.values()}
+    positions = {
+        alert_id: position
+        for alert_id, position in positions.items()
+        if is_valid_digest(data[position]) and not vehicle_errors_by_position[position]
+    }
+
+    changed_fields_of_alerts = handle_bulk_update_alerts(
+        [alerts_by_id[alert_id] for alert_id in positions], [data[position] for position in positions.values()], user
+    )
+    changed_fields_by_position = dict(zip(positions.values(), changed_fields_of_alerts))
+
+    results = []
+    for position, alert_id in enumerate(alert_ids):
+        if not _is_alert_id(alert_id):
+            results.append({"id": alert_id, "status": status.HTTP_400_BAD_REQUEST, "error": INVALID_ALERT_ID_MESSAGE})
+        elif alert_id not in alerts_by_id:
+            results.append({"id": alert_id, "status": status.HTTP_404_NOT_FOUND, "error": ALERT_DOES_NOT_EXIST_MESSAGE})
+        elif not is_valid_digest(data[position]):
+            results.append({"id": alert_id, "status": status.HTTP_400_BAD_REQUEST, "error": INVALID_DIGEST_MESSAGE})
+        elif vehicle_errors_by_position.get(position):
+            results.append({"id": alert_id, "status": status.HTTP_400_BAD_REQUEST, "errors": vehicle_errors_by_position[position]})
+        elif position not in changed_fields_by_position or not (
+            changed_fields_by_position[position] or is_vehicle_respelled(alerts_by_id[alert_id], data[position].get("vehicle") or {})
+        ):
+            results.append({"id": alert_id, "status": status.HTTP_400_BAD_REQUEST, "error": ALERT_NOT_UPDATED_MESSAGE})
+        else:
+            results.append({"id": alert_id, "status": status.HTTP_200_OK, "alert": AlertSerializer(alerts_by_id[alert_id]).data})
+
+    return results
+
+
+def _bulk_delete_alerts(user, data: list) -> list[dict]:
+    alerts_by_id = (
+        Alert.objects.select_related("vehicle").filter(user=user).in_bulk([alert_id for alert_id in data if _is_alert_id(alert_id)])
+    )
+    results = []
+    for alert_id in data:
+        if not _is_alert_id(alert_id):
+            results.append({"id": alert_id, "status": status.HTTP_400_BAD_REQUEST, "error": INVALID_ALERT_ID_MESSAGE})
+        elif alert_id not in alerts_by_id:
+            results.append({"id": alert_id, "status": status.HTTP_404_NOT_FOUND, "error": ALERT_DOES_NOT_EXIST_MESSAGE})
+        else:
+            results.append({"id": alert_id, "status": status.HTTP_204_NO_CONTENT})
+
+    # The results are built before deleting so nothing about the request can fail once the alerts are gone.
+    handle_bulk_delete_alerts(list(alerts_by_id.values()))
+
+    return results
@@ -0,0 +1,22 @@
+# Seeding constants
+BENCHMARK_USERNAME_PREFIX = "benchmark-user-"
+ALERTS_PER_USER = 10
+SEED_BATCH_SIZE = 10000
+MANUFACTURERS = {
+    "Toyota": ["Corolla", "Camry", "Tacoma", "RAV4", "Sienna"],
+    "Honda": ["Civic", "Accord", "CR-V", "Odyssey", "Fit"],
+    "Ford": ["Focus", "F-150", "Escape", "Ranger", "Taurus"],
+    "Chevrolet": ["Cruze", "Malibu", "Silverado", "Equinox", "Impala"],
+    "Nissan": ["Sentra", "Altima", "Rogue", "Versa", "Pathfinder"],
+    "Hyundai": ["Elantra", "Sonata", "Tucson", "Accent", "Santa Fe"],
+    "Mazda": ["3", "6", "CX-5", "MX-5", "Protege"],
+    "Volkswagen": ["Jetta", "Golf", "Passat", "Tiguan", "Beetle"],
+    "Kia": ["Rio", "Forte", "Soul", "Sorento", "Sportage"],
+    "Dodge": ["Caravan", "Ram", "Charger", "Dart", "Journey"],
+}
+MODEL_YEARS = [str(year) for year in range(1995, 2015)]
+BRANCHES = [None, "Ottawa", "Gatineau", "Montreal", "Toronto"]
+
+# Runner constants
+DEFAULT_BENCHMARK_SIZES = [1000, 100000, 1000000]
+NUMBER_OF_SAMPLED_USERS = 100
@@ -0,0 +1,5 @@
+class BenchmarkFailureException(Exception):
+    """Exception raised when an operation being benchmarked doesn't do what it should, so its timings can't be trusted."""
+
+    def __init__(self, message):
+        self.message = message
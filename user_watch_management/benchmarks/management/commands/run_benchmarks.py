@@ -0,0 +1,82 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks.constants import DEFAULT_BENCHMARK_SIZES
+from benchmarks.results import compare_results, load_results, write_results
+from benchmarks.runner import BenchmarkRunner
+from benchmarks.scenarios import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic users, vehicles and alerts at several sizes and measure the throughput and p50/p95/p99 latency of "
+        "consuming and ingesting listings and of getting, creating and updating alerts. SMTP, the alert producer and the "
+        "Celery broker are replaced with local stand-ins. The benchmarks run in their own database which is dropped "
+        "afterwards unless --keepdb is passed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=DEFAULT_BENCHMARK_SIZES, help="The numbers of alerts to benchmark with."
+        )
+        parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="The scenarios to run.")
+        parser.add_argument("--iterations", type=int, default=200, help="The number of timed iterations of each scenario at each size.")
+        parser.add_argument("--warmup", type=int, default=20, help="The number of iterations run before the timed ones.")
+        parser.add_argument("--seed", type=int, default=0, help="Seeds the sampling and random choices, for repeatable runs.")
+        parser.add_argument("--output", help="The file to write the results to as JSON.")
+        parser.add_argument("--baseline", help="The results of an earlier run (ex: of the main branch) to compare against.")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Keep the benchmark database so the next run doesn't have to seed it again."
+        )
+        parser.add_argument("--in-place", action="store_true", help="Seed and benchmark in the current database instead of a separate one.")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1 or options["warmup"] < 0:
+            raise CommandError("--iterations must be at least 1 and --warmup can't be negative.")
+
+        if any(size < 1 for size in options["sizes"]):
+            raise CommandError("--sizes must all be at least 1.")
+
+        baseline = load_results(options["baseline"]) if options["baseline"] else None
+
+        runner = BenchmarkRunner(
+            sizes=options["sizes"],
+            scenario_names=options["scenarios"],
+            iterations=options["iterations"],
+            warmup=options["warmup"],
+            seed=options["seed"],
+            log=self.stdout.write,
+        )
+
+        if options["in_place"]:
+            results = runner.run()
+        else:
+            results = self.__run_in_benchmark_database(runner, options["keepdb"])
+
+        if options["output"]:
+            write_results(results, options["output"])
+            self.stdout.write(f"Wrote the results to {options['output']}")
+
+        if baseline is not None:
+            for comparison in compare_results(results, baseline):
+                self.stdout.write(
+                    f"{comparison['size']} alerts, {comparison['scenario']}: throughput "
+                    f"{self.__format_change(comparison['throughput_change'])}, p95 {self.__format_change(comparison['p95_change'])}"
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {len(options['scenarios'])} scenarios at {len(options['sizes'])} sizes."))
+
+    def __run_in_benchmark_database(self, runner: BenchmarkRunner, keepdb: bool) -> dict:
+        # Like the test database, but under its own name so it never clashes with the one of the tests.
+        old_database_name = connection.settings_dict["NAME"]
+        connection.settings_dict["TEST"]["NAME"] = f"benchmark_{os.path.basename(str(old_database_name))}"
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        try:
+            return runner.run()
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0, keepdb=keepdb)
+
+    def __format_change(self, change) -> str:
+        return "n/a" if change is None else f"{change:+.1f}%"
@@ -0,0 +1,69 @@
+import json
+from typing import Optional
+
+from user_watch.percentiles import get_percentile
+
+
+def summarize(durations: list[float]) -> dict:
+    """
+    Summarize the durations of the timed iterations of a scenario.
+
+    :param durations: The duration of each iteration, in seconds.
+    :return: The number of iterations, the operations per second and the latency percentiles in milliseconds.
+    """
+    milliseconds = [duration * 1000 for duration in durations]
+    total_seconds = sum(durations)
+    return {
+        "iterations": len(durations),
+        "throughput": len(durations) / total_seconds if total_seconds else 0,
+        "p50": get_percentile(milliseconds, 50),
+        "p95": get_percentile(milliseconds, 95),
+        "p99": get_percentile(milliseconds, 99),
+    }
+
+
+def load_results(path: str) -> dict:
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def write_results(results: dict, path: str):
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
+
+
+def compare_results(results: dict, baseline: dict) -> list[dict]:
+    """
+    Compare the results of a run to the results of an earlier run (ex: of the main branch), for every size and scenario
+    both runs have.
+
+    :param results: The results of the run.
+    :param baseline: The results to compare against.
+    :return: The throughput and p95 of both runs with the change in percent of each, for every size and scenario.
+    """
+
+    def get_change(value: float, baseline_value: float) -> Optional[float]:
+        return (value - baseline_value) / baseline_value * 100 if baseline_value else None
+
+    comparisons = []
+    for size, scenarios in results["sizes"].items():
+        for name, summary in scenarios.items():
+            baseline_summary = baseline.get("sizes", {}).get(size, {}).get(name)
+            if baseline_summary is None:
+                continue
+
+            comparisons.append(
+                {
+                    "size": size,
+                    "scenario": name,
+                    "throughput": summary["throughput"],
+                    "baseline_throughput": baseline_summary["throughput"],
+                    "throughput_change": get_change(summary["throughput"], baseline_summary["throughput"]),
+                    "p95": summary["p95"],
+                    "baseline_p95": baseline_summary["p95"],
+                    "p95_change": get_change(summary["p95"], baseline_summary["p95"]),
+                }
+            )
+
+    return comparisons
@@ -0,0 +1,172 @@
+import logging
+import platform
+import random
+import subprocess
+import time
+import uuid
+from typing import Callable, Optional
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from alerts.models import Alert
+from benchmarks.constants import NUMBER_OF_SAMPLED_USERS
+from benchmarks.results import summarize
+from benchmarks.scenarios import SCENARIOS, BenchmarkContext, Scenario
+from benchmarks.seeding import get_benchmark_username, get_vehicle_catalog, seed
+from benchmarks.stand_ins import StandIns, stand_ins
+from signup.cache import local_user_cache
+
+logger = logging.getLogger(__name__)
+
+
+def get_commit() -> Optional[str]:
+    """
+    Get the commit the benchmarks are run on, to know what results are compared.
+
+    :return: The hash of the current commit, None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BenchmarkRunner:
+    """
+    Seed the synthetic data at each size (smallest first, only adding what is missing) and time every scenario against
+    it, one iteration after the other. The services reached over the network are replaced with local stand-ins and the
+    Celery tasks queued by an iteration are run right after it, outside of the timed part.
+
+    :param sizes: The numbers of alerts to benchmark with.
+    :param scenario_names: The scenarios to run, see benchmarks.scenarios.SCENARIOS.
+    :param iterations: The number of timed iterations of each scenario at each size.
+    :param warmup: The number of iterations run before the timed ones.
+    :param seed: Seeds the sampling of the alerts and the random choices of the scenarios, runs with the same seed do
+    the same work.
+    :param log: Called with the progress of the run.
+    """
+
+    def __init__(
+        self,
+        sizes: list[int],
+        scenario_names: list[str],
+        iterations: int,
+        warmup: int,
+        seed: int = 0,
+        log: Optional[Callable[[str], None]] = None,
+    ):
+        self.sizes = sorted(sizes)
+        self.scenario_names = scenario_names
+        self.iterations = iterations
+        self.warmup = warmup
+        self.seed = seed
+        self.log = log or logger.info
+
+        # Every synthetic user shares a password that is never used to log in.
+        self.__password = str(uuid.uuid4())
+
+    def run(self) -> dict:
+        """
+        Run every scenario at every size.
+
+        :return: The results, with what they were measured on and the iterations, throughput (operations per second) and
+        p50/p95/p99 latency (milliseconds) of each scenario by size.
+        """
+        results = {
+            "commit": get_commit(),
+            "created": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "iterations": self.iterations,
+            "warmup": self.warmup,
+            "seed": self.seed,
+            "sizes": {},
+        }
+
+        # Keep the benchmark's cache entries apart from the ones of the deployment sharing the same Redis.
+        caches = {alias: {**cache_settings, "KEY_PREFIX": "benchmark"} for alias, cache_settings in settings.CACHES.items()}
+        with override_settings(
+            DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], CACHES=caches
+        ), stand_ins() as local_stand_ins:
+            local_user_cache.clear()
+            try:
+                for size in self.sizes:
+                    results["sizes"][str(size)] = self.__run_size(size, local_stand_ins)
+            finally:
+                local_user_cache.clear()
+
+        return results
+
+    def __run_size(self, size: int, local_stand_ins: StandIns) -> dict:
+        started = time.monotonic()
+        counts = seed(size, self.__password)
+        self.log(
+            f"Seeded {counts['alerts']} alerts for {counts['users']} users ({counts['alerts_added']} added) in {time.monotonic() - started:.1f}s"
+        )
+
+        context = self.__build_context(counts["users"], local_stand_ins)
+        results = {}
+        for name in self.scenario_names:
+            results[name] = self.__run_scenario(SCENARIOS[name](context))
+            self.log(
+                f"{size} alerts, {name}: {results[name]['throughput']:.1f} ops/s, p50 {results[name]['p50']:.2f}ms, "
+                f"p95 {results[name]['p95']:.2f}ms, p99 {results[name]['p99']:.2f}ms"
+            )
+
+        return results
+
+    def __build_context(self, number_of_users: int, local_stand_ins: StandIns) -> BenchmarkContext:
+        sampler = random.Random(self.seed)
+        user_indexes = sampler.sample(range(number_of_users), min(NUMBER_OF_SAMPLED_USERS, number_of_users))
+        users = User.objects.filter(username__in=[get_benchmark_username(user_index) for user_index in user_indexes])
+        headers_by_user_id = {user.id: {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(user).access_token}"} for user in users}
+
+        # One alert of each sampled user, in the order the users were sampled.
+        first_alert_by_user_id = {}
+        for alert in (
+            Alert.objects.filter(user_id__in=headers_by_user_id)
+            .order_by("id")
+            .values("id", "user_id", "external_id", "branch", "vehicle__manufacturer_name", "vehicle__model_name", "vehicle__model_year")
+        ):
+            first_alert_by_user_id.setdefault(alert["user_id"], alert)
+
+        user_ids_by_username = {user.username: user.id for user in users}
+        alerts = [first_alert_by_user_id[user_ids_by_username[get_benchmark_username(user_index)]] for user_index in user_indexes]
+
+        return BenchmarkContext(
+            client=Client(),
+            stand_ins=local_stand_ins,
+            alerts=alerts,
+            headers_by_user_id=headers_by_user_id,
+            vehicles=get_vehicle_catalog(),
+            run_id=str(uuid.uuid4()),
+            seed=self.seed,
+        )
+
+    def __run_scenario(self, scenario: Scenario) -> dict:
+        durations = []
+        try:
+            for iteration in range(self.warmup + self.iterations):
+                scenario.prepare(iteration)
+
+                started = time.perf_counter()
+                scenario.run(iteration)
+                duration = time.perf_counter() - started
+
+                scenario.context.stand_ins.tasks.run_pending()
+                if iteration >= self.warmup:
+                    durations.append(duration)
+        finally:
+            scenario.cleanup()
+            scenario.context.stand_ins.tasks.run_pending()
+
+        return summarize(durations)
@@ -0,0 +1,221 @@
+import json
+import random
+from abc import ABC, abstractmethod
+
+from django.test import Client
+
+from alerts.cache import invalidate_alert_list
+from alerts.models import Alert
+from alerts.utils import handle_delete_alert
+from benchmarks.exceptions import BenchmarkFailureException
+from benchmarks.stand_ins import StandIns
+from listing_consumer.tasks import ingest_listening
+
+
+class BenchmarkContext:
+    """
+    What the scenarios of a benchmark run share.
+
+    :param client: The client the requests are sent with.
+    :param stand_ins: The stand-ins of the services reached over the network.
+    :param alerts: The sampled alerts the scenarios work with, with their vehicle's names.
+    :param headers_by_user_id: The headers authenticating each sampled user, by user id.
+    :param vehicles: The (manufacturer name, model name, model year) of the vehicles alerts can be created or updated with.
+    :param run_id: Unique to the run, to build listings that were never ingested before.
+    :param seed: Seeds the random choices of the scenarios.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        stand_ins: StandIns,
+        alerts: list[dict],
+        headers_by_user_id: dict[int, dict],
+        vehicles: list,
+        run_id: str,
+        seed: int,
+    ):
+        self.client = client
+        self.stand_ins = stand_ins
+        self.alerts = alerts
+        self.headers_by_user_id = headers_by_user_id
+        self.vehicles = vehicles
+        self.run_id = run_id
+        self.random = random.Random(seed)
+
+    def get_alert(self, iteration: int) -> dict:
+        return self.alerts[iteration % len(self.alerts)]
+
+    def get_headers(self, alert: dict) -> dict:
+        return self.headers_by_user_id[alert["user_id"]]
+
+    def build_listing(self, scenario_name: str, iteration: int) -> dict:
+        """
+        Build a listing for one of the sampled alerts, with a row_id that was never ingested so it isn't dropped as a
+        duplicate.
+
+        :param scenario_name: The name of the scenario the listing is for.
+        :param iteration: The iteration the listing is for.
+        :return: The listing.
+        """
+        alert = self.get_alert(iteration)
+        return {
+            "year": alert["vehicle__model_year"],
+            "make": alert["vehicle__manufacturer_name"],
+            "model": alert["vehicle__model_name"],
+            "date_listed": "2023-01-01",
+            "row_id": f"{self.run_id}-{scenario_name}-{iteration}",
+            "branch": alert["branch"] or "Ottawa",
+            "listing_url": f"https://kennyupull.com/listing/{iteration}",
+            "client_id": str(alert["external_id"]),
+        }
+
+
+class Scenario(ABC):
+    """
+    An operation to benchmark. Only run is timed, prepare sets up each iteration and cleanup runs once the scenario is
+    done.
+
+    :param context: What the scenarios of the run share.
+    """
+
+    name = ""
+
+    def __init__(self, context: BenchmarkContext):
+        self.context = context
+
+    def prepare(self, iteration: int):
+        pass
+
+    @abstractmethod
+    def run(self, iteration: int):
+        pass
+
+    def cleanup(self):
+        pass
+
+    def check(self, response, expected_status_code: int):
+        if response.status_code != expected_status_code:
+            raise BenchmarkFailureException(
+                f"{self.name} responded with {response.status_code} instead of {expected_status_code}: {response.content[:200]!r}"
+            )
+
+
+class ConsumeListingScenario(Scenario):
+    """
+    The producer sending a listing, which is only validated and queued.
+    """
+
+    name = "consume_listing"
+
+    def run(self, iteration: int):
+        response = self.context.client.post(
+            "/listing-consumer/v1/new-listing",
+            json.dumps(self.context.build_listing(self.name, iteration)),
+            content_type="application/json",
+        )
+        self.check(response, 204)
+
+
+class IngestListingScenario(Scenario):
+    """
+    A worker ingesting a listing: dropping duplicates, finding the alert and sending the email or adding it to the digest.
+    """
+
+    name = "ingest_listening"
+
+    def run(self, iteration: int):
+        result = ingest_listening(kenny_u_pull_listing_data=self.context.build_listing(self.name, iteration))
+        if result["listings_ingested"] != 1:
+            raise BenchmarkFailureException(f"{self.name} ingested {result['listings_ingested']} listings instead of 1")
+
+
+class GetAlertsScenario(Scenario):
+    """
+    A user listing their alerts, with their cached list invalidated first so the alerts are loaded every time.
+    """
+
+    name = "get_alerts"
+
+    def prepare(self, iteration: int):
+        invalidate_alert_list(self.context.get_alert(iteration)["user_id"])
+
+    def run(self, iteration: int):
+        alert = self.context.get_alert(iteration)
+        self.check(self.context.client.get("/alerts/v1/get-alerts", **self.context.get_headers(alert)), 200)
+
+
+class CreateAlertScenario(Scenario):
+    """
+    A user creating an alert, the alerts created are deleted once the scenario is done.
+    """
+
+    name = "create_alert"
+
+    def __init__(self, context: BenchmarkContext):
+        super().__init__(context)
+        self.created_alert_ids = []
+
+    def run(self, iteration: int):
+        alert = self.context.get_alert(iteration)
+        manufacturer_name, model_name, model_year = self.context.random.choice(self.context.vehicles)
+        response = self.context.client.post(
+            "/alerts/v1/create-alert",
+            json.dumps(
+                {
+                    "vehicle": {"manufacturer_name": manufacturer_name, "model_name": model_name, "model_year": model_year},
+                    "branch": "Ottawa",
+                }
+            ),
+            content_type="application/json",
+            **self.context.get_headers(alert),
+        )
+        self.check(response, 201)
+        self.created_alert_ids.append(response.json()["id"])
+
+    def cleanup(self):
+        for alert in Alert.objects.select_related("vehicle").filter(id__in=self.created_alert_ids):
+            handle_delete_alert(alert)
+
+
+class UpdateAlertScenario(Scenario):
+    """
+    A user moving one of their alerts to another vehicle and branch, which also queues the subscription changes. The
+    alerts are put back the way they were once the scenario is done so the seeded data stays the same between runs.
+    """
+
+    name = "update_alert"
+
+    def __init__(self, context: BenchmarkContext):
+        super().__init__(context)
+        self.original_alerts = {}
+
+    def prepare(self, iteration: int):
+        alert = self.context.get_alert(iteration)
+        if alert["id"] not in self.original_alerts:
+            self.original_alerts[alert["id"]] = Alert.objects.get(id=alert["id"])
+
+    def run(self, iteration: int):
+        alert = self.context.get_alert(iteration)
+        manufacturer_name, model_name, model_year = self.context.random.choice(self.context.vehicles)
+        response = self.context.client.put(
+            f"/alerts/v1/update-alert/{alert['id']}",
+            json.dumps(
+                {
+                    "vehicle": {"manufacturer_name": manufacturer_name, "model_name": model_name, "model_year": model_year},
+                    "branch": f"Branch {iteration}",
+                }
+            ),
+            content_type="application/json",
+            **self.context.get_headers(alert),
+        )
+        self.check(response, 200)
+
+    def cleanup(self):
+        Alert.objects.bulk_update(self.original_alerts.values(), ["vehicle", "branch", "digest", "subscription_status"])
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (ConsumeListingScenario, IngestListingScenario, GetAlertsScenario, CreateAlertScenario, UpdateAlertScenario)
+}
@@ -0,0 +1,119 @@
+import logging
+from itertools import product
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from alerts.models import Alert, SubscriptionStatus, Vehicle
+from benchmarks.constants import ALERTS_PER_USER, BENCHMARK_USERNAME_PREFIX, BRANCHES, MANUFACTURERS, MODEL_YEARS, SEED_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Spreads consecutive indexes over the catalog and branches (Knuth's multiplicative hash) so the data doesn't look sorted.
+_HASH_MULTIPLIER = 2654435761
+
+
+def get_vehicle_catalog() -> list[tuple[str, str, str]]:
+    """
+    Get the (manufacturer name, model name, model year) of every vehicle the synthetic alerts watch for.
+
+    :return: The vehicles, always in the same order.
+    """
+    return [
+        (manufacturer_name, model_name, model_year)
+        for (manufacturer_name, model_names), model_year in product(MANUFACTURERS.items(), MODEL_YEARS)
+        for model_name in model_names
+    ]
+
+
+def get_benchmark_username(user_index: int) -> str:
+    return f"{BENCHMARK_USERNAME_PREFIX}{user_index}"
+
+
+def seed_vehicles() -> list[Vehicle]:
+    """
+    Add the vehicle catalog of the synthetic alerts, keeping the vehicles that are already there.
+
+    :return: The vehicles in the catalog's order.
+    """
+    catalog = get_vehicle_catalog()
+    vehicles_by_keys = {}
+    # A few hundred vehicles at a time keeps the lookup query under the database's expression limits.
+    for start in range(0, len(catalog), 100):
+        vehicles_by_keys.update(Vehicle.objects.get_canonical_many(catalog[start : start + 100]))
+
+    return [vehicles_by_keys[Vehicle.build_keys(*names)] for names in catalog]
+
+
+def seed_users(number_of_users: int, password: str) -> list[int]:
+    """
+    Add the synthetic users up to number_of_users, keeping the ones that are already there.
+
+    :param number_of_users: The number of synthetic users there should be.
+    :param password: The password of the users, hashed once for all of them.
+    :return: The id of each user, by user index.
+    """
+    existing_ids = dict(User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).values_list("username", "id"))
+    hashed_password = make_password(password)
+
+    missing_users = [
+        User(
+            username=get_benchmark_username(user_index), email=f"{get_benchmark_username(user_index)}@example.com", password=hashed_password
+        )
+        for user_index in range(number_of_users)
+        if get_benchmark_username(user_index) not in existing_ids
+    ]
+    for start in range(0, len(missing_users), SEED_BATCH_SIZE):
+        User.objects.bulk_create(missing_users[start : start + SEED_BATCH_SIZE])
+
+    if missing_users:
+        existing_ids = dict(User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).values_list("username", "id"))
+
+    return [existing_ids[get_benchmark_username(user_index)] for user_index in range(number_of_users)]
+
+
+def build_alert(alert_index: int, user_ids: list[int], vehicles: list[Vehicle]) -> Alert:
+    """
+    Build the synthetic alert at an index, the same index always gives the same alert.
+
+    :param alert_index: The index of the alert.
+    :param user_ids: The id of each synthetic user, by user index.
+    :param vehicles: The vehicle catalog.
+    :return: The unsaved alert.
+    """
+    spread = alert_index * _HASH_MULTIPLIER % 2**32
+    return Alert(
+        user_id=user_ids[alert_index // ALERTS_PER_USER],
+        vehicle=vehicles[spread % len(vehicles)],
+        branch=BRANCHES[spread % len(BRANCHES)],
+        digest=spread % 4 == 0,
+        subscription_status=SubscriptionStatus.ACTIVE,
+    )
+
+
+def seed(number_of_alerts: int, password: str) -> dict[str, int]:
+    """
+    Top up the synthetic users, vehicles and alerts to number_of_alerts alerts, ALERTS_PER_USER alerts per user. Seeding
+    is deterministic and incremental so seeding 100k alerts after 1k only adds the 99k missing ones.
+
+    The alerts are inserted in bulk without their history or the signals of a save, the alert index isn't updated.
+
+    :param number_of_alerts: The number of synthetic alerts there should be.
+    :param password: The password of the synthetic users.
+    :return: The number of users, vehicles and alerts there are and the number of alerts added.
+    """
+    vehicles = seed_vehicles()
+    user_ids = seed_users(-(-number_of_alerts // ALERTS_PER_USER), password)
+
+    number_of_existing_alerts = Alert.objects.filter(user__username__startswith=BENCHMARK_USERNAME_PREFIX).count()
+    for start in range(number_of_existing_alerts, number_of_alerts, SEED_BATCH_SIZE):
+        end = min(start + SEED_BATCH_SIZE, number_of_alerts)
+        Alert.objects.bulk_create([build_alert(alert_index, user_ids, vehicles) for alert_index in range(start, end)])
+        logger.info(f"Seeded {end} of {number_of_alerts} benchmark alerts")
+
+    return {
+        "users": len(user_ids),
+        "vehicles": len(vehicles),
+        "alerts": max(number_of_existing_alerts, number_of_alerts),
+        "alerts_added": max(number_of_alerts - number_of_existing_alerts, 0),
+    }
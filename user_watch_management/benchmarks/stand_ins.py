@@ -0,0 +1,126 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from unittest import mock
+
+from celery.app.task import Task
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import override_settings
+
+import alerts.producer_client
+import listing_consumer.notifications
+from alerts.producer_stub import (
+    BULK_SUBSCRIBE_PATH,
+    BULK_UNSUBSCRIBE_PATH,
+    SUBSCRIBE_PATH,
+    SUBSCRIPTIONS_PATH,
+    UNSUBSCRIBE_PATH,
+    StubProducerServer,
+)
+
+
+class CountingEmailBackend(BaseEmailBackend):
+    """
+    An email backend standing in for the SMTP server during a benchmark, it only counts the messages it is given.
+    """
+
+    number_of_messages_sent = 0
+    _lock = threading.Lock()
+
+    def send_messages(self, email_messages) -> int:
+        with CountingEmailBackend._lock:
+            CountingEmailBackend.number_of_messages_sent += len(email_messages)
+
+        return len(email_messages)
+
+
+class TaskRecorder:
+    """
+    Records the Celery tasks queued during a benchmark instead of sending them to the broker, so they can be run in this
+    process outside of the timed part of the benchmark.
+    """
+
+    def __init__(self):
+        self.pending: list[tuple[Task, tuple, dict]] = []
+        self.number_of_tasks_run = 0
+
+    def record(self, task: Task, args=None, kwargs=None, **options):
+        self.pending.append((task, tuple(args or ()), dict(kwargs or {})))
+
+    def run_pending(self) -> int:
+        """
+        Run every recorded task, including the tasks they queue.
+
+        :return: The number of tasks run.
+        """
+        number_of_tasks_run = 0
+        while self.pending:
+            task, args, kwargs = self.pending.pop(0)
+            task.apply(args=args, kwargs=kwargs, throw=True)
+            number_of_tasks_run += 1
+
+        self.number_of_tasks_run += number_of_tasks_run
+        return number_of_tasks_run
+
+
+class StandIns:
+    """
+    The local stand-ins used while benchmarking.
+
+    :param producer: The in memory alert producer the subscriptions are sent to.
+    :param tasks: The recorder of the Celery tasks queued.
+    """
+
+    def __init__(self, producer: StubProducerServer, tasks: TaskRecorder):
+        self.producer = producer
+        self.tasks = tasks
+
+    @property
+    def number_of_emails_sent(self) -> int:
+        return CountingEmailBackend.number_of_messages_sent
+
+
+def _reset_process_clients():
+    # The process wide clients hold on to the settings they were created with, start over with the current ones.
+    if listing_consumer.notifications._dispatcher is not None:
+        listing_consumer.notifications._dispatcher.close()
+        listing_consumer.notifications._dispatcher = None
+
+    if alerts.producer_client._client is not None:
+        alerts.producer_client._client.close()
+        alerts.producer_client._client = None
+
+
+@contextmanager
+def stand_ins() -> Iterator[StandIns]:
+    """
+    Replace the services the benchmarks would otherwise reach over the network: emails are counted instead of sent over
+    SMTP, subscriptions go to an in memory alert producer and Celery tasks are recorded instead of sent to the broker.
+
+    :return: The stand-ins, to run the recorded tasks and look at what was sent.
+    """
+    producer = StubProducerServer().start()
+    tasks = TaskRecorder()
+    CountingEmailBackend.number_of_messages_sent = 0
+
+    settings_overrides = override_settings(
+        EMAIL_BACKEND="benchmarks.stand_ins.CountingEmailBackend",
+        ALERT_PRODUCER_URL=f"{producer.url}{SUBSCRIBE_PATH}",
+        ALERT_PRODUCER_UNSUBSCRIBE_URL=f"{producer.url}{UNSUBSCRIBE_PATH}",
+        ALERT_PRODUCER_BULK_SUBSCRIBE_URL=f"{producer.url}{BULK_SUBSCRIBE_PATH}",
+        ALERT_PRODUCER_BULK_UNSUBSCRIBE_URL=f"{producer.url}{BULK_UNSUBSCRIBE_PATH}",
+        ALERT_PRODUCER_SUBSCRIPTIONS_URL=f"{producer.url}{SUBSCRIPTIONS_PATH}",
+    )
+
+    def apply_async(task, args=None, kwargs=None, **options):
+        tasks.record(task, args, kwargs, **options)
+
+    try:
+        with settings_overrides, mock.patch.object(Task, "apply_async", apply_async):
+            _reset_process_clients()
+            try:
+                yield StandIns(producer=producer, tasks=tasks)
+            finally:
+                _reset_process_clients()
+    finally:
+        producer.stop()
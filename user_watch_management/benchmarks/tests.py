@@ -0,0 +1,138 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from alerts.models import Alert, Vehicle
+from alerts.tasks import relay_subscription_outbox
+from benchmarks.constants import ALERTS_PER_USER, BENCHMARK_USERNAME_PREFIX
+from benchmarks.results import compare_results, summarize
+from benchmarks.scenarios import SCENARIOS, Scenario
+from benchmarks.seeding import get_vehicle_catalog, seed
+from benchmarks.stand_ins import CountingEmailBackend, stand_ins
+from listing_consumer.data_models import KennyUPullListing
+from listing_consumer.tasks import build_listing_email, deliver_listing_emails
+from user_watch.percentiles import get_percentile
+
+
+class SeedTests(TestCase):
+    def test_seed_tops_up_the_alerts(self):
+        counts = seed(25, "password")
+
+        self.assertEqual(counts, {"users": 3, "vehicles": len(get_vehicle_catalog()), "alerts": 25, "alerts_added": 25})
+        self.assertEqual(Alert.objects.filter(user__username=f"{BENCHMARK_USERNAME_PREFIX}0").count(), ALERTS_PER_USER)
+
+        first_alerts = list(Alert.objects.order_by("id").values_list("user_id", "vehicle_id", "branch", "digest"))
+        counts = seed(40, "password")
+
+        self.assertEqual(counts["alerts_added"], 15)
+        self.assertEqual(Alert.objects.count(), 40)
+        # The alerts already seeded are left alone.
+        self.assertEqual(list(Alert.objects.order_by("id").values_list("user_id", "vehicle_id", "branch", "digest")[:25]), first_alerts)
+
+    def test_seed_is_deterministic(self):
+        seed(20, "password")
+        first_alerts = list(Alert.objects.order_by("id").values_list("user__username", "vehicle__model_name", "branch", "digest"))
+
+        Alert.objects.all().delete()
+        seed(20, "password")
+
+        self.assertEqual(
+            list(Alert.objects.order_by("id").values_list("user__username", "vehicle__model_name", "branch", "digest")), first_alerts
+        )
+        self.assertEqual(Vehicle.objects.count(), len(get_vehicle_catalog()))
+
+
+class BenchmarkResultsTests(TestCase):
+    def test_summarize(self):
+        summary = summarize([0.001 * duration for duration in range(1, 101)])
+
+        self.assertEqual(summary["iterations"], 100)
+        self.assertAlmostEqual(summary["throughput"], 100 / 5.05)
+        self.assertAlmostEqual(summary["p50"], 50.5)
+        self.assertAlmostEqual(summary["p99"], 99.01)
+
+    def test_get_percentile_with_few_durations(self):
+        self.assertEqual(get_percentile([], 95), 0)
+        self.assertEqual(get_percentile([3.0], 95), 3.0)
+
+    def test_compare_results(self):
+        baseline = {"sizes": {"1000": {"get_alerts": {"throughput": 100, "p95": 10}}}}
+        results = {"sizes": {"1000": {"get_alerts": {"throughput": 80, "p95": 15}, "create_alert": {"throughput": 5, "p95": 50}}}}
+
+        comparisons = compare_results(results, baseline)
+
+        self.assertEqual(len(comparisons), 1)
+        self.assertAlmostEqual(comparisons[0]["throughput_change"], -20)
+        self.assertAlmostEqual(comparisons[0]["p95_change"], 50)
+
+
+class StandInsTests(TestCase):
+    def test_emails_and_tasks_stay_local(self):
+        seed(1, "password")
+        alert = Alert.objects.select_related("user", "vehicle").get()
+
+        with stand_ins() as local_stand_ins:
+            listing = KennyUPullListing("2001", "Honda", "Civic", "2023-01-01", "1", "Ottawa", "https://kennyupull.com/1")
+            deliver_listing_emails(emails=[build_listing_email(alert, listing)])
+            relay_subscription_outbox.delay()
+
+            self.assertEqual(local_stand_ins.number_of_emails_sent, 1)
+            self.assertEqual(len(local_stand_ins.tasks.pending), 1)
+            self.assertEqual(local_stand_ins.tasks.run_pending(), 1)
+
+        self.assertEqual(CountingEmailBackend.number_of_messages_sent, 1)
+
+
+class RunBenchmarksTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+        return super().setUp()
+
+    def test_run_benchmarks_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            out = StringIO()
+            call_command(
+                "run_benchmarks", "--sizes", "30", "--iterations", "3", "--warmup", "1", "--in-place", "--output", output, stdout=out
+            )
+
+            with open(output) as results_file:
+                results = json.load(results_file)
+
+            call_command(
+                "run_benchmarks",
+                "--sizes",
+                "30",
+                "--iterations",
+                "2",
+                "--in-place",
+                "--scenarios",
+                "get_alerts",
+                "--baseline",
+                output,
+                stdout=out,
+            )
+
+        self.assertEqual(set(results["sizes"]["30"]), set(SCENARIOS))
+        for summary in results["sizes"]["30"].values():
+            self.assertEqual(summary["iterations"], 3)
+            self.assertGreater(summary["throughput"], 0)
+            self.assertLessEqual(summary["p50"], summary["p99"])
+
+        self.assertIn("30 alerts, get_alerts: throughput", out.getvalue())
+        # The alerts created are deleted and the ones updated are put back.
+        self.assertEqual(Alert.objects.count(), 30)
+        self.assertFalse(Alert.objects.filter(branch__startswith="Branch").exists())
+
+    def test_scenarios_must_define_run(self):
+        class IncompleteScenario(Scenario):
+            name = "incomplete"
+
+        with self.assertRaises(TypeError):
+            IncompleteScenario(context=None)
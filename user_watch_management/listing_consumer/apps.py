@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ListingConsumerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "listing_consumer"
+
+    def ready(self):
+        # Keep the alert index in sync with the alerts.
+        import listing_consumer.signals  # noqa: F401
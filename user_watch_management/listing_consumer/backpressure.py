@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Optional
+
+import redis
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+
+from listing_consumer.constants import LISTING_CONSUMER_OVERLOADED_MESSAGE
+from user_watch.celery import DEFAULT_QUEUE, LISTING_STAGES
+from user_watch.metrics import LISTING_REQUESTS_SHED
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_broker_client() -> redis.Redis:
+    """
+    Get the client the backlog of the broker is sampled with in this process. It gives up quickly so a broker that
+    stopped answering doesn't hold up the requests sampling it.
+
+    :return: The Redis client connected to CELERY_BROKER_URL.
+    """
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+def get_broker_backlog() -> Optional[int]:
+    """
+    Get the number of tasks waiting in the broker's queues, the default queue and those of the listing stages.
+
+    :return: The number of tasks waiting, None if the broker couldn't be reached.
+    """
+    try:
+        pipeline = get_broker_client().pipeline()
+        for queue in [DEFAULT_QUEUE, *LISTING_STAGES]:
+            pipeline.llen(queue)
+
+        return sum(pipeline.execute())
+    except redis.RedisError as e:
+        logger.warning(f"Failed to sample the broker backlog with error {e}")
+        return None
+
+
+class ListingLoadShedder:
+    """
+    Turns the listings away while the broker is too far behind, so a producer sending faster than the workers keep up
+    slows down instead of filling the broker until it runs out of memory.
+
+    The backlog is sampled at most once every sample_seconds by the process, the requests in between use the last sample
+    and a request arriving while another samples doesn't wait for it. Listings are accepted when the backlog couldn't be
+    sampled. The number of requests turned away is logged at most once every log_interval_seconds.
+
+    :param get_backlog: Called for the number of tasks waiting in the broker, None if it couldn't be reached.
+    :param high_water_mark: The backlog at which requests are turned away.
+    :param sample_seconds: How long a sample of the backlog is used for.
+    :param log_interval_seconds: The number of seconds between logs of the requests turned away.
+    :param clock: Called for the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        get_backlog: Callable[[], Optional[int]],
+        high_water_mark: int,
+        sample_seconds: float,
+        log_interval_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.get_backlog = get_backlog
+        self.high_water_mark = high_water_mark
+        self.sample_seconds = sample_seconds
+        self.log_interval_seconds = log_interval_seconds
+        self.clock = clock
+
+        self.__sample_lock = threading.Lock()
+        self.__backlog: Optional[int] = None
+        self.__sampled_at: Optional[float] = None
+
+        self.__shed_lock = threading.Lock()
+        self.__number_shed = 0
+        self.__logged_at = clock()
+
+    @property
+    def backlog(self) -> Optional[int]:
+        """
+        :return: The last sample of the backlog, taking a new one if it is older than sample_seconds.
+        """
+        now = self.clock()
+        if self.__sampled_at is not None and now - self.__sampled_at < self.sample_seconds:
+            return self.__backlog
+
+        # Only one request samples the broker at a time, the others use the last sample meanwhile.
+        if not self.__sample_lock.acquire(blocking=False):
+            return self.__backlog
+
+        try:
+            self.__backlog = self.get_backlog()
+            self.__sampled_at = self.clock()
+        finally:
+            self.__sample_lock.release()
+
+        self.log_shed()
+        return self.__backlog
+
+    def should_shed(self) -> bool:
+        """
+        Check whether to turn a request away, counting it if so.
+
+        :return: True if the backlog is at the high-water mark or over it.
+        """
+        backlog = self.backlog
+        if backlog is None or backlog < self.high_water_mark:
+            return False
+
+        LISTING_REQUESTS_SHED.inc()
+        with self.__shed_lock:
+            self.__number_shed += 1
+
+        self.log_shed()
+        return True
+
+    def log_shed(self):
+        """
+        Log the number of requests turned away since the last log, if any and log_interval_seconds have gone by.
+        """
+        now = self.clock()
+        with self.__shed_lock:
+            if not self.__number_shed or now - self.__logged_at < self.log_interval_seconds:
+                return
+
+            number_shed, self.__number_shed = self.__number_shed, 0
+            interval, self.__logged_at = now - self.__logged_at, now
+
+        logger.warning(
+            f"Shed {number_shed} listing requests in the last {interval:.1f}s, "
+            f"the broker backlog is {self.__backlog} tasks with a high-water mark of {self.high_water_mark}"
+        )
+
+
+@lru_cache(maxsize=None)
+def get_load_shedder() -> ListingLoadShedder:
+    """
+    :return: The load shedder of the listing consumer in this process.
+    """
+    return ListingLoadShedder(
+        get_backlog=get_broker_backlog,
+        high_water_mark=settings.LISTING_BACKPRESSURE_HIGH_WATER_MARK,
+        sample_seconds=settings.LISTING_BACKPRESSURE_SAMPLE_SECONDS,
+        log_interval_seconds=settings.LISTING_BACKPRESSURE_LOG_INTERVAL_SECONDS,
+    )
+
+
+def get_shed_response() -> Optional[JsonResponse]:
+    """
+    Get the response turning a listing request away while the broker is too far behind (see ListingLoadShedder), telling
+    the producer when to retry.
+
+    :return: The 503 response, None if the request should be accepted or LISTING_BACKPRESSURE_HIGH_WATER_MARK is 0.
+    """
+    if not settings.LISTING_BACKPRESSURE_HIGH_WATER_MARK or not get_load_shedder().should_shed():
+        return None
+
+    response = JsonResponse({"error": LISTING_CONSUMER_OVERLOADED_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response["Retry-After"] = str(settings.LISTING_BACKPRESSURE_RETRY_AFTER_SECONDS)
+    return response
@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class ListingCapture:
+    """
+    Appends the listings sent to the listing consumer to an NDJSON file, one {"captured_at", "path", "data"} object per
+    request, so a real burst of traffic can be replayed later with the replay_listings command. The file is rotated once
+    it reaches max_bytes, keeping backup_count older files.
+
+    Every process writes to its own file (named after the host and process id) so processes never rotate each other's.
+
+    :param directory: The directory to write the files to.
+    :param max_bytes: The size at which the file is rotated.
+    :param backup_count: The number of rotated files to keep.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, backup_count: int):
+        self.path = os.path.join(directory, f"listings-{socket.gethostname()}-{os.getpid()}.ndjson")
+        self.__handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.__handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def write(self, path: str, data):
+        """
+        Append the body of a request to the file.
+
+        :param path: The path the body was sent to.
+        :param data: The parsed body, a listing or a list of listings.
+        """
+        line = json.dumps({"captured_at": time.time(), "path": path, "data": data}, cls=DjangoJSONEncoder)
+        self.__handler.handle(logging.makeLogRecord({"msg": line}))
+
+    def close(self):
+        self.__handler.close()
+
+
+_capture: Optional[ListingCapture] = None
+_capture_key: Optional[tuple] = None
+_capture_lock = threading.Lock()
+
+
+def get_listing_capture() -> Optional[ListingCapture]:
+    """
+    Get the listing capture of the current process, a forked process gets its own file.
+
+    :return: The listing capture, None if LISTING_CAPTURE_DIR isn't set.
+    """
+    global _capture, _capture_key
+
+    if not settings.LISTING_CAPTURE_DIR:
+        return None
+
+    key = (os.getpid(), settings.LISTING_CAPTURE_DIR, settings.LISTING_CAPTURE_MAX_BYTES, settings.LISTING_CAPTURE_BACKUP_COUNT)
+    with _capture_lock:
+        if _capture is None or _capture_key != key:
+            if _capture is not None and _capture_key[0] == os.getpid():
+                _capture.close()
+
+            _capture = ListingCapture(
+                directory=settings.LISTING_CAPTURE_DIR,
+                max_bytes=settings.LISTING_CAPTURE_MAX_BYTES,
+                backup_count=settings.LISTING_CAPTURE_BACKUP_COUNT,
+            )
+            _capture_key = key
+
+        return _capture
+
+
+def capture_listings(path: str, data):
+    """
+    Capture the body of a request to the listing consumer if LISTING_CAPTURE_DIR is set. Failing to capture is logged
+    and never fails the request.
+
+    :param path: The path the body was sent to.
+    :param data: The parsed body, a listing or a list of listings.
+    """
+    try:
+        capture = get_listing_capture()
+        if capture is not None:
+            capture.write(path, data)
+    except Exception as e:
+        logger.warning(f"Failed to capture the listings sent to {path} with error {e}")
@@ -0,0 +1,27 @@
+# Alert index constants
+ALERT_INDEX_KEY_PREFIX = "listing_consumer:alert-index"
+ALERT_INDEX_ANY_BRANCH = "*"
+ALERT_INDEX_REBUILD_CHUNK_SIZE = 2000
+# The version of the index listings are matched against, and the version being rebuilt if any.
+ALERT_INDEX_VERSION_KEY = f"{ALERT_INDEX_KEY_PREFIX}:version"
+ALERT_INDEX_BUILDING_VERSION_KEY = f"{ALERT_INDEX_KEY_PREFIX}:building-version"
+ALERT_INDEX_LAST_VERSION_KEY = f"{ALERT_INDEX_KEY_PREFIX}:last-version"
+# A rebuild that stopped part way stops being written to after this long.
+ALERT_INDEX_BUILD_TTL_SECONDS = 24 * 60 * 60
+
+# Listing dedupe constants
+LISTING_DEDUPE_KEY_PREFIX = "listing_consumer:seen-listing"
+LISTING_DEDUPE_ANY_CLIENT = "*"
+LISTING_DEDUPE_SUPPRESSED_COUNTER_KEY = "listing_consumer:duplicate-listings-suppressed"
+
+# Sent email constants
+SENT_EMAIL_KEY_PREFIX = "listing_consumer:sent-email"
+# Longer than the broker's visibility timeout, after which an unacknowledged delivery task is delivered again.
+SENT_EMAIL_TTL_SECONDS = 24 * 60 * 60
+
+# Digest constants
+# The entries claimed by a digest run that stopped before sending them are claimed again after this long.
+DIGEST_CLAIM_TIMEOUT_SECONDS = 60 * 60
+
+# Backpressure constants
+LISTING_CONSUMER_OVERLOADED_MESSAGE = "Too many listings are waiting to be ingested, retry later"
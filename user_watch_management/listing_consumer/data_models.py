@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass(frozen=True)
@@ -10,4 +11,4 @@ class KennyUPullListing:
     row_id: str
     branch: str
     listing_url: str
-    client_id: str
+    client_id: Optional[str] = None
@@ -0,0 +1,149 @@
+import logging
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+from listing_consumer.constants import (
+    LISTING_DEDUPE_ANY_CLIENT,
+    LISTING_DEDUPE_KEY_PREFIX,
+    LISTING_DEDUPE_SUPPRESSED_COUNTER_KEY,
+    SENT_EMAIL_KEY_PREFIX,
+    SENT_EMAIL_TTL_SECONDS,
+)
+from listing_consumer.data_models import KennyUPullListing
+from listing_consumer.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def build_dedupe_key(kenny_u_pull_listing: KennyUPullListing) -> str:
+    """
+    Build the Redis key marking a listing as already ingested for a client.
+
+    :param kenny_u_pull_listing: The listing to build the key for.
+    :return: The dedupe key, based on the (client_id, row_id, branch) of the listing.
+    """
+    client_id = kenny_u_pull_listing.client_id or LISTING_DEDUPE_ANY_CLIENT
+    return f"{LISTING_DEDUPE_KEY_PREFIX}:{client_id}|{kenny_u_pull_listing.row_id}|{kenny_u_pull_listing.branch}"
+
+
+def drop_duplicate_listings(
+    kenny_u_pull_listings: list[KennyUPullListing], redis_client: Optional[redis.Redis] = None
+) -> tuple[list[KennyUPullListing], int]:
+    """
+    Drop every listing that was already ingested within the last LISTING_DEDUPE_TTL_SECONDS, for example because the
+    producer retried a POST. Listings are marked as seen with a single round trip to Redis. If Redis is unavailable every
+    listing is kept since sending an email twice is better than not sending it at all.
+
+    :param kenny_u_pull_listings: The listings to check.
+    :param redis_client: The Redis client to use, defaults to the listing consumer's client.
+    :return: The listings that were not seen before (in the same order) and the number of duplicates dropped.
+    """
+    ttl = settings.LISTING_DEDUPE_TTL_SECONDS
+    if ttl <= 0 or not kenny_u_pull_listings:
+        return kenny_u_pull_listings, 0
+
+    redis_client = redis_client or get_redis_client()
+    try:
+        pipeline = redis_client.pipeline()
+        for kenny_u_pull_listing in kenny_u_pull_listings:
+            pipeline.set(build_dedupe_key(kenny_u_pull_listing), 1, nx=True, ex=ttl)
+
+        was_first_seen = pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Failed to check {len(kenny_u_pull_listings)} listings for duplicates with error {e}")
+        return kenny_u_pull_listings, 0
+
+    new_listings = [kenny_u_pull_listing for kenny_u_pull_listing, is_new in zip(kenny_u_pull_listings, was_first_seen) if is_new]
+    number_of_duplicates = len(kenny_u_pull_listings) - len(new_listings)
+
+    if number_of_duplicates:
+        logger.info(f"Suppressed {number_of_duplicates} duplicate listings")
+        try:
+            redis_client.incrby(LISTING_DEDUPE_SUPPRESSED_COUNTER_KEY, number_of_duplicates)
+        except redis.RedisError as e:
+            logger.error(f"Failed to count {number_of_duplicates} suppressed duplicate listings with error {e}")
+
+    return new_listings, number_of_duplicates
+
+
+def forget_listings(kenny_u_pull_listings: list[KennyUPullListing], redis_client: Optional[redis.Redis] = None):
+    """
+    Stop treating listings as already ingested, for example because ingesting them failed, so they aren't dropped as
+    duplicates when they are sent again.
+
+    :param kenny_u_pull_listings: The listings to forget.
+    :param redis_client: The Redis client to use, defaults to the listing consumer's client.
+    """
+    if settings.LISTING_DEDUPE_TTL_SECONDS <= 0 or not kenny_u_pull_listings:
+        return
+
+    redis_client = redis_client or get_redis_client()
+    try:
+        redis_client.delete(*{build_dedupe_key(kenny_u_pull_listing) for kenny_u_pull_listing in kenny_u_pull_listings})
+    except redis.RedisError as e:
+        logger.error(f"Failed to forget {len(kenny_u_pull_listings)} listings with error {e}")
+
+
+def get_number_of_duplicates_suppressed(redis_client: Optional[redis.Redis] = None) -> int:
+    """
+    Get the number of duplicate listings suppressed since the counter was created.
+
+    :param redis_client: The Redis client to use, defaults to the listing consumer's client.
+    :return: The number of duplicate listings suppressed.
+    """
+    redis_client = redis_client or get_redis_client()
+    return int(redis_client.get(LISTING_DEDUPE_SUPPRESSED_COUNTER_KEY) or 0)
+
+
+def build_sent_email_key(task_id: str) -> str:
+    """
+    Build the Redis key of the set of emails of a delivery task that were sent.
+
+    :param task_id: The id of the delivery task.
+    :return: The sent emails key.
+    """
+    return f"{SENT_EMAIL_KEY_PREFIX}:{task_id}"
+
+
+def mark_emails_sent(task_id: str, positions: list[int], redis_client: Optional[redis.Redis] = None):
+    """
+    Mark emails of a delivery task as sent with a single round trip to Redis, so they are skipped if the task is
+    delivered again.
+
+    :param task_id: The id of the delivery task.
+    :param positions: The positions of the emails sent in the task's emails.
+    :param redis_client: The Redis client to use, defaults to the listing consumer's client.
+    """
+    if not positions:
+        return
+
+    redis_client = redis_client or get_redis_client()
+    key = build_sent_email_key(task_id)
+    try:
+        pipeline = redis_client.pipeline()
+        pipeline.sadd(key, *positions)
+        pipeline.expire(key, SENT_EMAIL_TTL_SECONDS)
+        pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Failed to mark {len(positions)} emails of task {task_id} as sent with error {e}")
+
+
+def get_sent_email_positions(task_id: str, redis_client: Optional[redis.Redis] = None) -> set[int]:
+    """
+    Get the emails of a delivery task that were already sent. If Redis is unavailable none are, since sending an email
+    twice is better than not sending it at all.
+
+    :param task_id: The id of the delivery task.
+    :param redis_client: The Redis client to use, defaults to the listing consumer's client.
+    :return: The positions of the emails already sent.
+    """
+    redis_client = redis_client or get_redis_client()
+    try:
+        sent = redis_client.smembers(build_sent_email_key(task_id))
+    except redis.RedisError as e:
+        logger.error(f"Failed to get the emails of task {task_id} already sent with error {e}")
+        return set()
+
+    return {int(position) for position in sent}
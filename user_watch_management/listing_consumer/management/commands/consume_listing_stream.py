@@ -0,0 +1,70 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from listing_consumer.redis_client import get_redis_client
+from listing_consumer.streams import ListingStreamConsumer, get_default_consumer_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest the listings added to a Redis Stream as a member of a consumer group, a batch at a time, acknowledging them "
+        "once they are matched and their emails queued. Listings left pending by a consumer that stopped are taken over. "
+        "Stops after the current batch on SIGINT or SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stream", default=settings.LISTING_STREAM_KEY, help="The key of the stream to read.")
+        parser.add_argument("--group", default=settings.LISTING_STREAM_GROUP, help="The consumer group to read as.")
+        parser.add_argument("--consumer", default=get_default_consumer_name(), help="The name of this consumer in the group.")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.LISTING_STREAM_BATCH_SIZE, help="The number of listings to read at once."
+        )
+        parser.add_argument(
+            "--block-ms", type=int, default=settings.LISTING_STREAM_BLOCK_MS, help="How long to wait for new listings when there are none."
+        )
+        parser.add_argument(
+            "--claim-idle-seconds",
+            type=float,
+            default=settings.LISTING_STREAM_CLAIM_IDLE_SECONDS,
+            help="How long a listing can stay pending before it is taken over.",
+        )
+        parser.add_argument(
+            "--max-deliveries",
+            type=int,
+            default=settings.LISTING_STREAM_MAX_DELIVERIES,
+            help="The number of times a listing is read before it is dropped.",
+        )
+        parser.add_argument("--burst", action="store_true", help="Stop once there are no listings left instead of waiting for more.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["block_ms"] < 1 or options["max_deliveries"] < 1 or options["claim_idle_seconds"] < 0:
+            raise CommandError("--batch-size, --block-ms and --max-deliveries must be positive and --claim-idle-seconds not negative.")
+
+        consumer = ListingStreamConsumer(
+            redis_client=get_redis_client(),
+            stream=options["stream"],
+            group=options["group"],
+            consumer=options["consumer"],
+            batch_size=options["batch_size"],
+            block_ms=options["block_ms"],
+            claim_idle_ms=int(options["claim_idle_seconds"] * 1000),
+            max_deliveries=options["max_deliveries"],
+        )
+
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signal_number, lambda *_: stop.set())
+
+        self.stdout.write(f"Consuming {options['stream']} as {options['consumer']} of {options['group']}")
+        counts = consumer.consume(stop=stop, burst=options["burst"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Read {counts['read']} listings: {counts['ingested']} ingested, {counts['invalid']} invalid, "
+                f"{counts['dropped']} dropped after too many deliveries and {counts['failed_batches']} batches left pending."
+            )
+        )
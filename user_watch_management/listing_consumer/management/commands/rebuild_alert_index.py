@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from listing_consumer.constants import ALERT_INDEX_REBUILD_CHUNK_SIZE
+from listing_consumer.matching import AlertIndex
+
+
+class Command(BaseCommand):
+    help = "Rebuild the index of alerts used to match listings to every interested alert."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=ALERT_INDEX_REBUILD_CHUNK_SIZE,
+            help="The number of alerts to load and index at once.",
+        )
+
+    def handle(self, *args, **options):
+        number_of_alerts_indexed = AlertIndex().rebuild(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {number_of_alerts_indexed} alerts."))
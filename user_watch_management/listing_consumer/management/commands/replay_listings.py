@@ -0,0 +1,86 @@
+import json
+from functools import partial
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from listing_consumer.replay import ListingReplayer, get_task_backlog, load_capture
+from user_watch.celery import DEFAULT_QUEUE, LISTING_STAGES
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay listings captured with LISTING_CAPTURE_DIR against a deployment, keeping the time between the requests "
+        "divided by --speed (ex: 1, 10 or 100), and report the throughput, error rate and task backlog over time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="The capture files or directories of capture files to replay.")
+        parser.add_argument("--url", default="http://localhost:8000", help="The base URL of the deployment.")
+        parser.add_argument("--speed", type=float, default=1, help="How many times faster than it was captured to replay the traffic.")
+        parser.add_argument("--concurrency", type=int, default=20, help="The number of requests in flight at once.")
+        parser.add_argument("--report-interval", type=float, default=1, help="The number of seconds between reports.")
+        parser.add_argument("--broker-url", default=settings.CELERY_BROKER_URL, help="The Redis broker to get the task backlog from.")
+        parser.add_argument(
+            "--queues", nargs="+", default=[DEFAULT_QUEUE, *LISTING_STAGES], help="The queues the task backlog is counted in."
+        )
+        parser.add_argument(
+            "--rewrite-row-ids",
+            action="store_true",
+            help=(
+                "Append a suffix unique to this replay to the row_id of every listing, so they aren't dropped as duplicates of "
+                "the listings already sent within LISTING_DEDUPE_TTL_SECONDS."
+            ),
+        )
+        parser.add_argument("--output", help="The file to write the results and the reports over time to as JSON.")
+
+    def handle(self, *args, **options):
+        if options["speed"] <= 0 or options["concurrency"] < 1 or options["report_interval"] <= 0:
+            raise CommandError("--speed and --report-interval must be positive and --concurrency at least 1.")
+
+        records = load_capture(options["paths"])
+        if not records:
+            raise CommandError("There are no captured listings to replay.")
+
+        row_id_suffix = f"-replay-{uuid4().hex[:8]}" if options["rewrite_row_ids"] else ""
+        if row_id_suffix:
+            self.stdout.write(f"Rewriting the row_id of every listing with the suffix {row_id_suffix}")
+
+        duration = records[-1]["captured_at"] - records[0]["captured_at"]
+        self.stdout.write(
+            f"Replaying {len(records)} requests captured over {duration:.1f}s at {options['speed']:g}x "
+            f"({duration / options['speed']:.1f}s) with {options['concurrency']} at once."
+        )
+
+        replayer = ListingReplayer(
+            url=options["url"],
+            records=records,
+            speed=options["speed"],
+            concurrency=options["concurrency"],
+            report_interval=options["report_interval"],
+            get_backlog=partial(get_task_backlog, options["broker_url"], options["queues"]),
+            row_id_suffix=row_id_suffix,
+        )
+        result = replayer.replay(on_report=self.__write_report)
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(result, output, indent=2)
+            self.stdout.write(f"Wrote the results to {options['output']}")
+
+        outcomes = ", ".join(f"{outcome}: {count}" for outcome, count in sorted(result["outcomes"].items()))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replayed {result['requests']} requests in {result['seconds']:.1f}s: {result['requests_per_second']:.1f} req/s, "
+                f"{result['error_rate']:.1%} errors, p50 {result['p50']:.1f}ms, p95 {result['p95']:.1f}ms, "
+                f"p99 {result['p99']:.1f}ms ({outcomes})"
+            )
+        )
+
+    def __write_report(self, report: dict):
+        backlog = "unknown" if report["task_backlog"] is None else report["task_backlog"]
+        self.stdout.write(
+            f"{report['elapsed']:.1f}s: {report['sent']} sent, {report['requests_per_second']:.1f} req/s, "
+            f"{report['error_rate']:.1%} errors, p95 {report['p95']:.1f}ms, {backlog} tasks waiting"
+        )
@@ -0,0 +1,228 @@
+from typing import Iterable, Optional
+
+import redis
+
+from alerts.models import Alert, Vehicle
+from listing_consumer.constants import (
+    ALERT_INDEX_ANY_BRANCH,
+    ALERT_INDEX_BUILD_TTL_SECONDS,
+    ALERT_INDEX_BUILDING_VERSION_KEY,
+    ALERT_INDEX_KEY_PREFIX,
+    ALERT_INDEX_LAST_VERSION_KEY,
+    ALERT_INDEX_REBUILD_CHUNK_SIZE,
+    ALERT_INDEX_VERSION_KEY,
+)
+from listing_consumer.data_models import KennyUPullListing
+from listing_consumer.redis_client import get_redis_client
+
+
+def normalize(value: Optional[str]) -> str:
+    """
+    Normalize a vehicle or branch value so differently formatted values share the same index key.
+
+    :param value: The value to normalize (ex: " Toyota ").
+    :return: The normalized value (ex: "toyota").
+    """
+    return (value or "").strip().lower()
+
+
+# Move an alert to its index key, removing it from the key it was in, atomically so concurrent updates of an alert can't
+# leave it in a key it no longer belongs to. KEYS: the alert's key and its new index key, ARGV: the alert's id.
+MOVE_ALERT_SCRIPT = """
+local previous_key = redis.call("GET", KEYS[1])
+if previous_key and previous_key ~= KEYS[2] then
+    redis.call("SREM", previous_key, ARGV[1])
+end
+redis.call("SADD", KEYS[2], ARGV[1])
+redis.call("SET", KEYS[1], KEYS[2])
+"""
+
+# Remove an alert from the index atomically. KEYS: the alert's key, ARGV: the alert's id.
+REMOVE_ALERT_SCRIPT = """
+local previous_key = redis.call("GET", KEYS[1])
+if previous_key then
+    redis.call("SREM", previous_key, ARGV[1])
+end
+redis.call("DEL", KEYS[1])
+"""
+
+
+def build_index_namespace(version: int) -> str:
+    """
+    Build the prefix of the keys of a version of the index.
+
+    :param version: The version of the index, 0 for the index built before it was versioned.
+    :return: The prefix of the version's keys.
+    """
+    return f"{ALERT_INDEX_KEY_PREFIX}:v{version}" if version else ALERT_INDEX_KEY_PREFIX
+
+
+def build_index_key(make: str, model: str, year: str, branch: Optional[str] = None, version: int = 0) -> str:
+    """
+    Build the Redis key of the set holding the ids of every alert watching the given vehicle at the given branch.
+
+    :param make: The manufacturer name of the vehicle (ex: "Toyota").
+    :param model: The model name of the vehicle (ex: "Corolla").
+    :param year: The model year of the vehicle (ex: "1996").
+    :param branch: The branch being watched, None if the alert is watching every branch.
+    :param version: The version of the index the key is in.
+    :return: The index key.
+    """
+    branch_key = normalize(branch) or ALERT_INDEX_ANY_BRANCH
+    return f"{build_index_namespace(version)}:key:{normalize(make)}|{normalize(model)}|{normalize(year)}|{branch_key}"
+
+
+def build_alert_key(alert_id: int, version: int = 0) -> str:
+    """
+    Build the Redis key holding which index key an alert is in.
+
+    :param alert_id: The id of the alert.
+    :param version: The version of the index the key is in.
+    :return: The alert key.
+    """
+    return f"{build_index_namespace(version)}:alert:{alert_id}"
+
+
+class AlertIndex:
+    """
+    An index of every alert keyed on the normalized (make, model, year, branch or any branch) it is watching for, stored
+    in Redis so every web and Celery process shares it.
+
+    Each index key is a set of alert ids and every indexed alert also stores which key it is in, so an alert can be moved
+    to a new key when its vehicle or branch changes.
+
+    The index is versioned so it can be rebuilt next to the one listings are matched against, which is swapped for the
+    new version once it is complete. The alerts changed while a rebuild runs are updated in both versions.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self.redis_client = redis_client or get_redis_client()
+        self.__move_alert = self.redis_client.register_script(MOVE_ALERT_SCRIPT)
+        self.__remove_alert = self.redis_client.register_script(REMOVE_ALERT_SCRIPT)
+
+    def get_version(self) -> int:
+        """
+        :return: The version of the index listings are matched against.
+        """
+        return int(self.redis_client.get(ALERT_INDEX_VERSION_KEY) or 0)
+
+    def __get_versions_to_update(self) -> list[int]:
+        version, building_version = self.redis_client.mget([ALERT_INDEX_VERSION_KEY, ALERT_INDEX_BUILDING_VERSION_KEY])
+        versions = [int(version or 0)]
+        if building_version and int(building_version) not in versions:
+            versions.append(int(building_version))
+
+        return versions
+
+    def index_alerts(self, alerts: Iterable[Alert], versions: Optional[list[int]] = None):
+        """
+        Add the alerts to the index or move them to their new key if they are already indexed.
+
+        :param alerts: The alerts to index (their vehicles should already be loaded to avoid extra queries).
+        :param versions: The versions of the index to update, defaults to the current one and the one being rebuilt.
+        """
+        alerts = list(alerts)
+        if not alerts:
+            return
+
+        pipeline = self.redis_client.pipeline()
+        for version in versions if versions is not None else self.__get_versions_to_update():
+            for alert in alerts:
+                vehicle = (alert.vehicle.manufacturer_name, alert.vehicle.model_name, alert.vehicle.model_year)
+                key = build_index_key(*vehicle, branch=alert.branch, version=version)
+                self.__move_alert(keys=[build_alert_key(alert.id, version), key], args=[alert.id], client=pipeline)
+
+        pipeline.execute()
+
+    def index_vehicle(self, vehicle: Vehicle):
+        """
+        Re-index every alert watching the vehicle, for example after the vehicle was updated.
+
+        :param vehicle: The vehicle whose alerts should be re-indexed.
+        """
+        alerts = Alert.objects.filter(vehicle=vehicle).only("id", "branch", "vehicle_id")
+        for alert in alerts:
+            # Avoid a query per alert since we already have the vehicle.
+            alert.vehicle = vehicle
+
+        self.index_alerts(alerts)
+
+    def remove_alert(self, alert_id: int):
+        """
+        Remove the alert from the index.
+
+        :param alert_id: The id of the alert to remove.
+        """
+        pipeline = self.redis_client.pipeline()
+        for version in self.__get_versions_to_update():
+            self.__remove_alert(keys=[build_alert_key(alert_id, version)], args=[alert_id], client=pipeline)
+
+        pipeline.execute()
+
+    def clear(self):
+        """
+        Remove every entry from every version of the index.
+        """
+        keys = list(self.redis_client.scan_iter(match=f"{ALERT_INDEX_KEY_PREFIX}:*", count=ALERT_INDEX_REBUILD_CHUNK_SIZE))
+        for start in range(0, len(keys), ALERT_INDEX_REBUILD_CHUNK_SIZE):
+            self.redis_client.delete(*keys[start : start + ALERT_INDEX_REBUILD_CHUNK_SIZE])
+
+    def rebuild(self, chunk_size: int = ALERT_INDEX_REBUILD_CHUNK_SIZE) -> int:
+        """
+        Rebuild the whole index from the database into a new version, which replaces the current one at once when it is
+        complete. Listings keep being matched against the current version meanwhile.
+
+        :param chunk_size: The number of alerts to load and index at once.
+        :return: The number of alerts indexed.
+        """
+        previous_version = self.get_version()
+        version = self.redis_client.incr(ALERT_INDEX_LAST_VERSION_KEY)
+        # The alerts changed from now on are also updated in the new version.
+        self.redis_client.set(ALERT_INDEX_BUILDING_VERSION_KEY, version, ex=ALERT_INDEX_BUILD_TTL_SECONDS)
+
+        number_of_alerts_indexed = 0
+        chunk = []
+        for alert in Alert.objects.select_related("vehicle").only("id", "branch", "vehicle").iterator(chunk_size=chunk_size):
+            chunk.append(alert)
+            if len(chunk) >= chunk_size:
+                self.index_alerts(chunk, versions=[version])
+                number_of_alerts_indexed += len(chunk)
+                chunk = []
+
+        self.index_alerts(chunk, versions=[version])
+
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.set(ALERT_INDEX_VERSION_KEY, version)
+        pipeline.delete(ALERT_INDEX_BUILDING_VERSION_KEY)
+        pipeline.execute()
+
+        self.__delete_version(previous_version)
+        return number_of_alerts_indexed + len(chunk)
+
+    def __delete_version(self, version: int):
+        namespace = build_index_namespace(version)
+        for key_type in ("key", "alert"):
+            keys = list(self.redis_client.scan_iter(match=f"{namespace}:{key_type}:*", count=ALERT_INDEX_REBUILD_CHUNK_SIZE))
+            for start in range(0, len(keys), ALERT_INDEX_REBUILD_CHUNK_SIZE):
+                self.redis_client.delete(*keys[start : start + ALERT_INDEX_REBUILD_CHUNK_SIZE])
+
+    def find_alert_ids(self, kenny_u_pull_listings: list[KennyUPullListing]) -> list[set[int]]:
+        """
+        Find the ids of every alert that could be interested in each listing in the current version of the index, using
+        one round trip to Redis after getting the version.
+
+        :param kenny_u_pull_listings: The listings to find alerts for.
+        :return: The alert ids for each listing in the same order as the listings.
+        """
+        if not kenny_u_pull_listings:
+            return []
+
+        version = self.get_version()
+        pipeline = self.redis_client.pipeline()
+        for kenny_u_pull_listing in kenny_u_pull_listings:
+            vehicle = (kenny_u_pull_listing.make, kenny_u_pull_listing.model, kenny_u_pull_listing.year)
+            pipeline.sunion(
+                build_index_key(*vehicle, branch=kenny_u_pull_listing.branch, version=version), build_index_key(*vehicle, version=version)
+            )
+
+        return [{int(alert_id) for alert_id in alert_ids} for alert_ids in pipeline.execute()]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.10 on 2026-10-18 15:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("alerts", "0003_alert_digest_historicalalert_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingDigestEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("listing_url", models.URLField(help_text="The URL of the listing on Kenny U-Pull's website.", max_length=512)),
+                ("branch", models.CharField(help_text="The Kenny U-Pull branch the listing is at.", max_length=64)),
+                ("alert", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="alerts.alert")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
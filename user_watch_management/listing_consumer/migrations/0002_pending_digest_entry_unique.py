@@ -0,0 +1,33 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_pending_digest_entries(apps, schema_editor):
+    PendingDigestEntry = apps.get_model("listing_consumer", "PendingDigestEntry")
+
+    duplicate_groups = (
+        PendingDigestEntry.objects.values("alert_id", "listing_url", "branch")
+        .annotate(number_of_entries=Count("id"), first_id=Min("id"))
+        .filter(number_of_entries__gt=1)
+    )
+    for group in duplicate_groups:
+        PendingDigestEntry.objects.filter(alert_id=group["alert_id"], listing_url=group["listing_url"], branch=group["branch"]).exclude(
+            id=group["first_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("listing_consumer", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_pending_digest_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="pendingdigestentry",
+            constraint=models.UniqueConstraint(fields=("alert", "listing_url", "branch"), name="unique_pending_digest_entry"),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("listing_consumer", "0002_pending_digest_entry_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingdigestentry",
+            name="claim_id",
+            field=models.UUIDField(blank=True, help_text="The id of the digest run sending the entry.", null=True),
+        ),
+        migrations.AddField(
+            model_name="pendingdigestentry",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, help_text="When the entry was claimed by the digest run sending it.", null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import models
+
+from alerts.constants import DEFAULT_MIN_CHAR_LENGTH
+from alerts.models import Alert
+
+
+class PendingDigestEntry(models.Model):
+    """
+    A model representing a listing that matched an alert in digest mode and is waiting to be sent to the user in their next
+    digest email.
+
+    :param id: Autogenerated by Django and the primary key of the table.
+    :param created: When the record was first inserted into the table.
+    :param user: The user the digest will be sent to.
+    :param alert: The alert the listing matched.
+    :param listing_url: The URL of the listing on Kenny U-Pull's website.
+    :param branch: The Kenny U-Pull branch the listing is at.
+    :param claim_id: The id of the digest run sending the entry, null while it isn't being sent.
+    :param claimed_at: When the entry was claimed by the digest run sending it.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    alert = models.ForeignKey(Alert, on_delete=models.CASCADE)
+    listing_url = models.URLField(max_length=512, help_text="The URL of the listing on Kenny U-Pull's website.")
+    branch = models.CharField(max_length=DEFAULT_MIN_CHAR_LENGTH, help_text="The Kenny U-Pull branch the listing is at.")
+    claim_id = models.UUIDField(null=True, blank=True, help_text="The id of the digest run sending the entry.")
+    claimed_at = models.DateTimeField(null=True, blank=True, help_text="When the entry was claimed by the digest run sending it.")
+
+    class Meta:
+        constraints = [
+            # A listing matched again (ex: a redelivered matching task) isn't sent twice in the digest.
+            models.UniqueConstraint(fields=["alert", "listing_url", "branch"], name="unique_pending_digest_entry"),
+        ]
+
+    def __str__(self) -> str:
+        """
+        String representation of a pending digest entry which should be human readable.
+        :returns: A string representing the pending digest entry in question.
+        """
+        return f"Pending digest entry for alert {self.alert_id} with the listing {self.listing_url}"
@@ -0,0 +1,182 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from typing import Callable, Optional
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from user_watch.metrics import EMAIL_SEND_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """
+    Sends the listing emails of a process over a single long-lived connection to the email server instead of opening a
+    new connection (and doing the TLS handshake) for every email.
+
+    Messages are queued and sent in groups once EMAIL_BATCH_SIZE messages are pending or EMAIL_FLUSH_INTERVAL_SECONDS
+    have passed since the last send. The connection is checked with a NOOP when it has been idle for longer than
+    EMAIL_CONNECTION_HEALTH_CHECK_SECONDS and is re-opened whenever it fails.
+    """
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        health_check_interval: Optional[float] = None,
+    ):
+        self.batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+        self.flush_interval = settings.EMAIL_FLUSH_INTERVAL_SECONDS if flush_interval is None else flush_interval
+        self.health_check_interval = (
+            settings.EMAIL_CONNECTION_HEALTH_CHECK_SECONDS if health_check_interval is None else health_check_interval
+        )
+
+        self.__lock = threading.RLock()
+        self.__pending: list[tuple[EmailMessage, Optional[Callable[[], None]]]] = []
+        self.__connection = None
+        self.__last_flush = time.monotonic()
+        self.__last_used = time.monotonic()
+
+    def enqueue(self, message: EmailMessage, on_sent: Optional[Callable[[], None]] = None):
+        """
+        Queue a message to be sent, sending the pending messages if the batch is full or the flush interval has passed.
+
+        :param message: The message to send.
+        :param on_sent: Called once the email server accepted the message.
+        """
+        with self.__lock:
+            self.__pending.append((message, on_sent))
+
+            if len(self.__pending) >= self.batch_size or time.monotonic() - self.__last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self) -> int:
+        """
+        Send every pending message.
+
+        :return: The number of messages sent.
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, []
+            self.__last_flush = time.monotonic()
+
+            number_of_messages_sent = 0
+            for start in range(0, len(pending), self.batch_size):
+                number_of_messages_sent += self.__send(pending[start : start + self.batch_size])
+
+            return number_of_messages_sent
+
+    def close(self):
+        """
+        Send every pending message and close the connection to the email server.
+        """
+        with self.__lock:
+            self.flush()
+            self.__close_connection()
+
+    def __send(self, messages: list[tuple[EmailMessage, Optional[Callable[[], None]]]]) -> int:
+        number_of_messages_sent = 0
+        for message, on_sent in messages:
+            # Messages go out one at a time over the shared connection so a failure part way through a batch never
+            # causes the messages before it to be sent twice when retrying on a new connection.
+            for attempt in range(2):
+                started = time.perf_counter()
+                try:
+                    number_of_messages_sent += self.__get_connection().send_messages([message])
+                    self.__last_used = time.monotonic()
+                    EMAIL_SEND_DURATION.labels(outcome="sent").observe(time.perf_counter() - started)
+                    if on_sent is not None:
+                        on_sent()
+                    break
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    # The server rejected this message, the connection itself is still fine.
+                    EMAIL_SEND_DURATION.labels(outcome="rejected").observe(time.perf_counter() - started)
+                    logger.error(f"Failed to send email to {message.to} with error {e}")
+                    break
+                except OSError as e:
+                    # Covers the server dropping the connection (SMTPServerDisconnected) and socket errors.
+                    EMAIL_SEND_DURATION.labels(outcome="disconnected").observe(time.perf_counter() - started)
+                    self.__close_connection()
+                    if attempt:
+                        logger.error(f"Failed to send email to {message.to} after reconnecting with error {e}")
+                    else:
+                        logger.warning(f"Lost the connection to the email server, reconnecting. Error {e}")
+                except Exception as e:
+                    EMAIL_SEND_DURATION.labels(outcome="error").observe(time.perf_counter() - started)
+                    logger.error(f"Failed to send email to {message.to} with error {e}")
+                    break
+
+        return number_of_messages_sent
+
+    def __get_connection(self):
+        if self.__connection is not None and time.monotonic() - self.__last_used >= self.health_check_interval:
+            if not self.__is_healthy():
+                logger.info("The connection to the email server is no longer healthy, reconnecting.")
+                self.__close_connection()
+
+        if self.__connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self.__connection = connection
+            self.__last_used = time.monotonic()
+
+        return self.__connection
+
+    def __is_healthy(self) -> bool:
+        smtp_connection = getattr(self.__connection, "connection", None)
+        if smtp_connection is None:
+            # Backends without a socket (ex: the in memory backend used in tests) have nothing to check.
+            return True
+
+        try:
+            status_code, _ = smtp_connection.noop()
+            return status_code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def __close_connection(self):
+        if self.__connection is None:
+            return
+
+        try:
+            self.__connection.close()
+        except Exception as e:
+            logger.warning(f"Failed to cleanly close the connection to the email server with error {e}")
+        finally:
+            self.__connection = None
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_pid: Optional[int] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """
+    Get the notification dispatcher of the current process. A forked Celery worker process gets its own dispatcher
+    rather than sharing the connection of its parent.
+
+    :return: The notification dispatcher of this process.
+    """
+    global _dispatcher, _dispatcher_pid
+
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_pid != os.getpid():
+            _dispatcher = NotificationDispatcher()
+            _dispatcher_pid = os.getpid()
+
+        return _dispatcher
+
+
+@worker_process_shutdown.connect
+def close_dispatcher(**kwargs):
+    """
+    Send anything still pending and close the connection to the email server when a Celery worker process stops.
+    """
+    if _dispatcher is not None and _dispatcher_pid == os.getpid():
+        _dispatcher.close()
@@ -0,0 +1,34 @@
+import codecs
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses a newline delimited JSON (NDJSON) stream into a list with one item per non-empty line.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None) -> list:
+        """
+        Parses the incoming bytestream as NDJSON and returns the resulting list of items.
+        """
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        decoded_stream = codecs.getreader(encoding)(stream)
+
+        items = []
+        for line_number, line in enumerate(decoded_stream, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON parse error on line {line_number} - {exc}")
+
+        return items
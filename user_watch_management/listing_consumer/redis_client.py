@@ -0,0 +1,15 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis_client() -> redis.Redis:
+    """
+    Get the Redis client shared by the listing consumer in this process. The client keeps its own connection pool so
+    it is safe to reuse across requests and tasks.
+
+    :return: The Redis client connected to LISTING_CONSUMER_REDIS_URL.
+    """
+    return redis.Redis.from_url(settings.LISTING_CONSUMER_REDIS_URL, decode_responses=True)
@@ -0,0 +1,232 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import redis
+import requests
+
+from user_watch.percentiles import get_percentile
+
+logger = logging.getLogger(__name__)
+
+
+def get_capture_files(paths: list[str]) -> list[str]:
+    """
+    Get the capture files to replay, the NDJSON files (including the rotated ones) of the directories are included.
+
+    :param paths: Capture files or directories of capture files.
+    :return: The paths of the capture files.
+    """
+    capture_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            capture_files.extend(sorted(glob.glob(os.path.join(path, "*.ndjson*"))))
+        else:
+            capture_files.append(path)
+
+    return capture_files
+
+
+def load_capture(paths: list[str]) -> list[dict]:
+    """
+    Load captured requests, merging the files of every process into the order the requests arrived in.
+
+    :param paths: Capture files or directories of capture files.
+    :return: The captured requests ({"captured_at", "path", "data"}) ordered by when they were captured.
+    """
+    records = []
+    for capture_file in get_capture_files(paths):
+        with open(capture_file, encoding="utf-8") as lines:
+            for line in lines:
+                if line.strip():
+                    records.append(json.loads(line))
+
+    return sorted(records, key=lambda record: record["captured_at"])
+
+
+def get_task_backlog(broker_url: str, queues: list[str]) -> Optional[int]:
+    """
+    Get the number of tasks waiting in the broker's queues.
+
+    :param broker_url: The URL of the Redis broker.
+    :param queues: The names of the queues to count.
+    :return: The number of tasks waiting, None if the broker couldn't be reached.
+    """
+    try:
+        client = redis.Redis.from_url(broker_url, socket_timeout=1)
+        pipeline = client.pipeline()
+        for queue in queues:
+            pipeline.llen(queue)
+
+        return sum(pipeline.execute())
+    except redis.RedisError as e:
+        logger.warning(f"Failed to get the task backlog with error {e}")
+        return None
+
+
+def rewrite_row_ids(data, row_id_suffix: str):
+    """
+    Append a suffix to the row_id of the captured listings, so the listings replayed aren't dropped as duplicates of
+    those already sent within LISTING_DEDUPE_TTL_SECONDS.
+
+    :param data: The body of a captured request, a listing or a list of listings.
+    :param row_id_suffix: The suffix appended to each row_id.
+    :return: A copy of the body with the row_id of each listing rewritten.
+    """
+    if isinstance(data, list):
+        return [rewrite_row_ids(listing, row_id_suffix) for listing in data]
+
+    if isinstance(data, dict) and "row_id" in data:
+        return {**data, "row_id": f"{data['row_id']}{row_id_suffix}"}
+
+    return data
+
+
+def is_success(outcome: str) -> bool:
+    return outcome.isdigit() and 200 <= int(outcome) < 300
+
+
+class ListingReplayer:
+    """
+    Re-send captured listing requests to a deployment keeping the time between them, divided by speed (ex: 10 replays
+    a capture 10 times faster), with at most concurrency requests in flight. A report of the last report_interval seconds
+    is taken as the replay goes.
+
+    :param url: The base URL of the deployment.
+    :param records: The captured requests ordered by when they were captured, see load_capture.
+    :param speed: How many times faster than it was captured to replay the traffic.
+    :param concurrency: The number of requests in flight at once.
+    :param report_interval: The number of seconds between reports.
+    :param get_backlog: Called for the number of tasks waiting to be run with each report.
+    :param row_id_suffix: Appended to the row_id of every listing sent (see rewrite_row_ids), the captured row_ids are
+    sent as they are if empty.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        records: list[dict],
+        speed: float,
+        concurrency: int,
+        report_interval: float,
+        get_backlog: Optional[Callable[[], Optional[int]]] = None,
+        row_id_suffix: str = "",
+    ):
+        self.url = url.rstrip("/")
+        self.records = records
+        self.speed = speed
+        self.concurrency = concurrency
+        self.report_interval = report_interval
+        self.get_backlog = get_backlog or (lambda: None)
+        self.row_id_suffix = row_id_suffix
+
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__results: list[tuple[str, float]] = []
+        self.__number_reported = 0
+        self.__number_sent = 0
+        self.__started = 0.0
+        self.__last_report_at = 0.0
+
+    def replay(self, on_report: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Replay every captured request.
+
+        :param on_report: Called with each report as it is taken.
+        :return: The number of requests, how long they took, the requests per second, the share of errors, the count of
+        each status code (or error), the latency percentiles in milliseconds and the reports taken over time.
+        """
+        timeline = []
+
+        def report():
+            timeline.append(self.__report())
+            if on_report is not None:
+                on_report(timeline[-1])
+
+        done = threading.Event()
+
+        def report_periodically():
+            while not done.wait(self.report_interval):
+                report()
+
+        self.__started = self.__last_report_at = time.monotonic()
+        reporter = threading.Thread(target=report_periodically, daemon=True)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                first_captured_at = self.records[0]["captured_at"] if self.records else 0
+                for record in self.records:
+                    delay = (record["captured_at"] - first_captured_at) / self.speed - (time.monotonic() - self.__started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                    executor.submit(self.__send, record)
+        finally:
+            done.set()
+            reporter.join()
+
+        seconds = time.monotonic() - self.__started
+        # The requests finished since the last report.
+        report()
+
+        durations = [duration for _, duration in self.__results]
+        outcomes = Counter(outcome for outcome, _ in self.__results)
+        number_of_errors = sum(count for outcome, count in outcomes.items() if not is_success(outcome))
+        return {
+            "requests": len(self.__results),
+            "seconds": seconds,
+            "requests_per_second": len(self.__results) / seconds if seconds else 0,
+            "error_rate": number_of_errors / len(self.__results) if self.__results else 0,
+            "outcomes": dict(outcomes),
+            "p50": get_percentile(durations, 50),
+            "p95": get_percentile(durations, 95),
+            "p99": get_percentile(durations, 99),
+            "timeline": timeline,
+        }
+
+    def __send(self, record: dict):
+        if not hasattr(self.__local, "session"):
+            self.__local.session = requests.Session()
+
+        with self.__lock:
+            self.__number_sent += 1
+
+        data = rewrite_row_ids(record["data"], self.row_id_suffix) if self.row_id_suffix else record["data"]
+
+        started = time.perf_counter()
+        try:
+            response = self.__local.session.post(f"{self.url}{record['path']}", json=data, timeout=30)
+            outcome = str(response.status_code)
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+
+        duration = (time.perf_counter() - started) * 1000
+        with self.__lock:
+            self.__results.append((outcome, duration))
+
+    def __report(self) -> dict:
+        now = time.monotonic()
+        with self.__lock:
+            results = self.__results[self.__number_reported :]
+            self.__number_reported = len(self.__results)
+            number_sent = self.__number_sent
+
+        interval, self.__last_report_at = now - self.__last_report_at, now
+
+        durations = [duration for _, duration in results]
+        number_of_errors = sum(1 for outcome, _ in results if not is_success(outcome))
+        return {
+            "elapsed": now - self.__started,
+            "sent": number_sent,
+            "completed": len(results),
+            "requests_per_second": len(results) / interval if interval else 0,
+            "error_rate": number_of_errors / len(results) if results else 0,
+            "p95": get_percentile(durations, 95),
+            "task_backlog": self.get_backlog(),
+        }
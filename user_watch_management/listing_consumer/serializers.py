@@ -9,4 +9,4 @@ class KennyUPullListingSerializer(serializers.Serializer):
     row_id = serializers.CharField()
     branch = serializers.CharField()
     listing_url = serializers.CharField()
-    client_id = serializers.UUIDField()
+    client_id = serializers.UUIDField(required=False)
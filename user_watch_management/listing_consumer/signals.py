@@ -0,0 +1,54 @@
+import logging
+
+import redis
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from alerts.models import Alert, Vehicle
+from alerts.signals import alerts_bulk_saved
+from listing_consumer.matching import AlertIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _update_alert_index(update, description: str):
+    """
+    Update the alert index once the current transaction commits so a rolled back change never reaches the index.
+    Redis being unavailable should never fail the write that triggered the update, the index can be rebuilt with
+    the rebuild_alert_index command.
+    """
+
+    def run_update():
+        try:
+            update(AlertIndex())
+        except redis.RedisError as e:
+            logger.error(f"Failed to update the alert index for {description} with error {e}")
+
+    transaction.on_commit(run_update)
+
+
+@receiver(post_save, sender=Alert, dispatch_uid="listing_consumer_index_alert")
+def index_alert(sender, instance: Alert, **kwargs):
+    _update_alert_index(lambda alert_index: alert_index.index_alerts([instance]), f"alert {instance.id}")
+
+
+@receiver(alerts_bulk_saved, sender=Alert, dispatch_uid="listing_consumer_index_alerts")
+def index_alerts(sender, alerts: list[Alert], **kwargs):
+    alerts = list(alerts)
+    _update_alert_index(lambda alert_index: alert_index.index_alerts(alerts), f"{len(alerts)} alerts")
+
+
+@receiver(post_delete, sender=Alert, dispatch_uid="listing_consumer_remove_alert")
+def remove_alert(sender, instance: Alert, **kwargs):
+    alert_id = instance.id
+    _update_alert_index(lambda alert_index: alert_index.remove_alert(alert_id), f"alert {alert_id}")
+
+
+@receiver(post_save, sender=Vehicle, dispatch_uid="listing_consumer_index_vehicle")
+def index_vehicle(sender, instance: Vehicle, created: bool, **kwargs):
+    if created:
+        # A brand new vehicle has no alerts yet, they are indexed when they are saved.
+        return
+
+    _update_alert_index(lambda alert_index: alert_index.index_vehicle(instance), f"vehicle {instance.id}")
@@ -0,0 +1,189 @@
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+
+import redis
+from django.db import close_old_connections
+
+from listing_consumer.data_models import KennyUPullListing
+from listing_consumer.serializers import KennyUPullListingSerializer
+from listing_consumer.tasks import ingest_listings
+
+logger = logging.getLogger(__name__)
+
+
+def get_default_consumer_name() -> str:
+    """
+    :return: The name of this process in the consumer group, unique to the host and process.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ListingStreamConsumer:
+    """
+    Reads listings from a Redis Stream as a member of a consumer group, a batch at a time, and ingests them in this
+    process: matching them against the alerts and queueing the emails of the matches for the delivery stage. Each entry
+    of the stream holds the fields of a listing (the same as the body of a POST to new-listing).
+
+    Entries are only acknowledged once their batch is matched and its emails queued, so the batch of a consumer that
+    stopped part way stays pending. Entries left pending for claim_idle_ms are taken over by the next consumer to look
+    and ingested again, an entry delivered more than max_deliveries times is dropped with an error.
+
+    :param redis_client: The Redis client to read the stream with, it must decode the responses.
+    :param stream: The key of the stream.
+    :param group: The consumer group.
+    :param consumer: The name of this consumer in the group.
+    :param batch_size: The number of entries to read at once.
+    :param block_ms: How long to wait for new entries when there are none.
+    :param claim_idle_ms: How long an entry can stay pending before it is taken over.
+    :param max_deliveries: The number of times an entry is read before it is dropped.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        stream: str,
+        group: str,
+        consumer: str,
+        batch_size: int,
+        block_ms: int,
+        claim_idle_ms: int,
+        max_deliveries: int,
+    ):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+
+        # The number of entries read, ingested, invalid, dropped after too many deliveries and of batches that failed.
+        self.counts = {"read": 0, "ingested": 0, "invalid": 0, "dropped": 0, "failed_batches": 0}
+        self.__claim_cursor = "0-0"
+
+    def create_group(self):
+        """
+        Create the consumer group, and the stream if it doesn't exist yet, starting from the first entry.
+        """
+        if self.redis_client.exists(self.stream) and any(
+            group["name"] == self.group for group in self.redis_client.xinfo_groups(self.stream)
+        ):
+            return
+
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def consume(self, stop: Optional[threading.Event] = None, burst: bool = False) -> dict[str, int]:
+        """
+        Ingest the listings of the stream until stopped.
+
+        :param stop: Stops consuming once the current batch is done when set.
+        :param burst: Stop once there are no new or stuck entries left instead of waiting for more.
+        :return: The counts of the consumer, see counts.
+        """
+        stop = stop or threading.Event()
+
+        self.create_group()
+        while not stop.is_set():
+            reclaimed_entries = self.reclaim()
+            if reclaimed_entries:
+                self.process(reclaimed_entries, redelivered=True)
+
+            new_entries = self.read(block_ms=0 if burst or reclaimed_entries else self.block_ms)
+            if new_entries:
+                self.process(new_entries)
+
+            if burst and not new_entries and not reclaimed_entries:
+                break
+
+        return dict(self.counts)
+
+    def read(self, block_ms: int) -> list[tuple[str, dict]]:
+        """
+        Read the next batch of entries no consumer of the group has read yet.
+
+        :param block_ms: How long to wait for new entries when there are none, 0 to not wait.
+        :return: The id and fields of each entry.
+        """
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=self.batch_size, block=block_ms or None
+        )
+        return response[0][1] if response else []
+
+    def reclaim(self) -> list[tuple[str, dict]]:
+        """
+        Take over the next batch of entries left pending for claim_idle_ms, usually by a consumer that stopped before
+        acknowledging them. Entries delivered more than max_deliveries times or deleted from the stream are acknowledged
+        without being ingested.
+
+        :return: The id and fields of each entry to ingest again.
+        """
+        response = self.redis_client.xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_time=self.claim_idle_ms, start_id=self.__claim_cursor, count=self.batch_size
+        )
+        # The next call picks up from where this one stopped, back at the start once every pending entry was looked at.
+        self.__claim_cursor = response[0]
+        entries = [(entry_id, fields) for entry_id, fields in response[1] if fields is not None]
+        deleted_ids = [entry_id for entry_id, fields in response[1] if fields is None] + (response[2] if len(response) > 2 else [])
+        if deleted_ids:
+            self.redis_client.xack(self.stream, self.group, *deleted_ids)
+
+        if not entries:
+            return []
+
+        pipeline = self.redis_client.pipeline()
+        for entry_id, _ in entries:
+            pipeline.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+        times_delivered = {pending["message_id"]: pending["times_delivered"] for result in pipeline.execute() for pending in result}
+        dropped_ids = [entry_id for entry_id, _ in entries if times_delivered.get(entry_id, 0) > self.max_deliveries]
+        if dropped_ids:
+            logger.error(f"Dropping listings {dropped_ids} from {self.stream} after {self.max_deliveries} failed deliveries")
+            self.redis_client.xack(self.stream, self.group, *dropped_ids)
+            self.counts["dropped"] += len(dropped_ids)
+
+        logger.info(f"Took over {len(entries) - len(dropped_ids)} pending listings from {self.stream}")
+        return [(entry_id, fields) for entry_id, fields in entries if entry_id not in dropped_ids]
+
+    def process(self, entries: list[tuple[str, dict]], redelivered: bool = False) -> bool:
+        """
+        Ingest a batch of entries and acknowledge them once the listings are matched and their emails queued. Invalid
+        listings are logged and acknowledged since they can never be ingested, if ingesting fails the batch is left
+        pending to be taken over later.
+
+        :param entries: The id and fields of each entry.
+        :param redelivered: Whether the entries were read before, in which case they skip the duplicate check.
+        :return: True if the entries were acknowledged, False if they were left pending.
+        """
+        self.counts["read"] += len(entries)
+        # The command runs for as long as the stream is consumed, outliving the database connection's CONN_MAX_AGE.
+        close_old_connections()
+        kenny_u_pull_listings = []
+        number_invalid = 0
+        for entry_id, fields in entries:
+            listing_serializer = KennyUPullListingSerializer(data=fields)
+            if listing_serializer.is_valid():
+                kenny_u_pull_listings.append(KennyUPullListing(**listing_serializer.validated_data))
+            else:
+                number_invalid += 1
+                logger.error(f"Skipping the invalid listing {entry_id} of {self.stream} with errors {listing_serializer.errors}")
+
+        try:
+            if kenny_u_pull_listings:
+                # A batch that is taken over starts at the same entry, so its emails are queued under the same ids.
+                ingest_listings(kenny_u_pull_listings, redelivered=redelivered, batch_id=f"{self.stream}:{entries[0][0]}")
+        except Exception:
+            logger.exception(f"Failed to ingest {len(kenny_u_pull_listings)} listings of {self.stream}, leaving them pending")
+            self.counts["failed_batches"] += 1
+            return False
+
+        self.redis_client.xack(self.stream, self.group, *[entry_id for entry_id, _ in entries])
+        self.counts["ingested"] += len(kenny_u_pull_listings)
+        self.counts["invalid"] += number_invalid
+        return True
@@ -1,56 +1,368 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
 
+from listing_consumer.constants import DIGEST_CLAIM_TIMEOUT_SECONDS
 from listing_consumer.data_models import KennyUPullListing
+from listing_consumer.dedupe import drop_duplicate_listings, forget_listings, get_sent_email_positions, mark_emails_sent
+from listing_consumer.matching import AlertIndex
+from listing_consumer.models import PendingDigestEntry
+from listing_consumer.notifications import get_dispatcher
 from alerts.models import Alert, Vehicle
+from user_watch.metrics import LISTING_MATCHES, LISTING_SKIPS
+from user_watch.query_profiler import profile_task_queries
 
+from datetime import timedelta
+from functools import partial
+from itertools import groupby
+from typing import Optional
+from uuid import UUID, uuid4
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def alert_matches_listing(alert: Alert, kenny_u_pull_listing: KennyUPullListing) -> bool:
+    """
+    Check if the given alert is watching for the vehicle in the listing.
+
+    :param alert: The alert to check (its vehicle should already be loaded to avoid an extra query).
+    :param kenny_u_pull_listing: The listing to check against the alert.
+    :return: True if the listing matches what the user wanted, False otherwise.
+    """
+    if alert.branch and alert.branch != kenny_u_pull_listing.branch:
+        # The branch doesn't match what the user wanted, skip this alert.
+        logger.info(f"Skipping alert {kenny_u_pull_listing} because the branch doesn't match.")
+        LISTING_SKIPS.labels(reason="branch").inc()
+        return False
+
+    if alert.vehicle.manufacturer_name.lower() != kenny_u_pull_listing.make.lower():
+        # The manufacturer doesn't match what the user wanted, skip this alert.
+        logger.info(f"Skipping alert {kenny_u_pull_listing} because the manufacturer doesn't match.")
+        LISTING_SKIPS.labels(reason="make").inc()
+        return False
+
+    if alert.vehicle.model_name.lower() != kenny_u_pull_listing.model.lower():
+        # The model doesn't match what the user wanted, skip this alert.
+        logger.info(f"Skipping alert {kenny_u_pull_listing} because the model doesn't match.")
+        LISTING_SKIPS.labels(reason="model").inc()
+        return False
+
+    if alert.vehicle.model_year.strip() != kenny_u_pull_listing.year.strip():
+        # The year doesn't match what the user wanted, skip this alert.
+        logger.info(f"Skipping alert {kenny_u_pull_listing} because the year doesn't match.")
+        LISTING_SKIPS.labels(reason="year").inc()
+        return False
+
+    return True
+
+
+def build_listing_email(alert: Alert, kenny_u_pull_listing: KennyUPullListing) -> dict:
+    """
+    Build the email telling the owner of the alert about the listing, to be sent by the delivery stage.
+
+    :param alert: The alert that matched the listing (its user and vehicle should already be loaded).
+    :param kenny_u_pull_listing: The listing to tell the user about.
+    :return: The arguments of the EmailMessage to send.
+    """
+    logger.info(f"Queueing email to {alert.user.email} for {alert.vehicle} for alert {alert.id}")
+    # TODO apply i18n to this email's text.
+    return {
+        "subject": f"Hey! You have a new listing for a {alert.vehicle}!",
+        "body": f"You can go visit the listing on their website at {kenny_u_pull_listing.listing_url}",
+        "from_email": "kennyu.watch@gmail.com",
+        "to": [
+            alert.user.email,
+        ],
+    }
+
+
+def build_listing_digest_email(user: User, entries: list[PendingDigestEntry]) -> dict:
+    """
+    Build the digest email telling the user about every listing that matched their digest alerts, like build_listing_email.
+
+    :param user: The user to send the digest to.
+    :param entries: The user's pending digest entries (their alert and its vehicle should already be loaded).
+    :return: The arguments of the EmailMessage to send.
+    """
+    listing_lines = "\n".join(f"- A {entry.alert.vehicle} at {entry.branch}: {entry.listing_url}" for entry in entries)
+    return {
+        "subject": f"Hey! You have {len(entries)} new listings!",
+        "body": f"Here are the new listings for your alerts:\n\n{listing_lines}",
+        "from_email": "kennyu.watch@gmail.com",
+        "to": [
+            user.email,
+        ],
+    }
+
+
+def find_alerts_for_listings(kenny_u_pull_listings: list[KennyUPullListing]) -> list[list[Alert]]:
+    """
+    Find the alerts to check for each listing. A listing with a client_id is only checked against the alert it was sent
+    for while a listing without one fans out to every alert in the alert index watching for that vehicle. All of the
+    alerts are loaded with a single query no matter how many listings there are.
+
+    :param kenny_u_pull_listings: The listings to find alerts for.
+    :return: The alerts for each listing in the same order as the listings.
+    """
+    fan_out_positions = [
+        position for position, kenny_u_pull_listing in enumerate(kenny_u_pull_listings) if not kenny_u_pull_listing.client_id
+    ]
+    alert_ids_by_position = {}
+    if fan_out_positions:
+        fan_out_listings = [kenny_u_pull_listings[position] for position in fan_out_positions]
+        alert_ids_by_position = dict(zip(fan_out_positions, AlertIndex().find_alert_ids(fan_out_listings)))
+
+    client_ids = {str(kenny_u_pull_listing.client_id) for kenny_u_pull_listing in kenny_u_pull_listings if kenny_u_pull_listing.client_id}
+    alert_ids = set().union(*alert_ids_by_position.values())
+
+    alerts_by_client_id = {}
+    alerts_by_id = {}
+    if client_ids or alert_ids:
+        alerts = Alert.objects.select_related("vehicle", "user").filter(Q(external_id__in=client_ids) | Q(id__in=alert_ids))
+        for alert in alerts:
+            alerts_by_client_id[str(alert.external_id)] = alert
+            alerts_by_id[alert.id] = alert
+
+    alerts_for_listings = []
+    for position, kenny_u_pull_listing in enumerate(kenny_u_pull_listings):
+        if kenny_u_pull_listing.client_id:
+            alert = alerts_by_client_id.get(str(kenny_u_pull_listing.client_id))
+            alerts_for_listings.append([alert] if alert else [])
+        else:
+            # The index can briefly hold alerts that were since deleted, those are simply not found.
+            alert_ids_for_listing = sorted(alert_ids_by_position[position])
+            alerts_for_listings.append([alerts_by_id[alert_id] for alert_id in alert_ids_for_listing if alert_id in alerts_by_id])
+
+    return alerts_for_listings
+
+
+def is_redelivered(task) -> bool:
+    """
+    Check if the running task was delivered again because its worker stopped before acknowledging it.
+
+    :param task: The task to check.
+    :return: True if the task is being run again, False otherwise.
+    """
+    return bool((task.request.delivery_info or {}).get("redelivered"))
+
+
+def build_delivery_task_id(batch_id: str, index: int) -> str:
+    """
+    Build the id of a delivery task queued by the matching stage, the same each time a batch of listings is matched so
+    the emails a redelivered batch queues again are recognized as already sent.
+
+    :param batch_id: The id of the batch of listings, ex: the id of the matching task.
+    :param index: The position of the chunk of emails in the batch's emails.
+    :return: The id of the delivery task.
+    """
+    return f"{batch_id}:deliver:{index}"
+
+
+def ingest_listings(
+    kenny_u_pull_listings: list[KennyUPullListing], redelivered: bool = False, batch_id: Optional[str] = None
+) -> dict[str, int]:
+    """
+    Match the listings against the alerts, queueing the emails of the users to alert in chunks of EMAIL_BATCH_SIZE for
+    the delivery stage. Listings that were already ingested recently are dropped before doing any other work, and are
+    forgotten again if matching them fails so they aren't dropped when sent again.
+
+    :param kenny_u_pull_listings: The listings to ingest.
+    :param redelivered: Whether the listings are being ingested again after a worker stopped part way, in which case
+    they were already marked as seen and are all matched again.
+    :param batch_id: The id of the batch the listings are ingested in (ex: the id of the matching task), the same each
+    time the batch is delivered. The ids of the delivery tasks are built from it, see build_delivery_task_id.
+    :return: The number of listings ingested and the number of duplicate listings suppressed.
+    """
+    number_of_listings = len(kenny_u_pull_listings)
+    number_of_duplicates = 0
+    if not redelivered:
+        kenny_u_pull_listings, number_of_duplicates = drop_duplicate_listings(kenny_u_pull_listings)
+
+    try:
+        match_listings(kenny_u_pull_listings, redelivered=redelivered, batch_id=batch_id)
+    except Exception:
+        # The listings were marked as seen before matching them, they would be dropped as duplicates when sent again.
+        forget_listings(kenny_u_pull_listings)
+        raise
+
+    return {"listings_ingested": number_of_listings - number_of_duplicates, "duplicates_suppressed": number_of_duplicates}
+
+
+def match_listings(kenny_u_pull_listings: list[KennyUPullListing], redelivered: bool = False, batch_id: Optional[str] = None):
+    """
+    Match the listings against the alerts, buffering the listings of digest alerts and queueing the emails of the others
+    in chunks of EMAIL_BATCH_SIZE for the delivery stage.
+
+    Matching a batch again is idempotent: a listing is only buffered once for each alert and the delivery tasks are
+    queued again under the same ids, so they skip the emails the first run already sent.
+
+    :param kenny_u_pull_listings: The listings to match.
+    :param redelivered: Whether the batch is matched again, in which case some of its emails may already be sent.
+    :param batch_id: The id of the batch the delivery task ids are built from, random ids are used without one.
+    """
+    alerts_for_listings = find_alerts_for_listings(kenny_u_pull_listings)
+    pending_digest_entries = []
+    emails = []
+
+    for kenny_u_pull_listing, alerts in zip(kenny_u_pull_listings, alerts_for_listings):
+        if not alerts:
+            logger.warning(f"Got a listing for a vehicle we don't have an alert for: {kenny_u_pull_listing}")
+            continue
+
+        for alert in alerts:
+            if not alert_matches_listing(alert, kenny_u_pull_listing):
+                continue
+
+            if alert.digest:
+                # The user will get this listing in their next digest email.
+                LISTING_MATCHES.labels(delivery="digest").inc()
+                pending_digest_entries.append(
+                    PendingDigestEntry(
+                        user_id=alert.user_id,
+                        alert=alert,
+                        listing_url=kenny_u_pull_listing.listing_url,
+                        branch=kenny_u_pull_listing.branch,
+                    )
+                )
+                continue
+
+            LISTING_MATCHES.labels(delivery="email").inc()
+            emails.append(build_listing_email(alert, kenny_u_pull_listing))
+
+    if pending_digest_entries:
+        PendingDigestEntry.objects.bulk_create(pending_digest_entries, ignore_conflicts=True)
+
+    for index, start in enumerate(range(0, len(emails), settings.EMAIL_BATCH_SIZE)):
+        deliver_listing_emails.apply_async(
+            kwargs={"emails": emails[start : start + settings.EMAIL_BATCH_SIZE], "resent": redelivered},
+            task_id=build_delivery_task_id(batch_id, index) if batch_id else None,
+        )
+
+
 @shared_task
+@profile_task_queries
 def ingest_listening(kenny_u_pull_listing_data: dict[str, str]):
     """
     Ingest a listing and alert all users who are watching for this listing.
 
-    :param kenny_u_pull_listing: The listing to ingest.
+    :param kenny_u_pull_listing: The listing to ingest, without a client_id it is matched against every alert.
+    :return: The number of listings ingested and the number of duplicate listings suppressed.
     """
     kenny_u_pull_listing = KennyUPullListing(**kenny_u_pull_listing_data)
     logger.info(f"Got a new listing to ingest: {kenny_u_pull_listing}")
 
-    try:
-        alert = Alert.objects.get(external_id=kenny_u_pull_listing.client_id)
-        if alert.branch and alert.branch != kenny_u_pull_listing.branch:
-            # The branch doesn't match what the user wanted, skip this alert.
-            logger.info(f"Skipping alert {kenny_u_pull_listing} because the branch doesn't match.")
-            return
-
-        if alert.vehicle.manufacturer_name.lower() != kenny_u_pull_listing.make.lower():
-            # The manufacturer doesn't match what the user wanted, skip this alert.
-            logger.info(f"Skipping alert {kenny_u_pull_listing} because the manufacturer doesn't match.")
-            return
-
-        if alert.vehicle.model_name.lower() != kenny_u_pull_listing.model.lower():
-            # The model doesn't match what the user wanted, skip this alert.
-            logger.info(f"Skipping alert {kenny_u_pull_listing} because the model doesn't match.")
-            return
-
-        try:
-            logger.info(f"Sending email to {alert.user.email} for {alert.vehicle} for alert {alert.id}")
-            # TODO apply i18n to this email's text.
-            send_mail(
-                f"Hey! You have a new listing for a {alert.vehicle}!",
-                f"You can go visit the listing on their website at {kenny_u_pull_listing.listing_url}",
-                "kennyu.watch@gmail.com",
-                [
-                    alert.user.email,
-                ],
-                fail_silently=False,
-            )
-        except Exception as e:
-            logger.error(f"Failed to send email to {alert.user.email} for {alert.vehicle} with error {e}")
-
-    except Alert.DoesNotExist:
-        logger.warning(f"Got a listing for a vehicle we don't have an alert for: {kenny_u_pull_listing}")
+    return ingest_listings([kenny_u_pull_listing], redelivered=is_redelivered(ingest_listening), batch_id=ingest_listening.request.id)
+
+
+@shared_task
+@profile_task_queries
+def ingest_listings_batch(kenny_u_pull_listings_data: list[dict[str, str]]):
+    """
+    Ingest a chunk of listings and alert all users who are watching for them. Every alert in the chunk is
+    resolved with a single query rather than one query per listing.
+
+    :param kenny_u_pull_listings_data: The listings to ingest.
+    :return: The number of listings ingested and the number of duplicate listings suppressed.
+    """
+    kenny_u_pull_listings = [KennyUPullListing(**listing_data) for listing_data in kenny_u_pull_listings_data]
+    logger.info(f"Got a batch of {len(kenny_u_pull_listings)} new listings to ingest")
+
+    return ingest_listings(
+        kenny_u_pull_listings, redelivered=is_redelivered(ingest_listings_batch), batch_id=ingest_listings_batch.request.id
+    )
+
+
+@shared_task
+def deliver_listing_emails(emails: list[dict], resent: bool = False):
+    """
+    Send the emails of the listings that matched alerts, queued by the matching stage. The emails go out over the
+    process' shared connection to the email server, failures are logged and not raised.
+
+    The emails the email server accepted are marked as sent together once the task's emails went out, so a task
+    delivered again because its worker stopped part way, or queued again by a redelivered matching task, only sends the
+    emails that weren't sent yet.
+
+    :param emails: The arguments of the EmailMessage of each email, see build_listing_email.
+    :param resent: Whether the task was queued again by a matching task that was redelivered (see match_listings).
+    """
+    task_id = deliver_listing_emails.request.id
+    sent_positions = set()
+    if task_id and (resent or is_redelivered(deliver_listing_emails)):
+        sent_positions = get_sent_email_positions(task_id)
+        if sent_positions:
+            logger.info(f"Skipping {len(sent_positions)} emails of task {task_id} that were already sent")
+
+    newly_sent_positions = []
+    dispatcher = get_dispatcher()
+    for position, email in enumerate(emails):
+        if position in sent_positions:
+            continue
+
+        dispatcher.enqueue(EmailMessage(**email), on_sent=partial(newly_sent_positions.append, position))
+
+    # Don't leave emails waiting in the worker once the task is done.
+    dispatcher.flush()
+    if task_id:
+        mark_emails_sent(task_id, newly_sent_positions)
+
+
+def claim_pending_digest_entries(claim_id: UUID) -> list[PendingDigestEntry]:
+    """
+    Claim the pending digest entries for a digest run in a short transaction, so the entries are sent without holding a
+    transaction or row locks open while talking to the email server. The entries another run claimed are skipped unless
+    they were claimed more than DIGEST_CLAIM_TIMEOUT_SECONDS ago, by a run that stopped before sending them.
+
+    :param claim_id: The id of the digest run.
+    :return: The entries claimed ordered by user with their user and their alert's vehicle loaded.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Skip the entries another run is claiming at the same time.
+        entries = list(
+            PendingDigestEntry.objects.select_related("user", "alert__vehicle")
+            .filter(Q(claim_id=None) | Q(claimed_at__lt=now - timedelta(seconds=DIGEST_CLAIM_TIMEOUT_SECONDS)))
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("user_id", "id")
+        )
+        PendingDigestEntry.objects.filter(id__in=[entry.id for entry in entries]).update(claim_id=claim_id, claimed_at=now)
+
+    return entries
+
+
+@shared_task
+@profile_task_queries
+def send_listing_digests():
+    """
+    Send every user with pending digest entries a single email with all of the listings that matched their digest alerts
+    since the last digest. Every pending entry is loaded with a single query no matter how many users there are.
+
+    The entries are claimed before sending them (see claim_pending_digest_entries) and a user's entries are only deleted
+    once their email was sent, the entries of an email that failed are released to be sent with the next digest.
+    """
+    claim_id = uuid4()
+    pending_digest_entries = claim_pending_digest_entries(claim_id)
+
+    sent_entry_ids = []
+    dispatcher = get_dispatcher()
+    for user_id, entries in groupby(pending_digest_entries, key=lambda entry: entry.user_id):
+        entries = list(entries)
+        user = entries[0].user
+        logger.info(f"Sending a digest of {len(entries)} listings to {user.email}")
+
+        dispatcher.enqueue(
+            EmailMessage(**build_listing_digest_email(user, entries)),
+            on_sent=partial(sent_entry_ids.extend, [entry.id for entry in entries]),
+        )
+
+    dispatcher.flush()
+
+    with transaction.atomic():
+        PendingDigestEntry.objects.filter(id__in=sent_entry_ids).delete()
+        # The entries of the digests that failed are sent with the next one.
+        PendingDigestEntry.objects.filter(claim_id=claim_id).update(claim_id=None, claimed_at=None)
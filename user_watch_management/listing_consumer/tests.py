@@ -1,17 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 from typing import Optional
 from uuid import uuid4
-from django.test import TestCase
+from django.conf import settings
+from django.test import AsyncClient, TestCase, override_settings
 from rest_framework.test import APIClient
 
 from unittest import mock
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.mail import EmailMessage
+import redis
+from datetime import datetime, timedelta, timezone
+from prometheus_client import REGISTRY
+import smtplib
+import click
+from celery.bin.worker import worker as worker_command
+from click.core import ParameterSource
+
 
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
 
+from listing_consumer.backpressure import ListingLoadShedder, get_broker_backlog, get_load_shedder
+from listing_consumer.capture import get_listing_capture
+from listing_consumer.constants import ALERT_INDEX_BUILDING_VERSION_KEY, DIGEST_CLAIM_TIMEOUT_SECONDS
+from listing_consumer.dedupe import get_number_of_duplicates_suppressed, mark_emails_sent
+from listing_consumer.matching import AlertIndex, build_index_key, build_index_namespace
+from listing_consumer.notifications import NotificationDispatcher
+from listing_consumer.redis_client import get_redis_client
+from listing_consumer.replay import ListingReplayer, load_capture, rewrite_row_ids
+from listing_consumer.streams import ListingStreamConsumer
+from listing_consumer.data_models import KennyUPullListing
 from listing_consumer.serializers import KennyUPullListingSerializer
-from listing_consumer.tasks import ingest_listening
+from listing_consumer.models import PendingDigestEntry
+from listing_consumer.tasks import (
+    claim_pending_digest_entries,
+    deliver_listing_emails,
+    ingest_listening,
+    ingest_listings,
+    ingest_listings_batch,
+    send_listing_digests,
+)
 from alerts.models import Alert, Vehicle
+from alerts.tasks import relay_subscription_outbox
+from user_watch.celery import (
+    DEFAULT_QUEUE,
+    LISTING_DELIVERY_QUEUE,
+    LISTING_MATCHING_QUEUE,
+    LISTING_STAGES,
+    celery_app,
+    configure_stage_worker,
+)
+from user_watch.metrics import PUBLISHED_AT_HEADER, get_queue_wait, mark_task_published
+
+
+def deliver_emails_in_process(test_case: TestCase):
+    """
+    Send the emails queued by the matching stage right away in the test's process instead of publishing them.
+    """
+    patcher = mock.patch.object(deliver_listing_emails, "apply_async", side_effect=lambda kwargs, task_id: deliver_listing_emails(**kwargs))
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
 
 
 class NewListingTests(TestCase):
@@ -61,8 +119,113 @@ class NewListingTests(TestCase):
         self.assertEqual(response.json(), {"non_field_errors": ["Invalid data."]})
 
 
+class AsgiNewListingTests(TestCase):
+    def __build_listing(self, row_id: str) -> dict:
+        return {
+            "make": "Honda",
+            "model": "Civic",
+            "year": "2000",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": "Ottawa",
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+            "client_id": str(uuid4()),
+        }
+
+    @mock.patch("listing_consumer.views.ingest_listening")
+    async def test_new_listing(self, mock_ingest_listening):
+        # Through the ASGI request handler like under uvicorn, which runs the views in a thread.
+        response = await AsyncClient().post(
+            "/listing-consumer/v1/new-listing", self.__build_listing("A12"), content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 204)
+        mock_ingest_listening.delay.assert_called_once()
+
+        response = await AsyncClient().post("/listing-consumer/v1/new-listing", {"make": "Honda"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("model", response.json())
+
+    @override_settings(LISTING_BATCH_CHUNK_SIZE=2)
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    async def test_new_listings(self, mock_ingest_listings_batch):
+        body = [self.__build_listing(f"A{row}") for row in range(3)]
+
+        response = await AsyncClient().post("/listing-consumer/v1/new-listings", data=body, content_type="application/json")
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(mock_ingest_listings_batch.delay.call_count, 2)
+
+
+class NewListingsTests(TestCase):
+    test_url = "/listing-consumer/v1/new-listings"
+
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.client = APIClient()
+
+        return super().setUp()
+
+    def __build_listing(self, row_id: str) -> dict:
+        return {
+            "make": "Honda",
+            "model": "Civic",
+            "year": "2000",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": "Ottawa",
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+            "client_id": str(uuid4()),
+        }
+
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    def test_new_listings_json_array_is_chunked(self, mock_ingest_listings_batch):
+        body = [self.__build_listing(row_id=f"A{index}") for index in range(5)]
+
+        with self.settings(LISTING_BATCH_CHUNK_SIZE=2):
+            response = self.client.post(self.test_url, body, format="json")
+
+        self.assertEqual(response.status_code, 204)
+        chunks = [call.kwargs["kenny_u_pull_listings_data"] for call in mock_ingest_listings_batch.delay.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([listing["row_id"] for chunk in chunks for listing in chunk], [listing["row_id"] for listing in body])
+
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    def test_new_listings_ndjson_stream(self, mock_ingest_listings_batch):
+        listings = [self.__build_listing(row_id=f"A{index}") for index in range(3)]
+        body = "\n".join(json.dumps(listing) for listing in listings) + "\n"
+
+        response = self.client.post(self.test_url, body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 204)
+        mock_ingest_listings_batch.delay.assert_called_once()
+        chunk = mock_ingest_listings_batch.delay.call_args.kwargs["kenny_u_pull_listings_data"]
+        self.assertEqual([listing["row_id"] for listing in chunk], ["A0", "A1", "A2"])
+
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    def test_new_listings_invalid_listing_rejects_the_whole_batch(self, mock_ingest_listings_batch):
+        invalid_listing = self.__build_listing(row_id="A2")
+        del invalid_listing["make"]
+        body = [self.__build_listing(row_id="A1"), invalid_listing]
+
+        response = self.client.post(self.test_url, body, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), [{}, {"make": ["This field is required."]}])
+        mock_ingest_listings_batch.delay.assert_not_called()
+
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    def test_new_listings_invalid_ndjson(self, mock_ingest_listings_batch):
+        response = self.client.post(self.test_url, '{"make": "Honda"}\nnot json\n', content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 400)
+        mock_ingest_listings_batch.delay.assert_not_called()
+
+
 class IngestListingTests(TestCase):
     def setUp(self) -> None:
+        deliver_emails_in_process(self)
         self.maxDiff = None
         username_and_email = "tester@test.com"
         self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
@@ -74,7 +237,7 @@ class IngestListingTests(TestCase):
         model_name = "Corolla"
         model_year = "1996"
 
-        vehicle = Vehicle.objects.create(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year=model_year, model_name=model_name)
         user = user if user else self.user
 
         return Alert.objects.create(user=user, vehicle=vehicle, branch=branch)
@@ -159,3 +322,1097 @@ class IngestListingTests(TestCase):
         ingest_listening(kenny_u_pull_listing_data=kenny_u_pull_listing_data)
 
         self.assertEqual(len(mail.outbox), 0)
+
+
+class IngestListingsBatchTests(TestCase):
+    def setUp(self) -> None:
+        deliver_emails_in_process(self)
+        self.maxDiff = None
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+
+        return super().setUp()
+
+    def __set_up_an_alert(self, branch: Optional[str] = None) -> Alert:
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+
+        return Alert.objects.create(user=self.user, vehicle=vehicle, branch=branch)
+
+    def __build_listing(self, client_id: str, make: str = "Toyota", row_id: str = "A12") -> dict:
+        return {
+            "make": make,
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": "Ottawa",
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+            "client_id": client_id,
+        }
+
+    def test_ingest_listings_batch_resolves_alerts_in_one_query(self):
+        alert1 = self.__set_up_an_alert()
+        alert2 = self.__set_up_an_alert()
+        alert_with_other_branch = self.__set_up_an_alert(branch="St-Test")
+        kenny_u_pull_listings_data = [
+            self.__build_listing(client_id=str(alert1.external_id), row_id="A1"),
+            self.__build_listing(client_id=str(alert2.external_id), row_id="A2"),
+            self.__build_listing(client_id=str(alert2.external_id), make="Honda", row_id="A3"),
+            self.__build_listing(client_id=str(alert_with_other_branch.external_id), row_id="A4"),
+            self.__build_listing(client_id=str(uuid4()), row_id="A5"),
+        ]
+
+        with self.assertNumQueries(1):
+            ingest_listings_batch(kenny_u_pull_listings_data=kenny_u_pull_listings_data)
+
+        self.assertEqual(
+            [message.body for message in mail.outbox],
+            [
+                "You can go visit the listing on their website at https://www.kennyupull.com/listing/A1",
+                "You can go visit the listing on their website at https://www.kennyupull.com/listing/A2",
+            ],
+        )
+        self.assertEqual(mail.outbox[0].subject, f"Hey! You have a new listing for a {alert1.vehicle}!")
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+    def test_ingest_listings_batch_empty(self):
+        with self.assertNumQueries(0):
+            ingest_listings_batch(kenny_u_pull_listings_data=[])
+
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class FanOutIngestListingTests(TestCase):
+    def setUp(self) -> None:
+        deliver_emails_in_process(self)
+        self.maxDiff = None
+        AlertIndex().clear()
+
+        return super().setUp()
+
+    def __set_up_an_alert(
+        self, email: str, branch: Optional[str] = None, manufacturer_name: str = "Toyota", model_name: str = "Corolla"
+    ) -> Alert:
+        user = User.objects.create_user(email, email, password=str(uuid4()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle = Vehicle.objects.get_canonical(manufacturer_name=manufacturer_name, model_year="1996", model_name=model_name)
+            return Alert.objects.create(user=user, vehicle=vehicle, branch=branch)
+
+    def __build_listing(self) -> dict:
+        # A new row id every time so the listing is never dropped as a duplicate of another test's listing.
+        row_id = str(uuid4())
+        return {
+            "make": "TOYOTA",
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": "Ottawa",
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+        }
+
+    def test_ingest_listing_without_client_id_alerts_every_matching_alert(self):
+        any_branch_alert = self.__set_up_an_alert(email="any@test.com")
+        same_branch_alert = self.__set_up_an_alert(email="ottawa@test.com", branch="Ottawa")
+        self.__set_up_an_alert(email="other-branch@test.com", branch="St-Test")
+        self.__set_up_an_alert(email="other-vehicle@test.com", manufacturer_name="Honda", model_name="Civic")
+
+        with self.assertNumQueries(1):
+            ingest_listening(kenny_u_pull_listing_data=self.__build_listing())
+
+        self.assertCountEqual([message.to for message in mail.outbox], [[any_branch_alert.user.email], [same_branch_alert.user.email]])
+
+    def test_ingest_listing_without_client_id_follows_vehicle_updates(self):
+        alert = self.__set_up_an_alert(email="any@test.com")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.vehicle.manufacturer_name = "Honda"
+            alert.vehicle.model_name = "Civic"
+            alert.vehicle.save()
+
+        ingest_listening(kenny_u_pull_listing_data=self.__build_listing())
+
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_ingest_listing_without_client_id_ignores_deleted_alerts(self):
+        alert = self.__set_up_an_alert(email="any@test.com")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.delete()
+
+        ingest_listening(kenny_u_pull_listing_data=self.__build_listing())
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(AlertIndex().find_alert_ids([KennyUPullListing(**self.__build_listing())]), [set()])
+
+    def test_rebuild_alert_index(self):
+        alert = self.__set_up_an_alert(email="any@test.com", branch="Ottawa")
+        AlertIndex().clear()
+
+        call_command("rebuild_alert_index", stdout=StringIO())
+
+        self.assertEqual(AlertIndex().find_alert_ids([KennyUPullListing(**self.__build_listing())]), [{alert.id}])
+
+    def test_rebuild_alert_index_keeps_matching_against_the_current_index(self):
+        alert = self.__set_up_an_alert(email="any@test.com", branch="Ottawa")
+        listing = KennyUPullListing(**self.__build_listing())
+        alert_index = AlertIndex()
+        previous_version = alert_index.get_version()
+        found_while_rebuilding = []
+        index_alerts = alert_index.index_alerts
+
+        def match_and_index_alerts(alerts, versions=None):
+            found_while_rebuilding.extend(AlertIndex().find_alert_ids([listing]))
+            index_alerts(alerts, versions=versions)
+
+        with mock.patch.object(alert_index, "index_alerts", side_effect=match_and_index_alerts):
+            alert_index.rebuild()
+
+        self.assertEqual(found_while_rebuilding[0], {alert.id})
+        self.assertNotEqual(alert_index.get_version(), previous_version)
+        self.assertEqual(AlertIndex().find_alert_ids([listing]), [{alert.id}])
+        # The previous version is deleted once replaced.
+        previous_namespace = build_index_namespace(previous_version)
+        self.assertEqual(list(get_redis_client().scan_iter(match=f"{previous_namespace}:key:*")), [])
+
+    def test_alerts_changed_while_rebuilding_are_updated_in_both_versions(self):
+        building_version = AlertIndex().get_version() + 1
+        get_redis_client().set(ALERT_INDEX_BUILDING_VERSION_KEY, building_version)
+
+        alert = self.__set_up_an_alert(email="any@test.com", branch="Ottawa")
+
+        for version in (AlertIndex().get_version(), building_version):
+            with self.subTest(version=version):
+                key = build_index_key("Toyota", "Corolla", "1996", branch="Ottawa", version=version)
+                self.assertEqual(get_redis_client().smembers(key), {str(alert.id)})
+
+    def test_moving_an_alert_removes_it_from_its_previous_key(self):
+        alert = self.__set_up_an_alert(email="any@test.com", branch="Ottawa")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.branch = "St-Test"
+            alert.save()
+
+        self.assertEqual(AlertIndex().find_alert_ids([KennyUPullListing(**self.__build_listing())]), [set()])
+
+
+class NotificationDispatcherTests(TestCase):
+    def __build_message(self, index: int) -> EmailMessage:
+        return EmailMessage(f"Subject {index}", f"Body {index}", "kennyu.watch@gmail.com", [f"tester{index}@test.com"])
+
+    def test_enqueue_sends_once_the_batch_is_full(self):
+        dispatcher = NotificationDispatcher(batch_size=2, flush_interval=60, health_check_interval=60)
+
+        dispatcher.enqueue(self.__build_message(1))
+        self.assertEqual(len(mail.outbox), 0)
+
+        dispatcher.enqueue(self.__build_message(2))
+        dispatcher.enqueue(self.__build_message(3))
+        self.assertEqual([message.subject for message in mail.outbox], ["Subject 1", "Subject 2"])
+
+        self.assertEqual(dispatcher.flush(), 1)
+        self.assertEqual([message.subject for message in mail.outbox], ["Subject 1", "Subject 2", "Subject 3"])
+
+    def test_enqueue_sends_once_the_flush_interval_has_passed(self):
+        dispatcher = NotificationDispatcher(batch_size=50, flush_interval=0, health_check_interval=60)
+
+        dispatcher.enqueue(self.__build_message(1))
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    @mock.patch("listing_consumer.notifications.get_connection")
+    def test_connection_is_reused_between_flushes(self, mock_get_connection):
+        mock_get_connection.return_value.send_messages.return_value = 1
+        dispatcher = NotificationDispatcher(batch_size=50, flush_interval=60, health_check_interval=60)
+
+        dispatcher.enqueue(self.__build_message(1))
+        dispatcher.flush()
+        dispatcher.enqueue(self.__build_message(2))
+        dispatcher.flush()
+
+        mock_get_connection.assert_called_once()
+        mock_get_connection.return_value.open.assert_called_once()
+        self.assertEqual(mock_get_connection.return_value.send_messages.call_count, 2)
+
+    @mock.patch("listing_consumer.notifications.get_connection")
+    def test_reconnects_when_the_connection_drops(self, mock_get_connection):
+        dropped_connection = mock.MagicMock()
+        dropped_connection.send_messages.side_effect = smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        new_connection = mock.MagicMock()
+        new_connection.send_messages.return_value = 1
+        mock_get_connection.side_effect = [dropped_connection, new_connection]
+        dispatcher = NotificationDispatcher(batch_size=50, flush_interval=60, health_check_interval=60)
+
+        dispatcher.enqueue(self.__build_message(1))
+
+        self.assertEqual(dispatcher.flush(), 1)
+        dropped_connection.close.assert_called_once()
+        new_connection.send_messages.assert_called_once()
+
+    @mock.patch("listing_consumer.notifications.get_connection")
+    def test_reconnects_when_the_health_check_fails(self, mock_get_connection):
+        stale_connection = mock.MagicMock()
+        stale_connection.send_messages.return_value = 1
+        stale_connection.connection.noop.return_value = (421, b"Service not available")
+        new_connection = mock.MagicMock()
+        new_connection.send_messages.return_value = 1
+        mock_get_connection.side_effect = [stale_connection, new_connection]
+        dispatcher = NotificationDispatcher(batch_size=50, flush_interval=60, health_check_interval=0)
+
+        dispatcher.enqueue(self.__build_message(1))
+        dispatcher.flush()
+        dispatcher.enqueue(self.__build_message(2))
+        dispatcher.flush()
+
+        stale_connection.close.assert_called_once()
+        new_connection.send_messages.assert_called_once()
+
+    @mock.patch("listing_consumer.notifications.get_connection")
+    def test_rejected_message_does_not_stop_the_batch(self, mock_get_connection):
+        mock_get_connection.return_value.send_messages.side_effect = [
+            smtplib.SMTPRecipientsRefused({"tester1@test.com": (550, b"No such user")}),
+            1,
+        ]
+        dispatcher = NotificationDispatcher(batch_size=50, flush_interval=60, health_check_interval=60)
+
+        dispatcher.enqueue(self.__build_message(1))
+        dispatcher.enqueue(self.__build_message(2))
+
+        self.assertEqual(dispatcher.flush(), 1)
+        mock_get_connection.assert_called_once()
+
+
+class ListingDigestTests(TestCase):
+    def setUp(self) -> None:
+        deliver_emails_in_process(self)
+        self.maxDiff = None
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+
+        return super().setUp()
+
+    def __set_up_an_alert(self, user: Optional[User] = None, digest: bool = True) -> Alert:
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+        user = user if user else self.user
+
+        return Alert.objects.create(user=user, vehicle=vehicle, digest=digest)
+
+    def __build_listing(self, alert: Alert, row_id: str, branch: str = "Ottawa") -> dict:
+        return {
+            "make": "Toyota",
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": branch,
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+            "client_id": str(alert.external_id),
+        }
+
+    def test_ingest_listing_for_digest_alert_is_buffered(self):
+        alert = self.__set_up_an_alert()
+
+        ingest_listening(kenny_u_pull_listing_data=self.__build_listing(alert, row_id="A12"))
+
+        self.assertEqual(len(mail.outbox), 0)
+        entry = PendingDigestEntry.objects.get()
+        self.assertEqual(entry.user, self.user)
+        self.assertEqual(entry.alert, alert)
+        self.assertEqual(entry.listing_url, "https://www.kennyupull.com/listing/A12")
+        self.assertEqual(entry.branch, "Ottawa")
+
+    def test_send_listing_digests_sends_one_email_per_user(self):
+        other_user = User.objects.create_user("other@test.com", "other@test.com", password=str(uuid4()))
+        alert = self.__set_up_an_alert()
+        other_alert = self.__set_up_an_alert(user=other_user)
+        immediate_alert = self.__set_up_an_alert(digest=False)
+        ingest_listings_batch(
+            kenny_u_pull_listings_data=[
+                self.__build_listing(alert, row_id="A1"),
+                self.__build_listing(alert, row_id="A2", branch="St-Test"),
+                self.__build_listing(other_alert, row_id="A3"),
+                self.__build_listing(immediate_alert, row_id="A4"),
+            ]
+        )
+        self.assertEqual(len(mail.outbox), 1)
+
+        with CaptureQueriesContext(connection) as captured_queries:
+            send_listing_digests()
+
+        # Every pending entry, their user and their alert's vehicle are loaded in one go.
+        selects = [query["sql"] for query in captured_queries if query["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), 1)
+
+        digests = mail.outbox[1:]
+        self.assertEqual([message.to for message in digests], [[self.user.email], [other_user.email]])
+        self.assertEqual(digests[0].subject, "Hey! You have 2 new listings!")
+        self.assertEqual(
+            digests[0].body,
+            "Here are the new listings for your alerts:\n\n"
+            f"- A {alert.vehicle} at Ottawa: https://www.kennyupull.com/listing/A1\n"
+            f"- A {alert.vehicle} at St-Test: https://www.kennyupull.com/listing/A2",
+        )
+        self.assertEqual(digests[1].subject, "Hey! You have 1 new listings!")
+        self.assertFalse(PendingDigestEntry.objects.exists())
+
+    @mock.patch("listing_consumer.notifications.get_connection")
+    def test_send_listing_digests_keeps_the_entries_of_a_digest_that_failed(self, mock_get_connection):
+        def send_messages(messages: list[EmailMessage]) -> int:
+            if messages[0].to == ["other@test.com"]:
+                raise smtplib.SMTPRecipientsRefused({"other@test.com": (550, b"Mailbox unavailable")})
+
+            return 1
+
+        mock_get_connection.return_value.send_messages.side_effect = send_messages
+        other_user = User.objects.create_user("other@test.com", "other@test.com", password=str(uuid4()))
+        alert = self.__set_up_an_alert()
+        other_alert = self.__set_up_an_alert(user=other_user)
+        ingest_listings_batch(
+            kenny_u_pull_listings_data=[self.__build_listing(alert, row_id="A1"), self.__build_listing(other_alert, row_id="A2")]
+        )
+
+        dispatcher = NotificationDispatcher(batch_size=50, flush_interval=60, health_check_interval=60)
+        with mock.patch("listing_consumer.tasks.get_dispatcher", return_value=dispatcher):
+            send_listing_digests()
+
+        self.assertEqual(mock_get_connection.return_value.send_messages.call_count, 2)
+        # The digest that failed is sent with the next one.
+        entry = PendingDigestEntry.objects.get()
+        self.assertEqual(entry.user, other_user)
+        self.assertIsNone(entry.claim_id)
+
+    def test_claimed_entries_are_skipped_until_the_claim_times_out(self):
+        alert = self.__set_up_an_alert()
+        ingest_listening(kenny_u_pull_listing_data=self.__build_listing(alert, row_id="A1"))
+
+        self.assertEqual(len(claim_pending_digest_entries(uuid4())), 1)
+        # Another run sending the digests at the same time.
+        self.assertEqual(claim_pending_digest_entries(uuid4()), [])
+
+        # The run that claimed the entry stopped before sending it.
+        PendingDigestEntry.objects.update(claimed_at=datetime.now(timezone.utc) - timedelta(seconds=DIGEST_CLAIM_TIMEOUT_SECONDS + 1))
+        claim_id = uuid4()
+
+        self.assertEqual(len(claim_pending_digest_entries(claim_id)), 1)
+        self.assertEqual(PendingDigestEntry.objects.get().claim_id, claim_id)
+
+    def test_listing_matched_again_is_buffered_once(self):
+        alert = self.__set_up_an_alert()
+        listing = self.__build_listing(alert, row_id="A1")
+
+        ingest_listings_batch(kenny_u_pull_listings_data=[listing, listing])
+        ingest_listings([KennyUPullListing(**listing)], redelivered=True)
+
+        self.assertEqual(PendingDigestEntry.objects.count(), 1)
+
+    def test_send_listing_digests_with_nothing_pending(self):
+        send_listing_digests()
+
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class DuplicateListingTests(TestCase):
+    def setUp(self) -> None:
+        deliver_emails_in_process(self)
+        self.maxDiff = None
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+        self.alert = Alert.objects.create(user=self.user, vehicle=vehicle)
+
+        return super().setUp()
+
+    def __build_listing(self, row_id: str, branch: str = "Ottawa") -> dict:
+        return {
+            "make": "Toyota",
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": branch,
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+            "client_id": str(self.alert.external_id),
+        }
+
+    def test_retried_listing_is_suppressed_before_any_query(self):
+        listing = self.__build_listing(row_id=str(uuid4()))
+        number_of_duplicates_suppressed = get_number_of_duplicates_suppressed()
+
+        self.assertEqual(ingest_listening(kenny_u_pull_listing_data=listing), {"listings_ingested": 1, "duplicates_suppressed": 0})
+        with self.assertNumQueries(0):
+            result = ingest_listening(kenny_u_pull_listing_data=listing)
+
+        self.assertEqual(result, {"listings_ingested": 0, "duplicates_suppressed": 1})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(get_number_of_duplicates_suppressed(), number_of_duplicates_suppressed + 1)
+
+    def test_listing_that_failed_to_ingest_is_not_suppressed(self):
+        listing = self.__build_listing(row_id=str(uuid4()))
+
+        with mock.patch("listing_consumer.tasks.find_alerts_for_listings", side_effect=DatabaseError("Connection lost")):
+            with self.assertRaises(DatabaseError):
+                ingest_listening(kenny_u_pull_listing_data=listing)
+
+        # The producer retried the POST.
+        result = ingest_listening(kenny_u_pull_listing_data=listing)
+
+        self.assertEqual(result, {"listings_ingested": 1, "duplicates_suppressed": 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_redelivered_listing_is_matched_again(self):
+        listing = self.__build_listing(row_id=str(uuid4()))
+        ingest_listening(kenny_u_pull_listing_data=listing)
+
+        # The worker stopped before acknowledging the task, which was already marked as seen.
+        ingest_listening.push_request(delivery_info={"redelivered": True})
+        self.addCleanup(ingest_listening.pop_request)
+        result = ingest_listening.run(kenny_u_pull_listing_data=listing)
+
+        self.assertEqual(result, {"listings_ingested": 1, "duplicates_suppressed": 0})
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_duplicates_within_a_batch_are_suppressed(self):
+        row_id = str(uuid4())
+        listings = [
+            self.__build_listing(row_id=row_id),
+            self.__build_listing(row_id=row_id),
+            self.__build_listing(row_id=row_id, branch="St-Test"),
+        ]
+
+        result = ingest_listings_batch(kenny_u_pull_listings_data=listings)
+
+        self.assertEqual(result, {"listings_ingested": 2, "duplicates_suppressed": 1})
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_dedupe_can_be_disabled(self):
+        listing = self.__build_listing(row_id=str(uuid4()))
+
+        with self.settings(LISTING_DEDUPE_TTL_SECONDS=0):
+            ingest_listening(kenny_u_pull_listing_data=listing)
+            ingest_listening(kenny_u_pull_listing_data=listing)
+
+        self.assertEqual(len(mail.outbox), 2)
+
+    @mock.patch("listing_consumer.dedupe.get_redis_client")
+    def test_listings_are_kept_when_redis_is_unavailable(self, mock_get_redis_client):
+        mock_get_redis_client.return_value.pipeline.return_value.execute.side_effect = redis.ConnectionError("Connection refused")
+        listing = self.__build_listing(row_id=str(uuid4()))
+
+        result = ingest_listening(kenny_u_pull_listing_data=listing)
+
+        self.assertEqual(result, {"listings_ingested": 1, "duplicates_suppressed": 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+
+def build_capture_listing(row_id: str) -> dict:
+    return {
+        "make": "Honda",
+        "model": "Civic",
+        "year": "2000",
+        "date_listed": "2020-01-01",
+        "row_id": row_id,
+        "branch": "Ottawa",
+        "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+    }
+
+
+class StagedPipelineTests(TestCase):
+    def setUp(self) -> None:
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+        self.alerts = [Alert.objects.create(user=self.user, vehicle=vehicle) for _ in range(3)]
+
+        return super().setUp()
+
+    def __build_listing(self, alert: Alert) -> dict:
+        return {
+            "make": "Toyota",
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": str(uuid4()),
+            "branch": "Ottawa",
+            "listing_url": "https://www.kennyupull.com/listing/A12",
+            "client_id": str(alert.external_id),
+        }
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    @mock.patch("listing_consumer.tasks.deliver_listing_emails")
+    def test_matching_queues_the_emails_for_delivery(self, mock_deliver_listing_emails):
+        ingest_listings_batch(kenny_u_pull_listings_data=[self.__build_listing(alert) for alert in self.alerts])
+
+        self.assertEqual(len(mail.outbox), 0)
+        chunks = [call.kwargs["kwargs"]["emails"] for call in mock_deliver_listing_emails.apply_async.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(chunks[0][0]["to"], [self.user.email])
+        # The emails go through the broker as JSON.
+        self.assertEqual(json.loads(json.dumps(chunks)), chunks)
+
+    def test_redelivered_matching_task_sends_its_emails_once(self):
+        def deliver(kwargs: dict, task_id: str):
+            deliver_listing_emails.apply(kwargs=kwargs, task_id=task_id)
+
+        listings = [self.__build_listing(alert) for alert in self.alerts]
+        task_id = str(uuid4())
+        with mock.patch.object(deliver_listing_emails, "apply_async", side_effect=deliver) as mock_apply_async:
+            ingest_listings_batch.apply(kwargs={"kenny_u_pull_listings_data": listings}, task_id=task_id)
+
+            # The worker stopped after queueing the emails, before acknowledging the matching task.
+            with mock.patch("listing_consumer.tasks.is_redelivered", side_effect=lambda task: task is ingest_listings_batch):
+                ingest_listings_batch.apply(kwargs={"kenny_u_pull_listings_data": listings}, task_id=task_id)
+
+        task_ids = [call.kwargs["task_id"] for call in mock_apply_async.call_args_list]
+        self.assertEqual(task_ids, [f"{task_id}:deliver:0", f"{task_id}:deliver:0"])
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_deliver_listing_emails(self):
+        deliver_listing_emails(
+            emails=[
+                {"subject": f"Subject {i}", "body": "Body", "from_email": "kennyu.watch@gmail.com", "to": [self.user.email]}
+                for i in range(2)
+            ]
+        )
+
+        self.assertEqual([message.subject for message in mail.outbox], ["Subject 0", "Subject 1"])
+
+    def test_stages_are_routed_to_their_own_queues(self):
+        for task, queue in [
+            (ingest_listening, LISTING_MATCHING_QUEUE),
+            (ingest_listings_batch, LISTING_MATCHING_QUEUE),
+            (deliver_listing_emails, LISTING_DELIVERY_QUEUE),
+            (send_listing_digests, LISTING_DELIVERY_QUEUE),
+            (relay_subscription_outbox, DEFAULT_QUEUE),
+        ]:
+            with self.subTest(task=task.name):
+                self.assertEqual(celery_app.amqp.router.route({}, task.name)["queue"].name, queue)
+                self.assertTrue(task.ignore_result)
+
+        self.assertTrue(ingest_listings_batch.acks_late)
+        self.assertTrue(deliver_listing_emails.acks_late)
+        self.assertFalse(relay_subscription_outbox.acks_late)
+
+    def test_stage_workers_take_the_settings_of_their_stage(self):
+        def configure_worker(queues: list[str]) -> mock.Mock:
+            worker = mock.Mock(concurrency=2, prefetch_multiplier=3)
+            worker.app.amqp.queues.consume_from = {queue: None for queue in queues}
+            worker.app.conf = {"worker_concurrency": None, "worker_prefetch_multiplier": 4}
+            configure_stage_worker(sender=worker)
+            return worker
+
+        for queue in (LISTING_MATCHING_QUEUE, LISTING_DELIVERY_QUEUE):
+            with self.subTest(queue=queue):
+                worker = configure_worker([queue])
+                self.assertEqual(worker.concurrency, LISTING_STAGES[queue]["concurrency"])
+                self.assertEqual(worker.prefetch_multiplier, LISTING_STAGES[queue]["prefetch_multiplier"])
+
+        # A worker consuming every queue keeps its own settings.
+        worker = configure_worker([DEFAULT_QUEUE, LISTING_MATCHING_QUEUE, LISTING_DELIVERY_QUEUE])
+        self.assertEqual((worker.concurrency, worker.prefetch_multiplier), (2, 3))
+
+    def test_stage_workers_keep_the_settings_they_were_given(self):
+        worker = mock.Mock(concurrency=2, prefetch_multiplier=3)
+        worker.app.amqp.queues.consume_from = {LISTING_DELIVERY_QUEUE: None}
+
+        # celery -A user_watch worker -Q listing-delivery -c 2
+        worker.app.conf = {"worker_concurrency": None, "worker_prefetch_multiplier": 4}
+        context = click.Context(worker_command)
+        context.set_parameter_source("concurrency", ParameterSource.COMMANDLINE)
+        context.set_parameter_source("prefetch_multiplier", ParameterSource.DEFAULT)
+        with context:
+            configure_stage_worker(sender=worker)
+
+        self.assertEqual(worker.concurrency, 2)
+        self.assertEqual(worker.prefetch_multiplier, LISTING_STAGES[LISTING_DELIVERY_QUEUE]["prefetch_multiplier"])
+
+        # CELERY_WORKER_PREFETCH_MULTIPLIER = 3
+        worker = mock.Mock(concurrency=2, prefetch_multiplier=3)
+        worker.app.amqp.queues.consume_from = {LISTING_DELIVERY_QUEUE: None}
+        worker.app.conf = {"worker_concurrency": None, "worker_prefetch_multiplier": 3}
+        configure_stage_worker(sender=worker)
+
+        self.assertEqual(worker.concurrency, LISTING_STAGES[LISTING_DELIVERY_QUEUE]["concurrency"])
+        self.assertEqual(worker.prefetch_multiplier, 3)
+
+    @mock.patch("listing_consumer.tasks.mark_emails_sent")
+    def test_sent_emails_are_marked_at_once(self, mock_mark_emails_sent):
+        emails = [
+            {"subject": f"Subject {i}", "body": "Body", "from_email": "kennyu.watch@gmail.com", "to": [self.user.email]} for i in range(3)
+        ]
+        task_id = str(uuid4())
+
+        deliver_listing_emails.apply(kwargs={"emails": emails}, task_id=task_id)
+
+        mock_mark_emails_sent.assert_called_once_with(task_id, [0, 1, 2])
+
+    @mock.patch("listing_consumer.tasks.is_redelivered", return_value=True)
+    def test_redelivered_emails_are_only_sent_once(self, *args):
+        emails = [
+            {"subject": f"Subject {i}", "body": "Body", "from_email": "kennyu.watch@gmail.com", "to": [self.user.email]} for i in range(3)
+        ]
+        task_id = str(uuid4())
+        # The worker stopped after sending the first email.
+        mark_emails_sent(task_id, [0])
+
+        deliver_listing_emails.apply(kwargs={"emails": emails}, task_id=task_id)
+        self.assertEqual([message.subject for message in mail.outbox], ["Subject 1", "Subject 2"])
+
+        # Every email is now marked as sent.
+        deliver_listing_emails.apply(kwargs={"emails": emails}, task_id=task_id)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class ListingStreamTests(TestCase):
+    def setUp(self) -> None:
+        deliver_emails_in_process(self)
+        username_and_email = "tester@test.com"
+        self.user = User.objects.create_user(username_and_email, username_and_email, password=str(uuid4()))
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_year="1996", model_name="Corolla")
+        self.alert = Alert.objects.create(user=self.user, vehicle=vehicle)
+
+        self.redis_client = get_redis_client()
+        self.stream = f"test-listings:{uuid4()}"
+        self.group = "test-consumers"
+        self.addCleanup(self.redis_client.delete, self.stream)
+
+        return super().setUp()
+
+    def __add_listing(self, **fields) -> str:
+        listing = {
+            "make": "Toyota",
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": str(uuid4()),
+            "branch": "Ottawa",
+            "listing_url": "https://www.kennyupull.com/listing/A12",
+            "client_id": str(self.alert.external_id),
+        }
+        return self.redis_client.xadd(self.stream, {**listing, **fields})
+
+    def __build_consumer(self, claim_idle_ms: int = 60000, max_deliveries: int = 5) -> ListingStreamConsumer:
+        return ListingStreamConsumer(
+            redis_client=self.redis_client,
+            stream=self.stream,
+            group=self.group,
+            consumer="alive",
+            batch_size=2,
+            block_ms=100,
+            claim_idle_ms=claim_idle_ms,
+            max_deliveries=max_deliveries,
+        )
+
+    def __read_and_stop(self):
+        """
+        Read every listing as a consumer that stops before acknowledging them.
+        """
+        self.__build_consumer().create_group()
+        self.redis_client.xreadgroup(self.group, "dead", {self.stream: ">"}, count=100)
+
+    def __get_number_pending(self) -> int:
+        return self.redis_client.xpending(self.stream, self.group)["pending"]
+
+    def test_consume_listing_stream_command(self):
+        for _ in range(2):
+            self.__add_listing()
+        self.__add_listing(year="")
+
+        out = StringIO()
+        call_command("consume_listing_stream", "--stream", self.stream, "--group", self.group, "--batch-size", "2", "--burst", stdout=out)
+
+        self.assertIn("Read 3 listings: 2 ingested, 1 invalid", out.getvalue())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        self.assertEqual(self.__get_number_pending(), 0)
+
+    def test_listings_are_only_acknowledged_once_ingested(self):
+        self.__add_listing()
+        consumer = self.__build_consumer()
+
+        with mock.patch("listing_consumer.streams.ingest_listings", side_effect=Exception("The database is down")):
+            counts = consumer.consume(burst=True)
+
+        self.assertEqual(counts["failed_batches"], 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.__get_number_pending(), 1)
+
+    def test_listings_of_a_stopped_consumer_are_taken_over(self):
+        self.__add_listing()
+        self.__read_and_stop()
+
+        # The listings were marked as seen by the consumer that stopped, they are matched again all the same.
+        with mock.patch("listing_consumer.tasks.drop_duplicate_listings", side_effect=lambda listings: ([], len(listings))):
+            counts = self.__build_consumer(claim_idle_ms=0).consume(burst=True)
+
+        self.assertEqual(counts["ingested"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.__get_number_pending(), 0)
+
+    def test_listings_pending_for_less_than_the_idle_time_are_left_alone(self):
+        self.__add_listing()
+        self.__read_and_stop()
+
+        counts = self.__build_consumer(claim_idle_ms=60000).consume(burst=True)
+
+        self.assertEqual(counts["read"], 0)
+        self.assertEqual(self.__get_number_pending(), 1)
+
+    def test_listings_delivered_too_many_times_are_dropped(self):
+        self.__add_listing()
+        self.__read_and_stop()
+
+        counts = self.__build_consumer(claim_idle_ms=0, max_deliveries=1).consume(burst=True)
+
+        self.assertEqual(counts["dropped"], 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.__get_number_pending(), 0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BackpressureTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        get_load_shedder.cache_clear()
+        self.addCleanup(get_load_shedder.cache_clear)
+        self.backlog = 0
+        patcher = mock.patch("listing_consumer.backpressure.get_broker_backlog", side_effect=lambda: self.backlog)
+        self.mock_get_broker_backlog = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        return super().setUp()
+
+    @override_settings(LISTING_BACKPRESSURE_HIGH_WATER_MARK=10, LISTING_BACKPRESSURE_RETRY_AFTER_SECONDS=7)
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_sheds_requests_over_the_high_water_mark(self, mock_ingest_listening, mock_ingest_listings_batch):
+        self.backlog = 10
+        shed_before = get_metric("user_watch_listing_requests_shed_total")
+
+        response = self.client.post("/listing-consumer/v1/new-listing", build_capture_listing("A1"), format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertIn("error", response.json())
+
+        response = self.client.post("/listing-consumer/v1/new-listings", [build_capture_listing("A2")], format="json")
+        self.assertEqual(response.status_code, 503)
+
+        mock_ingest_listening.delay.assert_not_called()
+        mock_ingest_listings_batch.delay.assert_not_called()
+        self.assertEqual(get_metric("user_watch_listing_requests_shed_total") - shed_before, 2)
+
+    @override_settings(LISTING_BACKPRESSURE_HIGH_WATER_MARK=10)
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_accepts_requests_under_the_high_water_mark(self, mock_ingest_listening):
+        self.backlog = 9
+
+        response = self.client.post("/listing-consumer/v1/new-listing", build_capture_listing("A1"), format="json")
+
+        self.assertEqual(response.status_code, 204)
+        mock_ingest_listening.delay.assert_called_once()
+
+    @override_settings(LISTING_BACKPRESSURE_HIGH_WATER_MARK=0)
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_disabled(self, mock_ingest_listening):
+        self.backlog = 1000
+
+        response = self.client.post("/listing-consumer/v1/new-listing", build_capture_listing("A1"), format="json")
+
+        self.assertEqual(response.status_code, 204)
+        self.mock_get_broker_backlog.assert_not_called()
+
+    def test_backlog_is_sampled_at_most_once_per_sample_interval(self):
+        clock = FakeClock()
+        get_backlog = mock.Mock(side_effect=[5, 20])
+        shedder = ListingLoadShedder(get_backlog, high_water_mark=10, sample_seconds=0.25, log_interval_seconds=10, clock=clock)
+
+        self.assertFalse(shedder.should_shed())
+        clock.now = 0.2
+        self.assertFalse(shedder.should_shed())
+        self.assertEqual(get_backlog.call_count, 1)
+
+        clock.now = 0.3
+        self.assertTrue(shedder.should_shed())
+        self.assertEqual(get_backlog.call_count, 2)
+
+    def test_accepts_requests_when_the_broker_cannot_be_reached(self):
+        shedder = ListingLoadShedder(lambda: None, high_water_mark=10, sample_seconds=0, log_interval_seconds=10)
+
+        self.assertFalse(shedder.should_shed())
+
+    def test_logs_the_number_of_requests_shed_per_interval(self):
+        clock = FakeClock()
+        shedder = ListingLoadShedder(lambda: 50, high_water_mark=10, sample_seconds=1, log_interval_seconds=10, clock=clock)
+
+        # Nothing is logged until log_interval_seconds went by.
+        for _ in range(3):
+            self.assertTrue(shedder.should_shed())
+
+        clock.now = 10
+        with self.assertLogs("listing_consumer.backpressure", level="WARNING") as logs:
+            self.assertTrue(shedder.should_shed())
+            self.assertTrue(shedder.should_shed())
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Shed 3 listing requests in the last 10.0s", logs.output[0])
+        self.assertIn("backlog is 50 tasks", logs.output[0])
+
+    def test_get_broker_backlog(self):
+        broker = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+        queues = [DEFAULT_QUEUE, *LISTING_STAGES]
+        before = sum(broker.llen(queue) for queue in queues)
+        broker.rpush(LISTING_MATCHING_QUEUE, "task", "task")
+        self.addCleanup(broker.ltrim, LISTING_MATCHING_QUEUE, 0, -3)
+
+        self.assertEqual(get_broker_backlog(), before + 2)
+
+
+class ListingCaptureTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        with self.settings(LISTING_CAPTURE_DIR=self.directory):
+            get_listing_capture().close()
+
+        return super().tearDown()
+
+    @mock.patch("listing_consumer.views.ingest_listings_batch")
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_listings_are_captured(self, *args):
+        with self.settings(LISTING_CAPTURE_DIR=self.directory):
+            self.client.post("/listing-consumer/v1/new-listing", build_capture_listing("A1"), format="json")
+            self.client.post("/listing-consumer/v1/new-listings", [build_capture_listing("A2")], format="json")
+
+        records = load_capture([self.directory])
+
+        self.assertEqual([record["path"] for record in records], ["/listing-consumer/v1/new-listing", "/listing-consumer/v1/new-listings"])
+        self.assertEqual(records[0]["data"], build_capture_listing("A1"))
+        self.assertEqual(records[1]["data"], [build_capture_listing("A2")])
+        self.assertLessEqual(records[0]["captured_at"], records[1]["captured_at"])
+
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_capture_file_is_rotated(self, *args):
+        with self.settings(LISTING_CAPTURE_DIR=self.directory, LISTING_CAPTURE_MAX_BYTES=300, LISTING_CAPTURE_BACKUP_COUNT=2):
+            for index in range(10):
+                self.client.post("/listing-consumer/v1/new-listing", build_capture_listing(f"A{index}"), format="json")
+
+        # Only the current file and the 2 most recent backups are kept.
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        self.assertEqual(load_capture([self.directory])[-1]["data"]["row_id"], "A9")
+
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_nothing_is_captured_by_default(self, *args):
+        self.client.post("/listing-consumer/v1/new-listing", build_capture_listing("A1"), format="json")
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class ReplayListingsTests(TestCase):
+    def setUp(self) -> None:
+        self.received = []
+        received = self.received
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                received.append((self.path, json.loads(self.rfile.read(int(self.headers["Content-Length"])))))
+                self.send_response(204 if received[-1][1].get("row_id") != "bad" else 400)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+        return super().tearDown()
+
+    def test_replay_keeps_the_pace_divided_by_the_speed(self):
+        records = [
+            {"captured_at": 1000 + index, "path": "/listing-consumer/v1/new-listing", "data": build_capture_listing(f"A{index}")}
+            for index in range(4)
+        ]
+        records.append({"captured_at": 1004, "path": "/listing-consumer/v1/new-listing", "data": build_capture_listing("bad")})
+
+        replayer = ListingReplayer(url=self.url, records=records, speed=20, concurrency=2, report_interval=0.05, get_backlog=lambda: 7)
+        result = replayer.replay()
+
+        self.assertEqual(len(self.received), 5)
+        self.assertEqual(result["requests"], 5)
+        self.assertEqual(result["outcomes"], {"204": 4, "400": 1})
+        self.assertAlmostEqual(result["error_rate"], 0.2)
+        # 4 seconds of traffic replayed 20 times faster.
+        self.assertGreaterEqual(result["seconds"], 0.2)
+        self.assertLess(result["seconds"], 2)
+        self.assertGreater(len(result["timeline"]), 1)
+        self.assertEqual(sum(report["completed"] for report in result["timeline"]), 5)
+        self.assertEqual(result["timeline"][-1]["task_backlog"], 7)
+
+    def test_replay_listings_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "listings-host-1.ndjson"), "w") as capture_file:
+                for index in range(3):
+                    record = {
+                        "captured_at": 1000 + index / 100,
+                        "path": "/listing-consumer/v1/new-listing",
+                        "data": build_capture_listing(f"A{index}"),
+                    }
+                    capture_file.write(f"{json.dumps(record)}\n")
+
+            output = os.path.join(directory, "results.json")
+            out = StringIO()
+            with mock.patch("listing_consumer.management.commands.replay_listings.get_task_backlog", return_value=0):
+                call_command("replay_listings", directory, "--url", self.url, "--speed", "10", "--output", output, stdout=out)
+
+            with open(output) as results_file:
+                self.assertEqual(json.load(results_file)["requests"], 3)
+
+        self.assertIn("Replayed 3 requests", out.getvalue())
+        self.assertEqual(sorted(data["row_id"] for _, data in self.received), ["A0", "A1", "A2"])
+
+    def test_replay_listings_command_rewrites_the_row_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "listings-host-1.ndjson"), "w") as capture_file:
+                for index in range(2):
+                    record = {
+                        "captured_at": 1000 + index / 100,
+                        "path": "/listing-consumer/v1/new-listing",
+                        "data": build_capture_listing("A1"),
+                    }
+                    capture_file.write(f"{json.dumps(record)}\n")
+
+            with mock.patch("listing_consumer.management.commands.replay_listings.get_task_backlog", return_value=0):
+                call_command("replay_listings", directory, "--url", self.url, "--rewrite-row-ids", stdout=StringIO())
+                call_command("replay_listings", directory, "--url", self.url, "--rewrite-row-ids", stdout=StringIO())
+
+        row_ids = [data["row_id"] for _, data in self.received]
+        self.assertEqual(len(row_ids), 4)
+        self.assertTrue(all(row_id.startswith("A1-replay-") for row_id in row_ids))
+        # The suffix is the same for every listing of a replay and unique to it.
+        self.assertEqual(len(set(row_ids)), 2)
+
+    def test_rewrite_row_ids(self):
+        listing = build_capture_listing("A1")
+
+        self.assertEqual(rewrite_row_ids(listing, "-x")["row_id"], "A1-x")
+        self.assertEqual([item["row_id"] for item in rewrite_row_ids([listing, build_capture_listing("A2")], "-x")], ["A1-x", "A2-x"])
+        self.assertEqual(listing["row_id"], "A1")
+
+
+def get_metric(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(METRICS_TOKEN="metrics-token")
+class MetricsTests(TestCase):
+    def setUp(self) -> None:
+        deliver_emails_in_process(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user("tester@test.com", "tester@test.com", password=str(uuid4()))
+        vehicle = Vehicle.objects.get_canonical(manufacturer_name="Toyota", model_name="Corolla", model_year="1996")
+        self.alert = Alert.objects.create(user=self.user, vehicle=vehicle, branch="Ottawa")
+
+        return super().setUp()
+
+    def __build_listing(self, **kwargs) -> dict:
+        row_id = str(uuid4())
+        return {
+            "make": "Toyota",
+            "model": "Corolla",
+            "year": "1996",
+            "date_listed": "2020-01-01",
+            "row_id": row_id,
+            "branch": "Ottawa",
+            "listing_url": f"https://www.kennyupull.com/listing/{row_id}",
+            "client_id": str(self.alert.external_id),
+            **kwargs,
+        }
+
+    @mock.patch("listing_consumer.views.ingest_listening")
+    def test_requests_are_timed_per_view(self, *args):
+        labels = {"view": "listing_consumer.views.consume_listing", "method": "POST", "status": "204"}
+        count = get_metric("user_watch_http_request_duration_seconds_count", **labels)
+
+        self.client.post("/listing-consumer/v1/new-listing", self.__build_listing(), format="json")
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer metrics-token")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"user_watch_http_request_duration_seconds_bucket", response.content)
+        self.assertEqual(get_metric("user_watch_http_request_duration_seconds_count", **labels), count + 1)
+
+    def test_ingest_listening_is_timed_and_its_matches_counted(self):
+        task = "listing_consumer.tasks.ingest_listening"
+        runs = get_metric("user_watch_celery_task_duration_seconds_count", task=task, state="SUCCESS")
+        emails = get_metric("user_watch_listing_matches_total", delivery="email")
+        branch_skips = get_metric("user_watch_listing_skips_total", reason="branch")
+        model_skips = get_metric("user_watch_listing_skips_total", reason="model")
+        sends = get_metric("user_watch_email_send_duration_seconds_count", outcome="sent")
+
+        ingest_listening.apply(kwargs={"kenny_u_pull_listing_data": self.__build_listing()})
+        ingest_listening.apply(kwargs={"kenny_u_pull_listing_data": self.__build_listing(branch="St-Test")})
+        ingest_listening.apply(kwargs={"kenny_u_pull_listing_data": self.__build_listing(model="Camry")})
+
+        self.assertEqual(get_metric("user_watch_celery_task_duration_seconds_count", task=task, state="SUCCESS"), runs + 3)
+        self.assertEqual(get_metric("user_watch_listing_matches_total", delivery="email"), emails + 1)
+        self.assertEqual(get_metric("user_watch_listing_skips_total", reason="branch"), branch_skips + 1)
+        self.assertEqual(get_metric("user_watch_listing_skips_total", reason="model"), model_skips + 1)
+        self.assertEqual(get_metric("user_watch_email_send_duration_seconds_count", outcome="sent"), sends + 1)
+
+    @mock.patch("listing_consumer.tasks.ingest_listings", side_effect=redis.ConnectionError("Connection refused"))
+    def test_ingest_listening_failures_are_counted(self, *args):
+        failures = get_metric("user_watch_celery_task_failures_total", task="listing_consumer.tasks.ingest_listening")
+
+        ingest_listening.apply(kwargs={"kenny_u_pull_listing_data": self.__build_listing()})
+
+        self.assertEqual(get_metric("user_watch_celery_task_failures_total", task="listing_consumer.tasks.ingest_listening"), failures + 1)
+
+    def test_queue_wait_is_measured_from_when_the_task_was_published_or_due(self):
+        headers = {}
+        mark_task_published(headers=headers)
+        published_at = headers[PUBLISHED_AT_HEADER]
+
+        self.assertAlmostEqual(get_queue_wait(mock.Mock(published_at=published_at, eta=None), published_at + 2), 2)
+        eta = datetime.fromtimestamp(published_at + 60, tz=timezone.utc).isoformat()
+        self.assertAlmostEqual(get_queue_wait(mock.Mock(published_at=published_at, eta=eta), published_at + 61), 1, places=3)
+        self.assertIsNone(get_queue_wait(mock.Mock(spec=["eta"], eta=None), published_at))
+
+    def test_metrics_of_every_process_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            script = "from prometheus_client import Counter\nCounter('user_watch_test_events_total', 'Test events.').inc(2)\n"
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", script], env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}, check=True)
+
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer metrics-token")
+
+        self.assertIn(b"user_watch_test_events_total 4.0", response.content)
+
+    def test_metrics_need_the_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong-token").status_code, 401)
+
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 404)
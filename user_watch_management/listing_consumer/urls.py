@@ -3,4 +3,5 @@ import listing_consumer.views as views
 
 urlpatterns = [
     path("v1/new-listing", views.consume_listing),
+    path("v1/new-listings", views.consume_listings),
 ]
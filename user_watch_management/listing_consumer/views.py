@@ -1,12 +1,17 @@
-from rest_framework.decorators import api_view
+from django.conf import settings
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.parsers import JSONParser
 from rest_framework import status
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 
+from listing_consumer.backpressure import get_shed_response
+from listing_consumer.capture import capture_listings
 from listing_consumer.data_models import KennyUPullListing
+from listing_consumer.parsers import NDJSONParser
 from listing_consumer.serializers import KennyUPullListingSerializer
-from listing_consumer.tasks import ingest_listening
+from listing_consumer.tasks import ingest_listening, ingest_listings_batch
 
 
 @api_view(["POST"])
@@ -15,7 +20,12 @@ def consume_listing(request):
     """
     Consume a listing for a Kenny U Pull listing from the producer.
     """
+    shed_response = get_shed_response()
+    if shed_response is not None:
+        return shed_response
+
     data = request.data
+    capture_listings(request.path, data)
     listing_serializer = KennyUPullListingSerializer(data=data)
 
     if not listing_serializer.is_valid():
@@ -26,3 +36,30 @@ def consume_listing(request):
 
     # Successfully consumed listing.
     return JsonResponse({}, status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(["POST"])
+@csrf_exempt
+@parser_classes([JSONParser, NDJSONParser])
+def consume_listings(request):
+    """
+    Consume many Kenny U Pull listings from the producer at once, sent as either a JSON array or an NDJSON stream.
+    """
+    shed_response = get_shed_response()
+    if shed_response is not None:
+        return shed_response
+
+    data = request.data
+    capture_listings(request.path, data)
+    listings_serializer = KennyUPullListingSerializer(data=data, many=True)
+
+    if not listings_serializer.is_valid():
+        return JsonResponse(listings_serializer.errors, safe=False, status=status.HTTP_400_BAD_REQUEST)
+
+    valid_data = listings_serializer.validated_data
+    chunk_size = settings.LISTING_BATCH_CHUNK_SIZE
+    for start in range(0, len(valid_data), chunk_size):
+        ingest_listings_batch.delay(kenny_u_pull_listings_data=valid_data[start : start + chunk_size])
+
+    # Successfully consumed listings.
+    return JsonResponse({}, status=status.HTTP_204_NO_CONTENT)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SignupConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "signup"
+
+    def ready(self):
+        # Keep the users cached for authentication in sync with the users.
+        import signup.signals  # noqa: F401
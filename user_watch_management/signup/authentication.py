@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from signup.cache import get_cached_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    A drop-in replacement for JWTAuthentication that resolves the user of the token through a short lived in-process and
+    shared cache instead of loading it from the database on every request. The cached user is invalidated whenever it is
+    saved (ex: a password change or a deactivation) or deleted.
+    """
+
+    def get_user(self, validated_token):
+        """
+        Find the user of a validated token.
+
+        :param validated_token: The validated token.
+        :return: The user of the token.
+        :raises InvalidToken: Raised if the token doesn't identify a user.
+        :raises AuthenticationFailed: Raised if the user doesn't exist or is inactive.
+        """
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_cached_user(user_id, self.__load_user)
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
+
+    def __load_user(self, user_id):
+        return self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
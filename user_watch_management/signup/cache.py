@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from signup.constants import CACHED_USER_KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# The password hash is never cached, a cached user loads it from the database if it is ever needed.
+UNCACHED_USER_FIELDS = {"password"}
+
+
+def _version_key(user_id) -> str:
+    return f"{CACHED_USER_KEY_PREFIX}:{user_id}:version"
+
+
+def _user_key(user_id, version: int) -> str:
+    return f"{CACHED_USER_KEY_PREFIX}:{user_id}:{version}"
+
+
+class LocalUserCache:
+    """
+    A small in-process cache of the users in front of the shared cache, holding each user for
+    AUTH_USER_LOCAL_CACHE_TIMEOUT_SECONDS. Other processes can't clear it so the timeout is kept short, it bounds how long a
+    change to the user made by another process goes unseen.
+    """
+
+    def __init__(self):
+        self.__users = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, user_id) -> Optional[dict]:
+        with self.__lock:
+            entry = self.__users.get(user_id)
+            if entry is None:
+                return None
+
+            expires_at, fields = entry
+            if expires_at <= time.monotonic():
+                del self.__users[user_id]
+                return None
+
+            return fields
+
+    def set(self, user_id, fields: dict):
+        with self.__lock:
+            self.__users[user_id] = (time.monotonic() + settings.AUTH_USER_LOCAL_CACHE_TIMEOUT_SECONDS, fields)
+            self.__users.move_to_end(user_id)
+            while len(self.__users) > settings.AUTH_USER_LOCAL_CACHE_MAX_SIZE:
+                self.__users.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.__lock:
+            self.__users.pop(user_id, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__users.clear()
+
+
+local_user_cache = LocalUserCache()
+
+
+def _get_user_version(user_id) -> int:
+    version_key = _version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        # Start from the current time so a version key that was evicted never comes back to a version with a user cached.
+        cache.add(version_key, time.time_ns(), timeout=None)
+        version = cache.get(version_key)
+
+    return version
+
+
+def get_cached_user(user_id, load_user):
+    """
+    Get a user from the in-process cache, then the shared cache, and only then the database. Every change to the user
+    moves to a new version of its cache entry, so a user read from the database while it was being changed is cached under
+    a version that is never read again.
+
+    :param user_id: The id of the user.
+    :param load_user: Called with the id of the user to load it from the database when it isn't cached.
+    :return: The user, with every field but the password loaded.
+    :raises: Whatever load_user raises when the user can't be loaded (ex: User.DoesNotExist).
+    """
+    user_model = get_user_model()
+    fields = local_user_cache.get(user_id)
+    if fields is None:
+        # The shared cache being unavailable should never fail authenticating, the user is loaded from the database.
+        version = None
+        try:
+            version = _get_user_version(user_id)
+            fields = cache.get(_user_key(user_id, version))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to get the cached user {user_id} with error {e}, loading it from the database")
+
+        if fields is None:
+            user = load_user(user_id)
+            fields = {
+                field.attname: getattr(user, field.attname)
+                for field in user_model._meta.concrete_fields
+                if field.attname not in UNCACHED_USER_FIELDS
+            }
+            if version is not None:
+                try:
+                    cache.set(_user_key(user_id, version), fields, timeout=settings.AUTH_USER_CACHE_TIMEOUT_SECONDS)
+                except redis.RedisError as e:
+                    logger.warning(f"Failed to cache the user {user_id} with error {e}")
+
+        local_user_cache.set(user_id, fields)
+
+    # Build the user the way the ORM does so the fields that weren't cached are deferred, loading them on access, and a
+    # save() only writes the fields that were loaded.
+    values = [fields[field.attname] for field in user_model._meta.concrete_fields if field.attname in fields]
+    return user_model.from_db("default", list(fields), values)
+
+
+def invalidate_cached_user(user_id):
+    """
+    Invalidate the cached user by moving to a new version, and drop it from the in-process cache of this process. The
+    shared cache being unavailable never fails the change to the user, it is logged and the user as it was before the
+    change can still be read from the shared cache for up to AUTH_USER_CACHE_TIMEOUT_SECONDS once it is back.
+
+    :param user_id: The id of the user.
+    """
+    local_user_cache.delete(user_id)
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # The user wasn't cached, the next read starts a new version.
+        pass
+    except redis.RedisError as e:
+        logger.error(f"Failed to invalidate the cached user {user_id} with error {e}")
@@ -0,0 +1,2 @@
+# Cache constants
+CACHED_USER_KEY_PREFIX = "signup:user"
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from signup.cache import invalidate_cached_user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user(sender, instance, **kwargs):
+    """
+    Invalidate the cached user whenever it changes (ex: its password or is_active) or is deleted. It is invalidated again
+    once the change is committed since a request could cache the user as it was before the change in between.
+    """
+    # Keep the id, a deleted user's pk is cleared before the transaction commits.
+    user_id = instance.pk
+    invalidate_cached_user(user_id)
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
@@ -2,14 +2,18 @@ import json
 from typing import Optional
 from unittest import mock
 from uuid import uuid4
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
 
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from alerts.constants import ALERT_NOT_UPDATED_MESSAGE
+from signup.authentication import CachedJWTAuthentication
+from signup.cache import local_user_cache
 
 
 class TestSignupV1New(TestCase):
@@ -34,3 +38,123 @@ class TestSignupV1New(TestCase):
 
         # Assert the user was created
         self.assertTrue(User.objects.filter(username=username, email=username).exists())
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        local_user_cache.clear()
+        self.password = str(uuid4())
+        self.user = User.objects.create_user("tester@test.com", "tester@test.com", password=self.password)
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.authentication = CachedJWTAuthentication()
+
+        return super().setUp()
+
+    def test_get_user_is_cached(self):
+        self.assertEqual(self.authentication.get_user(self.token), self.user)
+
+        with self.assertNumQueries(0):
+            user = self.authentication.get_user(self.token)
+
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(user.email, self.user.email)
+
+    def test_get_user_from_the_shared_cache(self):
+        self.authentication.get_user(self.token)
+        # Another process only has the shared cache.
+        local_user_cache.clear()
+
+        with self.assertNumQueries(0):
+            user = self.authentication.get_user(self.token)
+
+        self.assertEqual(user.username, self.user.username)
+
+    def test_cached_user_does_not_hold_the_password(self):
+        self.authentication.get_user(self.token)
+        local_user_cache.clear()
+        user = self.authentication.get_user(self.token)
+
+        self.assertIn("password", user.get_deferred_fields())
+        # The password is loaded when needed and saving the user doesn't clear it.
+        self.assertTrue(user.check_password(self.password))
+        user.first_name = "Tester"
+        user.save()
+
+        self.assertTrue(User.objects.get(id=self.user.id).check_password(self.password))
+
+    def test_deactivating_the_user_invalidates_the_cache(self):
+        self.authentication.get_user(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        with self.assertRaises(AuthenticationFailed) as context:
+            self.authentication.get_user(self.token)
+
+        self.assertEqual(context.exception.detail["code"], "user_inactive")
+
+    def test_changing_the_password_invalidates_the_cache(self):
+        self.authentication.get_user(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password(str(uuid4()))
+            self.user.save()
+
+        with self.assertNumQueries(1):
+            self.authentication.get_user(self.token)
+
+    def test_deleting_the_user_invalidates_the_cache(self):
+        self.authentication.get_user(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed) as context:
+            self.authentication.get_user(self.token)
+
+        self.assertEqual(context.exception.detail["code"], "user_not_found")
+
+    def test_authenticated_request_does_not_load_the_user(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        client.get("/alerts/v1/get-alerts")
+
+        # Only the freshness check of the cached list of alerts is left, the user isn't loaded.
+        with self.assertNumQueries(1):
+            response = client.get("/alerts/v1/get-alerts")
+
+        self.assertEqual(response.status_code, 200)
+
+
+# A Redis cache nothing listens on.
+UNAVAILABLE_CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:1"}}
+
+
+@override_settings(CACHES=UNAVAILABLE_CACHES)
+class UnavailableUserCacheTests(TestCase):
+    def setUp(self) -> None:
+        local_user_cache.clear()
+
+        return super().setUp()
+
+    def test_signup_and_authentication_fall_back_to_the_database(self):
+        with self.assertLogs("signup.cache", level="ERROR"):
+            response = APIClient().post("/signup/v1/new", data={"username": "tester@test.com", "password": str(uuid4())})
+
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username="tester@test.com")
+
+        with self.assertLogs("signup.cache", level="WARNING"):
+            authenticated_user = CachedJWTAuthentication().get_user(RefreshToken.for_user(user).access_token)
+
+        self.assertEqual(authenticated_user.id, user.id)
+
+    def test_changing_the_user_does_not_fail(self):
+        with self.assertLogs("signup.cache", level="ERROR"):
+            user = User.objects.create_user("tester@test.com", "tester@test.com", password=str(uuid4()))
+            user.is_active = False
+            user.save()
+
+        self.assertFalse(User.objects.get(id=user.id).is_active)
@@ -0,0 +1,22 @@
+from contextlib import AbstractContextManager, ExitStack, asynccontextmanager
+from typing import AsyncIterator
+
+from asgiref.sync import sync_to_async
+
+
+@asynccontextmanager
+async def sync_context(context_manager: AbstractContextManager) -> AsyncIterator:
+    """
+    Enter a sync context manager from async code in the thread the request's sync code runs in, and exit it there. Under
+    ASGI every sync_to_async call of a request runs in the same thread, including the sync views Django runs for it, so
+    the thread-local state the context manager sets (ex: the database connections' execute wrappers) applies to them.
+
+    :param context_manager: The context manager to enter.
+    :return: What the context manager returns when entered.
+    """
+    stack = ExitStack()
+    value = await sync_to_async(stack.enter_context)(context_manager)
+    try:
+        yield value
+    finally:
+        await sync_to_async(stack.close)()
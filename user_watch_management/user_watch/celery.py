@@ -1,8 +1,101 @@
 import os
+from typing import Optional
+
+import click
 from celery import Celery
+from celery.app.defaults import DEFAULTS
+from celery.signals import worker_init
+from click.core import ParameterSource
+from kombu import Queue
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "user_watch.settings")
 
+# The queue of every task without a stage of its own.
+DEFAULT_QUEUE = "celery"
+LISTING_MATCHING_QUEUE = "listing-matching"
+LISTING_DELIVERY_QUEUE = "listing-delivery"
+
+# Ingesting listings is split in stages, each on its own queue so its workers are scaled on their own and a slow email
+# server only holds up the delivery workers. A worker started on a single stage's queue (ex:
+# `celery -A user_watch worker -Q listing-delivery`) runs with that stage's concurrency and prefetch multiplier, a worker
+# started without -Q consumes every queue. The concurrency (-c) or prefetch multiplier (--prefetch-multiplier) given on the
+# command line or in the configuration are kept.
+LISTING_STAGES = {
+    # Matching the listings against the alerts, queueing the emails of the matches.
+    LISTING_MATCHING_QUEUE: {
+        "tasks": ["listing_consumer.tasks.ingest_listening", "listing_consumer.tasks.ingest_listings_batch"],
+        "concurrency": int(os.environ.get("LISTING_MATCHING_CONCURRENCY", 8)),
+        "prefetch_multiplier": int(os.environ.get("LISTING_MATCHING_PREFETCH_MULTIPLIER", 4)),
+        # A chunk of listings whose worker stopped part way is matched again rather than lost.
+        "acks_late": True,
+    },
+    # Sending the emails, which is mostly waiting on the email server.
+    LISTING_DELIVERY_QUEUE: {
+        "tasks": ["listing_consumer.tasks.deliver_listing_emails", "listing_consumer.tasks.send_listing_digests"],
+        "concurrency": int(os.environ.get("LISTING_DELIVERY_CONCURRENCY", 16)),
+        # Only one task is reserved at a time so the emails waiting behind a worker stuck on the email server are picked up
+        # by the others.
+        "prefetch_multiplier": int(os.environ.get("LISTING_DELIVERY_PREFETCH_MULTIPLIER", 1)),
+        "acks_late": True,
+    },
+}
+
 celery_app = Celery("user_watch")
 celery_app.config_from_object("django.conf:settings", namespace="CELERY")
+celery_app.conf.update(
+    task_queues=[Queue(DEFAULT_QUEUE)] + [Queue(queue) for queue in LISTING_STAGES],
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes={task: {"queue": queue} for queue, stage in LISTING_STAGES.items() for task in stage["tasks"]},
+    task_annotations={task: {"acks_late": stage["acks_late"]} for stage in LISTING_STAGES.values() for task in stage["tasks"]},
+)
 celery_app.autodiscover_tasks()
+
+
+def get_worker_stage(queues) -> Optional[dict]:
+    """
+    Get the stage of a worker from the queues it consumes.
+
+    :param queues: The names of the queues the worker consumes.
+    :return: The stage of the worker, None if it doesn't consume a single stage's queue.
+    """
+    queues = set(queues)
+    if len(queues) != 1:
+        return None
+
+    return LISTING_STAGES.get(queues.pop())
+
+
+def is_worker_option_set(worker, option: str) -> bool:
+    """
+    Check if a worker option was given on the command line (ex: -c 4) or in the configuration (ex:
+    CELERY_WORKER_CONCURRENCY), rather than left to Celery's default.
+
+    :param worker: The worker being started.
+    :param option: The name of the option, the configuration's is the same prefixed with worker_.
+    :return: True if the option was set, False otherwise.
+    """
+    context = click.get_current_context(silent=True)
+    if context is not None and context.get_parameter_source(option) not in (None, ParameterSource.DEFAULT):
+        return True
+
+    setting = f"worker_{option}"
+    return worker.app.conf.get(setting) != DEFAULTS[setting]
+
+
+@worker_init.connect(dispatch_uid="configure_stage_worker")
+def configure_stage_worker(sender, **kwargs):
+    """
+    Give a worker consuming a single stage's queue the concurrency and prefetch multiplier of that stage, before its pool
+    and consumer are started, unless they were set for the worker.
+    """
+    stage = get_worker_stage(sender.app.amqp.queues.consume_from)
+    if stage is None:
+        return
+
+    for option in ("concurrency", "prefetch_multiplier"):
+        if not is_worker_option_set(sender, option):
+            setattr(sender, option, stage[option])
+
+
+# Connects the signal hooks timing and counting the tasks.
+import user_watch.metrics  # noqa: E402,F401
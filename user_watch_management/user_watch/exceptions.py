@@ -0,0 +1,8 @@
+class RepeatedQueriesException(Exception):
+    """Exception raised when the same query is run too many times while profiling, usually once per row (N+1 queries)."""
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
@@ -0,0 +1,176 @@
+import asyncio
+import hmac
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, task_retry, worker_process_shutdown
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+# The Prometheus metrics of the web and Celery processes. When PROMETHEUS_MULTIPROC_DIR is set (before any process starts)
+# every process writes its metrics to that directory and /metrics adds up the metrics of all of them, so it has to be
+# shared by the web and Celery processes and emptied whenever the deployment starts.
+
+HTTP_REQUEST_DURATION = Histogram(
+    "user_watch_http_request_duration_seconds", "How long the requests took to handle.", ["view", "method", "status"]
+)
+
+TASK_QUEUE_WAIT = Histogram(
+    "user_watch_celery_task_queue_wait_seconds",
+    "How long the tasks waited in the broker before a worker started them.",
+    ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+TASK_DURATION = Histogram("user_watch_celery_task_duration_seconds", "How long the tasks took to run.", ["task", "state"])
+TASK_RETRIES = Counter("user_watch_celery_task_retries_total", "The number of times the tasks were retried.", ["task"])
+TASK_FAILURES = Counter("user_watch_celery_task_failures_total", "The number of times the tasks failed.", ["task"])
+
+LISTING_MATCHES = Counter(
+    "user_watch_listing_matches_total", "The number of alerts listings matched, by how the user is told.", ["delivery"]
+)
+LISTING_SKIPS = Counter(
+    "user_watch_listing_skips_total", "The number of alerts a listing was checked against but didn't match, by why.", ["reason"]
+)
+LISTING_REQUESTS_SHED = Counter(
+    "user_watch_listing_requests_shed_total", "The number of listing requests turned away because the broker was too far behind."
+)
+ALERT_LIST_CACHE_LOOKUPS = Counter(
+    "user_watch_alert_list_cache_lookups_total",
+    "The number of lists of alerts looked up in the cache, by whether they were found.",
+    ["result"],
+)
+EMAIL_SEND_DURATION = Histogram("user_watch_email_send_duration_seconds", "How long sending an email took.", ["outcome"])
+
+# The header holding when a task was published, to know how long it waited in the broker.
+PUBLISHED_AT_HEADER = "published_at"
+
+_task_started_at: dict[str, float] = {}
+_task_started_at_lock = threading.Lock()
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Get the registry to expose, which adds up the metrics of every process in multiprocess mode.
+
+    :return: The registry.
+    """
+    multiprocess_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not multiprocess_dir:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=multiprocess_dir)
+    return registry
+
+
+def metrics_view(request) -> HttpResponse:
+    """
+    Expose the metrics in the Prometheus text format to the requests with the METRICS_TOKEN bearer token.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404()
+
+    authorization = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+        return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Time every request, labelled with the view that handled it (its URL name or dotted path). It runs as async
+    middleware under ASGI, so Django doesn't switch the request between threads because of it.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.__observe(request, response, started)
+
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.__observe(request, response, started)
+
+        return response
+
+    def __observe(self, request, response, started: float):
+        resolver_match = getattr(request, "resolver_match", None)
+        view = resolver_match.view_name if resolver_match is not None else "<unresolved>"
+        HTTP_REQUEST_DURATION.labels(view=view, method=request.method, status=response.status_code).observe(time.perf_counter() - started)
+
+
+def get_queue_wait(request, now: float) -> Optional[float]:
+    """
+    Get how long a task waited in the broker, from when it was published or, for a task scheduled for later, from when it
+    was due.
+
+    :param request: The request of the task.
+    :param now: The current time as a Unix timestamp.
+    :return: The number of seconds the task waited, None if it wasn't published with PUBLISHED_AT_HEADER (ex: run eagerly).
+    """
+    published_at = getattr(request, PUBLISHED_AT_HEADER, None)
+    if published_at is None:
+        return None
+
+    eta = getattr(request, "eta", None)
+    if eta:
+        published_at = max(published_at, datetime.fromisoformat(eta).timestamp())
+
+    return max(now - published_at, 0)
+
+
+@before_task_publish.connect(dispatch_uid="metrics_mark_task_published")
+def mark_task_published(headers: Optional[dict] = None, **kwargs):
+    if headers is not None:
+        headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect(dispatch_uid="metrics_record_task_started")
+def record_task_started(task_id: str, task, **kwargs):
+    queue_wait = get_queue_wait(task.request, time.time())
+    if queue_wait is not None:
+        TASK_QUEUE_WAIT.labels(task=task.name).observe(queue_wait)
+
+    with _task_started_at_lock:
+        _task_started_at[task_id] = time.perf_counter()
+
+
+@task_postrun.connect(dispatch_uid="metrics_record_task_finished")
+def record_task_finished(task_id: str, task, state: Optional[str] = None, **kwargs):
+    with _task_started_at_lock:
+        started_at = _task_started_at.pop(task_id, None)
+
+    if started_at is not None:
+        TASK_DURATION.labels(task=task.name, state=state or "UNKNOWN").observe(time.perf_counter() - started_at)
+
+
+@task_retry.connect(dispatch_uid="metrics_count_task_retry")
+def count_task_retry(sender, **kwargs):
+    TASK_RETRIES.labels(task=sender.name).inc()
+
+
+@task_failure.connect(dispatch_uid="metrics_count_task_failure")
+def count_task_failure(sender, **kwargs):
+    TASK_FAILURES.labels(task=sender.name).inc()
+
+
+@worker_process_shutdown.connect(dispatch_uid="metrics_mark_process_dead")
+def mark_process_dead(**kwargs):
+    """
+    Let the live gauges of a Celery worker process that stopped go, in multiprocess mode. Web servers that fork workers
+    should do the same when one exits (ex: gunicorn's child_exit hook).
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
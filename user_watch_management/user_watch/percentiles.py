@@ -0,0 +1,15 @@
+import statistics
+
+
+def get_percentile(durations: list[float], percentile: int) -> float:
+    """
+    Get a percentile of durations, shared by the benchmarks, the load tests and the listing replays.
+
+    :param durations: The durations, in any unit.
+    :param percentile: The percentile to get, from 1 to 99.
+    :return: The percentile of the durations, the only duration if there is one and 0 if there are none.
+    """
+    if len(durations) < 2:
+        return durations[0] if durations else 0
+
+    return statistics.quantiles(durations, n=100, method="inclusive")[percentile - 1]
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from typing import Callable, Iterator, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from user_watch.async_utils import sync_context
+from user_watch.exceptions import RepeatedQueriesException
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:(?:%s|\?)\s*,\s*)+(?:%s|\?)\s*\)")
+_SAVEPOINT_ID = re.compile(r"\bs\d+_x\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def get_query_template(sql: str) -> str:
+    """
+    Get the template of a query, the same for every run of it with different values (ex: "... WHERE id = %s" and
+    "... WHERE id IN (...)" whatever the number of ids).
+
+    :param sql: The query.
+    :return: The template of the query.
+    """
+    template = _STRING_LITERAL.sub("?", sql)
+    template = _NUMBER_LITERAL.sub("?", template)
+    template = _PLACEHOLDER_LIST.sub("(...)", template)
+    template = _SAVEPOINT_ID.sub("?", template)
+    return _WHITESPACE.sub(" ", template).strip()
+
+
+class QueryProfile:
+    """
+    The queries run while profiling, with how long each of them took. It is installed as an execute wrapper of the
+    database connections, see profile_queries.
+    """
+
+    def __init__(self):
+        self.queries: list[tuple[str, float]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((get_query_template(sql), time.perf_counter() - started))
+
+    @property
+    def number_of_queries(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.queries)
+
+    def get_repeated_queries(self, threshold: int) -> dict[str, int]:
+        """
+        Get the query templates run at least threshold times, which usually means a query is run per row (N+1 queries).
+
+        :param threshold: The number of runs of the same template to report it at.
+        :return: The number of runs of each repeated template, most repeated first.
+        """
+        return {
+            template: count for template, count in Counter(template for template, _ in self.queries).most_common() if count >= threshold
+        }
+
+    def get_server_timing(self) -> str:
+        """
+        :return: The Server-Timing entry of the queries, for the browser's developer tools.
+        """
+        return f'db;dur={self.total_seconds * 1000:.1f};desc="{self.number_of_queries} queries"'
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """
+    Profile the queries run by the current thread on every database.
+
+    :return: The profile the queries are recorded in.
+    """
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+
+        yield profile
+
+
+def report_query_profile(profile: QueryProfile, description: str):
+    """
+    Warn about the query templates repeated QUERY_PROFILER_REPEAT_THRESHOLD times or more, with the details of the
+    profile in the log record's query_profile, or raise if QUERY_PROFILER_RAISE is on.
+
+    :param profile: The profile to report.
+    :param description: What was profiled (ex: the request).
+    :raises RepeatedQueriesException: Raised if QUERY_PROFILER_RAISE is on and queries were repeated.
+    """
+    repeated_queries = profile.get_repeated_queries(settings.QUERY_PROFILER_REPEAT_THRESHOLD)
+    if not repeated_queries:
+        return
+
+    message = (
+        f"{description} ran {profile.number_of_queries} queries in {profile.total_seconds * 1000:.1f}ms, "
+        f"{len(repeated_queries)} of them repeated: " + "; ".join(f"{count}x {template}" for template, count in repeated_queries.items())
+    )
+    if settings.QUERY_PROFILER_RAISE:
+        raise RepeatedQueriesException(message)
+
+    logger.warning(
+        message,
+        extra={
+            "query_profile": {
+                "description": description,
+                "number_of_queries": profile.number_of_queries,
+                "total_ms": profile.total_seconds * 1000,
+                "repeated_queries": repeated_queries,
+            }
+        },
+    )
+
+
+class QueryProfilerMiddleware(MiddlewareMixin):
+    """
+    Count the queries of every request and the time spent in them when QUERY_PROFILER_ENABLED is on, adding them to the
+    response's Server-Timing header and reporting repeated queries (see report_query_profile). Under ASGI it runs as async
+    middleware and profiles the thread the views run their queries in.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not settings.QUERY_PROFILER_ENABLED:
+            return self.get_response(request)
+
+        with profile_queries() as profile:
+            response = self.get_response(request)
+
+        self.__report(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.QUERY_PROFILER_ENABLED:
+            return await self.get_response(request)
+
+        async with sync_context(profile_queries()) as profile:
+            response = await self.get_response(request)
+
+        self.__report(request, response, profile)
+        return response
+
+    def __report(self, request, response, profile: QueryProfile):
+        server_timing = response.get("Server-Timing")
+        response["Server-Timing"] = f"{server_timing}, {profile.get_server_timing()}" if server_timing else profile.get_server_timing()
+        report_query_profile(profile, f"{request.method} {request.path}")
+
+
+def profile_task_queries(task: Callable) -> Callable:
+    """
+    Count the queries of every run of a task when QUERY_PROFILER_ENABLED is on, reporting repeated queries (see
+    report_query_profile). Goes under the task decorator.
+
+    :param task: The function of the task.
+    :return: The profiled function.
+    """
+
+    @wraps(task)
+    def wrapper(*args, **kwargs):
+        if not settings.QUERY_PROFILER_ENABLED:
+            return task(*args, **kwargs)
+
+        with profile_queries() as profile:
+            result = task(*args, **kwargs)
+
+        report_query_profile(profile, f"{task.__module__}.{task.__name__}")
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def assert_query_budget(max_queries: int, max_repeats: Optional[int] = None) -> Iterator[QueryProfile]:
+    """
+    Fail a test if the code in the block runs more than max_queries queries or runs the same query template more than
+    max_repeats times.
+
+    :param max_queries: The number of queries the block can run.
+    :param max_repeats: The number of times the block can run the same query template, not checked when None.
+    :return: The profile of the block's queries.
+    :raises AssertionError: Raised if the block went over its budget.
+    """
+    with profile_queries() as profile:
+        yield profile
+
+    problems = []
+    if profile.number_of_queries > max_queries:
+        problems.append(f"{profile.number_of_queries} queries were run, more than the budget of {max_queries}")
+
+    if max_repeats is not None:
+        for template, count in profile.get_repeated_queries(max_repeats + 1).items():
+            problems.append(f"{template} was run {count} times, more than the budget of {max_repeats}")
+
+    if problems:
+        queries = "\n".join(f"{index}. {template}" for index, (template, _) in enumerate(profile.queries, start=1))
+        raise AssertionError("\n".join(problems) + f"\nQueries:\n{queries}")
@@ -42,7 +42,10 @@ ALLOWED_HOSTS.extend(
 
 INSTALLED_APPS = [
     "alerts.apps.AlertsConfig",
-    'corsheaders',
+    "listing_consumer.apps.ListingConsumerConfig",
+    "signup.apps.SignupConfig",
+    "benchmarks.apps.BenchmarksConfig",
+    "corsheaders",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -52,19 +55,22 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "user_watch.metrics.MetricsMiddleware",
+    "user_watch.query_profiler.QueryProfilerMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    'corsheaders.middleware.CorsMiddleware',
+    "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "alerts.history.HistoryBatchMiddleware",
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "signup.authentication.CachedJWTAuthentication",
     ],
 }
 
@@ -148,10 +154,92 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://127.0.0.1:6379")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BACKEND", "redis://127.0.0.1:6379")
 CELERY_IMPORTS = [
     "listing_consumer.tasks",
+    "alerts.tasks",
 ]
 CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_SERIALIZER = "json"
+# Nothing reads the results of the tasks, a task whose result is needed sets ignore_result=False.
+CELERY_TASK_IGNORE_RESULT = True
+
+# Cache related settings
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_LOCATION", CELERY_BROKER_URL),
+    }
+}
+ALERT_LIST_CACHE_TIMEOUT_SECONDS = int(os.environ.get("ALERT_LIST_CACHE_TIMEOUT_SECONDS", 60 * 60))
+# Serialize lists of alerts straight from values() projections and encode them with orjson when it is installed.
+ALERT_FAST_SERIALIZATION = bool(int(os.environ.get("ALERT_FAST_SERIALIZATION", 1)))
+# The user of an authenticated request is cached in Redis and, for a shorter time, in the process itself.
+AUTH_USER_CACHE_TIMEOUT_SECONDS = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT_SECONDS", 60))
+AUTH_USER_LOCAL_CACHE_TIMEOUT_SECONDS = float(os.environ.get("AUTH_USER_LOCAL_CACHE_TIMEOUT_SECONDS", 5))
+AUTH_USER_LOCAL_CACHE_MAX_SIZE = int(os.environ.get("AUTH_USER_LOCAL_CACHE_MAX_SIZE", 1000))
+
+# Listing consumer related settings
+LISTING_BATCH_CHUNK_SIZE = int(os.environ.get("LISTING_BATCH_CHUNK_SIZE", 100))
+LISTING_CONSUMER_REDIS_URL = os.environ.get("LISTING_CONSUMER_REDIS_URL", CELERY_BROKER_URL)
+# How long an ingested listing is remembered so retried or re-sent copies of it are dropped (0 disables it).
+LISTING_DEDUPE_TTL_SECONDS = int(os.environ.get("LISTING_DEDUPE_TTL_SECONDS", 24 * 60 * 60))
+# How often the listings matching alerts in digest mode are grouped and emailed to their users.
+LISTING_DIGEST_WINDOW_SECONDS = float(os.environ.get("LISTING_DIGEST_WINDOW_SECONDS", 15 * 60))
+# The listings sent to the listing consumer are captured with when they arrived to replay them later, in rotating NDJSON
+# files (one per process) in this directory. Capturing is off when it isn't set.
+LISTING_CAPTURE_DIR = os.environ.get("LISTING_CAPTURE_DIR", "")
+LISTING_CAPTURE_MAX_BYTES = int(os.environ.get("LISTING_CAPTURE_MAX_BYTES", 100 * 1024 * 1024))
+LISTING_CAPTURE_BACKUP_COUNT = int(os.environ.get("LISTING_CAPTURE_BACKUP_COUNT", 10))
+# The Redis Stream (on LISTING_CONSUMER_REDIS_URL) the consume_listing_stream command reads listings from as a member of
+# LISTING_STREAM_GROUP, as an alternative to POSTing them. Listings left pending by a consumer for
+# LISTING_STREAM_CLAIM_IDLE_SECONDS are taken over by another, until they were read LISTING_STREAM_MAX_DELIVERIES times.
+LISTING_STREAM_KEY = os.environ.get("LISTING_STREAM_KEY", "listing_consumer:listings")
+LISTING_STREAM_GROUP = os.environ.get("LISTING_STREAM_GROUP", "listing-consumers")
+LISTING_STREAM_BATCH_SIZE = int(os.environ.get("LISTING_STREAM_BATCH_SIZE", 100))
+LISTING_STREAM_BLOCK_MS = int(os.environ.get("LISTING_STREAM_BLOCK_MS", 5000))
+LISTING_STREAM_CLAIM_IDLE_SECONDS = float(os.environ.get("LISTING_STREAM_CLAIM_IDLE_SECONDS", 60))
+LISTING_STREAM_MAX_DELIVERIES = int(os.environ.get("LISTING_STREAM_MAX_DELIVERIES", 5))
+# The listing consumer endpoints answer 503 with a Retry-After of LISTING_BACKPRESSURE_RETRY_AFTER_SECONDS while the
+# broker's queues hold LISTING_BACKPRESSURE_HIGH_WATER_MARK tasks or more (0 disables it), so the producer slows down
+# instead of the broker running out of memory. Each process samples the queues at most every
+# LISTING_BACKPRESSURE_SAMPLE_SECONDS and logs the requests it turned away at most every
+# LISTING_BACKPRESSURE_LOG_INTERVAL_SECONDS.
+LISTING_BACKPRESSURE_HIGH_WATER_MARK = int(os.environ.get("LISTING_BACKPRESSURE_HIGH_WATER_MARK", 100000))
+LISTING_BACKPRESSURE_RETRY_AFTER_SECONDS = int(os.environ.get("LISTING_BACKPRESSURE_RETRY_AFTER_SECONDS", 5))
+LISTING_BACKPRESSURE_SAMPLE_SECONDS = float(os.environ.get("LISTING_BACKPRESSURE_SAMPLE_SECONDS", 0.25))
+LISTING_BACKPRESSURE_LOG_INTERVAL_SECONDS = float(os.environ.get("LISTING_BACKPRESSURE_LOG_INTERVAL_SECONDS", 10))
+
+# Query profiler related settings
+# Count the queries (and the time spent in them) of every request and profiled task, adding them to the Server-Timing
+# header and warning about any query run QUERY_PROFILER_REPEAT_THRESHOLD times or more, which is usually one query per
+# row. With QUERY_PROFILER_RAISE on (ex: in tests) the request or task fails instead.
+QUERY_PROFILER_ENABLED = bool(int(os.environ.get("QUERY_PROFILER_ENABLED", 0)))
+QUERY_PROFILER_REPEAT_THRESHOLD = int(os.environ.get("QUERY_PROFILER_REPEAT_THRESHOLD", 5))
+QUERY_PROFILER_RAISE = bool(int(os.environ.get("QUERY_PROFILER_RAISE", 0)))
+
+# Metrics related settings
+# The bearer token Prometheus has to scrape /metrics with, which isn't served at all (404) without one.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Celery beat related settings
+CELERY_BEAT_SCHEDULE = {
+    "send-listing-digests": {
+        "task": "listing_consumer.tasks.send_listing_digests",
+        "schedule": LISTING_DIGEST_WINDOW_SECONDS,
+    },
+    # Picks up the outbox entries waiting on a retry, new entries are relayed as soon as they are committed.
+    "relay-subscription-outbox": {
+        "task": "alerts.tasks.relay_subscription_outbox",
+        "schedule": float(os.environ.get("SUBSCRIPTION_OUTBOX_RELAY_INTERVAL_SECONDS", 30)),
+    },
+    "reconcile-producer-subscriptions": {
+        "task": "alerts.tasks.reconcile_producer_subscriptions",
+        "schedule": float(os.environ.get("SUBSCRIPTION_RECONCILE_INTERVAL_SECONDS", 24 * 60 * 60)),
+    },
+    "prune-historical-alerts": {
+        "task": "alerts.tasks.prune_historical_alerts",
+        "schedule": float(os.environ.get("ALERT_HISTORY_PRUNE_INTERVAL_SECONDS", 24 * 60 * 60)),
+    },
+}
 
 # Email related settings
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -160,13 +248,46 @@ EMAIL_PORT = os.environ.get("EMAIL_PORT", 587)
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
+EMAIL_TIMEOUT = int(os.environ.get("EMAIL_TIMEOUT", 30))
+# Listing emails are sent in batches over one long-lived connection per worker process.
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", 50))
+EMAIL_FLUSH_INTERVAL_SECONDS = float(os.environ.get("EMAIL_FLUSH_INTERVAL_SECONDS", 5))
+EMAIL_CONNECTION_HEALTH_CHECK_SECONDS = float(os.environ.get("EMAIL_CONNECTION_HEALTH_CHECK_SECONDS", 30))
 
 # Alert Producer related settings
 ALERT_PRODUCER_URL = os.environ.get("ALERT_PRODUCER_URL", "http://go:8080/v1/subscribe-vehicle")
+ALERT_PRODUCER_UNSUBSCRIBE_URL = os.environ.get("ALERT_PRODUCER_UNSUBSCRIBE_URL", "http://go:8080/v1/unsubscribe-from-vehicle")
+ALERT_PRODUCER_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("ALERT_PRODUCER_CONNECT_TIMEOUT_SECONDS", 3))
+ALERT_PRODUCER_READ_TIMEOUT_SECONDS = float(os.environ.get("ALERT_PRODUCER_READ_TIMEOUT_SECONDS", 10))
+# Calls are retried with a jittered exponential backoff when the alert producer can't be reached.
+ALERT_PRODUCER_MAX_RETRIES = int(os.environ.get("ALERT_PRODUCER_MAX_RETRIES", 2))
+ALERT_PRODUCER_RETRY_BACKOFF_SECONDS = float(os.environ.get("ALERT_PRODUCER_RETRY_BACKOFF_SECONDS", 0.2))
+# The number of keep-alive connections to the alert producer kept open per process.
+ALERT_PRODUCER_POOL_SIZE = int(os.environ.get("ALERT_PRODUCER_POOL_SIZE", 10))
+# Optional endpoints taking many subscriptions in one request, subscriptions are sent one by one when they aren't set.
+ALERT_PRODUCER_BULK_SUBSCRIBE_URL = os.environ.get("ALERT_PRODUCER_BULK_SUBSCRIBE_URL", "")
+ALERT_PRODUCER_BULK_UNSUBSCRIBE_URL = os.environ.get("ALERT_PRODUCER_BULK_UNSUBSCRIBE_URL", "")
+ALERT_PRODUCER_BULK_SIZE = int(os.environ.get("ALERT_PRODUCER_BULK_SIZE", 500))
+ALERT_PRODUCER_SUBSCRIPTIONS_URL = os.environ.get("ALERT_PRODUCER_SUBSCRIPTIONS_URL", "http://go:8080/v1/subscriptions")
+# The alert producer's subscriptions are periodically reconciled with the alerts, this many of each side at a time.
+SUBSCRIPTION_RECONCILE_CHUNK_SIZE = int(os.environ.get("SUBSCRIPTION_RECONCILE_CHUNK_SIZE", 1000))
+# Subscription changes are written to an outbox with the alert and relayed to the alert producer by a Celery task.
+SUBSCRIPTION_OUTBOX_BATCH_SIZE = int(os.environ.get("SUBSCRIPTION_OUTBOX_BATCH_SIZE", 100))
+SUBSCRIPTION_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("SUBSCRIPTION_OUTBOX_MAX_ATTEMPTS", 8))
+SUBSCRIPTION_OUTBOX_RETRY_BASE_SECONDS = float(os.environ.get("SUBSCRIPTION_OUTBOX_RETRY_BASE_SECONDS", 5))
+SUBSCRIPTION_OUTBOX_RETRY_MAX_SECONDS = float(os.environ.get("SUBSCRIPTION_OUTBOX_RETRY_MAX_SECONDS", 10 * 60))
+# How long a relay holds on to the entries it claimed before another relay may pick them up again.
+SUBSCRIPTION_OUTBOX_LEASE_SECONDS = float(os.environ.get("SUBSCRIPTION_OUTBOX_LEASE_SECONDS", 60))
+
+# Alert history related settings
+# Write the alert history captured during a request with one bulk insert once it is handled instead of one per change.
+ALERT_HISTORY_DEFERRED = bool(int(os.environ.get("ALERT_HISTORY_DEFERRED", 0)))
+# Alert history older than this is pruned daily, a chunk at a time with a pause in between to keep the locks short.
+ALERT_HISTORY_RETENTION_DAYS = int(os.environ.get("ALERT_HISTORY_RETENTION_DAYS", 365))
+ALERT_HISTORY_PRUNE_CHUNK_SIZE = int(os.environ.get("ALERT_HISTORY_PRUNE_CHUNK_SIZE", 1000))
+ALERT_HISTORY_PRUNE_SLEEP_SECONDS = float(os.environ.get("ALERT_HISTORY_PRUNE_SLEEP_SECONDS", 0.1))
+# The pruned history is written to this directory as gzip compressed NDJSON before being deleted, it is only deleted when empty.
+ALERT_HISTORY_ARCHIVE_DIR = os.environ.get("ALERT_HISTORY_ARCHIVE_DIR", "")
 
 # Simple JWT related settings
-SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-    'ROTATE_REFRESH_TOKENS': True
-}
+SIMPLE_JWT = {"ACCESS_TOKEN_LIFETIME": timedelta(minutes=5), "REFRESH_TOKEN_LIFETIME": timedelta(days=1), "ROTATE_REFRESH_TOKENS": True}
@@ -17,8 +17,11 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt import views as jwt_views
 
+from user_watch.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("api/v1/token/", jwt_views.TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/v1/token/refresh/", jwt_views.TokenRefreshView.as_view(), name="token_refresh"),
     path("alerts/", include("alerts.urls")),